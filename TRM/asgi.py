@@ -0,0 +1,12 @@
+"""
+ASGI config for the project.
+It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server (e.g. uvicorn TRM.asgi:application) to keep the
+real-time notification streams open (see activities.stream).
+"""
+from __future__ import absolute_import
+import os
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "TRM.settings")
+
+from django.core.asgi import get_asgi_application
+application = get_asgi_application()
@@ -2,15 +2,19 @@ from __future__ import absolute_import
 from django.conf import settings
 from django.shortcuts import get_object_or_404
 from candidates.models import Candidate
-from companies.models import Recruiter, Company
-from common.models import Subdomain
-from payments.models import Package, ServiceCategory
+from companies.models import Recruiter
+from payments.catalog import get_pricing_catalog
 from activities.models import Notification
+from django.db.models import Max
+from django.utils.functional import SimpleLazyObject
 from django.utils.translation import gettext as _
 from TRM import settings
-from TRM.settings import LOGO_COMPANY_DEFAULT, LOGO_CANDIDATE_DEFAULT, ROOT_DOMAIN
+from TRM.settings import LOGO_COMPANY_DEFAULT, LOGO_CANDIDATE_DEFAULT
+from TRM.tenancy import get_tenant
 import json
-from django.db.models import Q
+
+# Notifications listed in the header
+NOTIFICATIONS_SHOWN = 100
 # from zinnia import settings as zinnia_settings
 def debug_mode(request):
     return {'debug_mode': settings.DEBUG}
@@ -30,19 +34,20 @@ def candidate_full_name(request):
 """
 
 def candidate_full_name(request):
-    full_name = _('Your Name')
+    """
+    Name of the signed-in candidate, looked up only if a template shows it.
+    """
+    def full_name():
+        if request.user.is_authenticated:
+            profile = getattr(request.user, 'profile', None)
 
-    if request.user.is_authenticated:
-        profile = getattr(request.user, 'profile', None)
+            if profile and getattr(profile, 'codename', '') == 'candidate':
+                candidate = Candidate.objects.filter(user=request.user).values('first_name', 'last_name').first()
+                if candidate:
+                    return f"{candidate['first_name']} {candidate['last_name']}"
+        return _('Your Name')
 
-        if profile and getattr(profile, 'codename', '') == 'candidate':
-            try:
-                candidate = Candidate.objects.get(user=request.user)
-                full_name = f"{candidate.first_name} {candidate.last_name}"
-            except Candidate.DoesNotExist:
-                pass
-
-    return {'candidate_full_name': full_name}
+    return {'candidate_full_name': SimpleLazyObject(full_name)}
 
 def logo_company_default(request):
     return {'LOGO_COMPANY_DEFAULT': LOGO_COMPANY_DEFAULT}
@@ -51,53 +56,7 @@ def logo_candidate_default(request):
     return {'LOGO_CANDIDATE_DEFAULT': LOGO_CANDIDATE_DEFAULT}
 
 def subdomain(request):
-    fqdn = request.get_host().split(':')[0]
-    domain_parts = fqdn.split('.')
-    if len(domain_parts)>=3 and domain_parts[-2] == 'spotaxis' and domain_parts[-3] == 'demo':
-        if len(domain_parts) > 3:
-            subdomain = domain_parts[0]
-        elif len(domain_parts)<4:
-            subdomain = None
-            return {'active_subdomain':None,'active_host':None,'isRoot':True,'hasCNAME':False}
-        else:
-            subdomain=None
-        b=subdomain
-        try:
-            subdomain = Subdomain.objects.get(
-                    Q(cname=fqdn) |
-                    Q(slug=subdomain)
-                )
-        except:
-            subdomain = None
-    else:
-        if len(domain_parts) > 2 and ROOT_DOMAIN == domain_parts[1]:
-            subdomain = domain_parts[0]
-        elif len(domain_parts) < 3 and ROOT_DOMAIN == domain_parts[0]:
-            subdomain = None
-            return {'active_subdomain':None,'active_host':None,'isRoot':True,'hasCNAME': False}
-        else:
-            subdomain = None
-        b = subdomain
-        try:
-            subdomain = Subdomain.objects.get(
-                    Q(cname=fqdn) |
-                    Q(slug=subdomain)
-                )
-        except:
-            subdomain = None
-    hasCNAME = False
-    if subdomain:
-        slug = subdomain.slug
-        active_host = None
-        if subdomain.cname:
-            hasCNAME = True
-            active_host = subdomain.cname
-        elif subdomain.slug:
-            active_host = subdomain.slug + '.' + ROOT_DOMAIN + '.com'
-    else:
-        slug=None
-        active_host = None
-    return {'active_subdomain': slug,'active_host':active_host, 'isRoot':False, 'hasCNAME':hasCNAME}
+    return get_tenant(request).as_context()
 
 """
 def user_profile(request):
@@ -123,45 +82,64 @@ def user_profile(request):
 """
 
 def user_profile(request):
-    user_profile = None
-    recruiter = None
-    company = None
-
-    try:
-        active_subdomain = subdomain(request)['active_subdomain']
-        if active_subdomain:
-            company = Company.objects.get(subdomain__slug=active_subdomain)
-    except Company.DoesNotExist:
-        company = None
-
-    if request.user.is_authenticated:
-        profile = getattr(request.user, 'profile', None)
-        if profile:
-            user_profile = profile.codename
-        try:
-            recruiter = Recruiter.objects.get(user=request.user, company=company, user__is_active=True)
-        except Recruiter.DoesNotExist:
-            recruiter = None
+    """
+    Profile codename of the user and its recruiter in the tenant company.
+    Both are looked up only if a template uses them.
+    """
+    def codename():
+        profile = getattr(request.user, 'profile', None) if request.user.is_authenticated else None
+        return profile.codename if profile else None
+
+    def recruiter():
+        if not request.user.is_authenticated:
+            return None
+        return Recruiter.objects.filter(user=request.user, company=get_tenant(request).company,
+                                        user__is_active=True).first()
 
     return {
-        'user_profile': user_profile,
-        'recruiter': recruiter,
+        'user_profile': SimpleLazyObject(codename),
+        'recruiter': SimpleLazyObject(recruiter),
         'settings': settings
     }
 
-def notifications(request):
-    if request.user.is_authenticated:
-        msgs = Notification.objects.filter(user=request.user)
-        try:
-            request.session['last_notification'] = msgs.latest('id').id
-        except:
-            request.session['last_notification'] = 0
-        return {'notifications': msgs[:100],'unseen_notification_count':Notification.objects.filter(seen=False, user = request.user).count()}
+def remember_last_notification(request, msgs):
+    """
+    Store the id of the newest notification of the page in the session, for
+    the notification stream to send only newer ones. The session is only
+    written when the id changes.
+    """
+    if len(msgs) < NOTIFICATIONS_SHOWN:
+        last_id = max([msg.id for msg in msgs] or [0])
     else:
+        last_id = Notification.objects.filter(user=request.user).aggregate(last_id=Max('id'))['last_id'] or 0
+    if request.session.get('last_notification') != last_id:
+        request.session['last_notification'] = last_id
+
+def notifications(request):
+    """
+    Latest notifications of the user and the number of unseen ones, queried
+    only if a template shows them.
+    """
+    if not request.user.is_authenticated:
         return {}
 
+    def latest():
+        msgs = list(Notification.objects.filter(user=request.user).select_related('actor', 'target')[:NOTIFICATIONS_SHOWN])
+        remember_last_notification(request, msgs)
+        return msgs
+
+    def unseen_count():
+        return Notification.objects.filter(seen=False, user=request.user).count()
+
+    return {'notifications': SimpleLazyObject(latest), 'unseen_notification_count': SimpleLazyObject(unseen_count)}
+
 def packages(request):
+    """
+    Packages and service categories of the pricing modals, from the cached
+    pricing catalog (see ``payments.catalog``), read only if a template lists them.
+    """
+    catalog = SimpleLazyObject(get_pricing_catalog)
     return {
-        'packages':Package.objects.all(),
-        'service_categories':ServiceCategory.objects.all()
+        'packages': SimpleLazyObject(lambda: catalog['packages']),
+        'service_categories': SimpleLazyObject(lambda: catalog['service_categories'])
     }
\ No newline at end of file
@@ -6,13 +6,11 @@ from django.shortcuts import render
 from django.utils.cache import patch_vary_headers
 from django.conf import settings
 
-from TRM.settings import SUBDOMAIN_URLCONF, ROOT_DOMAIN, SITE_SUFFIX, SUPPORT_URLCONF, BLOG_URLCONF
-from django.db.models import Q
+from TRM.settings import SUBDOMAIN_URLCONF, SITE_SUFFIX, SUPPORT_URLCONF, BLOG_URLCONF
 from django.urls import set_urlconf, reverse, resolve
 from django.http import Http404, HttpResponseRedirect
 import time
-from common.models import Subdomain
-from TRM.context_processors import subdomain as check_subdomain
+from TRM.tenancy import get_tenant
 # class CustomSocialAuthExceptionMiddleware(SocialAuthExceptionMiddleware):
 #     def process_exception(self, request, exception):
 #         if type(exception) == AuthCanceled:
@@ -26,34 +24,10 @@ class SubdomainMiddleware:
 
     def __call__(self, request):
         # Migrate process_request logic here
-        fqdn = request.get_host().split(':')[0]
-        domain_parts = fqdn.split('.')
-
-        subdomain = None
-        if len(domain_parts) >= 3 and domain_parts[-2] == 'spotaxis' and domain_parts[-3] == 'demo':
-            if len(domain_parts) > 3:
-                subdomain_slug = domain_parts[0]
-            else:
-                subdomain_slug = None
-            try:
-                subdomain = Subdomain.objects.get(
-                    Q(cname=fqdn) |
-                    Q(slug=subdomain_slug)
-                )
-            except Subdomain.DoesNotExist:
-                subdomain = None
-        else:
-            if len(domain_parts) > 2 and ROOT_DOMAIN in fqdn:
-                subdomain_slug = domain_parts[0]
-            else:
-                subdomain_slug = None
-            try:
-                subdomain = Subdomain.objects.get(
-                    Q(cname=fqdn) |
-                    Q(slug=subdomain_slug)
-                )
-            except Subdomain.DoesNotExist:
-                subdomain = None
+        # The tenant is resolved once per request, see TRM.tenancy
+        tenant = get_tenant(request)
+        fqdn = tenant.host
+        subdomain = tenant.subdomain
 
         if subdomain:
             set_urlconf(SUBDOMAIN_URLCONF)
@@ -74,7 +48,7 @@ class MediumMiddleware:
 
     def __call__(self, request):
         # Equivalent of process_request
-        subdomain_data = check_subdomain(request)
+        subdomain_data = get_tenant(request).as_context()
         if subdomain_data.get('active_subdomain') or subdomain_data.get('hasCNAME'):
             referer = request.META.get('HTTP_REFERER')
             if referer and "spotaxis.com" not in referer and request.get_host() not in referer:
@@ -136,7 +110,6 @@ from django.contrib.sessions.middleware import SessionMiddleware
 
 from django.contrib import messages
 from django.urls import resolve, reverse
-from django.contrib import messages
 from django.http import HttpResponseRedirect
 
 class ExpiredPlanMiddleware:
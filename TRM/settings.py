@@ -72,6 +72,9 @@ USE_TZ = False
 
 STATIC_URL = '/static/'
 
+# Rendered PDF downloads (see common.pdf_cache), kept outside MEDIA_ROOT
+PDF_CACHE_ROOT = os.path.join(PROJECT_PATH, 'private', 'pdf_cache')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -159,9 +162,12 @@ MIDDLEWARE = [
 ]
 CRONJOBS = [
     # ('*/5 * * * *', 'helpdesk.cron.EmailTicketCronJob', '>> '+PROJECT_PATH+'cronjob.log'),
+    # ('* * * * *', 'helpdesk.cron.BulkTicketJobsCronJob', '>> '+PROJECT_PATH+'cronjob.log'),
     ('* * * * *', 'payments.cron.SubscriptionCronJob', '>> '+PROJECT_PATH+'cronjob.log'),
-    ('0 0 * * *', 'vacancies.cron.PublishCronJob', '>> '+PROJECT_PATH+'cronjob.log'),
-    ('0 0 * * *', 'vacancies.cron.UnPublishCronJob', '>> '+PROJECT_PATH+'cronjob.log'),
+    ('* * * * *', 'common.cron.SendQueuedEmailsCronJob', '>> '+PROJECT_PATH+'cronjob.log'),
+    ('* * * * *', 'candidates.cron.CurriculumJobsCronJob', '>> '+PROJECT_PATH+'cronjob.log'),
+    ('*/10 * * * *', 'vacancies.cron.PublishCronJob', '>> '+PROJECT_PATH+'cronjob.log'),
+    ('*/10 * * * *', 'vacancies.cron.UnPublishCronJob', '>> '+PROJECT_PATH+'cronjob.log'),
     # ...
 ]
 TEMPLATES = [
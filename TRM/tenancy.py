@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Resolution of the tenant (subdomain and company) of a request.
+
+The subdomain middlewares, the ``subdomain`` and ``user_profile`` context
+processors and most views used to resolve the host to a ``Subdomain`` and then
+to its ``Company`` on their own, so a single page looked the same tenant up
+five times or more.
+
+``SubdomainMiddleware`` now resolves the tenant once and stores it in
+``request.tenant``; ``get_tenant(request)`` returns it (resolving it for
+requests that did not go through the middleware). Resolutions are kept in a
+process-local LRU cache for ``TENANT_CACHE_TIMEOUT`` seconds, keyed by host.
+Saving or deleting a ``Subdomain`` or a ``Company`` clears the cache of the
+current process (see the end of ``companies.models``); other processes see
+the change when their entries expire.
+"""
+
+from __future__ import absolute_import
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import Http404
+
+TENANT_CACHE_TIMEOUT = getattr(settings, 'TENANT_CACHE_TIMEOUT', 300)
+TENANT_CACHE_SIZE = getattr(settings, 'TENANT_CACHE_SIZE', 1024)
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+class Tenant(object):
+    """
+    Tenant of a host.
+
+    Attributes:
+        host (str): Host name of the request, without port.
+        subdomain (Subdomain): The matching subdomain, or None.
+        company (Company): The company of the subdomain, or None.
+        active_subdomain (str): Slug of the subdomain, or None.
+        active_host (str): Public host of the subdomain (its CNAME if it has one), or None.
+        is_root (bool): Whether the host is the root domain.
+        has_cname (bool): Whether the subdomain is served on its own domain.
+    """
+    def __init__(self, host, subdomain=None, company=None, is_root=False):
+        self.host = host
+        self.subdomain = subdomain
+        self.company = company
+        self.is_root = is_root
+        self.has_cname = False
+        self.active_subdomain = None
+        self.active_host = None
+        if subdomain:
+            self.active_subdomain = subdomain.slug
+            if subdomain.cname:
+                self.has_cname = True
+                self.active_host = subdomain.cname
+            elif subdomain.slug:
+                self.active_host = subdomain.slug + '.' + settings.ROOT_DOMAIN + '.com'
+
+    def as_context(self):
+        """
+        Returns:
+            dict: The values of the ``subdomain`` context processor.
+        """
+        return {'active_subdomain': self.active_subdomain, 'active_host': self.active_host,
+                'isRoot': self.is_root, 'hasCNAME': self.has_cname}
+
+    def copy(self):
+        """ Copy for one request, so requests never share model instances. """
+        tenant = copy.copy(self)
+        tenant.subdomain = copy.copy(self.subdomain)
+        tenant.company = copy.copy(self.company)
+        return tenant
+
+
+def _resolve(host):
+    """ Look the tenant of a host up in the database. """
+    from common.models import Subdomain
+    from companies.models import Company
+    domain_parts = host.split('.')
+    if len(domain_parts) >= 3 and domain_parts[-2] == 'spotaxis' and domain_parts[-3] == 'demo':
+        if len(domain_parts) < 4:
+            return Tenant(host, is_root=True)
+        slug = domain_parts[0]
+    elif len(domain_parts) > 2 and settings.ROOT_DOMAIN == domain_parts[1]:
+        slug = domain_parts[0]
+    elif len(domain_parts) < 3 and settings.ROOT_DOMAIN == domain_parts[0]:
+        return Tenant(host, is_root=True)
+    else:
+        slug = None
+    condition = Q(cname=host)
+    if slug:
+        condition = condition | Q(slug=slug)
+    # A custom domain wins over a slug
+    subdomains = sorted(Subdomain.objects.filter(condition)[:2], key=lambda subdomain: subdomain.cname != host)
+    if not subdomains:
+        return Tenant(host)
+    subdomain = subdomains[0]
+    company = Company.objects.filter(subdomain=subdomain).first()
+    return Tenant(host, subdomain, company)
+
+
+def resolve_tenant(host):
+    """
+    Tenant of a host, from the process cache when possible.
+
+    Args:
+        host (str): Host name, without port.
+
+    Returns:
+        Tenant: A copy owned by the caller.
+    """
+    host = host.lower()
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(host)
+        if entry and entry[0] > now:
+            _cache.move_to_end(host)
+            return entry[1].copy()
+    tenant = _resolve(host)
+    with _lock:
+        _cache[host] = (now + TENANT_CACHE_TIMEOUT, tenant)
+        _cache.move_to_end(host)
+        while len(_cache) > TENANT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return tenant.copy()
+
+
+def clear_tenant_cache():
+    """ Forget the cached tenants of the current process. """
+    with _lock:
+        _cache.clear()
+
+
+def get_tenant(request):
+    """
+    Tenant of a request, resolved once and stored in ``request.tenant``.
+
+    Args:
+        request (HttpRequest): The request.
+
+    Returns:
+        Tenant: The tenant of the request host.
+    """
+    tenant = getattr(request, 'tenant', None)
+    if tenant is None:
+        tenant = request.tenant = resolve_tenant(request.get_host().split(':')[0])
+    return tenant
+
+
+def get_tenant_company(request):
+    """
+    Company of the request subdomain.
+
+    Raises:
+        Company.DoesNotExist: If the host has no company.
+    """
+    from companies.models import Company
+    company = get_tenant(request).company
+    if company is None:
+        raise Company.DoesNotExist('No company for host %s' % request.get_host())
+    return company
+
+
+def get_tenant_company_or_404(request):
+    """
+    Company of the request subdomain.
+
+    Raises:
+        Http404: If the host has no company.
+    """
+    company = get_tenant(request).company
+    if company is None:
+        raise Http404
+    return company
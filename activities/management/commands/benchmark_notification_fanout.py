@@ -0,0 +1,93 @@
+"""
+benchmark_notification_fanout.py - Compare the per-recipient and the bulk
+creation of organization notifications for several company sizes.
+
+Everything runs in a transaction that is rolled back, so the command can be
+run against a copy of the production database without leaving rows behind.
+"""
+
+from __future__ import absolute_import
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from activities.models import MessageChunk, Notification
+from activities.utils import bulk_post_notification
+from common.models import User
+
+MESSAGE_CHUNKS = [
+    {'subject': 'Senior Developer', 'subject_action': 'was updated', 'action_url': 'http://example.com/job/1/'},
+    {'subject': 'Interview stage', 'subject_action': 'was added', 'action_url': 'http://example.com/job/1/'},
+]
+
+
+def legacy_post_org_notification(users, actor, message_chunks):
+    """ Former fan-out: one notification, its chunks and their links per recipient. """
+    for member in users:
+        notification = Notification.objects.create(user=member, actor=actor, action='updated', subject='Job')
+        for order, message_chunk in enumerate(message_chunks):
+            chunk = MessageChunk.objects.create(subject=message_chunk['subject'], order=order,
+                                                subject_action=message_chunk['subject_action'],
+                                                action_url=message_chunk['action_url'])
+            notification.message_chunks.add(chunk)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """
+    Django management command measuring the queries and the time of one
+    organization notification with the former per-recipient loop and with
+    bulk_post_notification.
+    """
+    help = 'Benchmark the notification fan-out for several company sizes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='10,50,200',
+            help='Comma separated numbers of recipients.')
+
+    def measure(self, function):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+        return len(queries.captured_queries), elapsed
+
+    def handle(self, *args, **options):
+        """
+        Command entry point.
+
+        Args:
+            *args: Positional arguments (not used).
+            **options: sizes.
+        """
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        # The bulk path differs on databases that do not return the ids of bulk inserted rows (MySQL)
+        self.stdout.write('database: %s (ids returned by bulk inserts: %s)' % (
+            connection.vendor, connection.features.can_return_rows_from_bulk_insert))
+        self.stdout.write('%10s %16s %16s %16s %16s' % ('recipients', 'legacy queries', 'legacy ms',
+                                                        'bulk queries', 'bulk ms'))
+        try:
+            with transaction.atomic():
+                actor = User.objects.create(username='fanout-benchmark-actor', email='actor@fanout.invalid')
+                users = list(User.objects.bulk_create([
+                    User(username='fanout-benchmark-%s' % index, email='%s@fanout.invalid' % index)
+                    for index in range(max(sizes))]))
+                if not all(user.pk for user in users):
+                    users = list(User.objects.filter(email__endswith='@fanout.invalid').exclude(pk=actor.pk))
+                for size in sizes:
+                    recipients = users[:size]
+                    legacy = self.measure(lambda: legacy_post_org_notification(recipients, actor, MESSAGE_CHUNKS))
+                    bulk = self.measure(lambda: bulk_post_notification(recipients, actor=actor, action='updated',
+                                                                       subject='Job', message_chunks=MESSAGE_CHUNKS))
+                    self.stdout.write('%10s %16s %16.1f %16s %16.1f' % (size, legacy[0], legacy[1] * 1000,
+                                                                        bulk[0], bulk[1] * 1000))
+                raise Rollback
+        except Rollback:
+            pass
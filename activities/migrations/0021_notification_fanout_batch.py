@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activities', '0020_alter_activity_id_alter_messagechunk_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='fanout_batch',
+            field=models.UUIDField(blank=True, default=None, editable=False, null=True),
+        ),
+    ]
@@ -150,6 +150,7 @@ class Notification(models.Model):
         target (User): The user who is the target of the notification. Optional.
         actor_count (int): Count of actors involved. Defaults to 0.
         message_chunks (ManyToMany[MessageChunk]): Message chunks used in this notification.
+        fanout_batch (UUID): Token of the bulk insert that created the notification. Optional.
     """
     
     user = models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.CASCADE)
@@ -168,6 +169,8 @@ class Notification(models.Model):
     target = models.ForeignKey(settings.AUTH_USER_MODEL,related_name='notification_target', null=True, blank=True, default=None,on_delete=models.SET_NULL)
     actor_count = models.PositiveIntegerField(default=0, null=True, blank=True)
     message_chunks = models.ManyToManyField(MessageChunk)
+    # Set on the rows of a bulk insert to read their ids back where the database does not return them
+    fanout_batch = models.UUIDField(null=True, blank=True, default=None, editable=False)
 
     class Meta:
         verbose_name = "Notification"
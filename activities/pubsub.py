@@ -0,0 +1,177 @@
+"""
+Publish/subscribe fan-out of the real-time notifications.
+
+``post_notification`` publishes every new notification on the channel of its
+recipient, and the notification stream of each connected browser subscribes to
+the channel of its user, so idle connections cost no database query.
+
+Two backends are available, selected with ``NOTIFICATION_PUBSUB_BACKEND``:
+
+- ``'local'`` (default): in-process queues. Only the connections served by the
+  process that created the notification receive it, which suits a single ASGI
+  process or development.
+- ``'redis'``: Redis (or any server speaking its protocol) at
+  ``NOTIFICATION_PUBSUB_URL``, for several processes or hosts. Needs the
+  ``redis`` package.
+"""
+
+from __future__ import absolute_import
+import asyncio
+import json
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# Messages kept for a slow connection before the oldest are dropped
+QUEUE_SIZE = 100
+
+
+def user_channel(user_id):
+    """ Name of the notification channel of a user. """
+    return 'notifications:%s' % user_id
+
+
+class LocalSubscription(object):
+    """
+    Subscription to a channel of the local backend, read from the event loop
+    that created it.
+    """
+    def __init__(self, pubsub, channel):
+        self.pubsub = pubsub
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def deliver(self, message):
+        """ Queue a message, from any thread. Returns False if the loop is gone. """
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            return False
+        return True
+
+    def _put(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout):
+        """
+        Wait for the next message.
+
+        Args:
+            timeout (float): Seconds to wait.
+
+        Returns:
+            dict: The message, or None on timeout.
+        """
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        self.pubsub.unsubscribe(self)
+
+
+class LocalPubSub(object):
+    """ In-process backend. """
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    async def subscribe(self, channel):
+        subscription = LocalSubscription(self, channel)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def subscribed_channels(self, channels):
+        """ The channels a connection of this process listens to, among some channels. """
+        with self._lock:
+            return set(channel for channel in channels if self._subscriptions.get(channel))
+
+    def publish(self, channel, message):
+        """
+        Send a message to the subscribers of a channel.
+
+        Args:
+            channel (str): Channel name.
+            message (dict): JSON serializable message.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            if not subscription.deliver(message):
+                self.unsubscribe(subscription)
+
+
+class RedisSubscription(object):
+    """ Subscription to a channel of the Redis backend, with its own connection. """
+    def __init__(self, client, channel):
+        self.client = client
+        self.channel = channel
+        self.pubsub = client.pubsub()
+
+    async def get(self, timeout):
+        message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if message is None:
+            return None
+        return json.loads(message['data'])
+
+    async def close(self):
+        await self.pubsub.unsubscribe(self.channel)
+        await self.pubsub.aclose()
+        await self.client.aclose()
+
+
+class RedisPubSub(object):
+    """ Redis backend. """
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("NOTIFICATION_PUBSUB_BACKEND 'redis' needs the redis package.")
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+
+    async def subscribe(self, channel):
+        from redis import asyncio as aioredis
+        subscription = RedisSubscription(aioredis.Redis.from_url(self.url), channel)
+        await subscription.pubsub.subscribe(channel)
+        return subscription
+
+    def subscribed_channels(self, channels):
+        """ The channels a connection listens to, among some channels (one NUMSUB round trip). """
+        channels = list(set(channels))
+        if not channels:
+            return set()
+        return set(name.decode() if isinstance(name, bytes) else name
+                   for name, count in self.client.pubsub_numsub(*channels) if count)
+
+    def publish(self, channel, message):
+        self.client.publish(channel, json.dumps(message))
+
+
+@lru_cache(maxsize=None)
+def get_pubsub():
+    """
+    Returns:
+        The configured backend (one per process).
+    """
+    backend = getattr(settings, 'NOTIFICATION_PUBSUB_BACKEND', 'local')
+    if backend == 'local':
+        return LocalPubSub()
+    if backend == 'redis':
+        return RedisPubSub(getattr(settings, 'NOTIFICATION_PUBSUB_URL', 'redis://localhost:6379/0'))
+    raise ImproperlyConfigured('Unknown NOTIFICATION_PUBSUB_BACKEND %r' % backend)
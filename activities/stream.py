@@ -0,0 +1,193 @@
+"""
+Real-time notification stream (server-sent events).
+
+The browser used to poll ``/notifications/``: each request answered the
+notifications created since the last one and closed, so the browser reconnected
+every few seconds and every reconnect queried the database and wrote the
+session.
+
+Served over ASGI, the endpoint now keeps the connection open: it sends the
+notifications missed since ``Last-Event-ID`` (or since the last page render),
+then waits on the pub/sub channel of the user (see ``activities.pubsub``) and
+pushes each new notification as it is published by ``post_notification``.
+A comment is sent every ``NOTIFICATION_STREAM_HEARTBEAT`` seconds to keep
+proxies from closing idle connections.
+
+Served over WSGI, where an open connection would hold a worker, it answers the
+missed notifications and asks the browser to reconnect after
+``NOTIFICATION_STREAM_RETRY`` milliseconds.
+"""
+
+from __future__ import absolute_import
+import copy
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+
+from activities.models import Notification
+from activities.pubsub import get_pubsub, user_channel
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT = getattr(settings, 'NOTIFICATION_STREAM_HEARTBEAT', 15)
+RETRY = getattr(settings, 'NOTIFICATION_STREAM_RETRY', 10000)
+# Most notifications sent when a connection opens
+BACKLOG_SIZE = 100
+# Stands for the notification id in an item rendered for several notifications
+ID_PLACEHOLDER = '__notification_id__'
+
+
+def notification_payload(notification, viewer=None, html=None):
+    """
+    Data of a notification sent to the browser.
+
+    Args:
+        notification (Notification): The notification, with its actor and target loaded.
+        viewer (User): The recipient (defaults to ``notification.user``).
+        html (str): The already rendered item, see ``render_notification_items``.
+
+    Returns:
+        dict: ``id``, ``actor``, ``message``, ``action_url``, ``last_updated`` and ``html``.
+    """
+    if html is None:
+        html = render_to_string('notification_item.html', {'notification': notification,
+                                                           'viewer': viewer or notification.user})
+    return {
+        'id': str(notification.id),
+        'actor': str(notification.actor).strip(),
+        'message': str(notification.message).strip(),
+        'action_url': str(notification.action_url).strip(),
+        'last_updated': str(notification.timestamp).strip(),
+        'html': html,
+    }
+
+
+def render_notification_items(notifications):
+    """
+    HTML items of notifications of one message, rendered once per kind of
+    recipient: the item only depends on the recipient being the actor, the
+    target or someone else, and on the notification id.
+
+    Args:
+        notifications (list): Notifications of the same message.
+
+    Returns:
+        list: The HTML of each notification.
+    """
+    rendered = {}
+    items = []
+    for notification in notifications:
+        role = 'actor' if notification.user_id == notification.actor_id else \
+            'target' if notification.user_id == notification.target_id else None
+        if role not in rendered:
+            template = copy.copy(notification)
+            template.id = ID_PLACEHOLDER
+            rendered[role] = render_to_string('notification_item.html', {'notification': template,
+                                                                         'viewer': notification.user})
+        items.append(rendered[role].replace(ID_PLACEHOLDER, str(notification.id)))
+    return items
+
+
+def publish_notifications(notifications):
+    """
+    Push new notifications of one message to the open streams of their
+    recipients once the current transaction commits. Only the items of
+    recipients with an open stream are rendered. Delivery errors are logged,
+    never raised.
+
+    Args:
+        notifications (list): The saved notifications.
+    """
+    def publish():
+        try:
+            pubsub = get_pubsub()
+            subscribed = pubsub.subscribed_channels([user_channel(notification.user_id)
+                                                     for notification in notifications])
+            listened = [notification for notification in notifications
+                        if user_channel(notification.user_id) in subscribed]
+            for notification, html in zip(listened, render_notification_items(listened)):
+                pubsub.publish(user_channel(notification.user_id), notification_payload(notification, html=html))
+        except Exception:
+            logger.exception('Could not publish notifications %s', [notification.pk for notification in notifications])
+    if notifications:
+        transaction.on_commit(publish)
+
+
+def load_backlog(user, last_id):
+    """
+    Payloads of the notifications of a user newer than ``last_id``, oldest first.
+    """
+    notifications = Notification.objects.filter(user=user, id__gt=last_id) \
+        .select_related('actor', 'target').order_by('-id')[:BACKLOG_SIZE]
+    return [notification_payload(notification, user) for notification in reversed(notifications)]
+
+
+def last_notification_id(request):
+    """
+    Id of the last notification the browser has: the ``Last-Event-ID`` of a
+    reconnecting stream, else the one stored by the last page render.
+    """
+    try:
+        return int(request.META.get('HTTP_LAST_EVENT_ID') or request.session.get('last_notification', 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def format_event(payloads):
+    """ Server-sent event carrying a list of notification payloads. """
+    return 'id: %s\ndata: %s\n\n' % (payloads[-1]['id'], json.dumps(payloads))
+
+
+async def notification_events(user, last_id):
+    """
+    Server-sent events of a user: the backlog, then the published
+    notifications and heartbeats until the client disconnects.
+    """
+    subscription = await get_pubsub().subscribe(user_channel(user.pk))
+    try:
+        yield 'retry: %d\n\n' % RETRY
+        # Subscribed before loading the backlog, so nothing is missed in between
+        backlog = await sync_to_async(load_backlog)(user, last_id)
+        if backlog:
+            last_id = int(backlog[-1]['id'])
+            yield format_event(backlog)
+        while True:
+            payload = await subscription.get(HEARTBEAT)
+            if payload is None:
+                yield ': keep-alive\n\n'
+            elif int(payload['id']) > last_id:
+                last_id = int(payload['id'])
+                yield format_event([payload])
+    finally:
+        await subscription.close()
+
+
+async def notification_stream(request):
+    """
+    Response of the notification endpoint.
+
+    Args:
+        request (HttpRequest): The request.
+
+    Returns:
+        HttpResponse: A long-lived event stream under ASGI, a single batch of
+        events under WSGI.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse('Unauthorised access', content_type='text/event-stream')
+    last_id = await sync_to_async(last_notification_id)(request)
+    if isinstance(request, ASGIRequest):
+        response = StreamingHttpResponse(notification_events(user, last_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    backlog = await sync_to_async(load_backlog)(user, last_id)
+    return HttpResponse('retry: %d\n\n%s' % (RETRY, format_event(backlog) if backlog else ''),
+                        content_type='text/event-stream')
@@ -4,11 +4,150 @@ Utility functions for managing activities and notifications in the SpotAxis appl
 This module provides helper functions for creating and managing activities and notifications
 across the system. It handles the creation of notifications, organizational notifications,
 and various types of activities with their associated message chunks.
+
+Notifications for many recipients are created in bulk: the message chunks are
+created once and shared by every notification, notifications and their
+message chunk links are inserted with bulk_create, so an event costs a few
+queries whatever the size of the company. On databases that do not return the
+ids of bulk inserted rows (MySQL), the notifications of a fan-out share a
+``fanout_batch`` token and their ids are read back with one query. Set NOTIFICATION_FANOUT_DEFERRED to
+True to create them in a background thread once the transaction commits.
 """
 
 from __future__ import absolute_import
 from __future__ import print_function
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+
 from activities.models import *
+from common.models import User
+
+FANOUT_DEFERRED = getattr(settings, 'NOTIFICATION_FANOUT_DEFERRED', False)
+FANOUT_BATCH_SIZE = getattr(settings, 'NOTIFICATION_FANOUT_BATCH_SIZE', 500)
+
+_fanout_executor = None
+
+def create_message_chunks(message_chunks):
+	"""
+	Creates the MessageChunk rows of a message, in order.
+
+	Args:
+		message_chunks (list): Dictionaries with 'subject', 'subject_action' and 'action_url' keys.
+
+	Returns:
+		list: The saved MessageChunk objects.
+	"""
+	chunks = [MessageChunk(subject = message_chunk['subject'], subject_action = message_chunk['subject_action'], action_url = message_chunk['action_url'], order = order) for order, message_chunk in enumerate(message_chunks)]
+	if connection.features.can_return_rows_from_bulk_insert:
+		MessageChunk.objects.bulk_create(chunks)
+	else:
+		for chunk in chunks:
+			chunk.save()
+	return chunks
+
+def link_message_chunks(model, objects, chunks):
+	"""
+	Links message chunks to many notifications or activities with a single bulk insert.
+
+	Args:
+		model: Notification or Activity.
+		objects (list): Saved instances of the model.
+		chunks (list): Saved MessageChunk objects.
+	"""
+	through = model.message_chunks.through
+	source = model._meta.model_name + '_id'
+	rows = [through(**{source: obj.pk, 'messagechunk_id': chunk.pk}) for obj in objects for chunk in chunks]
+	through.objects.bulk_create(rows, batch_size = FANOUT_BATCH_SIZE)
+
+def notification_recipients(user, actor):
+	"""
+	Resolves the recipients of an organization notification, leaving the actor out.
+
+	Args:
+		user (str|User|QuerySet|list): 'all' or None for every member of the actor's company,
+			otherwise a user or the users to notify.
+		actor (User): The user who triggered the notification.
+
+	Returns:
+		list: Distinct users.
+	"""
+	if user == 'all' or user == None:
+		company = actor.recruiter.company.all()[0]
+		users = User.objects.filter(recruiter__company = company).distinct()
+	elif isinstance(user, User):
+		users = [user]
+	else:
+		users = user
+	recipients = []
+	seen = set()
+	for member in users:
+		if member.pk in seen or (actor and member.pk == actor.pk):
+			continue
+		seen.add(member.pk)
+		recipients.append(member)
+	return recipients
+
+def bulk_post_notification(users, actor = None, action = None, target = None, target_action = None, subject = None, subject_action = None, msg=None, url=None, message_chunks = [], chunks = None):
+	"""
+	Creates the same notification for many users with a fixed number of queries.
+
+	Args:
+		users (list): Users to receive the notification.
+		chunks (list, optional): Already saved MessageChunk objects to share, instead of
+			creating them from message_chunks.
+		Other arguments: as post_notification.
+
+	Returns:
+		list: The created notifications.
+	"""
+	from activities.stream import publish_notifications
+	users = list(users)
+	if not users:
+		return []
+	if chunks is None:
+		chunks = create_message_chunks(message_chunks)
+	# The database may not return the ids of bulk inserted rows (MySQL), they are then read back by batch token
+	fanout_batch = None if connection.features.can_return_rows_from_bulk_insert else uuid.uuid4()
+	notifications = [Notification(user = member, message = msg, action_url = url, actor=actor, action = action, target = target, target_action = target_action, subject = subject, subject_action = subject_action, fanout_batch = fanout_batch) for member in users]
+	Notification.objects.bulk_create(notifications, batch_size = FANOUT_BATCH_SIZE)
+	if fanout_batch:
+		# Rows are numbered in insertion order. The user index finds them, fanout_batch is not indexed
+		ids = Notification.objects.filter(user__in = set(member.pk for member in users), fanout_batch = fanout_batch) \
+			.order_by('id').values_list('id', flat = True)
+		for notification, pk in zip(notifications, ids):
+			notification.pk = notification.id = pk
+	if chunks:
+		link_message_chunks(Notification, notifications, chunks)
+	publish_notifications(notifications)
+	return notifications
+
+def _run_deferred_fanout(kwargs):
+	try:
+		bulk_post_notification(**kwargs)
+	finally:
+		connections.close_all()
+
+def fanout_notification(users, **kwargs):
+	"""
+	Notifies many users, now or after the commit in a background thread when
+	NOTIFICATION_FANOUT_DEFERRED is set.
+
+	Args:
+		users (list): Users to receive the notification.
+		**kwargs: Arguments of bulk_post_notification.
+	"""
+	global _fanout_executor
+	users = list(users)
+	if not FANOUT_DEFERRED:
+		bulk_post_notification(users, **kwargs)
+		return
+	if _fanout_executor is None:
+		_fanout_executor = ThreadPoolExecutor(max_workers = 1, thread_name_prefix = 'notification-fanout')
+	kwargs['users'] = users
+	transaction.on_commit(lambda: _fanout_executor.submit(_run_deferred_fanout, kwargs))
 
 def post_notification(user=None, actor = None, action = None, target = None, target_action = None, subject = None, subject_action = None, msg=None, url=None, message_chunks = []):
 	"""
@@ -27,24 +166,21 @@ def post_notification(user=None, actor = None, action = None, target = None, tar
 		message_chunks (list, optional): List of dictionaries containing message chunk data.
 			Each chunk should have 'subject', 'subject_action', and 'action_url' keys.
 	"""
-	notification = Notification.objects.create(user = user , message = msg, action_url = url, actor=actor, action = action, target = target, target_action = target_action, subject = subject, subject_action = subject_action)
-	print(notification)
-	for order,message_chunk in enumerate(message_chunks):
-		chunk = MessageChunk.objects.create(subject = message_chunk['subject'], subject_action = message_chunk['subject_action'], action_url = message_chunk['action_url'] ,order = order)
-		notification.message_chunks.add(chunk)
+	bulk_post_notification([user], msg = msg, url = url, actor = actor, action = action, target = target, target_action = target_action, subject = subject, subject_action = subject_action, message_chunks = message_chunks)
 
-def post_org_notification(user=None,actor=None, msg=None, url=None, action = None, target = None, target_action = None, subject = None, subject_action = None, message_chunks = []):
+def post_org_notification(user=None,actor=None, msg=None, url=None, action = None, target = None, target_action = None, subject = None, subject_action = None, message_chunks = [], chunks = None):
 	"""
 	Creates notifications for multiple users in an organization.
 	
 	This function handles sending notifications to all members of an organization,
 	excluding the actor who triggered the notification. It can either notify all
-	members of a company or a specific subset of users.
+	members of a company or a specific subset of users. The notifications are
+	created in bulk (see bulk_post_notification).
 	
 	Args:
-		user (str|User|QuerySet, optional): 
+		user (str|User|QuerySet|list, optional): 
 			- 'all' or None: Notifies all company members
-			- User or QuerySet: Specific users to notify
+			- User, QuerySet or list: Specific users to notify
 		actor (User): The user who triggered the notification.
 		msg (str, optional): The main notification message.
 		url (str, optional): URL associated with the notification.
@@ -54,25 +190,10 @@ def post_org_notification(user=None,actor=None, msg=None, url=None, action = Non
 		subject (str, optional): The subject of the notification.
 		subject_action (str, optional): Action associated with the subject.
 		message_chunks (list, optional): List of message chunk dictionaries.
+		chunks (list, optional): Already saved MessageChunk objects to share.
 	"""
-	if user == 'all' or user == None:
-		company = actor.recruiter.company.all()[0]
-		users = [r.user for r in company.recruiter_set.all()]
-		if actor in users:
-			users.remove(actor)
-	else:
-		users = user
-		try:
-			users = users.exclude(id = actor.id)
-		except:
-			pass
-		try:
-			users = users.remove(actor)
-		except:
-			pass
-	print(users)
-	for member in users:
-		post_notification(user=member, actor = actor, msg = msg, url = url, target = target, subject = subject, action = action, target_action = target_action, subject_action = subject_action, message_chunks = message_chunks)
+	users = notification_recipients(user, actor)
+	fanout_notification(users, msg = msg, url = url, actor = actor, action = action, target = target, target_action = target_action, subject = subject, subject_action = subject_action, message_chunks = message_chunks, chunks = chunks)
 
 def post_activity(actor = None, action = None, message = None, subscribers=[], action_url = "", activity_type = 0, target = None, target_action = None, subject = None, subject_action = None, postulate_id = None, message_chunks=[]):
 	"""
@@ -82,6 +203,9 @@ def post_activity(actor = None, action = None, message = None, subscribers=[], a
 	and manages their subscribers and notifications. It supports two main activity types:
 	- Type 0: Standard activity
 	- Type 1: Postulate-related activity
+
+	Subscribers are added with a single query and the message chunks of a new
+	activity are shared with its notifications.
 	
 	Args:
 		actor (User, optional): The user who performed the activity.
@@ -107,47 +231,36 @@ def post_activity(actor = None, action = None, message = None, subscribers=[], a
 		company = actor.recruiter.company.all()[0]
 	except:
 		company = None
+	subscribers = list(subscribers or [])
 	if activity_type == 0 or not activity_type:
 		activity = Activity.objects.create(actor = actor, message = message, action_url = action_url, action = action, activity_type = 0)
-		order = 0;
-		for message_chunk in message_chunks:
-			chunk = MessageChunk.objects.create(subject = message_chunk['subject'], subject_action = message_chunk['subject_action'], action_url = message_chunk['action_url'] ,order = order)
-			activity.message_chunks.add(chunk)
-			order = order + 1 
-			# raise ValueError(activity.message_chunks.all())
+		chunks = create_message_chunks(message_chunks)
+		if chunks:
+			link_message_chunks(Activity, [activity], chunks)
 		if actor:
-			for subscriber in subscribers:
-				activity.subscribers.add(subscriber)
-				activity.subscribers.add(actor)
+			activity.subscribers.add(*(subscribers + [actor]))
 		if not activity.action_url:
 			activity.action_url = activity.get_absolute_url()
 		activity.save()
-		try:
-			subscribers = subscribers.exclude(user = request.user)
-		except:
-			if actor in subscribers:
-				subscribers = subscribers.remove(actor)
-		post_org_notification(message_chunks = message_chunks, user = subscribers, subject = subject, subject_action = subject_action, target = target, target_action = target_action, msg = message, actor = actor, action = action, url = action_url)
-		# raise ValueError(order)
+		post_org_notification(chunks = chunks, user = subscribers, subject = subject, subject_action = subject_action, target = target, target_action = target_action, msg = message, actor = actor, action = action, url = action_url)
 	elif activity_type == 1:
 		try:
 			activity = Activity.objects.get(postulate__id = postulate_id)
 		except:
 			activity = None
 		if activity:
-			for subscriber in subscribers:
-				activity.subscribers.add(subscriber)
+			if subscribers:
+				activity.subscribers.add(*subscribers)
 			activity.save()
 			post_org_notification(message_chunks = message_chunks, user = activity.subscribers.all(), msg = message, action = action, actor = actor, subject = subject, subject_action = subject_action, target_action = target_action, target = target)
-			# for subscriber in activity.subscribers:
-			# 	post_notification(user = subscriber, msg = action, url = activity.action_url, actor = actor)
 		else:
-			postulate = Postulate.objects.get(id = postulate_id)
+			postulate = Postulate.objects.select_related('vacancy').get(id = postulate_id)
 			activity = Activity.objects.create(actor = actor, message = message, action = action, activity_type = activity_type,postulate = postulate, action_url = action_url)
-			for user in [p.user for p in postulate.vacancy.company.recruiter_set.filter(membership=3)]:
-				activity.subscribers.add(user)
+			members = list(User.objects.filter(recruiter__company = postulate.vacancy.company_id, recruiter__membership = 3))
 			if company and actor:
-				activity.subscribers.add(actor)
+				members.append(actor)
+			if members:
+				activity.subscribers.add(*members)
 			activity.save()
 			post_org_notification(message_chunks = message_chunks, user = activity.subscribers.all(), actor = actor, msg = message, url = action_url, subject = subject, subject_action = subject_action, target_action = target_action, target = target, action = action)
 
@@ -24,8 +24,8 @@ from django.http import Http404, HttpResponse
 from django.shortcuts import render, render_to_response, redirect, get_object_or_404
 from django.template import RequestContext
 from TRM.settings import SITE_URL, num_pages, number_objects_page
-from TRM.context_processors import subdomain
-from companies.models import Company, Recruiter
+from TRM.tenancy import get_tenant_company
+from companies.models import Recruiter
 from activities.models import *
 # Create your views here.
 
@@ -62,9 +62,8 @@ def activities(request, activity_id=None):
                 for the company, or the requested activity is not accessible
     """
     context = {}
-    subdomain_data = subdomain(request)
     try:
-        company = Company.objects.get(subdomain__slug = subdomain_data['active_subdomain'])
+        company = get_tenant_company(request)
         recruiter = Recruiter.objects.get(company__in=[company], user = request.user)
     except:
         raise Http404
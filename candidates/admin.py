@@ -15,7 +15,8 @@ options are applied to improve usability.
 from __future__ import absolute_import
 from django.conf import settings
 from django.contrib import admin
-from candidates.models import Candidate, Expertise, Academic_Area, Academic_Status, Academic, Language_Level, Language, CV_Language, Curriculum
+from candidates.models import Candidate, Expertise, Academic_Area, Academic_Status, Academic, Language_Level, Language, CV_Language, Curriculum, \
+    CandidateSearchDocument, CurriculumText, CurriculumJob
 from common.admin import CustomModelAdminAllFields
 
 
@@ -108,3 +109,38 @@ class CurriculumAdmin(CustomModelAdminAllFields):
     list_display_links = ('id', 'candidate')
     search_fields = ('id', 'candidate__first_name')
 admin.site.register(Curriculum, CurriculumAdmin)
+
+
+class CandidateSearchDocumentAdmin(CustomModelAdminAllFields):
+    """
+    Admin interface for the `CandidateSearchDocument` model.
+
+    Documents are maintained by signals; the admin is meant for inspection only.
+    """
+    list_filter = ('last_indexed',)
+    list_display_links = ('id', 'candidate')
+    search_fields = ('id', 'candidate__id', 'candidate__first_name', 'cv_file')
+admin.site.register(CandidateSearchDocument, CandidateSearchDocumentAdmin)
+
+
+class CurriculumTextAdmin(CustomModelAdminAllFields):
+    """
+    Admin interface for the `CurriculumText` model.
+
+    Rows are filled on demand when a CV is read; deleting one only forces a new extraction.
+    """
+    list_filter = ('add_date',)
+    search_fields = ('id', 'file_hash')
+admin.site.register(CurriculumText, CurriculumTextAdmin)
+
+
+class CurriculumJobAdmin(CustomModelAdminAllFields):
+    """
+    Admin interface for the `CurriculumJob` model.
+
+    Set a failed job back to pending to retry it.
+    """
+    list_filter = ('status', 'run_after')
+    list_display_links = ('id', 'curriculum')
+    search_fields = ('id', 'curriculum__id', 'locked_by', 'last_error')
+admin.site.register(CurriculumJob, CurriculumJobAdmin)
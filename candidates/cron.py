@@ -0,0 +1,21 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from datetime import datetime
+
+from django.core.management import call_command
+
+
+def CurriculumJobsCronJob():
+    """
+    Processes the queued CV files (see candidates.processing), for setups
+    without a running process_curriculum_jobs worker. Several invocations can
+    safely run together: each job is claimed once.
+
+    Exceptions during execution are caught and printed to the console.
+    """
+    print((str(datetime.now()) + ' --> Curriculum Jobs Cron start'))
+    try:
+        call_command('process_curriculum_jobs', once=True)
+    except Exception as e:
+        print(e)
+    print((str(datetime.now()) + ' --> Curriculum Jobs Cron completed'))
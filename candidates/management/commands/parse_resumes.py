@@ -0,0 +1,80 @@
+"""
+parse_resumes.py - Parse a folder of resumes (or the uploaded CVs) in batch
+and write the extracted profiles as JSON lines (see resume_parser.batch).
+"""
+
+from __future__ import absolute_import
+from django.core.management.base import BaseCommand, CommandError
+
+from candidates.models import Curriculum
+from resume_parser.batch import iter_curricula, iter_directory, parse_batch
+
+
+class Command(BaseCommand):
+    """
+    Django management command to parse resumes with a pool of processes.
+
+    Every parsed file is appended to the output file right away. Running the
+    command again with the same output skips the files already parsed, so an
+    interrupted import can be resumed.
+    """
+
+    help = 'Parse resumes in batch and write name, email, phone, skills, education and experience as JSON lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'directory',
+            nargs='?',
+            help='Folder of resumes, parsed recursively.')
+        parser.add_argument(
+            '--curricula',
+            action='store_true',
+            default=False,
+            help='Parse the uploaded CV files instead of a folder.')
+        parser.add_argument(
+            '--output',
+            required=True,
+            help='JSON lines file receiving the results, also used as checkpoint.')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Number of processes (defaults to the number of CPUs).')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=4,
+            help='Files sent to a process at once.')
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            default=False,
+            help='Parse again the files that failed in a previous run.')
+
+    def handle(self, *args, **options):
+        """
+        Command entry point.
+
+        Args:
+            *args: Positional arguments (not used).
+            **options: directory, curricula, output, workers, chunk_size and retry_failed.
+        """
+        if bool(options['directory']) == options['curricula']:
+            raise CommandError('Give either a directory or --curricula.')
+        if options['curricula']:
+            tasks = iter_curricula(Curriculum.objects.all())
+        else:
+            tasks = iter_directory(options['directory'])
+
+        def report(record):
+            if record['error']:
+                self.stderr.write('FAILED %s (%.2fs): %s' % (record['source'], record['seconds'], record['error']))
+            elif options['verbosity'] > 1:
+                self.stdout.write('%s (%.2fs)' % (record['source'], record['seconds']))
+
+        summary = parse_batch(tasks, options['output'], workers=options['workers'],
+                              chunksize=options['chunk_size'], retry_failed=options['retry_failed'], callback=report)
+        files = summary['parsed'] + summary['failed']
+        self.stdout.write('Parsed %s files, %s failed, %s already done, in %.1fs (%.3fs per file, %.1f files/s).' % (
+            summary['parsed'], summary['failed'], summary['skipped'], summary['seconds'],
+            summary['parse_seconds'] / files if files else 0, files / summary['seconds'] if summary['seconds'] else 0))
@@ -0,0 +1,82 @@
+"""
+process_curriculum_jobs.py - Worker running the text extraction and PDF
+conversion of the uploaded CV files (see candidates.processing).
+"""
+
+from __future__ import absolute_import
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from candidates.processing import claim_jobs, complete_job, fail_job, process_file
+
+
+class Command(BaseCommand):
+    """
+    Django management command processing the queued curriculum jobs.
+
+    Keep it running next to the web server (e.g. under supervisor). Files are
+    converted by a fixed pool of processes that live as long as the worker.
+    """
+
+    help = 'Process the queued CV files (text extraction and PDF conversion).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'CURRICULUM_CONVERTER_WORKERS', 2),
+            help='Number of converter processes.')
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=5,
+            help='Seconds to wait when the queue is empty.')
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            default=False,
+            help='Exit when the queue is empty.')
+
+    def handle(self, *args, **options):
+        """
+        Command entry point.
+
+        Args:
+            *args: Positional arguments (not used).
+            **options: workers, sleep and once.
+        """
+        worker = '%s-%s' % (socket.gethostname(), os.getpid())
+        processed = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+            while True:
+                jobs = claim_jobs(worker, options['workers'])
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+                futures = []
+                for job in jobs:
+                    if not job.curriculum.file:
+                        # The file was removed after the upload, nothing left to process
+                        complete_job(job, None, None)
+                        continue
+                    path = job.curriculum.file.path
+                    futures.append((job, path, executor.submit(process_file, path)))
+                for job, path, future in futures:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write('Curriculum %s: %s' % (job.curriculum_id, e))
+                        fail_job(job, e)
+                    else:
+                        complete_job(job, path, result)
+                        processed += 1
+        self.stdout.write('Processed %s files (%s failed attempts).' % (processed, failed))
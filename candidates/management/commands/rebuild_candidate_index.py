@@ -0,0 +1,50 @@
+"""
+rebuild_candidate_index.py - Build the search documents used to filter
+applicants by text (see candidates.search).
+"""
+
+from __future__ import absolute_import
+from django.core.management.base import BaseCommand
+
+from candidates.models import Candidate
+from candidates.search import index_candidate
+
+
+class Command(BaseCommand):
+    """
+    Django management command to (re)index candidates.
+
+    Run it once after migrating. Day to day the documents are kept current by
+    the signals of the candidate and its profile sections.
+    """
+
+    help = 'Build the search documents used to filter applicants by text.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing',
+            action='store_true',
+            default=False,
+            help='Only index candidates without a search document.')
+        parser.add_argument(
+            '--refresh-cv',
+            action='store_true',
+            default=False,
+            help='Extract the CV text again even if the file did not change.')
+
+    def handle(self, *args, **options):
+        """
+        Command entry point.
+
+        Args:
+            *args: Positional arguments (not used).
+            **options: missing and refresh_cv.
+        """
+        candidates = Candidate.objects.all().select_related('user')
+        if options['missing']:
+            candidates = candidates.filter(search_document__isnull=True)
+        total = 0
+        for candidate in candidates.iterator(chunk_size=200):
+            index_candidate(candidate, refresh_cv=options['refresh_cv'])
+            total += 1
+        self.stdout.write('Indexed %s candidates.' % total)
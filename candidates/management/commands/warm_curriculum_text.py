@@ -0,0 +1,77 @@
+"""
+warm_curriculum_text.py - Fill the extracted text cache of the uploaded CVs
+(see candidates.models.CurriculumText).
+"""
+
+from __future__ import absolute_import
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+
+from candidates.models import Curriculum, CurriculumText
+from utils import get_file_hash
+
+
+def extract_file(path):
+    """
+    Hash a CV file and extract its text and preview. Runs in a worker process.
+
+    Args:
+        path (str): Absolute path of the file.
+
+    Returns:
+        tuple: (path, file hash, (text, content)), or (path, None, error message).
+    """
+    try:
+        return path, get_file_hash(path), CurriculumText.extract(path)
+    except Exception as e:
+        return path, None, '%s' % e
+
+
+class Command(BaseCommand):
+    """
+    Django management command to extract the text of every uploaded CV once.
+
+    The extraction (pdf/docx/doc converters) is CPU bound, so it runs in a pool
+    of worker processes; the cache rows are written by the main process.
+    CVs whose content is already cached are skipped.
+    """
+
+    help = 'Extract and cache the text of the uploaded CV files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Number of worker processes (defaults to the number of CPUs).')
+
+    def handle(self, *args, **options):
+        """
+        Command entry point.
+
+        Args:
+            *args: Positional arguments (not used).
+            **options: workers.
+        """
+        curricula = {}
+        for curriculum in Curriculum.objects.exclude(file='').only('id', 'file', 'file_hash').iterator(chunk_size=500):
+            curricula.setdefault(curriculum.file.path, []).append(curriculum)
+
+        cached = set(CurriculumText.objects.values_list('file_hash', flat=True))
+        pending = [path for path, items in curricula.items()
+                   if not all(item.file_hash and item.file_hash in cached for item in items)]
+
+        extracted = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+            for path, file_hash, result in executor.map(extract_file, pending, chunksize=4):
+                if file_hash is None:
+                    failed += 1
+                    self.stderr.write('%s: %s' % (path, result))
+                    continue
+                CurriculumText.get_for_file(path, file_hash, extracted=result)
+                Curriculum.objects.filter(pk__in=[item.pk for item in curricula[path]]).update(file_hash=file_hash)
+                extracted += 1
+        self.stdout.write('Cached %s CV files (%s already cached, %s failed).'
+                          % (extracted, len(curricula) - len(pending), failed))
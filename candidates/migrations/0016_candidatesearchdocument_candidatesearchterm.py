@@ -0,0 +1,41 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candidates', '0015_alter_academic_id_alter_academic_area_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CandidateSearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cv_file', models.CharField(blank=True, default='', max_length=255, verbose_name='Indexed CV file')),
+                ('cv_text', models.TextField(blank=True, default='', verbose_name='CV text')),
+                ('last_indexed', models.DateTimeField(auto_now=True, verbose_name='Last Indexed')),
+                ('candidate', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='search_document', to='candidates.candidate', verbose_name='Candidate')),
+            ],
+            options={
+                'verbose_name': 'Candidate Search Document',
+                'verbose_name_plural': 'Candidate Search Documents',
+            },
+        ),
+        migrations.CreateModel(
+            name='CandidateSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(db_index=True, max_length=50, verbose_name='Term')),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='candidates.candidate', verbose_name='Candidate')),
+            ],
+            options={
+                'verbose_name': 'Candidate Search Term',
+                'verbose_name_plural': 'Candidate Search Terms',
+                'unique_together': {('term', 'candidate')},
+            },
+        ),
+    ]
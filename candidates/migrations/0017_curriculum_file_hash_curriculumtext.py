@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candidates', '0016_candidatesearchdocument_candidatesearchterm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurriculumText',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=64, unique=True, verbose_name='File Hash')),
+                ('text', models.TextField(blank=True, default='', verbose_name='Text')),
+                ('content', models.TextField(blank=True, default='', verbose_name='Preview')),
+                ('add_date', models.DateTimeField(auto_now_add=True, verbose_name='Add Date')),
+            ],
+            options={
+                'verbose_name': 'Curriculum Text',
+                'verbose_name_plural': 'Curriculum Texts',
+            },
+        ),
+        migrations.AddField(
+            model_name='curriculum',
+            name='file_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64, verbose_name='File Hash'),
+        ),
+    ]
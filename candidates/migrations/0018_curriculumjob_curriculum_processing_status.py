@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-18 09:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('candidates', '0017_curriculum_file_hash_curriculumtext'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='curriculum',
+            name='processing_status',
+            field=models.CharField(choices=[('ready', 'Ready'), ('pending', 'Pending'), ('processing', 'Processing'), ('failed', 'Failed')], default='ready', max_length=10, verbose_name='Processing Status'),
+        ),
+        migrations.CreateModel(
+            name='CurriculumJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('run_after', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Run After')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=100, verbose_name='Locked By')),
+                ('locked_at', models.DateTimeField(blank=True, default=None, null=True, verbose_name='Locked At')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Last Error')),
+                ('add_date', models.DateTimeField(auto_now_add=True, verbose_name='Add Date')),
+                ('last_modified', models.DateTimeField(auto_now=True, verbose_name='Last Modified')),
+                ('curriculum', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='job', to='candidates.curriculum', verbose_name='Curriculum')),
+            ],
+            options={
+                'verbose_name': 'Curriculum Job',
+                'verbose_name_plural': 'Curriculum Jobs',
+            },
+        ),
+    ]
@@ -3,10 +3,10 @@
 from __future__ import absolute_import
 from __future__ import print_function
 import os
-import subprocess
 from datetime import date, timedelta, datetime
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.db.models import Q
+from django.utils import timezone
 from common.models import Gender, Marital_Status, Country, State, Municipal, Degree, Address
 from django.utils.translation import gettext_lazy as _
 from dateutil.relativedelta import relativedelta
@@ -14,7 +14,7 @@ from companies.models import *
 from django.conf import settings
 from ckeditor.fields import RichTextField
 from phonenumber_field.modelfields import PhoneNumberField
-from utils import get_file_content, get_file_text
+from utils import get_file_content, get_file_hash, get_file_text
 from phonenumber_field.modelfields import PhoneNumberField
 
 MEDIA_ROOT = settings.MEDIA_ROOT
@@ -665,6 +665,13 @@ def upload_cv_file_path(instance, filename):
     # default_cv = ''
     return 'candidates/%s/cv-file/%s' % (str(instance.candidate.id), filename)
 
+PROCESSING_STATUS_CHOICES = (
+    ('ready', _('Ready')),
+    ('pending', _('Pending')),
+    ('processing', _('Processing')),
+    ('failed', _('Failed')),
+)
+
 class Curriculum(models.Model):
     """ Indicates Curriculum Information recorded by a candiate """
     default_path = 'candidates'
@@ -684,15 +691,16 @@ class Curriculum(models.Model):
     add_date = models.DateTimeField(verbose_name=_('Add Date'), auto_now_add=True)
     last_modified = models.DateTimeField(verbose_name=_('Last Modified'), auto_now=True)
     filecontent = models.TextField(default="", null=True, blank=True)
-
+    file_hash = models.CharField(verbose_name=_('File Hash'), max_length=64, blank=True, default='', db_index=True)
+    processing_status = models.CharField(verbose_name=_('Processing Status'), choices=PROCESSING_STATUS_CHOICES, max_length=10, default='ready')
 
     def get_form(self):
         from candidates.forms import cv_FileForm
         return cv_FileForm(instance = self)
 
     def save(self, *args, **kw):
-        """Custom save method that updates file content and converts the uploaded CV to PDF."""
-        print('saving')
+        """Custom save method that queues the text extraction and PDF conversion of a new CV file
+        (see candidates.processing)."""
         updatecontent = False
         if self.pk is not None:
             orig = Curriculum.objects.get(pk=self.pk)
@@ -700,29 +708,19 @@ class Curriculum(models.Model):
                 updatecontent = True
         else:
             updatecontent = True
+        if updatecontent and self.file:
+            self.file_hash = ''
+            self.filecontent = ''
+            self.pdf_file = None
+            self.processing_status = 'pending'
         super(Curriculum, self).save(*args, **kw)
         if updatecontent and self.file:
-            updatecontent = False
-            content = get_file_content(self.file.path)
-            try:
-                self.filecontent = content
-            except:
-                try:
-                    self.filecontent = content.encode('ascii')
-                except:
-                    self.filecontent = content.encode('utf8').decode('ascii','ignore')
-            file_name = self.file.name.split("/")[-1]
-            name = file_name.split(".")[0]
-            ext = file_name.split(".")[-1]
-            dir_path = os.path.dirname(self.file.path)
-            if ext != 'pdf':
-                subprocess.call(['libreoffice', '--headless', '--convert-to', 'pdf', MEDIA_ROOT + "/" + self.file.name, '--outdir', dir_path])
-            pdf_name = dir_path + "/" + name + ".pdf"
-            self.pdf_file = pdf_name.replace(MEDIA_ROOT, '').strip('\\/')
-            self.save()
-#             self.filecontent = str(get_file_content(self.file.path))
-#             self.save()
+            from candidates.processing import enqueue_curriculum
+            enqueue_curriculum(self)
 
+    def is_processing(self):
+        """Returns True while the uploaded file is waiting for (or going through) background processing."""
+        return self.processing_status in ('pending', 'processing')
 
     def set_advance(self):
         """Calculates and sets the 'advance' field representing the percentage completion of the curriculum sections."""
@@ -760,13 +758,34 @@ class Curriculum(models.Model):
         ext = ext[1:].lower()
         return ext
 
+    def extracted_text(self):
+        """Returns the CurriculumText of the current file version, extracting it only once per content hash.
+        Curricula saved before the cache existed get their hash computed on first use."""
+        if not self.file:
+            return None
+        cached = getattr(self, '_extracted_text', None)
+        if cached is not None and self.file_hash and cached.file_hash == self.file_hash:
+            return cached
+        if not self.file_hash:
+            self.file_hash = get_file_hash(self.file.path)
+            if self.pk:
+                Curriculum.objects.filter(pk=self.pk).update(file_hash=self.file_hash)
+        self._extracted_text = CurriculumText.get_for_file(self.file.path, self.file_hash)
+        return self._extracted_text
+
     def file_content(self):
-        """Reads and returns the full content of the uploaded CV file."""
-        return get_file_content(self.file.path)
+        """Returns the preview (HTML or text) of the uploaded CV file, served from the extracted text cache."""
+        extracted = self.extracted_text()
+        if extracted is None:
+            return ""
+        return extracted.content
 
     def file_text(self):
-        """Reads and returns the extracted text from the uploaded CV file."""
-        return get_file_text(self.file.path)
+        """Returns the plain text of the uploaded CV file, served from the extracted text cache."""
+        extracted = self.extracted_text()
+        if extracted is None:
+            return ""
+        return extracted.text
 
     def __unicode__(self):
         """ Returns a string representation of the curriculum showing candidate's name and ID."""
@@ -777,7 +796,149 @@ class Curriculum(models.Model):
         verbose_name_plural = _('Curricula')
         ordering = ['-advance']
 
+class CurriculumText(models.Model):
+    """ Extracted plain text and preview of a CV file version, shared by every curriculum with the same content """
+    file_hash = models.CharField(verbose_name=_('File Hash'), max_length=64, unique=True)
+    text = models.TextField(verbose_name=_('Text'), blank=True, default='')
+    content = models.TextField(verbose_name=_('Preview'), blank=True, default='')
+    add_date = models.DateTimeField(verbose_name=_('Add Date'), auto_now_add=True)
+
+    @classmethod
+    def extract(cls, path):
+        """Runs the (slow) text and preview extraction of a file. Returns a (text, content) tuple."""
+        text = get_file_text(path)
+        if isinstance(text, bytes):
+            text = text.decode('utf8', 'ignore')
+        return text, get_file_content(path)
+
+    @classmethod
+    def get_for_file(cls, path, file_hash, extracted=None):
+        """Returns the cached extraction for a file version, extracting and storing it if missing.
+
+        extracted may hold an already computed (text, content) tuple, e.g. from a worker process."""
+        try:
+            return cls.objects.get(file_hash=file_hash)
+        except cls.DoesNotExist:
+            pass
+        text, content = extracted or cls.extract(path)
+        try:
+            with transaction.atomic():
+                return cls.objects.create(file_hash=file_hash, text=text, content=content)
+        except IntegrityError:
+            # Extracted concurrently by another process
+            return cls.objects.get(file_hash=file_hash)
+
+    def __unicode__(self):
+        """ Returns a string representation of the cached extraction showing the file hash."""
+        return self.file_hash
+
+    class Meta:
+        verbose_name = _('Curriculum Text')
+        verbose_name_plural = _('Curriculum Texts')
+
+JOB_STATUS_CHOICES = (
+    ('pending', _('Pending')),
+    ('processing', _('Processing')),
+    ('done', _('Done')),
+    ('failed', _('Failed')),
+)
+
+class CurriculumJob(models.Model):
+    """ Background processing (text extraction and PDF conversion) of the file of a curriculum """
+    curriculum = models.OneToOneField(Curriculum, verbose_name=_('Curriculum'), related_name='job', on_delete=models.CASCADE)
+    status = models.CharField(verbose_name=_('Status'), choices=JOB_STATUS_CHOICES, max_length=10, default='pending', db_index=True)
+    attempts = models.PositiveIntegerField(verbose_name=_('Attempts'), default=0)
+    run_after = models.DateTimeField(verbose_name=_('Run After'), default=timezone.now, db_index=True)
+    locked_by = models.CharField(verbose_name=_('Locked By'), max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(verbose_name=_('Locked At'), blank=True, null=True, default=None)
+    last_error = models.TextField(verbose_name=_('Last Error'), blank=True, default='')
+    add_date = models.DateTimeField(verbose_name=_('Add Date'), auto_now_add=True)
+    last_modified = models.DateTimeField(verbose_name=_('Last Modified'), auto_now=True)
+
+    def __unicode__(self):
+        """ Returns a string representation of the job showing the curriculum ID and its status."""
+        return 'Curriculum %s - %s' % (str(self.curriculum_id), self.status)
+
+    class Meta:
+        verbose_name = _('Curriculum Job')
+        verbose_name_plural = _('Curriculum Jobs')
+
 ## End of Section Curriculum ""
 
 
+## Section start Search Index ""
+class CandidateSearchDocument(models.Model):
+    """ Denormalized search document of a candidate, used to filter applicants by text """
+    candidate = models.OneToOneField(Candidate, verbose_name=candidate, related_name='search_document', on_delete=models.CASCADE)
+    cv_file = models.CharField(verbose_name=_('Indexed CV file'), max_length=255, blank=True, default='')
+    cv_text = models.TextField(verbose_name=_('CV text'), blank=True, default='')
+    last_indexed = models.DateTimeField(verbose_name=_('Last Indexed'), auto_now=True)
+
+    def __unicode__(self):
+        """ Returns a string representation of the search document showing the candidate ID."""
+        return 'Search document - Id: %s' % str(self.candidate_id)
+
+    class Meta:
+        verbose_name = _('Candidate Search Document')
+        verbose_name_plural = _('Candidate Search Documents')
+
+class CandidateSearchTerm(models.Model):
+    """ Indexed term of a candidate search document (profile, sections and CV text) """
+    candidate = models.ForeignKey(Candidate, verbose_name=candidate, related_name='search_terms', on_delete=models.CASCADE)
+    term = models.CharField(verbose_name=_('Term'), max_length=50, db_index=True)
+
+    def __unicode__(self):
+        return self.term
+
+    class Meta:
+        verbose_name = _('Candidate Search Term')
+        verbose_name_plural = _('Candidate Search Terms')
+        unique_together = ('term', 'candidate')
+
+def update_candidate_search_index(sender, instance, **kwargs):
+    """ Refreshes the search document of the candidate owning a saved or deleted profile section."""
+    from candidates.search import index_candidate
+    if isinstance(kwargs.get('origin'), Candidate):
+        # The whole candidate is being deleted, its document goes with it
+        return
+    if sender is Candidate:
+        index_candidate(instance)
+    elif instance.candidate_id:
+        try:
+            index_candidate(Candidate.objects.get(pk=instance.candidate_id), refresh_cv=sender is Curriculum)
+        except Candidate.DoesNotExist:
+            pass
+
+def update_candidate_email_search_index(sender, instance, **kwargs):
+    """ Refreshes the search document when the e-mail of a candidate user changes."""
+    from candidates.search import index_candidate
+    update_fields = kwargs.get('update_fields')
+    if update_fields and 'email' not in update_fields:
+        return
+    for candidate_obj in Candidate.objects.filter(user=instance):
+        index_candidate(candidate_obj)
+
+for search_sender in (Candidate, Expertise, Academic, CV_Language, Training, Certificate, Project, Curriculum):
+    models.signals.post_save.connect(update_candidate_search_index, sender=search_sender)
+    if search_sender is not Candidate:
+        models.signals.post_delete.connect(update_candidate_search_index, sender=search_sender)
+models.signals.post_save.connect(update_candidate_email_search_index, sender=settings.AUTH_USER_MODEL)
+
+def invalidate_candidate_pdf(sender, instance, **kwargs):
+    """ Drops the cached profile PDFs of the candidate owning a saved or deleted profile section."""
+    from common.pdf_cache import invalidate_pdf_cache
+    if sender is Candidate:
+        invalidate_pdf_cache('curriculum', [instance.pk])
+    elif sender._meta.label == settings.AUTH_USER_MODEL:
+        invalidate_pdf_cache('curriculum', Candidate.objects.filter(user=instance).values_list('id', flat=True))
+    elif instance.candidate_id:
+        invalidate_pdf_cache('curriculum', [instance.candidate_id])
+
+for pdf_sender in (Candidate, Expertise, Academic, CV_Language, Training, Certificate, Project):
+    models.signals.post_save.connect(invalidate_candidate_pdf, sender=pdf_sender)
+    models.signals.post_delete.connect(invalidate_candidate_pdf, sender=pdf_sender)
+models.signals.post_save.connect(invalidate_candidate_pdf, sender=settings.AUTH_USER_MODEL)
+
+## End of Section Search Index ""
+
 ### IF YOU ADD ADDITIONAL MODELS, DO NOT FORGET TO REGISTER THEM IN ADMIN ###
\ No newline at end of file
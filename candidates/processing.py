@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Background processing of the uploaded CV files.
+
+``Curriculum.save`` used to extract the text of a new file and convert it to
+PDF with LibreOffice inside the request, then save itself again. A DOCX upload
+blocked the web worker for seconds and concurrent uploads started competing
+LibreOffice instances on the same user profile.
+
+Saving a curriculum now only queues a ``CurriculumJob``. The
+``process_curriculum_jobs`` command (kept running, or run every minute by
+``candidates.cron.CurriculumJobsCronJob``) claims due jobs and runs them in a
+bounded pool of long-lived converter processes, each with its own LibreOffice
+profile. Results are written back by the worker, failures are retried with an
+exponential backoff and the curriculum ``processing_status`` tells the UI
+whether the preview is ready.
+
+Set ``CURRICULUM_PROCESSING_EAGER = True`` to process the files inline
+(development setups without a running worker).
+"""
+
+from __future__ import absolute_import
+import os
+import subprocess
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from candidates.models import Curriculum, CurriculumJob, CurriculumText
+from utils import get_file_hash
+
+MAX_ATTEMPTS = getattr(settings, 'CURRICULUM_PROCESSING_MAX_ATTEMPTS', 5)
+RETRY_DELAY = getattr(settings, 'CURRICULUM_PROCESSING_RETRY_DELAY', 60)
+CONVERSION_TIMEOUT = getattr(settings, 'CURRICULUM_CONVERSION_TIMEOUT', 120)
+# A job locked for longer than this is considered abandoned by a dead worker
+LOCK_TIMEOUT = getattr(settings, 'CURRICULUM_PROCESSING_LOCK_TIMEOUT', 900)
+
+
+def enqueue_curriculum(curriculum):
+    """
+    Queue the processing of the current file of a curriculum.
+
+    A job already queued or running for a previous file is reset, so the
+    result of the old file is discarded when it completes.
+
+    Args:
+        curriculum (Curriculum): Saved curriculum with a new file.
+
+    Returns:
+        CurriculumJob: The queued job.
+    """
+    job, created = CurriculumJob.objects.update_or_create(curriculum=curriculum, defaults={
+        'status': 'pending',
+        'attempts': 0,
+        'run_after': timezone.now(),
+        'locked_by': '',
+        'locked_at': None,
+        'last_error': '',
+    })
+    if getattr(settings, 'CURRICULUM_PROCESSING_EAGER', False):
+        transaction.on_commit(lambda: run_inline(job.pk))
+    return job
+
+
+def claim_jobs(worker, limit):
+    """
+    Lock up to ``limit`` due jobs for a worker.
+
+    Rows are selected with ``SKIP LOCKED`` where the database supports it, so
+    several workers never pick the same job. Jobs left in processing by a dead
+    worker are claimed again once their lock expires, unless they used up
+    ``MAX_ATTEMPTS``: those are marked failed.
+
+    Args:
+        worker (str): Identifier of the worker.
+        limit (int): Maximum number of jobs.
+
+    Returns:
+        list: The claimed jobs with their curriculum.
+    """
+    now = timezone.now()
+    stale = Q(status='processing', locked_at__lt=now - timedelta(seconds=LOCK_TIMEOUT))
+    due = Q(status='pending', run_after__lte=now) | (stale & Q(attempts__lt=MAX_ATTEMPTS))
+    with transaction.atomic():
+        # A job whose worker died on every attempt (e.g. a file crashing the converter) is not retried forever
+        abandoned = list(CurriculumJob.objects.select_for_update(skip_locked=True)
+                         .filter(stale, attempts__gte=MAX_ATTEMPTS).values_list('id', flat=True))
+        if abandoned:
+            CurriculumJob.objects.filter(pk__in=abandoned).update(
+                status='failed', locked_at=None, last_error='Abandoned after %s attempts' % MAX_ATTEMPTS)
+            Curriculum.objects.filter(job__in=abandoned).update(processing_status='failed')
+        ids = list(CurriculumJob.objects.select_for_update(skip_locked=True).filter(due)
+                   .order_by('run_after', 'id').values_list('id', flat=True)[:limit])
+        CurriculumJob.objects.filter(pk__in=ids).update(
+            status='processing', locked_by=worker, locked_at=now, attempts=F('attempts') + 1)
+        Curriculum.objects.filter(job__in=ids).update(processing_status='processing')
+    return list(CurriculumJob.objects.filter(pk__in=ids, locked_by=worker).select_related('curriculum'))
+
+
+def _converter_profile():
+    """
+    LibreOffice user profile of the current process. Two instances sharing a
+    profile lock each other out, so every converter process gets its own.
+    """
+    path = os.path.join(tempfile.gettempdir(), 'trm-libreoffice-%s' % os.getpid())
+    return 'file://' + path
+
+
+def convert_to_pdf(path):
+    """
+    Convert a document to PDF next to the original file.
+
+    Args:
+        path (str): Absolute path of the document.
+
+    Returns:
+        str: Absolute path of the PDF.
+    """
+    dir_path = os.path.dirname(path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    if not path.lower().endswith('.pdf'):
+        subprocess.run(['libreoffice', '-env:UserInstallation=%s' % _converter_profile(), '--headless',
+                        '--convert-to', 'pdf', path, '--outdir', dir_path],
+                       check=True, timeout=CONVERSION_TIMEOUT, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return os.path.join(dir_path, name + '.pdf')
+
+
+def process_file(path):
+    """
+    Hash, extract and convert a CV file. Runs in a converter process and does
+    not touch the database.
+
+    Args:
+        path (str): Absolute path of the file.
+
+    Returns:
+        dict: ``file_hash``, ``text``, ``content`` and ``pdf_path``.
+    """
+    text, content = CurriculumText.extract(path)
+    return {
+        'file_hash': get_file_hash(path),
+        'text': text,
+        'content': content,
+        'pdf_path': convert_to_pdf(path),
+    }
+
+
+def complete_job(job, path, result):
+    """
+    Store the result of a job, unless the curriculum file changed meanwhile.
+
+    Args:
+        job (CurriculumJob): Claimed job.
+        path (str): Processed file, or None if the file was removed.
+        result (dict): Output of ``process_file``, or None if the file was removed.
+
+    Returns:
+        bool: Whether the result was stored.
+    """
+    from candidates.search import index_candidate
+    values = {'processing_status': 'ready'}
+    if result is not None:
+        extracted = CurriculumText.get_for_file(path, result['file_hash'], extracted=(result['text'], result['content']))
+        values.update(file_hash=extracted.file_hash, filecontent=extracted.content,
+                      pdf_file=result['pdf_path'].replace(settings.MEDIA_ROOT, '').strip('\\/'))
+    with transaction.atomic():
+        # A new upload resets the job to pending; its result is then stale
+        if not CurriculumJob.objects.filter(pk=job.pk, status='processing', locked_by=job.locked_by) \
+                .update(status='done', locked_at=None, last_error=''):
+            return False
+        Curriculum.objects.filter(pk=job.curriculum_id).update(**values)
+    curriculum = Curriculum.objects.select_related('candidate').get(pk=job.curriculum_id)
+    if curriculum.candidate_id:
+        index_candidate(curriculum.candidate, refresh_cv=True)
+    return True
+
+
+def fail_job(job, error):
+    """
+    Record a failed attempt. The job is retried with an exponential backoff
+    until ``MAX_ATTEMPTS`` is reached, then the curriculum is marked failed.
+
+    Args:
+        job (CurriculumJob): Claimed job.
+        error: The exception or message.
+    """
+    with transaction.atomic():
+        if job.attempts >= MAX_ATTEMPTS:
+            if CurriculumJob.objects.filter(pk=job.pk, status='processing', locked_by=job.locked_by) \
+                    .update(status='failed', locked_at=None, last_error='%s' % error):
+                Curriculum.objects.filter(pk=job.curriculum_id).update(processing_status='failed')
+        else:
+            run_after = timezone.now() + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1))
+            if CurriculumJob.objects.filter(pk=job.pk, status='processing', locked_by=job.locked_by) \
+                    .update(status='pending', locked_at=None, run_after=run_after, last_error='%s' % error):
+                Curriculum.objects.filter(pk=job.curriculum_id).update(processing_status='pending')
+
+
+def run_inline(job_id):
+    """
+    Process a job in the current process (``CURRICULUM_PROCESSING_EAGER``).
+
+    Args:
+        job_id (int): Id of the job.
+    """
+    worker = 'inline-%s' % os.getpid()
+    now = timezone.now()
+    if not CurriculumJob.objects.filter(pk=job_id, status='pending').update(
+            status='processing', locked_by=worker, locked_at=now, attempts=F('attempts') + 1):
+        return
+    job = CurriculumJob.objects.select_related('curriculum').get(pk=job_id)
+    path = job.curriculum.file.path
+    try:
+        result = process_file(path)
+    except Exception as e:
+        fail_job(job, e)
+    else:
+        complete_job(job, path, result)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Search index of candidates.
+
+Filtering the applicants of a process by text used to run, for every term and
+every application, one icontains query per profile section plus a fresh text
+extraction of the CV file. Each candidate now has a denormalized search
+document (profile fields, experience, academics, languages, trainings,
+certificates, projects and the extracted CV text) whose terms are stored in
+the indexed ``CandidateSearchTerm`` table.
+
+The document is refreshed by the post_save/post_delete signals of the
+candidate and its sections (see the end of ``candidates.models``). The CV is
+only re-extracted when the curriculum file changes. ``rebuild_candidate_index``
+fills the index for existing candidates.
+"""
+
+from __future__ import absolute_import
+from functools import reduce
+from operator import and_, or_
+
+from django.db import transaction
+from django.db.models import Q
+
+from candidates.models import CandidateSearchDocument, CandidateSearchTerm
+from utils import tokenize
+
+PROFILE_FIELDS = ('first_name', 'last_name', 'objective', 'interests', 'hobbies', 'others', 'skills',
+                  'extra_curriculars', 'public_email')
+
+
+def profile_texts(candidate):
+    """
+    Collect the searchable texts of a candidate profile and its sections.
+
+    Args:
+        candidate (Candidate): The candidate to describe.
+
+    Returns:
+        list: Texts (some may be None).
+    """
+    texts = [getattr(candidate, field) for field in PROFILE_FIELDS]
+    if candidate.user_id:
+        texts.append(candidate.user.email)
+    for training in candidate.training_set.all():
+        texts += [training.name, training.description]
+    for certificate in candidate.certificate_set.all():
+        texts += [certificate.name, certificate.description]
+    for project in candidate.project_set.all():
+        texts += [project.name, project.description]
+    for expertise in candidate.expertise_set.all().select_related('industry'):
+        texts += [expertise.company, expertise.employment, expertise.tasks,
+                  expertise.industry.name if expertise.industry else None]
+    for academic in candidate.academic_set.all().select_related('degree'):
+        texts += [academic.area, academic.course_name, academic.school,
+                  academic.degree.name if academic.degree else None]
+    for cv_language in candidate.cv_language_set.all().select_related('language'):
+        if cv_language.language:
+            texts.append(cv_language.language.name)
+    return texts
+
+
+def index_candidate(candidate, refresh_cv=False):
+    """
+    Rebuild the search document and terms of a candidate.
+
+    Args:
+        candidate (Candidate): The candidate to index.
+        refresh_cv (bool): Extract the CV text again even if the file did not change.
+
+    Returns:
+        CandidateSearchDocument: The updated document.
+    """
+    document, created = CandidateSearchDocument.objects.get_or_create(candidate=candidate)
+    curriculum = candidate.curriculum_set.all().first()
+    cv_file = curriculum.file.name if curriculum and curriculum.file else ''
+    if curriculum and curriculum.is_processing():
+        # Indexed by the processing worker once the text is extracted
+        cv_file, refresh_cv = document.cv_file, False
+    if cv_file != document.cv_file or (refresh_cv and cv_file):
+        cv_text = ''
+        if cv_file:
+            try:
+                cv_text = curriculum.file_text()
+            except Exception:
+                # Missing or unreadable file, the profile is still indexed
+                cv_text = ''
+        if isinstance(cv_text, bytes):
+            cv_text = cv_text.decode('utf8', 'ignore')
+        document.cv_file = cv_file
+        document.cv_text = cv_text
+
+    terms = set()
+    for text in profile_texts(candidate) + [document.cv_text]:
+        terms.update(tokenize(text))
+
+    with transaction.atomic():
+        document.save()
+        CandidateSearchTerm.objects.filter(candidate=candidate).delete()
+        CandidateSearchTerm.objects.bulk_create([
+            CandidateSearchTerm(candidate=candidate, term=term) for term in terms
+        ])
+    return document
+
+
+def text_condition(texts, prefix=''):
+    """
+    Build the condition matching candidates for a list of search texts.
+
+    A candidate matches a text when every word of the text starts an indexed
+    term of its document; it matches the list when it matches any text.
+
+    Args:
+        texts (list): Search texts, e.g. ['python', 'new delhi'].
+        prefix (str): Lookup path from the filtered model to the candidate,
+            e.g. 'postulate__candidate__'.
+
+    Returns:
+        Q or None: The condition, or None if no text has searchable words.
+    """
+    conditions = []
+    for text in texts:
+        words = tokenize(text)
+        if not words:
+            continue
+        conditions.append(reduce(and_, [
+            Q(**{prefix + 'id__in': CandidateSearchTerm.objects.filter(term__startswith=word).values('candidate')})
+            for word in words
+        ]))
+    if not conditions:
+        return None
+    return reduce(or_, conditions)
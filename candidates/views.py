@@ -13,10 +13,9 @@ from django.contrib.auth.decorators import login_required
 from django.utils.translation import gettext_lazy as _
 from django.urls import reverse
 from django.http import Http404, JsonResponse
-from django.http import Http404, JsonResponse, HttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.template import RequestContext
-from weasyprint import HTML
+from common.pdf_cache import cached_pdf_response, viewer_scope
 from companies.models import Company_Industry
 from .forms import AcademicForm, CandidateForm, CvLanguageForm, ExpertiseForm, ObjectiveForm, \
     cv_FileForm, TrainingForm, CertificateForm, ProjectForm, InterestsForm, \
@@ -624,42 +623,39 @@ def curriculum_to_pdf(request, candidate_id, template=None):
         template (str, optional): Template to use for PDF rendering. Defaults to None.
 
     Returns:
-        HttpResponse: PDF file response with the candidate's CV.
+        HttpResponse: Streamed PDF file response with the candidate's CV (cached until
+        the profile changes), or 304 Not Modified.
     """
     from django.template.loader import render_to_string
     from TRM.settings import MEDIA_URL
 
     candidate = get_object_or_404(Candidate, pk=candidate_id)
-    academics = Academic.objects.filter(candidate=candidate)
-    expertises = Expertise.objects.filter(candidate=candidate)
-    languages = CV_Language.objects.filter(candidate=candidate)
-    trainings = Training.objects.filter(candidate=candidate)
-    certificates = Certificate.objects.filter(candidate=candidate)
-    projects = Project.objects.filter(candidate=candidate)
-    # softwares = CV_Software.objects.filter(candidate=candidate)
     today = datetime.now().date()
     logo_pdf = 'logos_TRM/logo_pdf.png'
     pdf_name = '%s_%s_%s.pdf' % (candidate.first_name, candidate.last_name, candidate.pk)
-    html_string = render_to_string('curriculum_to_pdf.html',
-                                    context={'user': request.user,
-                                             'today': today,
-                                             'candidate': candidate,
-                                             'academics': academics,
-                                             'expertises': expertises,
-                                             'languages': languages,
-                                             'trainings': trainings,
-                                             'certificates': certificates,
-                                             'projects': projects,
-                                             # 'softwares': softwares,
-                                             'MEDIA_URL': MEDIA_URL,
-                                             'logo_pdf': logo_pdf,
-                                    })
-    
-    # Generate PDF using WeasyPrint
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="%s"' % pdf_name
-    HTML(string=html_string, base_url=request.build_absolute_uri('/')).write_pdf(response)
-    return response
+
+    def render_html():
+        profile = Candidate.objects.select_related('user', 'gender').get(pk=candidate.pk)
+        return render_to_string('curriculum_to_pdf.html',
+                                context={'user': request.user,
+                                         'today': today,
+                                         'candidate': profile,
+                                         'academics': Academic.objects.filter(candidate=candidate),
+                                         'expertises': Expertise.objects.filter(candidate=candidate).select_related('country'),
+                                         'languages': CV_Language.objects.filter(candidate=candidate).select_related('language'),
+                                         'trainings': Training.objects.filter(candidate=candidate),
+                                         'certificates': Certificate.objects.filter(candidate=candidate),
+                                         'projects': Project.objects.filter(candidate=candidate),
+                                         # 'softwares': CV_Software.objects.filter(candidate=candidate),
+                                         'MEDIA_URL': MEDIA_URL,
+                                         'logo_pdf': logo_pdf,
+                                })
+
+    # PDF rendered with WeasyPrint once per profile version, day and viewer
+    # scope, the durations of current jobs depend on today (see common.pdf_cache)
+    variant = 'cv_%s' % viewer_scope(request.user, candidate.user)
+    return cached_pdf_response(request, 'curriculum', candidate.pk, variant, pdf_name, render_html,
+                               request.build_absolute_uri('/'), version=today.isoformat())
 
 def create_candidates(request):
     """
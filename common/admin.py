@@ -20,7 +20,7 @@ from django.contrib import admin
 from django.contrib.auth.models import Group
 from django.contrib.sites.models import Site
 from common.models import Profile, User, AccountVerification, EmailVerification, Employment_Type, Country,\
-    Address, Degree, Marital_Status, Gender, Subdomain, SocialAuth
+    Address, Degree, Marital_Status, Gender, Subdomain, SocialAuth, CronLock, OutboundEmail
 
 admin.site.unregister(Group)
 # admin.site.unregister(Site)
@@ -131,4 +131,21 @@ class SocialAuthAdmin(admin.ModelAdmin):
     list_filter = ('social_code',)
     search_fields = ('user__first_name','user__last_name', 'user__username', 'user__email')
     actions_on_bottom = True
-admin.site.register(SocialAuth, SocialAuthAdmin)
\ No newline at end of file
+admin.site.register(SocialAuth, SocialAuthAdmin)
+class CronLockAdmin(CustomModelAdminAllFields):
+    """Admin interface for the Cron Lock model."""
+    list_display_links = ('id', 'name')
+admin.site.register(CronLock, CronLockAdmin)
+
+class OutboundEmailAdmin(admin.ModelAdmin):
+    """
+    Admin interface for the Outbound Email model.
+
+    Lists the queued emails with their delivery status and last error.
+    """
+    list_display = ('id', 'subject', 'to', 'status', 'attempts', 'run_after', 'sent_at')
+    list_display_links = ('id', 'subject')
+    list_filter = ('status',)
+    search_fields = ('subject', 'to')
+    readonly_fields = ('add_date', 'sent_at')
+admin.site.register(OutboundEmail, OutboundEmailAdmin)
@@ -78,6 +78,7 @@ from __future__ import absolute_import
 from __future__ import print_function
 import json
 import traceback
+from activities.stream import notification_stream
 from activities.utils import *
 from candidates.forms import AcademicForm, CandidateForm, CvLanguageForm, ExpertiseForm, ObjectiveForm, cv_FileForm, \
     TrainingForm, CertificateForm, ProjectForm, InterestsForm, HobbiesForm, ExtraCurricularsForm, OthersForm, CandidateContactForm
@@ -96,7 +97,7 @@ from django.contrib.messages import get_messages
 from django.core import serializers
 from django.urls import reverse
 from django.db.models import Q
-from django.http import HttpResponse, Http404, JsonResponse
+from django.http import HttpResponse, Http404, JsonResponse, StreamingHttpResponse
 from hashids import Hashids
 from payments.models import *
 from django.shortcuts import get_object_or_404, render
@@ -107,102 +108,37 @@ from django.utils.html import strip_tags
 from django.utils.translation import gettext as _
 from django.views.decorators.csrf import csrf_exempt
 from scheduler.models import Schedule
-from TRM.context_processors import subdomain
+from TRM.tenancy import get_tenant, get_tenant_company
 from TRM.settings import ROOT_DOMAIN, STATIC_URL
 from urllib.parse import parse_qsl
 from utils import validate_code, posttofbprofile, posttofbgroup,posttofbpage, posttoliprofile, posttolicompany, posttotwitter
+from vacancies.candidate_filter import CandidateFilter, filter_stage_candidates
 from vacancies.forms import Public_FilesForm, diff_month
 from vacancies.models import Question, VacancyStage, Vacancy, Comment, Postulate_Stage, Postulate_Score
 from vacancies.models import Vacancy, Postulate, Salary_Type, Candidate_Fav , VacancyTags
+from vacancies.pipeline import COMPARE_CHUNK_SIZE, COMPARE_MAX_CANDIDATES, load_compared_candidates
 from validate_email import validate_email
 
 def filter_text_from_profile(arr=[], postulate_ids = [], public = False):
     """Filter candidate profiles based on text search criteria.
 
+    Profile fields, profile sections and the CV text are matched through the
+    candidate search index (see candidates.search), so any number of terms is
+    answered with a single query.
+
     Args:
-        arr (list): List of search terms to filter by
-        postulate_ids (list): List of postulate IDs to search within
+        arr (list): List of search terms to filter by (a postulate matches any of them)
+        postulate_ids (list or QuerySet): Postulate stage IDs to search within
         public (bool): Whether to search in public postulates
 
     Returns:
         list: List of matching postulate IDs
     """
-    postulates = Postulate_Stage.objects.filter(id__in=postulate_ids)
-    pps = Postulate_Stage.objects.none()
-    for text in arr:
-        pp = postulates.filter(Q(postulate__candidate__first_name__icontains=text) \
-                            | Q(postulate__candidate__last_name__icontains = text) \
-                            | Q(postulate__candidate__objective__icontains = text) \
-                            | Q(postulate__candidate__interests__icontains = text) \
-                            | Q(postulate__candidate__hobbies__icontains = text) \
-                            | Q(postulate__candidate__others__icontains = text) \
-                            | Q(postulate__candidate__skills__icontains = text) \
-                            | Q(postulate__candidate__extra_curriculars__icontains = text) \
-                            | Q(postulate__candidate__public_email__icontains = text) \
-                            | Q(postulate__description__icontains = text) \
-                            | Q(postulate__candidate__user__email__icontains = text) \
-                        )
-        pps = pps | pp
-        ids = []
-        for postulate in postulates:
-            filtera = postulate.postulate.candidate.training_set.all().filter( \
-                    Q(name__icontains = text) \
-                    | Q(description__icontains = text) \
-                )
-            if filtera:
-                ids = ids + [postulate.id]
-                continue
-            filterb = postulate.postulate.candidate.certificate_set.all().filter( \
-                    Q(name__icontains = text) \
-                    | Q(description__icontains = text) \
-                )
-            if filterb:
-                ids = ids + [postulate.id]
-                continue
-            filterc = postulate.postulate.candidate.project_set.all().filter( \
-                    Q(name__icontains = text) \
-                    | Q(description__icontains = text) \
-                )
-            if filterc:
-                ids = ids + [postulate.id]
-                continue
-            filterd = postulate.postulate.candidate.expertise_set.all().filter( \
-                    Q(company__icontains = text) \
-                    | Q(employment__icontains = text) \
-                    | Q(tasks__icontains = text) \
-                    | Q(industry__name__icontains = text) \
-                )
-            if filterd:
-                ids = ids + [postulate.id]
-                continue
-            filtere = postulate.postulate.candidate.academic_set.all().filter( \
-                    Q(area__icontains = text) \
-                    | Q(course_name__icontains = text) \
-                    | Q(school__icontains = text) \
-                    | Q(degree__name__icontains = text) \
-                )
-            if filtere:
-                ids = ids + [postulate.id]
-                continue
-            filterf = postulate.postulate.candidate.cv_language_set.all().filter( \
-                    Q(language__name__icontains = text) \
-                )
-            if filterf:
-                ids = ids + [postulate.id]
-                continue
-            filterg = False
-            text = text.lower()
-            curriculum = postulate.postulate.candidate.curriculum_set.all()[0]
-            if curriculum.file:
-                ftext = curriculum.file_text().lower()
-                if text in ftext:
-                    filterg = True
-            if filterg:
-                ids = ids + [postulate.id]
-                continue                    
-        pp = postulates.filter(id__in=ids)
-        pps = pps | pp
-    return list(set([p.id for p in pps]))
+    condition = CandidateFilter(texts=arr).text_condition()
+    if condition is None:
+        return []
+    postulates = Postulate_Stage.objects.filter(id__in=postulate_ids).filter(condition)
+    return list(postulates.values_list('id', flat=True).distinct())
 
 def companies_change_academic_area(request):
     """Update available careers based on selected academic area.
@@ -512,11 +448,10 @@ def add_stage(request):
     context={}
     context['success'] = False
     context['auth'] = request.is_ajax()
-    subdomain_data = subdomain(request)
     if request.is_ajax() and request.user.is_authenticated:
         stage_name = request.POST['stage_name']
         try:
-            company = Company.objects.get(subdomain__slug=subdomain_data['active_subdomain'])
+            company = get_tenant_company(request)
         except:
             company = None
         if company and company.check_service('AT_CUSTOM_HIRING_PROCESS'):
@@ -2010,301 +1945,110 @@ def pricing_request(request):
 
 @csrf_exempt
 def compare_candidates(request):
-    context={}
-    if request.method == 'POST' or request.method == 'GET':
-        if request.method == 'POST':
-            vacancy_stage_id = request.POST.get('vsid',0)
-            Candidates = request.POST.get('cids',None)
-            if Candidates:
-                Candidates = Candidates.split(',')
-            # Public_candidates = request.POST.get('pcids',None)
-            # if Public_candidates:
-            #     Public_candidates = Public_candidates.split(',')
-        else:            
-            vacancy_stage_id = request.GET.get('vsid',0)
-            Candidates = request.GET.get('cids')
-            if Candidates:
-                Candidates = Candidates.split(',')
-            # Public_candidates = request.GET.get('pcids')
-            # if Public_candidates:
-            #     Public_candidates = Public_candidates.split(',')
-        context['current_process'] = None
-        # context['public_candidates'] = None
-        context['candidates'] = None
-        subdomain_data = subdomain(request)
-        # candidate processes
-        if request.user.is_authenticated:
-            # raise ValueError()
-            try:
-                recruiter = Recruiter.objects.get(user=request.user, user__is_active=True, company__subdomain__slug=subdomain_data['active_subdomain'])
-            except:
-                raise ValueError()
-            if vacancy_stage_id:
-                # try:
-                vacancy_stage = VacancyStage.objects.get(id = vacancy_stage_id)
-                context['current_process'] = vacancy_stage
-                candidates = []
-                count = 0
-                if Candidates:
-                    for candidate in Candidates:
-                        count += 1
-                        postulate = Postulate.objects.filter(id = int(candidate.strip()))
-                        if postulate:
-                            postulate = postulate[0]
-                            postulate.processes = postulate.postulate_stage_set.all()
-                            postulate.process = postulate.processes.filter(vacancy_stage = vacancy_stage)
-                            postulate.checkbox_id = '-0-'+str(postulate.id)
-                            candidates += [postulate]
-                        else:
-                            raise ValueError()
-                # if Public_candidates:
-                #     for candidate in Public_candidates:
-                #         count += 1
-                #         postulate = Public_Postulate.objects.filter(id = int(candidate.strip()))
-                #         if postulate:
-                #             postulate = postulate[0]
-                #             postulate.processes = postulate.public_postulate_stage_set.all()
-                #             postulate.process = postulate.processes.filter(vacancy_stage = vacancy_stage)
-                #             postulate.checkbox_id = '-1-'+str(postulate.id)
-                #             candidates += [postulate]
-                #         else:
-                #             raise ValueError()
-                context['candidates'] = candidates
-                context['count'] = count
-                user = request.user
-                # except:
-                #     raise ValueError()
-                
-            else:
-                raise ValueError()
-    else:
+    """Render the comparison cards of the selected applications of a stage.
+
+    The applications are loaded by vacancies.pipeline.load_compared_candidates
+    in a fixed number of queries per chunk of COMPARE_CHUNK_SIZE columns, and
+    the chunks are streamed as they are rendered, so a comparison of a few
+    hundred candidates (up to COMPARE_MAX_CANDIDATES) never holds all of them
+    in memory.
+
+    Args:
+        request: HTTP request with ``vsid`` (vacancy stage id) and ``cids``
+            (comma separated application ids), posted or in the query string
+
+    Returns:
+        StreamingHttpResponse: HTML of the comparison cards
+
+    Raises:
+        ValueError: If the user is not a recruiter of the subdomain, or an
+            application is missing or belongs to another company
+        VacancyStage.DoesNotExist: If the stage is not a stage of the company
+    """
+    if request.method not in ('POST', 'GET'):
+        raise ValueError()
+    data = request.POST if request.method == 'POST' else request.GET
+    vacancy_stage_id = data.get('vsid', 0)
+    ids = [int(candidate.strip()) for candidate in (data.get('cids') or '').split(',') if candidate.strip()]
+    ids = list(dict.fromkeys(ids))[:COMPARE_MAX_CANDIDATES]
+    context = {'current_process': None, 'candidates': None, 'count': len(ids)}
+    if not request.user.is_authenticated:
+        return render(request, 'compare_candidates.html', context)
+    company = get_tenant(request).company
+    if not company or not Recruiter.objects.filter(user=request.user, user__is_active=True, company=company).exists():
+        raise ValueError()
+    if not vacancy_stage_id:
+        raise ValueError()
+    vacancy_stage = VacancyStage.objects.get(id=vacancy_stage_id, vacancy__company=company)
+    if Postulate.objects.filter(id__in=ids, vacancy__company=company).count() != len(ids):
         raise ValueError()
-    return render(request, 'compare_candidates.html', context)
+    context['current_process'] = vacancy_stage
+    template = get_template('compare_candidates.html')
+
+    def columns():
+        for start in range(0, len(ids), COMPARE_CHUNK_SIZE):
+            context['candidates'] = load_compared_candidates(ids[start:start + COMPARE_CHUNK_SIZE], vacancy_stage)
+            yield template.render(context, request)
+
+    return StreamingHttpResponse(columns())
    
 @csrf_exempt
 def filter_candidates(request):
+    """Ids of the applicants of a stage section matching the keyword filters.
+
+    The filter spec is compiled by vacancies.candidate_filter into a single
+    query.
+
+    Args:
+        request: HTTP request with the process (stage) id, the stage section
+            (0 in process, 1 from this stage on, 2 archived) and the filter spec
+
+    Returns:
+        JsonResponse: Success flag, message and matching candidates
+    """
     context = {}
     context['success'] = False
     context['msg'] = ''
-    # raise ValueError()
     if request.method == 'POST':
-        filters = request.POST.get('filter','')
-        try:
-            filters = filters.split(',')
-        except:
-            pass
-        if filters[0].strip() == "":
-            filters = None
         try:
             process_id = int(request.POST.get('process',0))
-            process = VacancyStage.objects.get(id = process_id)
-        except:
+            process = VacancyStage.objects.select_related('vacancy').get(id = process_id)
+        except (ValueError, VacancyStage.DoesNotExist):
             process = None
         if process:
-            # raise ValueError(filters)
             section = request.POST.get('section', 0)
-            # raise ValueError(section)
             if section == '2' or section == 2:
                 postulates = process.postulate_stage_set.all().filter(postulate__discard = True)
-                # public_postulates = process.public_postulate_stage_set.all().filter(postulate__discard = True)
             elif section == '1' or section == 1:
                 postulates = Postulate_Stage.objects.filter(vacancy_stage__id__gte= process.id)
-                # public_postulates = Public_Postulate_Stage.objects.filter(process__id__gte=process.id)
             else:
                 postulates = process.postulate_stage_set.all().filter(postulate__discard = False)
-                # public_postulates = process.public_postulate_stage_set.all().filter(postulate__discard = False)
-            # raise ValueError([p.id for p in postulates] + [p.id for p in public_postulates])
-            filter5 = []
-            filter3 = []
-            filter2 = []
-            filter1 = []
-            filter0 = []
-            # raise ValueError(postulates)
-            min = None
-            max = None
-            text = ""
-            pids = []
-            # raise ValueError()
-            if filters:
-                for filter in filters:
-
-                    # raise ValueError(filters)
-                    splitArray = filter.split('-')
-                    type = splitArray[0]
-                    splitArray[0] = ""
-                    if len(splitArray)<2:
-                        # contex
-                        return JsonResponse(context)
-                    else:
-                        splitArray[1] = '-'.join(splitArray).strip('-')
-                        # raise ValueError(splitArray[1])
-                        if type == '5':
-                            val = int(splitArray[1])
-                            filter5 = filter5 + [val]
-                        elif type == '3':
-                            val = int(splitArray[1])
-                            filter3 = filter3 + [val]
-                            # except:
-                                # context['msg'] = 'no recruiter in type 3 for ' + splitArray[1]
-                                # return JsonResponse(context)
-                        elif type == '2':
-                            # try:
-                            # raise ValueError(splitArray[1])
-                            val = int(splitArray[1])
-                            filter2 = filter2 +[val]
-                            # except:
-                            #     context['msg'] = 'no recruiter in type 2'
-                            #     return JsonResponse(context)
-                        elif type == '1':
-                            arr = splitArray[1].split('-')
-                            arr[0] = ""
-                            filter1 = filter1 + [arr]
-                        elif type == '0':
-                            filter0 = filter0 + [str(splitArray[1])]
-            if filter5:
-                tags = VacancyTags.objects.filter(id__in = filter5, vacancy = process.vacancy)
-                for tag in tags:
-                    ids = [p.id for p in tag.postulate_set.all()]
-                    pids = pids + [p.id for p in postulates.filter(postulate__id__in=ids)]
-            if filter3:
-                # for postulate in postulates:
-                pids = pids + [pp.id for pp in postulates.filter(postulate__recruiter__id__in = filter3)]
-                context['msg'] = pids
-            if filter2:
-                ids=[]
-                for postulate in postulates:
-                    if postulate.postulate.comment_set.all().filter(recruiter__id__in = filter2):
-                        ids = ids + [postulate.id]
-                pids = pids + ids
-                # postulates = postulates.exclude(id__in = ids)
-                ids = []
-                # for postulate in public_postulates:
-                #     if postulate.postulate.comment_set.all().filter(recruiter__id__in = filter2):
-                #         ids = ids + [postulate.id]
-                # public_postulates = public_postulates.exclude(id__in = ids)
-            if filter0:
-                postulate_ids = filter_text_from_profile(filter0,[p.id for p in postulates],False)
-                # public_postulate_ids = filter_text_from_profile(filter0, [p.id for p in public_postulates],True)
-                # postulates = postulates.filter(id__in=postulate_ids)
-                pids = pids + postulate_ids
-                postulate_ids = []
-                
-                # public_postulates = public_postulates.filter(id__in=public_postulate_ids)
-                # ppids = ppids + public_postulate_ids
-            if filter1:
-                ids = []
-                for f in filter1:
-                    min = int(f[1])
-                    max = int(f[2]) 
-                    if min >= 0 and max >= 0:
-                        for postulate in postulates:
-                            if postulate.avg_score() >= min and postulate.avg_score() <= max:
-                                ids = ids + [postulate.id]           
-                # postulates = postulates.filter(id__in=ids)
-                pids = pids + ids
-                ids = []
-                # for f in filter1:
-                #     min = int(f[1])
-                #     max = int(f[2])
-                #     if min>=0 and max >= 0:
-                        # for postulate in public_postulates:
-                        #     if postulate.avg_score() >= min and postulate.avg_score() <= max:
-                        #         ids = ids + [postulate.id] 
-                # public_postulates = public_postulates.filter(id__in=ids)
-                # ppids = ppids + ids
-            candidates = []
-            # raise ValueError()
-            if filters:
-                if postulates:
-                    postulates = postulates.filter(id__in = pids)
-                # if public_postulates:
-                #     public_postulates = public_postulates.filter(id__in = ppids)
-            # context['msg'] = filter3
-            for postulate in postulates:
-                candidates = candidates + [{'public':0,'candidate':postulate.postulate.id}]
-            # for postulate in public_postulates:
-            #     candidates = candidates + [{'public':1,'candidate':postulate.postulate.id}]
-            context['candidates'] = candidates
+            try:
+                ids = filter_stage_candidates(postulates, request.POST.get('filter',''), process.vacancy)
+            except ValueError:
+                context['msg'] = 'Invalid filter'
+                return JsonResponse(context)
+            context['candidates'] = [{'public':0,'candidate':postulate_id} for postulate_id in ids]
             context['success'] = True
-            # raise ValueError()
         else:
             context['msg'] = 'No process to apply filter'
     else:
         context['msg'] = 'Unauthorised Access'
     return JsonResponse(context)
 
-def notifications(request):
-    response = HttpResponse("", content_type="text/event-stream")
-    if request.user.is_authenticated:
-        msg = ""
-        if not 'last_notification' in request.session:
-            last_notification = 0
-        else:
-            last_notification = int(request.session['last_notification'])
-        new_notifications = Notification.objects.filter(id__gt=last_notification, user = request.user)
-        try:
-            last_shown = Notification.objects.filter(user = request.user).latest('id').id
-        except:
-            last_shown = 0
-        notifications = []
-        for notification in new_notifications:
-            html = """<li class="border-bottom border-light unseen" data-notification='"""+ str(notification.id) +"""'>
-                <p class="pt10 pb10 pr10 has-img text-muted">"""
-            if notification.actor:
-                html = html + """<img src='"""+notification.actor.photo.url+"""' class="img-card ml10 mr10 card-left" data-name='"""+str(notification.actor.get_full_name())+"""'><b>"""
-                if notification.actor == request.user:
-                    html = html + """You """
-                else:
-                    html = html + str(notification.actor) + ' '
-                html = html + '</b>'
-            if notification.action:
-                html = html + str(notification.action) + ' '
-            if notification.target:
-                html = html +'<b>'
-                if notification.target == request.user:
-                    if notification.target_action:
-                        html = html + "you "
-                    else:
-                        html =html + "your "
-                else:
-                    if notification.actor == notification.target:
-                        html = html + "their "
-                    else:
-                        html = html + str(notification.target)
-                        if not notification.target_action:
-                            html = html + "'s "
-                        else:
-                            html = html + " "
-                html = html + "</b>"
-            if notification.target_action:
-                html = html + str(notification.target_action) + ' '
-            if notification.subject:
-                html = html + "<a "
-                if notification.action_url:
-                    html = html + "href='" + str(notification.action_url) + "'"
-                html = html + " target = '_blank'>" + str(notification.subject) + '</a> '
-                if notification.subject_action:
-                    html = html + str(notification.subject_action)
-            if notification.message:
-                html = html + '<br>' + str(notification.message)
-            html = html + '<br><i><small>' + naturaltime(notification.timestamp) + '</small></i></p></li>'
-            data = {
-                'id': str(notification.id),
-                'actor': str(notification.actor).strip(),
-                'message': str(notification.message).strip(),
-                'action_url': str(notification.action_url).strip(),
-                'last_updated': str(notification.timestamp).strip(),
-                'html': html
-                }
-            notifications.append(data)
-        msg = msg + 'data: '+ json.dumps(notifications) + ' \n'
-        msg = msg + '\n'
-        if last_shown > request.session['last_notification']:
-            request.session['last_notification'] = last_shown
-        response.write(msg)
-    else:
-        response.write('Unauthorised access')
-    return response
+async def notifications(request):
+    """Stream the real-time notifications of the user (server-sent events).
+
+    See activities.stream: a long-lived stream fed by the notification
+    pub/sub under ASGI, the notifications missed since the last event under WSGI.
+
+    Args:
+        request: HTTP request
+
+    Returns:
+        HttpResponse: text/event-stream response
+    """
+    return await notification_stream(request)
 
 @csrf_exempt
 def post_message_to_stream(request):
@@ -2928,21 +2672,21 @@ def update_site_template(request):
         except TemplateDoesNotExist:
             context['msg'] = 'Please select a valid template to continue.'
         if valid:
-            subdomain_data = subdomain(request)
-            if not subdomain_data['active_host']:
+            tenant = get_tenant(request)
+            if not tenant.active_host:
                 context['msg'] = 'Unauthorised access'
                 return JsonResponse(context)
-            company = Company.objects.filter(subdomain__slug=subdomain_data['active_subdomain'])
-            if not company or not company[0] in request.user.recruiter.company.all():
+            company = tenant.company
+            if not company or not company in request.user.recruiter.company.all():
                 context['msg'] = 'Unauthorised access'
                 return JsonResponse(context)
-            company = company[0]
             company.site_template = template_id
             above_job = str(get_template('careers/base/t-'+ str(template_id) +'/above_jobs.html').render(Context({'STATIC_URL':STATIC_URL})))
             company.above_jobs = above_job
             below_job = str(get_template('careers/base/t-'+ str(template_id) +'/below_jobs.html').render(Context({'STATIC_URL':STATIC_URL})))
             company.below_jobs = below_job
-            company.save()
+            # The tenant company may be a few minutes old, only write the changed fields
+            company.save(update_fields=['site_template', 'above_jobs', 'below_jobs'])
             context['msg'] = 'Template Updated'
             context['success'] = True
     else:
@@ -2961,22 +2705,21 @@ def save_template(request):
     """
     context = {}
     context['success'] = False
-    subdomain_data = subdomain(request)
-    if not subdomain_data['active_host']:
+    tenant = get_tenant(request)
+    if not tenant.active_host:
         context['msg'] = 'Unauthorised access'
         return JsonResponse(context)
-    company = Company.objects.filter(subdomain__slug=subdomain_data['active_subdomain'])
-    if not company or not company[0] in request.user.recruiter.company.all():
+    company = tenant.company
+    if not company or not company in request.user.recruiter.company.all():
         context['msg'] = 'Unauthorised access'
         return JsonResponse(context)
-    company = company[0]
     if request.user.is_authenticated and request.user.recruiter.is_manager() and request.is_ajax() and request.method == 'POST':
         above_jobs = request.POST.get('above_jobs');
         below_jobs = request.POST.get('below_jobs');
         if above_jobs and below_jobs:
             company.above_jobs = above_jobs
             company.below_jobs = below_jobs
-            company.save()
+            company.save(update_fields=['above_jobs', 'below_jobs'])
             context['success'] = True
         else:
             context['msg'] = 'Save data not provided.'
@@ -2988,15 +2731,14 @@ def save_template(request):
 def get_evaluators(request):
     context = {}
     context['success'] = False
-    subdomain_data = subdomain(request)
-    if not subdomain_data['active_host']:
+    tenant = get_tenant(request)
+    if not tenant.active_host:
         context['msg'] = 'Unauthorised access'
         return JsonResponse(context)
-    company = Company.objects.filter(subdomain__slug=subdomain_data['active_subdomain'])
-    if not company or not company[0] in request.user.recruiter.company.all():
+    company = tenant.company
+    if not company or not company in request.user.recruiter.company.all():
         context['msg'] = 'Unauthorised access'
         return JsonResponse(context)
-    company = company[0]
     if request.user.is_authenticated and request.user.recruiter.is_manager() and request.is_ajax() and request.method == 'POST':
         try:
             vstage = VacancyStage.objects.get(id = request.POST.get('vid'))
@@ -3013,15 +2755,14 @@ def get_evaluators(request):
 def get_process_criterias(request):
     context = {}
     context['success'] = False
-    subdomain_data = subdomain(request)
-    if not subdomain_data['active_host']:
+    tenant = get_tenant(request)
+    if not tenant.active_host:
         context['msg'] = 'Unauthorised access'
         return JsonResponse(context)
-    company = Company.objects.filter(subdomain__slug=subdomain_data['active_subdomain'])
-    if not company or not company[0] in request.user.recruiter.company.all():
+    company = tenant.company
+    if not company or not company in request.user.recruiter.company.all():
         context['msg'] = 'Unauthorised access'
         return JsonResponse(context)
-    company = company[0]
     if request.user.is_authenticated and request.user.recruiter.is_manager() and request.is_ajax() and request.method == 'POST':
         try:
             vstage = VacancyStage.objects.get(id = request.POST.get('vid'))
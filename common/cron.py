@@ -0,0 +1,21 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from datetime import datetime
+
+from django.core.management import call_command
+
+
+def SendQueuedEmailsCronJob():
+    """
+    Sends the emails waiting in the outbound queue (see common.mail_queue),
+    for setups without a running send_queued_emails worker. Several
+    invocations can safely run together: each message is claimed once.
+
+    Exceptions during execution are caught and printed to the console.
+    """
+    print((str(datetime.now()) + ' --> Send Emails Cron start'))
+    try:
+        call_command('send_queued_emails', once=True)
+    except Exception as e:
+        print(e)
+    print((str(datetime.now()) + ' --> Send Emails Cron completed'))
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Cross-process locks of the scheduled jobs.
+
+The jobs in ``CRONJOBS`` are started by cron on every host of the site, and a
+run that lasts longer than its interval overlaps with the next one. Jobs that
+bill or notify must not run twice at the same time, so they take a lock stored
+in the ``CronLock`` table: it is acquired with a single conditional UPDATE,
+which the database serializes across processes and hosts.
+
+A lock expires after its timeout, so a run killed before releasing it only
+blocks the job until then.
+"""
+
+from __future__ import absolute_import
+import os
+import socket
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import IntegrityError
+from django.db.models import Q
+from django.utils import timezone
+
+from common.models import CronLock
+
+
+def acquire_lock(name, timeout):
+    """
+    Take a lock unless another process holds it.
+
+    Args:
+        name (str): Name of the lock, e.g. the dotted path of the job.
+        timeout (int): Seconds after which the lock expires.
+
+    Returns:
+        str: The owner token to release the lock with, or None if the lock is held.
+    """
+    try:
+        CronLock.objects.get_or_create(name=name)
+    except IntegrityError:
+        # Created concurrently by another process
+        pass
+    now = timezone.now()
+    owner = '%s:%s:%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+    acquired = CronLock.objects.filter(Q(locked_until__isnull=True) | Q(locked_until__lte=now), name=name) \
+        .update(locked_by=owner, locked_until=now + timedelta(seconds=timeout))
+    return owner if acquired else None
+
+
+def release_lock(name, owner):
+    """
+    Release a lock taken by ``acquire_lock``. Does nothing if it expired and
+    was taken by another process meanwhile.
+    """
+    CronLock.objects.filter(name=name, locked_by=owner) \
+        .update(locked_by='', locked_until=None, last_run=timezone.now())
+
+
+@contextmanager
+def cron_lock(name, timeout):
+    """
+    Context manager holding a lock for the duration of a job.
+
+    Yields:
+        bool: Whether the lock was acquired; the job must be skipped if not.
+
+    Example:
+        with cron_lock('payments.cron.SubscriptionCronJob', 600) as acquired:
+            if acquired:
+                run()
+    """
+    owner = acquire_lock(name, timeout)
+    try:
+        yield owner is not None
+    finally:
+        if owner is not None:
+            release_lock(name, owner)
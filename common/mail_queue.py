@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Outbound email queue.
+
+``send_TRM_email`` and ``helpdesk.lib.send_templated_mail`` used to open an
+SMTP connection per message inside the request or the cron loop, so a bulk
+action (subscription reminders, recruiter invitations...) paid one SMTP
+handshake per email and failed for good on a transient SMTP error.
+
+Messages are now stored in the ``OutboundEmail`` table by ``send_message``
+(within the current transaction, so an email is only sent if the change it
+reports is committed). The ``send_queued_emails`` command (and the cron job
+of the same name) claims due messages and sends them in batches of
+``EMAIL_QUEUE_BATCH_SIZE`` over a single SMTP connection per batch. Failures
+are retried with an exponential backoff until ``EMAIL_QUEUE_MAX_ATTEMPTS``.
+
+Set ``EMAIL_QUEUE_ENABLED = False`` to send inline (setups without a worker).
+"""
+
+from __future__ import absolute_import
+import base64
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from common.models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+QUEUE_ENABLED = getattr(settings, 'EMAIL_QUEUE_ENABLED', True)
+BATCH_SIZE = getattr(settings, 'EMAIL_QUEUE_BATCH_SIZE', 100)
+MAX_ATTEMPTS = getattr(settings, 'EMAIL_QUEUE_MAX_ATTEMPTS', 6)
+RETRY_DELAY = getattr(settings, 'EMAIL_QUEUE_RETRY_DELAY', 60)
+# A message locked for longer than this is considered abandoned by a dead worker
+LOCK_TIMEOUT = getattr(settings, 'EMAIL_QUEUE_LOCK_TIMEOUT', 600)
+
+
+def _text(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def enqueue_message(message):
+    """
+    Store an email in the outbound queue.
+
+    Args:
+        message (EmailMessage): The message, e.g. an EmailMultiAlternatives.
+
+    Returns:
+        OutboundEmail: The queued row.
+    """
+    attachments = []
+    for attachment in message.attachments:
+        filename, content, mimetype = attachment
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        attachments.append([filename, base64.b64encode(content).decode('ascii'), mimetype])
+    return OutboundEmail.objects.create(
+        subject=message.subject or '',
+        body=_text(message.body) or '',
+        from_email=message.from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(message.to),
+        cc=list(message.cc),
+        bcc=list(message.bcc),
+        reply_to=list(message.reply_to),
+        headers=dict(message.extra_headers),
+        alternatives=[[_text(content), mimetype] for content, mimetype in getattr(message, 'alternatives', [])],
+        attachments=attachments,
+        content_subtype=message.content_subtype,
+    )
+
+
+def build_message(email, connection=None):
+    """
+    Rebuild the EmailMessage of a queued row.
+
+    Args:
+        email (OutboundEmail): Queued row.
+        connection: Email backend connection to send it with.
+
+    Returns:
+        EmailMultiAlternatives: The message.
+    """
+    message = EmailMultiAlternatives(email.subject, email.body, email.from_email, email.to, bcc=email.bcc,
+                                     connection=connection, headers=email.headers, cc=email.cc,
+                                     reply_to=email.reply_to)
+    message.content_subtype = email.content_subtype
+    for content, mimetype in email.alternatives:
+        message.attach_alternative(content, mimetype)
+    for filename, content, mimetype in email.attachments:
+        message.attach(filename, base64.b64decode(content), mimetype)
+    return message
+
+
+def send_message(message):
+    """
+    Queue an email, or send it right away when the queue is disabled.
+
+    Args:
+        message (EmailMessage): The message.
+
+    Returns:
+        int: Number of messages queued or sent, like ``EmailMessage.send()``.
+    """
+    if not QUEUE_ENABLED:
+        return message.send()
+    if not message.recipients():
+        return 0
+    enqueue_message(message)
+    return 1
+
+
+def claim_emails(worker, limit):
+    """
+    Lock up to ``limit`` due messages for a worker.
+
+    Rows are selected with ``SKIP LOCKED`` where the database supports it, so
+    several workers never pick the same message. Messages left in sending by a
+    dead worker are claimed again once their lock expires.
+
+    Args:
+        worker (str): Identifier of the worker.
+        limit (int): Maximum number of messages.
+
+    Returns:
+        list: The claimed OutboundEmail rows.
+    """
+    now = timezone.now()
+    due = Q(status='pending', run_after__lte=now) | \
+        Q(status='sending', locked_at__lt=now - timedelta(seconds=LOCK_TIMEOUT))
+    with transaction.atomic():
+        ids = list(OutboundEmail.objects.select_for_update(skip_locked=True).filter(due)
+                   .order_by('run_after', 'id').values_list('id', flat=True)[:limit])
+        OutboundEmail.objects.filter(pk__in=ids).update(
+            status='sending', locked_by=worker, locked_at=now, attempts=F('attempts') + 1)
+    return list(OutboundEmail.objects.filter(pk__in=ids, locked_by=worker).order_by('run_after', 'id'))
+
+
+def fail_email(email, error):
+    """
+    Record a failed attempt. The message is retried with an exponential
+    backoff until ``MAX_ATTEMPTS`` is reached, then marked failed.
+    """
+    logger.warning('Could not send email %s (attempt %s): %s', email.pk, email.attempts, error)
+    values = {'locked_at': None, 'last_error': '%s' % error}
+    if email.attempts >= MAX_ATTEMPTS:
+        values['status'] = 'failed'
+    else:
+        values.update(status='pending', run_after=timezone.now() + timedelta(seconds=RETRY_DELAY * 2 ** (email.attempts - 1)))
+    OutboundEmail.objects.filter(pk=email.pk, locked_by=email.locked_by).update(**values)
+
+
+def send_batch(emails, connection=None):
+    """
+    Send claimed messages over one connection of the email backend.
+
+    Args:
+        emails (list): Claimed OutboundEmail rows.
+        connection: Open backend connection (one is opened and closed if None).
+
+    Returns:
+        tuple: Numbers of sent and failed messages.
+    """
+    sent, failed = [], 0
+    own_connection = connection is None
+    if own_connection:
+        connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        for email in emails:
+            fail_email(email, e)
+        return 0, len(emails)
+    try:
+        for email in emails:
+            try:
+                build_message(email, connection).send()
+            except Exception as e:
+                fail_email(email, e)
+                failed += 1
+            else:
+                sent.append(email.pk)
+    finally:
+        if own_connection:
+            connection.close()
+        OutboundEmail.objects.filter(pk__in=sent).update(status='sent', locked_at=None, last_error='',
+                                                         sent_at=timezone.now())
+    return len(sent), failed
+
+
+def send_queued_emails(worker=None, limit=BATCH_SIZE, connection=None):
+    """
+    Claim and send one batch of due messages.
+
+    Args:
+        worker (str): Identifier of the worker (defaults to host and pid).
+        limit (int): Maximum number of messages.
+        connection: Backend connection to reuse across batches.
+
+    Returns:
+        tuple: Numbers of sent and failed messages.
+    """
+    worker = worker or '%s-%s' % (socket.gethostname(), os.getpid())
+    emails = claim_emails(worker, limit)
+    if not emails:
+        return 0, 0
+    return send_batch(emails, connection)
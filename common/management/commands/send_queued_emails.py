@@ -0,0 +1,80 @@
+"""
+send_queued_emails.py - Worker sending the messages of the outbound email
+queue (see common.mail_queue).
+"""
+
+from __future__ import absolute_import
+import os
+import socket
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from common.mail_queue import BATCH_SIZE, claim_emails, send_batch
+
+
+class Command(BaseCommand):
+    """
+    Django management command sending the queued emails.
+
+    Keep it running next to the web server (e.g. under supervisor), or let the
+    SendQueuedEmailsCronJob cron job drain the queue every minute. The SMTP
+    connection stays open while there are messages to send and is closed when
+    the queue is empty.
+    """
+
+    help = 'Send the emails of the outbound queue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Number of messages claimed at a time.')
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=5,
+            help='Seconds to wait when the queue is empty.')
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            default=False,
+            help='Exit when the queue is empty.')
+
+    def handle(self, *args, **options):
+        """
+        Command entry point.
+
+        Args:
+            *args: Positional arguments (not used).
+            **options: batch_size, sleep and once.
+        """
+        worker = '%s-%s' % (socket.gethostname(), os.getpid())
+        connection = None
+        sent = failed = 0
+        try:
+            while True:
+                emails = claim_emails(worker, options['batch_size'])
+                if not emails:
+                    if connection is not None:
+                        connection.close()
+                        connection = None
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+                if connection is None:
+                    connection = get_connection()
+                batch_sent, batch_failed = send_batch(emails, connection)
+                sent += batch_sent
+                failed += batch_failed
+                if batch_failed:
+                    # Start over with a fresh connection in case it broke
+                    connection.close()
+                    connection = None
+        finally:
+            if connection is not None:
+                connection.close()
+        self.stdout.write('Sent %s emails (%s failed attempts).' % (sent, failed))
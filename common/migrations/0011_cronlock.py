@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0010_alter_accountverification_id_alter_address_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CronLock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Name')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=100, verbose_name='Locked By')),
+                ('locked_until', models.DateTimeField(blank=True, default=None, null=True, verbose_name='Locked Until')),
+                ('last_run', models.DateTimeField(blank=True, default=None, null=True, verbose_name='Last Run')),
+            ],
+            options={
+                'verbose_name': 'Cron Lock',
+                'verbose_name_plural': 'Cron Locks',
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0011_cronlock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.TextField(blank=True, default='', verbose_name='Subject')),
+                ('body', models.TextField(blank=True, default='', verbose_name='Body')),
+                ('from_email', models.CharField(blank=True, default='', max_length=255, verbose_name='From')),
+                ('to', models.JSONField(blank=True, default=list, verbose_name='To')),
+                ('cc', models.JSONField(blank=True, default=list, verbose_name='Cc')),
+                ('bcc', models.JSONField(blank=True, default=list, verbose_name='Bcc')),
+                ('reply_to', models.JSONField(blank=True, default=list, verbose_name='Reply To')),
+                ('headers', models.JSONField(blank=True, default=dict, verbose_name='Headers')),
+                ('alternatives', models.JSONField(blank=True, default=list, verbose_name='Alternatives')),
+                ('attachments', models.JSONField(blank=True, default=list, verbose_name='Attachments')),
+                ('content_subtype', models.CharField(default='plain', max_length=20, verbose_name='Content Subtype')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10, verbose_name='Status')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('run_after', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Run After')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=100, verbose_name='Locked By')),
+                ('locked_at', models.DateTimeField(blank=True, default=None, null=True, verbose_name='Locked At')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Last Error')),
+                ('add_date', models.DateTimeField(auto_now_add=True, verbose_name='Add Date')),
+                ('sent_at', models.DateTimeField(blank=True, default=None, null=True, verbose_name='Sent At')),
+            ],
+            options={
+                'verbose_name': 'Outbound Email',
+                'verbose_name_plural': 'Outbound Emails',
+            },
+        ),
+    ]
@@ -17,7 +17,6 @@ from django.contrib.sites.models import Site
 from django.template import loader
 from TRM.settings import logo_email, SITE_URL, PHOTO_USER_DEFAULT, NOTIFICATION_EMAILS, MEDIA_URL, SITE_SUFFIX, DEFAULT_FROM_EMAIL, ADMINS
 from phonenumber_field.modelfields import PhoneNumberField
-import types
 
 Name = _('Name')
 
@@ -85,7 +84,8 @@ class User(AbstractUser):
 # Sending of Emails #
 # --------------- #
 def send_TRM_email(subject_template_name, email_template_name, context_email, to_user, from_email="SpotAxis <noreply@mail.spotaxis.com>", use_https=None, file= None, bcc=False):
-    # Context using all emails sent
+    # Queued in the outbound email queue and sent by the send_queued_emails worker
+    # (see common.mail_queue). Context using all emails sent
     try:
         base_context_email = {
             'site_url': SITE_URL,
@@ -109,8 +109,7 @@ def send_TRM_email(subject_template_name, email_template_name, context_email, to
         # print(text_email)
         if not from_email:
             from_email = DEFAULT_FROM_EMAIL
-        html_email.encoding = "utf-8"
-        if isinstance(to_user, types.StringTypes):
+        if isinstance(to_user, str):
             to_user = [to_user]
         to_user = list(to_user)
         # try:
@@ -119,14 +118,14 @@ def send_TRM_email(subject_template_name, email_template_name, context_email, to
         else:
             bcc = []
         msg = EmailMultiAlternatives(subject, text_email, from_email, to_user , bcc = bcc)
-        print(msg)
         msg.attach_alternative(html_email, "text/html" )
         # except:
         #     msg = EmailMessage(subject, html_email, from_email, to_user)
         #     msg.content_subtype = "html"
         if file:
             msg.attach_file(file)
-        return msg.send()
+        from common.mail_queue import send_message
+        return send_message(msg)
     except Exception as e:
         print('%s (%s)' % (e, type(e)))#print '%s (%s)' % (e.message, type(e))
         return 0
@@ -513,4 +512,64 @@ class SocialAuth(models.Model):
                 return True
             except:
                 print('failed to retrieve from web')
-                return False
\ No newline at end of file
+                return False
+
+class CronLock(models.Model):
+    """
+    Lock shared by the processes and hosts running a scheduled job, so two
+    invocations of the same job never overlap (see common.locks).
+    """
+    name = models.CharField(verbose_name=_(u'Name'), max_length=100, unique=True)
+    locked_by = models.CharField(verbose_name=_(u'Locked By'), max_length=100, blank=True, default='')
+    locked_until = models.DateTimeField(verbose_name=_(u'Locked Until'), null=True, blank=True, default=None)
+    last_run = models.DateTimeField(verbose_name=_(u'Last Run'), null=True, blank=True, default=None)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = _(u'Cron Lock')
+        verbose_name_plural = _(u'Cron Locks')
+
+
+OUTBOUND_EMAIL_STATUS = (
+    ('pending', _(u'Pending')),
+    ('sending', _(u'Sending')),
+    ('sent', _(u'Sent')),
+    ('failed', _(u'Failed')),
+)
+
+class OutboundEmail(models.Model):
+    """
+    Email waiting in the outbound queue (see common.mail_queue). Holds what is
+    needed to rebuild the EmailMessage in the sender worker.
+    """
+    subject = models.TextField(verbose_name=_(u'Subject'), blank=True, default='')
+    body = models.TextField(verbose_name=_(u'Body'), blank=True, default='')
+    from_email = models.CharField(verbose_name=_(u'From'), max_length=255, blank=True, default='')
+    to = models.JSONField(verbose_name=_(u'To'), default=list, blank=True)
+    cc = models.JSONField(verbose_name=_(u'Cc'), default=list, blank=True)
+    bcc = models.JSONField(verbose_name=_(u'Bcc'), default=list, blank=True)
+    reply_to = models.JSONField(verbose_name=_(u'Reply To'), default=list, blank=True)
+    headers = models.JSONField(verbose_name=_(u'Headers'), default=dict, blank=True)
+    # [content, mimetype] pairs, e.g. the HTML version
+    alternatives = models.JSONField(verbose_name=_(u'Alternatives'), default=list, blank=True)
+    # [filename, base64 content, mimetype] triples
+    attachments = models.JSONField(verbose_name=_(u'Attachments'), default=list, blank=True)
+    content_subtype = models.CharField(verbose_name=_(u'Content Subtype'), max_length=20, default='plain')
+
+    status = models.CharField(verbose_name=_(u'Status'), choices=OUTBOUND_EMAIL_STATUS, max_length=10, default='pending', db_index=True)
+    attempts = models.PositiveIntegerField(verbose_name=_(u'Attempts'), default=0)
+    run_after = models.DateTimeField(verbose_name=_(u'Run After'), default=timezone.now, db_index=True)
+    locked_by = models.CharField(verbose_name=_(u'Locked By'), max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(verbose_name=_(u'Locked At'), null=True, blank=True, default=None)
+    last_error = models.TextField(verbose_name=_(u'Last Error'), blank=True, default='')
+    add_date = models.DateTimeField(verbose_name=_(u'Add Date'), auto_now_add=True)
+    sent_at = models.DateTimeField(verbose_name=_(u'Sent At'), null=True, blank=True, default=None)
+
+    def __str__(self):
+        return self.subject
+
+    class Meta:
+        verbose_name = _(u'Outbound Email')
+        verbose_name_plural = _(u'Outbound Emails')
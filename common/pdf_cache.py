@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of the PDF downloads (job descriptions and candidate profiles).
+
+WeasyPrint used to run on every download of a vacancy or CV PDF, although
+recruiters download the same documents many times a day. Rendered PDFs are now
+stored under ``PDF_CACHE_ROOT/<kind>/<object id>/`` and served by the views
+rendering them, as streaming file responses with ``ETag``/``Last-Modified``
+headers, so unchanged documents are answered with a 304 by browsers that
+already have them. ``PDF_CACHE_ROOT`` is a private directory outside
+``MEDIA_ROOT``: the files have guessable names and must only be reachable
+through the views and their permission checks.
+
+A cached file is one variant of a document (e.g. the owner and the public view
+of a vacancy, see ``viewer_scope``) and may carry a version (e.g. the day, for
+documents showing durations up to today). The files of an object are deleted by the post_save /
+post_delete signals of the object and of the models rendered with it (see the
+end of ``vacancies.models`` and ``candidates.models``). Code changing those
+rows with ``QuerySet.update()`` must call ``invalidate_pdf_cache`` itself.
+"""
+
+from __future__ import absolute_import
+import os
+import posixpath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+PDF_CACHE_ROOT = getattr(settings, 'PDF_CACHE_ROOT',
+                         os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'private', 'pdf_cache'))
+
+# Not served by the web server nor by the MEDIA_URL route: the files have no URL
+pdf_storage = FileSystemStorage(location=PDF_CACHE_ROOT)
+
+
+def _object_dir(kind, object_id):
+    return posixpath.join(kind, str(object_id))
+
+
+def _listdir(directory):
+    """ Files of a cache directory, or an empty list if it does not exist yet. """
+    try:
+        return pdf_storage.listdir(directory)[1]
+    except (OSError, NotImplementedError):
+        return []
+
+
+def get_pdf_path(kind, object_id, variant, version=None):
+    """
+    Storage path of a cached PDF.
+
+    Args:
+        kind (str): Type of document, e.g. 'vacancy' or 'curriculum'.
+        object_id (int): Id of the rendered object.
+        variant (str): Variant of the document, e.g. 'public'.
+        version (str): Optional version inside the variant, e.g. a date.
+
+    Returns:
+        str: Path relative to PDF_CACHE_ROOT.
+    """
+    name = variant if version is None else '%s-%s' % (variant, version)
+    return posixpath.join(_object_dir(kind, object_id), '%s.pdf' % name)
+
+
+def viewer_scope(user, owner):
+    """
+    Permission scope of the viewer of a document, to be part of the variant
+    of documents whose content depends on who downloads them.
+
+    Args:
+        user (User): The requesting user, possibly anonymous.
+        owner (User): Owner of the document, or None.
+
+    Returns:
+        str: 'owner', 'user' (any other signed-in user) or 'public'.
+    """
+    if not user.is_authenticated:
+        return 'public'
+    if owner is not None and user.pk == owner.pk:
+        return 'owner'
+    return 'user'
+
+
+def invalidate_pdf_cache(kind, object_ids):
+    """
+    Delete the cached PDFs of some objects.
+
+    Args:
+        kind (str): Type of document.
+        object_ids (iterable): Ids of the changed objects.
+    """
+    for object_id in object_ids:
+        directory = _object_dir(kind, object_id)
+        for name in _listdir(directory):
+            pdf_storage.delete(posixpath.join(directory, name))
+
+
+def _store_pdf(path, variant, html_string, base_url):
+    """ Render a PDF with WeasyPrint, store it and drop the older versions of the variant. """
+    from weasyprint import HTML
+    pdf = HTML(string=html_string, base_url=base_url).write_pdf()
+    directory, current = posixpath.split(path)
+    for name in _listdir(directory):
+        if name != current and (name == '%s.pdf' % variant or name.startswith('%s-' % variant)):
+            pdf_storage.delete(posixpath.join(directory, name))
+    if not pdf_storage.exists(path):
+        saved = pdf_storage.save(path, ContentFile(pdf))
+        if saved != path:
+            # Stored concurrently by another request, keep a single copy
+            pdf_storage.delete(saved)
+
+
+def cached_pdf_response(request, kind, object_id, variant, filename, render_html, base_url, version=None):
+    """
+    Serve a PDF from the cache, rendering and storing it on a miss.
+
+    Args:
+        request (HttpRequest): The HTTP request (for conditional headers).
+        kind (str): Type of document, e.g. 'vacancy'.
+        object_id (int): Id of the rendered object.
+        variant (str): Variant of the document.
+        filename (str): Name of the downloaded file.
+        render_html (callable): Returns the HTML of the document. Only called
+            on a cache miss, so the queries it needs are skipped on hits.
+        base_url (str): Base URL used by WeasyPrint to resolve media.
+        version (str): Optional version inside the variant.
+
+    Returns:
+        HttpResponse: Streaming PDF attachment, or 304 Not Modified.
+    """
+    path = get_pdf_path(kind, object_id, variant, version)
+    if not pdf_storage.exists(path):
+        _store_pdf(path, variant, render_html(), base_url)
+
+    last_modified = int(pdf_storage.get_modified_time(path).timestamp())
+    etag = quote_etag('%x-%x' % (last_modified, pdf_storage.size(path)))
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = FileResponse(pdf_storage.open(path, 'rb'), as_attachment=True, filename=filename,
+                                content_type='application/pdf')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,70 @@
+"""
+ Testing the comparison of the applications of a stage (common.ajax.compare_candidates).
+ The test is divided into 1 part:
+ 	1. Applications and stages scoped to the company of the subdomain
+ """
+
+# Imports
+from __future__ import absolute_import
+from django.test import RequestFactory, TestCase
+from candidates.models import Candidate
+from common.ajax import compare_candidates
+from common.models import User
+from companies.models import Company, Recruiter, Stage
+from TRM.tenancy import Tenant
+from vacancies.models import Postulate, Vacancy, VacancyStage
+
+## Testing the company scope
+
+class CompareCandidatesTest(TestCase):
+	"""
+	USE CASE
+	--------------------
+		1. The applications of a stage of the company are compared
+		2. An application of another company is rejected
+		3. A stage of another company is rejected
+	"""
+	@classmethod
+	def setUpTestData(cls):
+		cls.user = User.objects.create(username='recruiter', email='recruiter@example.com')
+		cls.company = Company.objects.create(name='Acme', user=cls.user)
+		cls.recruiter = Recruiter.objects.create(user=cls.user, membership=3)
+		cls.recruiter.company.add(cls.company)
+		cls.other_company = Company.objects.create(name='Other')
+		cls.stage = cls.create_stage(cls.company)
+		cls.other_stage = cls.create_stage(cls.other_company)
+		cls.postulates = [cls.create_postulate(cls.stage) for i in range(2)]
+		cls.other_postulate = cls.create_postulate(cls.other_stage)
+
+	@classmethod
+	def create_stage(cls, company):
+		vacancy = Vacancy.objects.create(employment='Developer', company=company)
+		return VacancyStage.objects.create(vacancy=vacancy, order=0,
+										   stage=Stage.objects.create(name='Screening', company=company))
+
+	@classmethod
+	def create_postulate(cls, stage):
+		candidate = Candidate.objects.create(first_name='Candidate')
+		return Postulate.objects.create(vacancy=stage.vacancy, candidate=candidate, vacancy_stage=stage)
+
+	def compare(self, stage, postulates):
+		request = RequestFactory().get('/ajax/compare-candidates/', {
+			'vsid': stage.pk, 'cids': ','.join(str(postulate.pk) for postulate in postulates)})
+		request.user = self.user
+		request.tenant = Tenant('acme.example.com', company=self.company)
+		response = compare_candidates(request)
+		return b''.join(response.streaming_content)
+
+	def test_company_candidates(self):
+		"""Check that the applications of the company are compared"""
+		self.assertTrue(self.compare(self.stage, self.postulates))
+
+	def test_other_company_candidate(self):
+		"""Check that an application of another company is rejected"""
+		with self.assertRaises(ValueError):
+			self.compare(self.stage, self.postulates + [self.other_postulate])
+
+	def test_other_company_stage(self):
+		"""Check that a stage of another company is rejected"""
+		with self.assertRaises(VacancyStage.DoesNotExist):
+			self.compare(self.other_stage, [self.other_postulate])
@@ -0,0 +1,127 @@
+"""
+ Testing the keyword filters of the applicants of a vacancy stage
+ (common.ajax.filter_candidates and vacancies.candidate_filter).
+ The test is divided into 2 parts:
+ 	1. Filter spec parsing
+ 	2. Filtering, including the number of queries for '1000' applicants
+ """
+
+# Imports
+from __future__ import absolute_import
+import json
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from candidates.models import Candidate
+from common.ajax import filter_candidates
+from companies.models import Recruiter
+from vacancies.candidate_filter import CandidateFilter
+from vacancies.models import Comment, Postulate, Postulate_Score, Postulate_Stage, Vacancy, VacancyStage, VacancyTags
+
+APPLICANTS = 1000
+
+## Testing the filter spec
+
+class CandidateFilterParseTest(SimpleTestCase):
+	"""
+	USE CASE
+	--------------------
+		1. An empty spec is no filter
+		2. Every filter type is parsed, texts keep their dashes
+		3. A malformed item raises ValueError
+	"""
+	def test_empty_spec(self):
+		"""Check that an empty spec gives no filter"""
+		self.assertIsNone(CandidateFilter.parse(''))
+		self.assertIsNone(CandidateFilter.parse(' , '))
+
+	def test_filter_types(self):
+		"""Check the parsing of every filter type"""
+		candidate_filter = CandidateFilter.parse('5-7,3-2,2-4,1-2-4,0-front-end')
+		self.assertEqual(candidate_filter.tags, [7])
+		self.assertEqual(candidate_filter.recruiters, [2])
+		self.assertEqual(candidate_filter.commenters, [4])
+		self.assertEqual(candidate_filter.scores, [(2, 4)])
+		self.assertEqual(candidate_filter.texts, ['front-end'])
+		self.assertEqual(CandidateFilter.parse('1-rating-0-4').scores, [(0, 4)])
+
+	def test_malformed_spec(self):
+		"""Check that malformed items are rejected"""
+		for spec in ('5', '3-x', '1-2', '1-rating-2'):
+			with self.assertRaises(ValueError):
+				CandidateFilter.parse(spec)
+
+## Testing the filtering
+
+class FilterCandidatesTest(TestCase):
+	"""
+	USE CASE
+	--------------------
+		1. Without filters every applicant of the stage section is returned
+		2. Each filter type returns the matching applicants
+		3. Filters are combined with OR
+		4. The view runs '2' queries whatever the number of applicants and filters
+		5. A malformed spec fails without error
+	"""
+	@classmethod
+	def setUpTestData(cls):
+		cls.vacancy = Vacancy.objects.create(employment='Developer')
+		cls.stage = VacancyStage.objects.create(vacancy=cls.vacancy, order=1)
+		cls.recruiter, cls.commenter = Recruiter.objects.create(), Recruiter.objects.create()
+		candidates = Candidate.objects.bulk_create([Candidate(first_name='C%s' % i) for i in range(APPLICANTS)])
+		postulates = Postulate.objects.bulk_create([
+			Postulate(vacancy=cls.vacancy, candidate=candidate, vacancy_stage=cls.stage, discard=(i == 1),
+					  recruiter=cls.recruiter if i in (2, 3) else None,
+					  description='Knows front-end work' if i == 4 else None)
+			for i, candidate in enumerate(candidates)
+		])
+		stages = Postulate_Stage.objects.bulk_create([Postulate_Stage(vacancy_stage=cls.stage, postulate=postulate)
+													  for postulate in postulates])
+		cls.ids = [postulate.pk for postulate in postulates]
+		cls.tag = VacancyTags.objects.create(name='senior', vacancy=cls.vacancy)
+		cls.other_tag = VacancyTags.objects.create(name='other')
+		postulates[5].tags.add(cls.tag)
+		postulates[6].tags.add(cls.other_tag)
+		Comment.objects.create(recruiter=cls.commenter, postulate=postulates[7], stage=cls.stage)
+		stages[8].scores.add(Postulate_Score.objects.create(name='skill', score=4))
+		stages[9].scores.add(Postulate_Score.objects.create(name='skill', score=1))
+
+	def filter(self, spec, section=0):
+		request = RequestFactory().post('/ajax/filter-candidates/',
+										{'process': self.stage.pk, 'filter': spec, 'section': section})
+		return filter_candidates(request)
+
+	def candidates(self, spec, section=0):
+		context = json.loads(self.filter(spec, section).content)
+		self.assertTrue(context['success'])
+		return [candidate['candidate'] for candidate in context['candidates']]
+
+	def test_no_filter(self):
+		"""Check that every applicant of the section is returned"""
+		self.assertEqual(self.candidates(''), [pk for i, pk in enumerate(self.ids) if i != 1])
+		self.assertEqual(self.candidates('', section=2), [self.ids[1]])
+
+	def test_filter_types(self):
+		"""Check every filter type"""
+		self.assertEqual(self.candidates('5-%s' % self.tag.pk), [self.ids[5]])
+		self.assertEqual(self.candidates('5-%s' % self.other_tag.pk), [])
+		self.assertEqual(self.candidates('3-%s' % self.recruiter.pk), [self.ids[2], self.ids[3]])
+		self.assertEqual(self.candidates('2-%s' % self.commenter.pk), [self.ids[7]])
+		self.assertEqual(self.candidates('1-3-5'), [self.ids[8]])
+		self.assertEqual(self.candidates('0-front-end'), [self.ids[4]])
+
+	def test_filters_are_combined(self):
+		"""Check that an applicant matching any filter is returned"""
+		spec = '5-%s,3-%s,2-%s,1-3-5,0-front-end' % (self.tag.pk, self.recruiter.pk, self.commenter.pk)
+		self.assertEqual(self.candidates(spec), [self.ids[i] for i in (2, 3, 4, 5, 7, 8)])
+
+	def test_number_of_queries(self):
+		"""Check that the stage and the applicants are read in '2' queries"""
+		spec = '5-%s,3-%s,2-%s,1-3-5,0-front-end' % (self.tag.pk, self.recruiter.pk, self.commenter.pk)
+		with self.assertNumQueries(2):
+			self.filter(spec)
+		with self.assertNumQueries(2):
+			self.filter('')
+
+	def test_malformed_spec(self):
+		"""Check that a malformed spec fails"""
+		self.assertEqual(self.filter('3-x').status_code, 200)
+		self.assertIn(b'"success": false', self.filter('3-x').content)
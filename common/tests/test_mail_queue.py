@@ -0,0 +1,144 @@
+"""
+ Testing the outbound email queue (common.mail_queue).
+ The test is divided into 3 parts:
+ 	1. Storage of the queued messages
+ 	2. Claims and failed attempts
+ 	3. Inline sending and the send_queued_emails command
+ """
+
+# Imports
+from __future__ import absolute_import
+from datetime import timedelta
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from common import mail_queue
+from common.mail_queue import build_message, claim_emails, enqueue_message, send_batch, send_message
+from common.models import OutboundEmail
+
+
+class MailQueueTestCase(TestCase):
+	def message(self, subject='Welcome', to=('candidate@example.com',)):
+		message = EmailMultiAlternatives(subject, 'Hello', 'noreply@example.com', list(to),
+										 cc=['cc@example.com'], reply_to=['hr@example.com'],
+										 headers={'X-Campaign': 'welcome'})
+		message.attach_alternative('<p>Hello</p>', 'text/html')
+		message.attach('cv.pdf', b'%PDF-1.4\x00\xff', 'application/pdf')
+		return message
+
+	def failing_connection(self):
+		connection = mock.Mock()
+		connection.send_messages.side_effect = SMTPException('Connection unexpectedly closed')
+		return connection
+
+## Testing the storage
+
+class EnqueueMessageTest(MailQueueTestCase):
+	"""
+	USE CASE
+	--------------------
+		1. A queued message keeps its recipients, headers, alternatives and attachments
+		2. A message without recipients is not queued
+	"""
+	def test_round_trip(self):
+		"""Check that the rebuilt message matches the queued one"""
+		original = self.message()
+		rebuilt = build_message(OutboundEmail.objects.get(pk=enqueue_message(original).pk))
+		for field in ('subject', 'body', 'from_email', 'to', 'cc', 'bcc', 'reply_to', 'extra_headers',
+					  'content_subtype'):
+			self.assertEqual(getattr(rebuilt, field), getattr(original, field), field)
+		self.assertEqual([tuple(alternative) for alternative in rebuilt.alternatives], [('<p>Hello</p>', 'text/html')])
+		self.assertEqual([tuple(attachment) for attachment in rebuilt.attachments],
+						 [('cv.pdf', b'%PDF-1.4\x00\xff', 'application/pdf')])
+
+	def test_no_recipients(self):
+		"""Check that a message without recipients is not queued"""
+		message = self.message(to=())
+		message.cc = []
+		self.assertEqual(send_message(message), 0)
+		self.assertFalse(OutboundEmail.objects.exists())
+
+## Testing the claims and the failed attempts
+
+class SendFailureTest(MailQueueTestCase):
+	"""
+	USE CASE
+	--------------------
+		1. A failed attempt is retried after an exponential backoff
+		2. A message is marked failed after the maximum number of attempts
+		3. A message locked by a dead worker is claimed again
+	"""
+	def setUp(self):
+		self.email = enqueue_message(self.message())
+
+	def test_backoff(self):
+		"""Check that each failed attempt doubles the delay set on run_after"""
+		for attempt in (1, 2):
+			OutboundEmail.objects.filter(pk=self.email.pk).update(run_after=timezone.now())
+			before = timezone.now()
+			emails = claim_emails('worker', 10)
+			self.assertEqual(send_batch(emails, self.failing_connection()), (0, 1))
+			email = OutboundEmail.objects.get(pk=self.email.pk)
+			delay = timedelta(seconds=mail_queue.RETRY_DELAY * 2 ** (attempt - 1))
+			self.assertEqual((email.status, email.attempts), ('pending', attempt))
+			self.assertGreaterEqual(email.run_after, before + delay)
+			self.assertLessEqual(email.run_after, timezone.now() + delay)
+			self.assertIn('Connection unexpectedly closed', email.last_error)
+			self.assertEqual(claim_emails('worker', 10), [])
+
+	def test_max_attempts(self):
+		"""Check that the message is marked failed after the last attempt"""
+		OutboundEmail.objects.filter(pk=self.email.pk).update(attempts=mail_queue.MAX_ATTEMPTS - 1)
+		send_batch(claim_emails('worker', 10), self.failing_connection())
+		email = OutboundEmail.objects.get(pk=self.email.pk)
+		self.assertEqual((email.status, email.attempts), ('failed', mail_queue.MAX_ATTEMPTS))
+		OutboundEmail.objects.filter(pk=self.email.pk).update(run_after=timezone.now() - timedelta(days=1))
+		self.assertEqual(claim_emails('worker', 10), [])
+
+	def test_stale_lock(self):
+		"""Check that only a lock older than the timeout is reclaimed"""
+		self.assertEqual(claim_emails('dead-worker', 10), [self.email])
+		self.assertEqual(claim_emails('worker', 10), [])
+		locked_at = timezone.now() - timedelta(seconds=mail_queue.LOCK_TIMEOUT + 1)
+		OutboundEmail.objects.filter(pk=self.email.pk).update(locked_at=locked_at)
+		self.assertEqual(claim_emails('worker', 10), [self.email])
+		email = OutboundEmail.objects.get(pk=self.email.pk)
+		self.assertEqual((email.status, email.locked_by, email.attempts), ('sending', 'worker', 2))
+
+## Testing the inline sending and the command
+
+class SendQueuedEmailsTest(MailQueueTestCase):
+	"""
+	USE CASE
+	--------------------
+		1. Messages are sent inline when the queue is disabled
+		2. Queued messages are sent by the worker, not when queued
+		3. The command run with --once drains the queue and exits
+	"""
+	def test_queue_disabled(self):
+		"""Check that a message is sent right away when the queue is disabled"""
+		with mock.patch.object(mail_queue, 'QUEUE_ENABLED', False):
+			self.assertEqual(send_message(self.message()), 1)
+		self.assertEqual(len(mail.outbox), 1)
+		self.assertFalse(OutboundEmail.objects.exists())
+
+	def test_command_once(self):
+		"""Check that the command sends every queued message over one connection"""
+		for i in range(3):
+			self.assertEqual(send_message(self.message(subject='Message %s' % i)), 1)
+		self.assertEqual(mail.outbox, [])
+		out = StringIO()
+		with mock.patch('common.management.commands.send_queued_emails.get_connection',
+						wraps=mail.get_connection) as get_connection:
+			call_command('send_queued_emails', '--once', '--batch-size', '2', stdout=out)
+		self.assertEqual(get_connection.call_count, 1)
+		self.assertEqual(sorted(message.subject for message in mail.outbox), ['Message 0', 'Message 1', 'Message 2'])
+		self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+		self.assertEqual(set(OutboundEmail.objects.values_list('status', flat=True)), {'sent'})
+		self.assertFalse(OutboundEmail.objects.filter(sent_at=None).exists())
+		self.assertIn('Sent 3 emails (0 failed attempts).', out.getvalue())
@@ -0,0 +1,118 @@
+"""
+ Testing the cache of the PDF downloads (common.pdf_cache).
+ The test is divided into 2 parts:
+ 	1. Storage of the cached files outside the media files
+ 	2. Cache key of the curriculum PDF
+ """
+
+# Imports
+from __future__ import absolute_import
+import shutil
+import sys
+import tempfile
+import types
+from unittest import mock
+from django.contrib.auth.models import AnonymousUser
+from django.core.files.storage import FileSystemStorage
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+from django.views.static import serve
+from candidates.models import Candidate
+from candidates.views import curriculum_to_pdf
+from common import pdf_cache
+from common.models import User
+
+
+class FakeHTML(object):
+	"""WeasyPrint stand-in, counting the rendered documents"""
+	rendered = 0
+
+	def __init__(self, string, base_url):
+		FakeHTML.rendered += 1
+
+	def write_pdf(self):
+		return b'%PDF-1.4 fake'
+
+
+class PDFCacheTestCase(TestCase):
+	def setUp(self):
+		self.media_root = tempfile.mkdtemp()
+		self.cache_root = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.media_root)
+		self.addCleanup(shutil.rmtree, self.cache_root)
+		media_settings = override_settings(MEDIA_ROOT=self.media_root, MEDIA_URL='/media/')
+		media_settings.enable()
+		self.addCleanup(media_settings.disable)
+		patches = [
+			mock.patch.object(pdf_cache, 'pdf_storage', FileSystemStorage(location=self.cache_root)),
+			mock.patch.dict(sys.modules, {'weasyprint': types.SimpleNamespace(HTML=FakeHTML)}),
+		]
+		for patch in patches:
+			patch.start()
+			self.addCleanup(patch.stop)
+		FakeHTML.rendered = 0
+
+	def download(self, user=None, **headers):
+		request = RequestFactory().get('/pdf/', **headers)
+		request.user = user or AnonymousUser()
+		return pdf_cache.cached_pdf_response(request, 'curriculum', 1, 'cv_public', 'cv.pdf',
+											 lambda: '<p>CV</p>', 'http://testserver/', version='2020-01-01')
+
+## Testing the storage
+
+class PDFCacheStorageTest(PDFCacheTestCase):
+	"""
+	USE CASE
+	--------------------
+		1. A cached PDF is served by the view, rendered once
+		2. The cached file is stored outside MEDIA_ROOT and not reachable under MEDIA_URL
+	"""
+	def test_cached_pdf_response(self):
+		"""Check that the PDF is rendered once and served by the view"""
+		first = self.download()
+		self.assertEqual(b''.join(first.streaming_content), b'%PDF-1.4 fake')
+		second = self.download()
+		self.assertEqual(b''.join(second.streaming_content), b'%PDF-1.4 fake')
+		self.assertEqual(FakeHTML.rendered, 1)
+		self.assertEqual(self.download(HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+	def test_not_reachable_under_media_url(self):
+		"""Check that the cached file is not in the media files served under MEDIA_URL"""
+		self.download().close()
+		path = pdf_cache.get_pdf_path('curriculum', 1, 'cv_public', '2020-01-01')
+		self.assertTrue(pdf_cache.pdf_storage.exists(path))
+		self.assertFalse(pdf_cache.pdf_storage.path(path).startswith(self.media_root))
+		# The MEDIA_URL route (TRM.urls) serves MEDIA_ROOT with django.views.static.serve
+		for media_path in (path, 'pdf_cache/' + path):
+			with self.assertRaises(Http404):
+				serve(RequestFactory().get('/media/' + media_path), media_path, document_root=self.media_root)
+
+## Testing the cache key
+
+class CurriculumPDFScopeTest(PDFCacheTestCase):
+	"""
+	USE CASE
+	--------------------
+		1. The viewer scope is 'owner', 'user' or 'public'
+		2. The owner, other users and anonymous visitors get separate copies of a curriculum PDF
+	"""
+	def test_viewer_scope(self):
+		"""Check the scope of every kind of viewer"""
+		owner = User(pk=1)
+		self.assertEqual(pdf_cache.viewer_scope(owner, owner), 'owner')
+		self.assertEqual(pdf_cache.viewer_scope(User(pk=2), owner), 'user')
+		self.assertEqual(pdf_cache.viewer_scope(User(pk=2), None), 'user')
+		self.assertEqual(pdf_cache.viewer_scope(AnonymousUser(), owner), 'public')
+
+	def test_curriculum_cache_key(self):
+		"""Check that the cached curriculum depends on the viewer scope"""
+		owner = User.objects.create(username='owner', email='owner@example.com')
+		other = User.objects.create(username='other', email='other@example.com')
+		candidate = Candidate.objects.create(first_name='Ana', last_name='Diaz', user=owner)
+		for user in (owner, owner, other, None):
+			request = RequestFactory().get('/profile/pdf/%s/' % candidate.pk)
+			request.user = user or AnonymousUser()
+			curriculum_to_pdf(request, candidate.pk).close()
+		self.assertEqual(FakeHTML.rendered, 3)
+		names = pdf_cache.pdf_storage.listdir('curriculum/%s' % candidate.pk)[1]
+		self.assertEqual(sorted(name.split('-')[0] for name in names), ['cv_owner', 'cv_public', 'cv_user'])
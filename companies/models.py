@@ -105,10 +105,15 @@ class Company(models.Model):
         Args:
             service (str): Service code to check.
 
+        The codenames of the package are read once per instance: templates
+        check several services for every candidate of a page.
+
         Returns:
             bool: True if service is included, False otherwise.
         """
-        return self.subscription.price_slab.package.services.filter(codename=service).exists()
+        if not hasattr(self, '_service_codenames'):
+            self._service_codenames = set(self.subscription.price_slab.package.services.values_list('codename', flat=True))
+        return service in self._service_codenames
 
     def active_recruiter_count(self):
         """Returns the count of active recruiters associated with this company."""
@@ -436,3 +441,16 @@ class ExternalReferal(models.Model):
         return tag
     
 ### IF YOU ADD ADDITIONAL MODELS, DO NOT FORGET TO REGISTER THEM IN ADMIN ###
+
+
+def invalidate_tenant_cache(sender, instance, **kwargs):
+    """
+    Forget the tenants resolved by this process when a subdomain or a company changes.
+    """
+    from TRM.tenancy import clear_tenant_cache
+    clear_tenant_cache()
+
+models.signals.post_save.connect(invalidate_tenant_cache, sender=Subdomain)
+models.signals.post_delete.connect(invalidate_tenant_cache, sender=Subdomain)
+models.signals.post_save.connect(invalidate_tenant_cache, sender=Company)
+models.signals.post_delete.connect(invalidate_tenant_cache, sender=Company)
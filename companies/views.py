@@ -35,6 +35,7 @@ from django.views.decorators.clickjacking import xframe_options_exempt
 from hashids import Hashids
 from payments.models import *
 from TRM.context_processors import subdomain
+from TRM.tenancy import get_tenant_company, get_tenant_company_or_404
 from TRM.settings import SITE_URL, num_pages, number_objects_page, DEFAULT_SITE_TEMPLATE, STATIC_URL
 from vacancies.forms import VacancyForm, VacancyFileForm, Public_FilesForm
 from vacancies.models import Vacancy, Vacancy_Status, Postulate, Vacancy_Files, VacancyStage
@@ -435,7 +436,7 @@ def company_profile(request):
     subdomain_data = subdomain(request)
     if not subdomain_data['active_host']:
         raise Http404
-    company = get_object_or_404(Company, subdomain__slug=subdomain_data['active_subdomain'])
+    company = get_tenant_company_or_404(request)
     # company = Company.objects.get(subdomain__slug='trm7')
     created = False
     statuses = Vacancy_Status.objects.all()
@@ -892,7 +893,7 @@ def vacancies_summary(request, vacancy_status_name=None):
     else:
         recruiter=None
     try:
-        company = Company.objects.get(subdomain__slug=subdomain_data['active_subdomain'])
+        company = get_tenant_company(request)
     except:
         raise Http404
     if vacancy_status_name and not recruiter:
@@ -1471,7 +1472,7 @@ def add_update_vacancy_hiring_process(request, vacancy_id = None):
     recruiter = get_object_or_404(Recruiter,user=request.user, user__is_active=True)
     if not recruiter.is_manager():
         raise Http404
-    company = get_object_or_404(Company, subdomain__slug=subdomain_data['active_subdomain'])
+    company = get_tenant_company_or_404(request)
     if not company.check_service('JP_POST'):
         raise Http404
     vacancy = get_object_or_404(Vacancy, pk=vacancy_id,company__in=recruiter.company.all())
@@ -1518,7 +1519,7 @@ def add_update_vacancy_talent_sourcing(request, vacancy_id = None):
     recruiter = get_object_or_404(Recruiter,user=request.user, user__is_active=True)
     if not recruiter.is_manager():
         raise Http404
-    company = get_object_or_404(Company, subdomain__slug=subdomain_data['active_subdomain'])
+    company = get_tenant_company_or_404(request)
     if not company.check_service('JP_POST'):
         raise Http404
     vacancy = get_object_or_404(Vacancy, pk=vacancy_id,company__in=recruiter.company.all())
@@ -1945,7 +1946,7 @@ def widget_jobs(request):
     else:
         recruiter=None
     try:
-        company = Company.objects.get(subdomain__slug=subdomain_data['active_subdomain'])
+        company = get_tenant_company(request)
     except:
         raise Http404
     if vacancy_status_name and not recruiter:
@@ -2163,7 +2164,7 @@ def template_editor(request):
     if not subdomain_data['active_host']:
         raise Http404
     recruiter = request.user.recruiter
-    company = get_object_or_404(Company, subdomain__slug=subdomain_data['active_subdomain'])
+    company = get_tenant_company_or_404(request)
     if not company in request.user.recruiter.company.all():
         raise Http404
     try:
@@ -2191,7 +2192,7 @@ def site_template_preview(request, template_id = None):
     if not subdomain_data['active_host']:
         raise Http404
     recruiter = request.user.recruiter
-    company = get_object_or_404(Company, subdomain__slug=subdomain_data['active_subdomain'])
+    company = get_tenant_company_or_404(request)
     if not company in request.user.recruiter.company.all():
         raise Http404
     try:
@@ -2242,7 +2243,7 @@ def get_site_template(request):
     subdomain_data = subdomain(request)
     if not subdomain_data['active_host']:
         raise Http404
-    company = get_object_or_404(Company, subdomain__slug=subdomain_data['active_subdomain'])
+    company = get_tenant_company_or_404(request)
     if not company in request.user.recruiter.company.all():
         raise Http404
     template = company.site_template
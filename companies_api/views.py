@@ -40,6 +40,7 @@ from candidates.models import Country
 from common.forms import UserDataForm
 from customField.forms import TemplateForm, FieldFormset
 from TRM.context_processors import subdomain
+from TRM.tenancy import get_tenant, get_tenant_company, get_tenant_company_or_404
 from TRM.settings import SITE_URL, num_pages, number_objects_page, DEFAULT_SITE_TEMPLATE, STATIC_URL
 from vacancies.forms import VacancyForm, VacancyFileForm, Public_FilesForm
 from vacancies.models import Vacancy, Vacancy_Status, Postulate, Vacancy_Files, VacancyStage
@@ -360,7 +361,7 @@ class CompanyProfileViewSet(viewsets.ModelViewSet):
         if not subdomain_data.get('active_host'):
             return Response({'error': 'Invalid subdomain'}, status=status.HTTP_404_NOT_FOUND)
 
-        company = get_object_or_404(Company, subdomain__slug=subdomain_data['active_subdomain'])
+        company = get_tenant_company_or_404(request)
         context = {'success': False}
         recruiter = None
 
@@ -831,7 +832,7 @@ class VacanciesSummaryViewSet(viewsets.ModelViewSet):
             raise Http404
 
         try:
-            company = Company.objects.get(subdomain__slug=subdomain_data['active_subdomain'])
+            company = get_tenant_company(self.request)
         except Company.DoesNotExist:
             raise Http404
 
@@ -1095,7 +1096,7 @@ class AddUpdateVacancyHiringProcessViewSet(viewsets.ViewSet):
             raise PermissionDenied("Not a manager")
         
         # Verify company by subdomain
-        company = get_object_or_404(Company, subdomain__slug=subdomain_data['active_subdomain'])
+        company = get_tenant_company_or_404(request)
         if not company.check_service('JP_POST'):
             raise PermissionDenied("Service not available")
         
@@ -1136,7 +1137,7 @@ class AddUpdateVacancyTalentSourcingViewSet(viewsets.ViewSet):
         if not recruiter.is_manager():
             raise PermissionDenied("Not a manager")
 
-        company = get_object_or_404(Company, subdomain__slug=subdomain_data['active_subdomain'])
+        company = get_tenant_company_or_404(request)
         if not company.check_service('JP_POST'):
             raise PermissionDenied("Service not available")
 
@@ -1383,7 +1384,7 @@ class WidgetJobsViewSet(viewsets.ModelViewSet):
         if not subdomain_data.get('active_subdomain'):
             raise Http404("Subdomain not found")
 
-        self.company = get_object_or_404(Company, subdomain__slug=subdomain_data['active_subdomain'])
+        self.company = get_tenant_company_or_404(request)
 
         if request.user.is_authenticated and hasattr(request.user, 'profile'):
             if request.user.profile.codename == 'recruiter':
@@ -1615,16 +1616,14 @@ class GetSiteTemplateViewSet(viewsets.ViewSet):
         user = request.user
 
         # Subdomain logic
-        subdomain_data = subdomain(request)
-        active_subdomain = subdomain_data.get('active_subdomain')
-        active_host = subdomain_data.get('active_host')
-        if not active_host or not active_subdomain:
+        tenant = get_tenant(request)
+        if not tenant.active_host or not tenant.active_subdomain:
             raise Http404
 
-        # Get company by pk and subdomain and user's company membership
-        try:
-            company = Company.objects.get(id=pk, subdomain__slug=active_subdomain, recruiter__user=user)
-        except Company.DoesNotExist:
+        # The company of the subdomain, if it is the requested one and the user is one of its recruiters
+        company = tenant.company
+        if company is None or str(company.pk) != str(pk) or \
+                not Recruiter.objects.filter(user=user, company=company).exists():
             raise Http404
         
         # Validate template existence
@@ -4,7 +4,7 @@ from django.utils.translation import gettext_lazy as _
 from helpdesk.models import Queue, Ticket, FollowUp, PreSetReply, KBCategory
 from helpdesk.models import EscalationExclusion, EmailTemplate, KBItem
 from helpdesk.models import TicketChange, Attachment, IgnoreEmail
-from helpdesk.models import CustomField
+from helpdesk.models import CustomField, BulkTicketJob
 
 
 """
@@ -22,6 +22,7 @@ Registered models include:
 - KBCategory, KBItem
 - EscalationExclusion, EmailTemplate, IgnoreEmail
 - CustomField, Attachment, TicketChange
+- BulkTicketJob
 """
 
 
@@ -125,3 +126,14 @@ admin.site.register(PreSetReply)
 admin.site.register(EscalationExclusion)
 admin.site.register(KBCategory)
 admin.site.register(IgnoreEmail)
+
+
+@admin.register(BulkTicketJob)
+class BulkTicketJobAdmin(admin.ModelAdmin):
+    """
+    Admin interface for the bulk ticket updates run in the background,
+    with their progress.
+    """
+    list_display = ('created', 'user', 'action', 'status', 'processed', 'total', 'finished')
+    list_filter = ('status', 'action')
+    readonly_fields = ('created', 'finished', 'locked_by', 'locked_at')
@@ -0,0 +1,290 @@
+"""
+django-helpdesk - A Django powered ticket tracker for small enterprise.
+
+(c) Copyright 2008 Jutda. All Rights Reserved. See LICENSE for details.
+
+bulk.py - Bulk updates of the tickets selected in the ticket list
+          (views.staff.mass_update).
+
+update_tickets applies an action to chunks of HELPDESK_BULK_UPDATE_CHUNK_SIZE
+tickets with one update() (or delete()) per chunk, and creates the FollowUp
+and TicketChange rows with bulk_create. The closing emails go through
+send_templated_mail, which queues them (see common.mail_queue). Queue access
+is checked once by the view, which keeps only the selected tickets in the
+queues of the user.
+
+Selections of more than HELPDESK_BULK_UPDATE_BACKGROUND_THRESHOLD tickets are
+stored as a BulkTicketJob and processed by the process_bulk_ticket_jobs
+command (or its cron job), which records the progress on the job.
+"""
+
+from __future__ import absolute_import
+import logging
+import os
+import socket
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from helpdesk import settings as helpdesk_settings
+from helpdesk.lib import safe_template_context, send_templated_mail
+from helpdesk.models import BulkTicketJob, FollowUp, Ticket, TicketChange
+
+logger = logging.getLogger('helpdesk')
+
+ACTIONS = ('assign', 'unassign', 'close', 'close_public', 'delete')
+CHUNK_SIZE = helpdesk_settings.HELPDESK_BULK_UPDATE_CHUNK_SIZE
+# A job locked for longer than this is considered abandoned by a dead worker
+LOCK_TIMEOUT = 3600
+
+
+def owner_name(user):
+    """Name of a ticket owner, as Ticket.get_assigned_to prints it."""
+    if user is None:
+        return _('Unassigned')
+    return user.get_full_name() or user.get_username()
+
+
+def create_followups(followups, changes):
+    """
+    Insert follow-ups with one TicketChange each, in two queries.
+
+    FollowUp.save() would save the ticket again, bulk_create skips it. The
+    follow-ups of a call must be of different tickets and share their date.
+
+    Args:
+        followups (list): Unsaved FollowUp objects.
+        changes (list): (field, old_value, new_value) of each follow-up.
+    """
+    followups = FollowUp.objects.bulk_create(followups)
+    if not all(followup.pk for followup in followups):
+        # Backends that do not return the IDs of bulk inserted rows
+        by_ticket = dict(FollowUp.objects.filter(ticket_id__in=[followup.ticket_id for followup in followups],
+                                                 date=followups[0].date).values_list('ticket_id', 'id'))
+        for followup in followups:
+            followup.pk = followup.id = by_ticket[followup.ticket_id]
+    TicketChange.objects.bulk_create([
+        TicketChange(followup=followup, field=field, old_value=old_value, new_value=new_value)
+        for followup, (field, old_value, new_value) in zip(followups, changes)])
+
+
+def update_chunk(ticket_ids, action, user, assign_to=None):
+    """
+    Apply an action to a chunk of tickets in a few set-based queries.
+
+    Tickets the action would not change (already assigned to the user,
+    unassigned or closed) are left alone.
+
+    Args:
+        ticket_ids (list): IDs of the tickets.
+        action (str): One of ACTIONS.
+        user (User): User running the update, author of the follow-ups.
+        assign_to (User): New owner for the 'assign' action.
+
+    Returns:
+        int: Number of tickets changed.
+    """
+    tickets = Ticket.objects.filter(id__in=ticket_ids)
+    if action == 'delete':
+        changed = tickets.count()
+        tickets.delete()
+        return changed
+
+    if action == 'assign':
+        tickets = tickets.exclude(assigned_to=assign_to)
+    elif action == 'unassign':
+        tickets = tickets.filter(assigned_to__isnull=False)
+    else:
+        tickets = tickets.exclude(status=Ticket.CLOSED_STATUS)
+    tickets = list(tickets.select_related('assigned_to').order_by('id'))
+    if not tickets:
+        return 0
+    ids = [ticket.pk for ticket in tickets]
+    now = timezone.now()
+
+    if action in ('assign', 'unassign'):
+        Ticket.objects.filter(id__in=ids).update(assigned_to=assign_to, modified=now)
+        if action == 'assign':
+            title = _('Assigned to %(username)s in bulk update' % {'username': assign_to.get_username()})
+        else:
+            title = _('Unassigned in bulk update')
+        followups = [FollowUp(ticket=ticket, date=now, title=title, public=True, user=user) for ticket in tickets]
+        changes = [(_('Owner'), owner_name(ticket.assigned_to), owner_name(assign_to)) for ticket in tickets]
+    else:
+        Ticket.objects.filter(id__in=ids).update(status=Ticket.CLOSED_STATUS, modified=now)
+        followups = [FollowUp(ticket=ticket, date=now, title=_('Closed in bulk update'),
+                              public=(action == 'close_public'), user=user, new_status=Ticket.CLOSED_STATUS)
+                     for ticket in tickets]
+        changes = [(_('Status'), ticket.get_status_display(), dict(Ticket.STATUS_CHOICES)[Ticket.CLOSED_STATUS])
+                   for ticket in tickets]
+
+    create_followups(followups, changes)
+
+    if action == 'close_public':
+        transaction.on_commit(lambda: notify_closed(ids, user))
+    return len(ids)
+
+
+def notify_closed(ticket_ids, user):
+    """
+    Email the submitter, the CCs, the owner and the queue CC of tickets closed
+    in bulk. The messages are queued by send_templated_mail.
+    """
+    tickets = Ticket.objects.filter(id__in=ticket_ids).select_related('queue', 'assigned_to') \
+        .prefetch_related('ticketcc_set')
+    for t in tickets:
+        context = safe_template_context(t)
+        context.update(resolution=t.resolution,
+                       queue=t.queue)
+
+        messages_sent_to = []
+
+        if t.submitter_email:
+            send_templated_mail(
+                'closed_submitter',
+                context,
+                recipients=t.submitter_email,
+                sender=t.queue.from_address,
+                fail_silently=True,
+                )
+            messages_sent_to.append(t.submitter_email)
+
+        for cc in t.ticketcc_set.all():
+            if cc.email_address not in messages_sent_to:
+                send_templated_mail(
+                    'closed_submitter',
+                    context,
+                    recipients=cc.email_address,
+                    sender=t.queue.from_address,
+                    fail_silently=True,
+                    )
+                messages_sent_to.append(cc.email_address)
+
+        if t.assigned_to and \
+                user != t.assigned_to and \
+                t.assigned_to.email and \
+                t.assigned_to.email not in messages_sent_to:
+            send_templated_mail(
+                'closed_owner',
+                context,
+                recipients=t.assigned_to.email,
+                sender=t.queue.from_address,
+                fail_silently=True,
+                )
+            messages_sent_to.append(t.assigned_to.email)
+
+        if t.queue.updated_ticket_cc and \
+                t.queue.updated_ticket_cc not in messages_sent_to:
+            send_templated_mail(
+                'closed_cc',
+                context,
+                recipients=t.queue.updated_ticket_cc,
+                sender=t.queue.from_address,
+                fail_silently=True,
+                )
+
+
+def update_tickets(ticket_ids, action, user, assign_to=None, progress=None):
+    """
+    Apply an action to tickets, one chunk and one transaction at a time.
+
+    Args:
+        ticket_ids (list): IDs of the tickets, already limited to the queues
+            of the user.
+        action (str): One of ACTIONS.
+        user (User): User running the update.
+        assign_to (User): New owner for the 'assign' action.
+        progress (callable): Called with the number of tickets processed
+            after each chunk.
+
+    Returns:
+        int: Number of tickets changed.
+    """
+    changed = 0
+    for start in range(0, len(ticket_ids), CHUNK_SIZE):
+        with transaction.atomic():
+            changed += update_chunk(ticket_ids[start:start + CHUNK_SIZE], action, user, assign_to)
+        if progress:
+            progress(min(start + CHUNK_SIZE, len(ticket_ids)))
+    return changed
+
+
+def mass_update_tickets(ticket_ids, action, user, assign_to=None):
+    """
+    Run a bulk update, in the background for large selections.
+
+    Returns:
+        BulkTicketJob or None: The queued job, None if the update was applied
+        right away.
+    """
+    if len(ticket_ids) <= helpdesk_settings.HELPDESK_BULK_UPDATE_BACKGROUND_THRESHOLD:
+        update_tickets(ticket_ids, action, user, assign_to)
+        return None
+    return BulkTicketJob.objects.create(user=user, action=action, assign_to=assign_to, total=len(ticket_ids),
+                                        ticket_ids=','.join('%s' % pk for pk in ticket_ids))
+
+
+def claim_job(worker):
+    """
+    Lock the oldest pending job for a worker, or a job left running by a
+    dead worker once its lock expired.
+
+    Returns:
+        BulkTicketJob or None: The claimed job.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = BulkTicketJob.objects.select_for_update(skip_locked=True).filter(status='pending') \
+            .order_by('created').first()
+        if job is None:
+            job = BulkTicketJob.objects.select_for_update(skip_locked=True) \
+                .filter(status='running', locked_at__lt=now - timedelta(seconds=LOCK_TIMEOUT)) \
+                .order_by('created').first()
+        if job is None:
+            return None
+        job.status, job.locked_by, job.locked_at = 'running', worker, now
+        job.save(update_fields=['status', 'locked_by', 'locked_at'])
+    return job
+
+
+def run_job(job):
+    """
+    Process a claimed job and record its progress. Chunks already processed
+    by a previous attempt are skipped.
+    """
+    ticket_ids = job.get_ticket_ids()
+    done = job.processed
+
+    def progress(processed):
+        BulkTicketJob.objects.filter(pk=job.pk).update(processed=done + processed, locked_at=timezone.now())
+
+    try:
+        update_tickets(ticket_ids[done:], job.action, job.user, job.assign_to, progress)
+    except Exception as e:
+        logger.exception('Bulk ticket update %s failed', job.pk)
+        BulkTicketJob.objects.filter(pk=job.pk).update(status='failed', last_error='%s' % e, locked_at=None,
+                                                       finished=timezone.now())
+        return False
+    BulkTicketJob.objects.filter(pk=job.pk).update(status='done', processed=len(ticket_ids), locked_at=None,
+                                                   finished=timezone.now())
+    return True
+
+
+def process_jobs(worker=None, limit=None):
+    """
+    Claim and run pending jobs until there are none left (or ``limit`` jobs).
+
+    Returns:
+        int: Number of jobs run.
+    """
+    worker = worker or '%s-%s' % (socket.gethostname(), os.getpid())
+    count = 0
+    while limit is None or count < limit:
+        job = claim_job(worker)
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
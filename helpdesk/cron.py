@@ -40,4 +40,18 @@ def EmailTicketCronJob():
         call_command('get_email')
     except Exception as e:
         print(e)
-    print((str(datetime.now()) + ' --> Email Ticket Cron completed'))
\ No newline at end of file
+    print((str(datetime.now()) + ' --> Email Ticket Cron completed'))
+
+def BulkTicketJobsCronJob():
+    """
+    Runs the bulk ticket updates queued by the ticket list (see helpdesk.bulk),
+    for setups without a running process_bulk_ticket_jobs worker.
+
+    Exceptions during execution are caught and printed to the console.
+    """
+    print((str(datetime.now()) + ' --> Bulk Ticket Updates Cron start'))
+    try:
+        call_command('process_bulk_ticket_jobs', once=True)
+    except Exception as e:
+        print(e)
+    print((str(datetime.now()) + ' --> Bulk Ticket Updates Cron completed'))
@@ -8,6 +8,7 @@ lib.py - Common functions (eg multipart e-mail)
 
 from __future__ import absolute_import
 import logging
+from functools import lru_cache
 
 try:
     from base64 import urlsafe_b64encode as b64encode
@@ -38,6 +39,17 @@ Includes:
 logger = logging.getLogger('helpdesk')
 
 
+@lru_cache(maxsize=256)
+def compile_email_template(source):
+    """
+    Compiled Django template of an e-mail part. The e-mail templates live in
+    the database and used to be compiled again for every message; the source
+    is the cache key, so an edited EmailTemplate is compiled anew.
+    """
+    from django.template import engines
+    return engines['django'].from_string(source)
+
+
 def send_templated_mail(template_name,
                         email_context,
                         recipients,
@@ -74,7 +86,7 @@ def send_templated_mail(template_name,
     from django import VERSION
     from django.conf import settings
     from django.core.mail import EmailMultiAlternatives
-    from django.template import loader, Context
+    from django.template import Context
 
     from helpdesk.models import EmailTemplate
     from helpdesk.settings import HELPDESK_EMAIL_SUBJECT_TEMPLATE, \
@@ -111,13 +123,7 @@ def send_templated_mail(template_name,
 
     footer_file = os.path.join('helpdesk', locale, 'email_text_footer.txt')
 
-    # get_template_from_string was removed in Django 1.8
-    # http://django.readthedocs.org/en/1.8.x/ref/templates/upgrading.html
-    try:
-        from django.template import engines
-        template_func = engines['django'].from_string
-    except ImportError:  # occurs in django < 1.8
-        template_func = loader.get_template_from_string
+    template_func = compile_email_template
 
     text_part = template_func(
         "%s{%% include '%s' %%}" % (t.plain_text, footer_file)
@@ -164,7 +170,9 @@ def send_templated_mail(template_name,
             msg.attach(filename=attachment[0], content=file_to_attach.read())
             file_to_attach.close()
 
-    return msg.send(fail_silently=False)
+    # Queued, see common.mail_queue
+    from common.mail_queue import send_message
+    return send_message(msg)
 
 
 def query_to_dict(results, descriptions):
@@ -0,0 +1,651 @@
+"""
+django-helpdesk - A Django powered ticket tracker for small enterprise.
+
+(c) Copyright 2008 Jutda. All Rights Reserved. See LICENSE for details.
+
+mailbox.py - Turns the messages of the POP3 and IMAP mailboxes of the queues
+             into tickets (management command get_email).
+
+process_email polls up to HELPDESK_EMAIL_WORKERS mailboxes at the same time,
+each with its own connection, opened through the SOCKS proxy of its queue
+only. Messages are downloaded by batches of HELPDESK_EMAIL_BATCH_SIZE (IMAP
+UID FETCH of UID ranges) and the tickets, follow-ups and attachments of a
+batch are created with bulk_create. The UID of the last IMAP message read is
+stored on the queue as a checkpoint, so the messages left in the mailbox
+(ignored senders kept in the mailbox, messages that could not be read) are
+not scanned again. The notifications of a batch are sent once it is
+committed and checkpointed.
+"""
+
+from __future__ import absolute_import
+import email
+import imaplib
+import logging
+import mimetypes
+import poplib
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from email.header import decode_header
+from email.utils import parseaddr, collapse_rfc2231_value
+
+from email_reply_parser import EmailReplyParser
+
+from django.core.files.base import ContentFile
+from django.db import connection, connections, models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from helpdesk import settings as helpdesk_settings
+from helpdesk.lib import send_templated_mail, safe_template_context
+from helpdesk.models import Queue, Ticket, FollowUp, Attachment, IgnoreEmail
+
+logger = logging.getLogger('helpdesk')
+
+BATCH_SIZE = helpdesk_settings.HELPDESK_EMAIL_BATCH_SIZE
+TIMEOUT = helpdesk_settings.HELPDESK_EMAIL_TIMEOUT
+
+STRIPPED_SUBJECT_STRINGS = [
+    "Re: ",
+    "Fw: ",
+    "RE: ",
+    "FW: ",
+    "Automatic reply: ",
+]
+
+
+class ProxyMixin(object):
+    """
+    Opens the connection of a poplib or imaplib client through a SOCKS proxy,
+    for this connection only.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.proxy = kwargs.pop('proxy')
+        super(ProxyMixin, self).__init__(*args, **kwargs)
+
+    def _create_socket(self, timeout):
+        import socks
+        sock = socks.socksocket()
+        sock.set_proxy(*self.proxy)
+        sock.settimeout(timeout)
+        try:
+            sock.connect((self.host, self.port))
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+
+class ProxyPOP3(ProxyMixin, poplib.POP3):
+    pass
+
+
+class ProxyPOP3_SSL(ProxyMixin, poplib.POP3_SSL):
+
+    def _create_socket(self, timeout):
+        sock = super(ProxyPOP3_SSL, self)._create_socket(timeout)
+        return self.context.wrap_socket(sock, server_hostname=self.host)
+
+
+class ProxyIMAP4(ProxyMixin, imaplib.IMAP4):
+    pass
+
+
+class ProxyIMAP4_SSL(ProxyMixin, imaplib.IMAP4_SSL):
+
+    def _create_socket(self, timeout):
+        sock = super(ProxyIMAP4_SSL, self)._create_socket(timeout)
+        return self.ssl_context.wrap_socket(sock, server_hostname=self.host)
+
+
+# (mailbox type, SSL): client, client through a proxy, default port
+CLIENTS = {
+    ('pop3', False): (poplib.POP3, ProxyPOP3, 110),
+    ('pop3', True): (poplib.POP3_SSL, ProxyPOP3_SSL, 995),
+    ('imap', False): (imaplib.IMAP4, ProxyIMAP4, 143),
+    ('imap', True): (imaplib.IMAP4_SSL, ProxyIMAP4_SSL, 993),
+}
+
+
+def open_mailbox(queue, email_box_type):
+    """
+    Connect and log in to the mailbox of a queue.
+
+    Args:
+        queue (helpdesk.models.Queue): The queue.
+        email_box_type (str): 'pop3' or 'imap'.
+
+    Returns:
+        poplib.POP3 or imaplib.IMAP4: The client, logged in.
+
+    Raises:
+        ImportError: If socks proxy is configured but PySocks library is missing.
+    """
+    ssl = bool(queue.email_box_ssl or helpdesk_settings.QUEUE_EMAIL_BOX_SSL)
+    client, proxy_client, default_port = CLIENTS[(email_box_type, ssl)]
+    address = (queue.email_box_host or helpdesk_settings.QUEUE_EMAIL_BOX_HOST,
+               int(queue.email_box_port or default_port))
+
+    if queue.socks_proxy_type and queue.socks_proxy_host and queue.socks_proxy_port:
+        try:
+            import socks
+        except ImportError:
+            raise ImportError("Queue has been configured with proxy settings, "
+                              "but no socks library was installed. "
+                              "Try to install PySocks via pypi.")
+
+        proxy_type = {
+            'socks4': socks.SOCKS4,
+            'socks5': socks.SOCKS5,
+        }.get(queue.socks_proxy_type)
+        server = proxy_client(*address, timeout=TIMEOUT,
+                              proxy=(proxy_type, queue.socks_proxy_host, int(queue.socks_proxy_port)))
+    else:
+        server = client(*address, timeout=TIMEOUT)
+
+    user = queue.email_box_user or helpdesk_settings.QUEUE_EMAIL_BOX_USER
+    password = queue.email_box_pass or helpdesk_settings.QUEUE_EMAIL_BOX_PASSWORD
+    if email_box_type == 'pop3':
+        server.getwelcome()
+        server.user(user)
+        server.pass_(password)
+    else:
+        server.login(user, password)
+    return server
+
+
+def uid_ranges(uids):
+    """IMAP set of sorted UIDs, eg '1:3,7' for [1, 2, 3, 7]."""
+    ranges = []
+    for uid in uids:
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ','.join('%s:%s' % (first, last) if first != last else '%s' % first for first, last in ranges)
+
+
+def read_pop3(queue, server, quiet=False):
+    """
+    Turn the messages of a POP3 mailbox into tickets, a batch at a time. The
+    messages processed are deleted when the session ends. POP3 has no UIDs
+    to resume from, the whole mailbox is read every time.
+    """
+    try:
+        numbers = [int(line.split()[0]) for line in server.list()[1]]
+        ignores = ignored_senders(queue)
+        for start in range(0, len(numbers), BATCH_SIZE):
+            messages = [(number, b'\n'.join(server.retr(number)[1]))
+                        for number in numbers[start:start + BATCH_SIZE]]
+            processed, received = ingest_messages(queue, messages, ignores, quiet=quiet)
+            for number in processed:
+                server.dele(number)
+            notify_after_commit(queue, received)
+    finally:
+        server.quit()
+
+
+def read_imap(queue, server, quiet=False):
+    """
+    Turn the new messages of an IMAP folder into tickets, a batch of UIDs at
+    a time. The messages processed are deleted and the last UID read is
+    stored on the queue after each batch.
+    """
+    try:
+        server.select(queue.email_box_imap_folder)
+        uid_validity = server.response('UIDVALIDITY')[1][0]
+        uid_validity = int(uid_validity) if uid_validity else None
+        last_uid = queue.email_box_last_uid or 0
+        if uid_validity is None or uid_validity != queue.email_box_uid_validity:
+            # The UIDs of the folder changed, or were never read
+            last_uid = 0
+
+        status, data = server.uid('SEARCH', 'UID', '%s:*' % (last_uid + 1), 'NOT', 'DELETED')
+        # 'n:*' also matches the last message when its UID is lower than n
+        uids = sorted(uid for uid in (int(uid) for uid in (data[0] or b'').split()) if uid > last_uid)
+        ignores = ignored_senders(queue)
+        for start in range(0, len(uids), BATCH_SIZE):
+            batch = uids[start:start + BATCH_SIZE]
+            status, data = server.uid('FETCH', uid_ranges(batch), '(UID RFC822)')
+            messages = []
+            for item in data:
+                match = re.search(br'UID (\d+)', item[0]) if isinstance(item, tuple) else None
+                if match:
+                    messages.append((int(match.group(1)), item[1]))
+            processed, received = ingest_messages(queue, messages, ignores, quiet=quiet)
+            if processed:
+                server.uid('STORE', uid_ranges(sorted(processed)), '+FLAGS', '(\\Deleted)')
+            Queue.objects.filter(pk=queue.pk).update(email_box_last_uid=batch[-1],
+                                                     email_box_uid_validity=uid_validity)
+            notify_after_commit(queue, received)
+
+        server.expunge()
+        server.close()
+    finally:
+        server.logout()
+
+
+def process_queue(q, quiet=False):
+    """
+    Process a single email queue: connect, fetch, and process messages.
+
+    Args:
+        q (helpdesk.models.Queue): The queue object to process.
+        quiet (bool): If True, suppress verbose output.
+    """
+    if not quiet:
+        print(("Processing: %s" % q))
+
+    email_box_type = helpdesk_settings.QUEUE_EMAIL_BOX_TYPE or q.email_box_type
+    if email_box_type not in ('pop3', 'imap'):
+        return
+
+    server = open_mailbox(q, email_box_type)
+    if email_box_type == 'pop3':
+        read_pop3(q, server, quiet=quiet)
+    else:
+        read_imap(q, server, quiet=quiet)
+
+
+def queue_due(q):
+    """Whether the mailbox of a queue was last checked more than its interval ago."""
+    last_check = q.email_box_last_check or timezone.now() - timedelta(minutes=30)
+    return last_check + timedelta(minutes=q.email_box_interval or 0) <= timezone.now()
+
+
+def poll_queue(q, quiet=False):
+    """
+    Process the mailbox of a queue and record when it was checked. Errors are
+    logged rather than raised, so they do not stop the other queues.
+
+    Returns:
+        bool: True if the mailbox was processed.
+    """
+    try:
+        process_queue(q, quiet=quiet)
+    except Exception:
+        logger.exception('Could not process the mailbox of queue %s', q.slug)
+        return False
+    Queue.objects.filter(pk=q.pk).update(email_box_last_check=timezone.now())
+    return True
+
+
+def poll_queue_in_thread(q, quiet=False):
+    try:
+        return poll_queue(q, quiet=quiet)
+    finally:
+        connections.close_all()
+
+
+def process_email(quiet=False, workers=None):
+    """
+    Process all configured email queues for new messages.
+
+    The queues due for a check are processed by up to ``workers`` threads
+    (HELPDESK_EMAIL_WORKERS by default), each with its own mailbox and
+    database connection.
+
+    Args:
+        quiet (bool): If True, suppress detailed output during processing.
+        workers (int): Number of mailboxes processed at the same time.
+
+    Returns:
+        int: Number of mailboxes processed.
+    """
+    queues = [q for q in Queue.objects.filter(email_box_type__isnull=False, allow_email_submission=True)
+              if queue_due(q)]
+    workers = min(workers or helpdesk_settings.HELPDESK_EMAIL_WORKERS, len(queues))
+    if workers <= 1:
+        return sum(poll_queue(q, quiet=quiet) for q in queues)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='helpdesk-mailbox') as executor:
+        return sum(executor.map(lambda q: poll_queue_in_thread(q, quiet=quiet), queues))
+
+
+def decodeUnknown(charset, string):
+    """
+    Decode a byte string using the given charset, or fallback to utf-8/iso8859-1.
+    Strings that are already decoded are returned as they are.
+
+    Args:
+        charset (str or None): Character set name or None if unknown.
+        string (bytes): Byte string to decode.
+
+    Returns:
+        str: Decoded string.
+    """
+    if not isinstance(string, bytes):
+        return string
+    if not charset:
+        try:
+            return string.decode('utf-8', 'ignore')
+        except:
+            return string.decode('iso8859-1', 'ignore')
+    return str(string, charset)
+
+
+def decode_mail_headers(string):
+    """
+    Decode email headers that may have multiple encodings.
+
+    Args:
+        string (str): Raw email header string.
+
+    Returns:
+        str: Decoded string with all parts joined.
+    """
+    decoded = decode_header(string)
+    return ' '.join([msg if isinstance(msg, str) else str(msg, charset or 'utf-8', 'replace')
+                     for msg, charset in decoded])
+
+
+def ignored_senders(queue):
+    """IgnoreEmail entries that apply to a queue."""
+    return list(IgnoreEmail.objects.filter(Q(queues=queue) | Q(queues__isnull=True)))
+
+
+def parse_message(raw, queue):
+    """
+    Read the subject, sender, body (plain text and HTML) and attachments of
+    a RFC822 message.
+
+    Args:
+        raw (bytes or str): Raw RFC822 email message.
+        queue (helpdesk.models.Queue): Queue the email belongs to.
+
+    Returns:
+        dict: subject, sender_email, ticket_id (the ticket a reply or forward
+        refers to, or None), body, priority and files.
+    """
+    if isinstance(raw, bytes):
+        message = email.message_from_bytes(raw)
+    else:
+        message = email.message_from_string(raw)
+    subject = message.get('subject', _('Created from e-mail'))
+    subject = decode_mail_headers(decodeUnknown(message.get_charset(), subject))
+    for affix in STRIPPED_SUBJECT_STRINGS:
+        subject = subject.replace(affix, "")
+    subject = subject.strip()
+
+    sender = message.get('from', _('Unknown Sender'))
+    sender = decode_mail_headers(decodeUnknown(message.get_charset(), sender))
+
+    sender_email = parseaddr(sender)[1]
+
+    matchobj = re.match(r".*\[" + re.escape(queue.slug) + r"-(?P<id>\d+)\]", subject)
+    # This is a reply or forward.
+    ticket_id = int(matchobj.group('id')) if matchobj else None
+
+    body_plain, body_html = '', ''
+    counter = 0
+    files = []
+
+    for part in message.walk():
+        if part.get_content_maintype() == 'multipart':
+            continue
+
+        name = part.get_param("name")
+        if name:
+            name = collapse_rfc2231_value(name)
+
+        if part.get_content_maintype() == 'text' and name is None:
+            if part.get_content_subtype() == 'plain':
+                body_plain = EmailReplyParser.parse_reply(
+                    decodeUnknown(part.get_content_charset(), part.get_payload(decode=True)))
+            else:
+                body_html = part.get_payload(decode=True)
+        else:
+            if not name:
+                ext = mimetypes.guess_extension(part.get_content_type())
+                name = "part-%i%s" % (counter, ext)
+
+            files.append({
+                'filename': name,
+                'content': part.get_payload(decode=True),
+                'type': part.get_content_type()},
+                )
+
+        counter += 1
+
+    if body_plain:
+        body = body_plain
+    else:
+        body = _('No plain-text email body available. Please see attachment email_html_body.html.')
+
+    if body_html:
+        files.append({
+            'filename': _("email_html_body.html"),
+            'content': body_html,
+            'type': 'text/html',
+        })
+
+    priority = 3
+
+    smtp_priority = message.get('priority', '')
+    smtp_importance = message.get('importance', '')
+
+    high_priority_types = ('high', 'important', '1', 'urgent')
+
+    if smtp_priority in high_priority_types or smtp_importance in high_priority_types:
+        priority = 2
+
+    return {
+        'subject': subject,
+        'sender_email': sender_email,
+        'ticket_id': ticket_id,
+        'body': body,
+        'priority': priority,
+        'files': files,
+    }
+
+
+def insert_all(objects):
+    """
+    Insert objects of a model with bulk_create, without their save() method.
+    Backends that do not return the IDs of bulk inserted rows (MySQL) insert
+    them one at a time instead.
+    """
+    if objects and connection.features.can_return_rows_from_bulk_insert:
+        return type(objects[0]).objects.bulk_create(objects)
+    for obj in objects:
+        models.Model.save(obj, force_insert=True)
+    return objects
+
+
+def ingest_messages(queue, messages, ignores, quiet=False):
+    """
+    Create the tickets, or the follow-ups of the tickets they reply to, of a
+    batch of messages of a queue, in one transaction. Closed tickets that get
+    a reply are re-opened. The attachment files saved are deleted if the
+    transaction is rolled back.
+
+    The notification emails are left to the caller, which sends them with
+    notify_after_commit once the messages are marked as read in the mailbox.
+
+    Args:
+        queue (helpdesk.models.Queue): Queue of the mailbox.
+        messages (list): (key, raw message) of each message, the key being
+            its number or UID in the mailbox.
+        ignores (list): IgnoreEmail entries of the queue.
+        quiet (bool): Suppress detailed output if True.
+
+    Returns:
+        tuple: Keys of the messages to delete from the mailbox (the ones
+        processed and the ignored ones that are not kept in the mailbox),
+        and the messages turned into tickets or follow-ups.
+    """
+    processed = []
+    received = []
+    for key, raw in messages:
+        try:
+            message = parse_message(raw, queue)
+            ignore = next((ignore for ignore in ignores if ignore.test(message['sender_email'])), None)
+        except Exception:
+            logger.exception('Could not read message %s of queue %s, it is left in the mailbox', key, queue.slug)
+            continue
+        if ignore is not None:
+            if not ignore.keep_in_mailbox:
+                processed.append(key)
+            continue
+        received.append(message)
+        processed.append(key)
+    if not received:
+        return processed, received
+
+    now = timezone.now()
+    files = []
+    try:
+        with transaction.atomic():
+            save_messages(queue, received, now, files, quiet=quiet)
+    except Exception:
+        for file in files:
+            file.delete(save=False)
+        raise
+    return processed, received
+
+
+def save_messages(queue, received, now, files, quiet=False):
+    """
+    Create the tickets, follow-ups and attachments of the messages received,
+    see ingest_messages. The attachment files saved are appended to files.
+    """
+    replied = Ticket.objects.select_related('queue', 'assigned_to').in_bulk(
+        {message['ticket_id'] for message in received if message['ticket_id']})
+    if replied:
+        Ticket.objects.filter(id__in=list(replied)).update(modified=now, status=Case(
+            When(status=Ticket.CLOSED_STATUS, then=Value(Ticket.REOPENED_STATUS)), default=F('status')))
+        for t in replied.values():
+            t.modified = now
+            if t.status == Ticket.CLOSED_STATUS:
+                t.status = Ticket.REOPENED_STATUS
+
+    new_tickets = []
+    for message in received:
+        t = replied.get(message['ticket_id'])
+        message['new'] = t is None
+        if t is None:
+            t = Ticket(
+                title=message['subject'],
+                queue=queue,
+                submitter_email=message['sender_email'],
+                created=now,
+                modified=now,
+                description=message['body'],
+                priority=message['priority'],
+            )
+            new_tickets.append(t)
+        message['ticket'] = t
+    insert_all(new_tickets)
+
+    followups = []
+    for message in received:
+        t = message['ticket']
+        f = FollowUp(
+            ticket=t,
+            title=_('E-Mail Received from %(sender_email)s' % {'sender_email': message['sender_email']}),
+            date=now,
+            public=True,
+            comment=message['body'],
+        )
+        if t.status == Ticket.REOPENED_STATUS:
+            f.new_status = Ticket.REOPENED_STATUS
+            f.title = _('Ticket Re-Opened by E-Mail Received from %(sender_email)s' % {
+                'sender_email': message['sender_email']})
+        message['followup'] = f
+        followups.append(f)
+    insert_all(followups)
+
+    attachments = []
+    for message in received:
+        t, f = message['ticket'], message['followup']
+        if not quiet:
+            print((" [%s-%s] %s" % (t.queue.slug, t.id, t.title,)))
+
+        for file in message['files']:
+            if file['content']:
+                filename = file['filename'].encode('ascii', 'replace').decode('ascii').replace(' ', '_')
+                filename = re.sub('[^a-zA-Z0-9._-]+', '', filename)
+                a = Attachment(
+                    followup=f,
+                    filename=filename,
+                    mime_type=file['type'],
+                    size=len(file['content']),
+                    )
+                a.file.save(filename, ContentFile(file['content']), save=False)
+                files.append(a.file)
+                attachments.append(a)
+                if not quiet:
+                    print(("    - %s" % filename))
+    Attachment.objects.bulk_create(attachments)
+
+
+def notify_after_commit(queue, received):
+    """
+    Send the notification emails of the messages received (notify_received)
+    once the transaction, if any, is committed. Errors are logged, so they do
+    not stop the reading of the mailbox.
+    """
+    if received:
+        transaction.on_commit(lambda: notify_received(queue, received), robust=True)
+
+
+def notify_received(queue, received):
+    """
+    Email the submitter and the queue CCs of the new tickets, and the owner
+    and the queue CC of the tickets updated by a reply. The messages are
+    queued by send_templated_mail.
+    """
+    for message in received:
+        t = message['ticket']
+        context = safe_template_context(t)
+
+        if message['new']:
+
+            if message['sender_email']:
+                send_templated_mail(
+                    'newticket_submitter',
+                    context,
+                    recipients=message['sender_email'],
+                    sender=queue.from_address,
+                    fail_silently=True,
+                    )
+
+            if queue.new_ticket_cc:
+                send_templated_mail(
+                    'newticket_cc',
+                    context,
+                    recipients=queue.new_ticket_cc,
+                    sender=queue.from_address,
+                    fail_silently=True,
+                    )
+
+            if queue.updated_ticket_cc and queue.updated_ticket_cc != queue.new_ticket_cc:
+                send_templated_mail(
+                    'newticket_cc',
+                    context,
+                    recipients=queue.updated_ticket_cc,
+                    sender=queue.from_address,
+                    fail_silently=True,
+                    )
+
+        else:
+            context.update(comment=message['followup'].comment)
+
+            if t.assigned_to and t.assigned_to.email:
+                send_templated_mail(
+                    'updated_owner',
+                    context,
+                    recipients=t.assigned_to.email,
+                    sender=queue.from_address,
+                    fail_silently=True,
+                    )
+
+            if queue.updated_ticket_cc:
+                send_templated_mail(
+                    'updated_cc',
+                    context,
+                    recipients=queue.updated_ticket_cc,
+                    sender=queue.from_address,
+                    fail_silently=True,
+                    )
@@ -0,0 +1,95 @@
+"""
+benchmark_ticket_stats.py - Compare the former Python computation of the
+dashboard ticket statistics with the aggregate one of helpdesk.stats.
+
+Everything runs in a transaction that is rolled back, so the command can be
+run against a copy of the production database without leaving rows behind.
+"""
+
+from __future__ import absolute_import
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from helpdesk.models import Queue, Ticket
+from helpdesk.stats import calc_basic_ticket_stats, date_rel_to_today
+
+
+def legacy_basic_ticket_stats(Tickets):
+    """ Former computation: len() on the open tickets by age and a loop over the closed tickets. """
+    all_open_tickets = Tickets.exclude(status=Ticket.CLOSED_STATUS)
+    today = datetime.today()
+    date_30_str = date_rel_to_today(today, 30).strftime('%Y-%m-%d')
+    date_60_str = date_rel_to_today(today, 60).strftime('%Y-%m-%d')
+    counts = [len(all_open_tickets.filter(created__gte=date_30_str)),
+              len(all_open_tickets.filter(created__gte=date_60_str, created__lte=date_30_str)),
+              len(all_open_tickets.filter(created__lte=date_60_str))]
+    averages = []
+    all_closed_tickets = Tickets.filter(status=Ticket.CLOSED_STATUS)
+    for closed in (all_closed_tickets, all_closed_tickets.filter(created__gte=date_60_str)):
+        days = [(ticket.modified - ticket.created).days for ticket in closed]
+        averages.append(sum(days) / len(days) if days else 0)
+    return counts, averages
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """
+    Django management command measuring the queries and the time of the
+    dashboard ticket statistics, computed in Python and with aggregates.
+    """
+    help = 'Benchmark the dashboard ticket statistics for several numbers of tickets.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='1000,10000,100000',
+            help='Comma separated numbers of tickets.')
+
+    def measure(self, function):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+        return len(queries.captured_queries), elapsed
+
+    def handle(self, *args, **options):
+        """
+        Command entry point.
+
+        Args:
+            *args: Positional arguments (not used).
+            **options: sizes.
+        """
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        self.stdout.write('%10s %16s %16s %16s %16s' % ('tickets', 'legacy queries', 'legacy ms',
+                                                        'aggregate queries', 'aggregate ms'))
+        statuses = [status for status, _label in Ticket.STATUS_CHOICES]
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                queue = Queue.objects.create(title='Stats benchmark', slug='stats-benchmark')
+                created = 0
+                for size in sizes:
+                    tickets = []
+                    for index in range(created, size):
+                        opened = now - timedelta(days=index % 120, hours=index % 24)
+                        tickets.append(Ticket(title='Ticket %s' % index, queue=queue, status=statuses[index % len(statuses)],
+                                              created=opened, modified=opened + timedelta(days=index % 15)))
+                    Ticket.objects.bulk_create(tickets, batch_size=5000)
+                    created = size
+                    queryset = Ticket.objects.filter(queue=queue)
+                    legacy = self.measure(lambda: legacy_basic_ticket_stats(queryset))
+                    aggregate = self.measure(lambda: calc_basic_ticket_stats(queryset))
+                    self.stdout.write('%10s %16s %16.1f %16s %16.1f' % (size, legacy[0], legacy[1] * 1000,
+                                                                        aggregate[0], aggregate[1] * 1000))
+                raise Rollback
+        except Rollback:
+            pass
@@ -1,4 +1,3 @@
-#!/usr/bin/python
 """
 django-helpdesk - A Django powered ticket tracker for small enterprise.
 
@@ -6,26 +5,30 @@ django-helpdesk - A Django powered ticket tracker for small enterprise.
 
 scripts/escalate_tickets.py - Easy way to escalate tickets based on their age,
                               designed to be run from Cron or similar.
+
+The exclusion dates are loaded once to count the working days, each queue is
+escalated with a single update() and the FollowUp and TicketChange rows are
+created with bulk_create. The emails are sent after the commit through
+send_templated_mail, which queues them (see common.mail_queue).
 """
 
 
 from __future__ import absolute_import
 from __future__ import print_function
 from datetime import timedelta, date
-import getopt
-from optparse import make_option
-import sys
 
 from django.core.management.base import BaseCommand, CommandError
-from django.db.models import Q
-from django.utils.translation import ugettext as _
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils.translation import gettext as _
 
 try:
     from django.utils import timezone
 except ImportError:
     from datetime import datetime as timezone
 
-from helpdesk.models import Queue, Ticket, FollowUp, EscalationExclusion, TicketChange
+from helpdesk.bulk import create_followups
+from helpdesk.models import Queue, Ticket, FollowUp, EscalationExclusion
 from helpdesk.lib import send_templated_mail, safe_template_context
 
 
@@ -36,23 +39,28 @@ class Command(BaseCommand):
     Options:
         --queues: Comma-separated list of queue slugs to include (default is all).
         --verboseescalation: Enables verbose output during escalation process.
+        --dry-run: Lists the tickets that would be escalated, changes nothing.
 
     The command filters tickets based on status, on_hold, priority, and last escalation date,
     and escalates them by lowering their priority number and notifying relevant parties.
     """
-    def __init__(self):
-        BaseCommand.__init__(self)
-
-        self.option_list += (
-            make_option(
-                '--queues',
-                help='Queues to include (default: all). Use queue slugs'),
-            make_option(
-                '--verboseescalation',
-                action='store_true',
-                default=False,
-                help='Display a list of dates excluded'),
-            )
+
+    help = 'Escalate the open tickets of the queues with escalation configured.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queues',
+            help='Queues to include (default: all). Use queue slugs')
+        parser.add_argument(
+            '--verboseescalation',
+            action='store_true',
+            default=False,
+            help='Display a list of dates excluded')
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            default=False,
+            help='List the tickets that would be escalated without changing them')
 
     def handle(self, *args, **options):
         """
@@ -71,17 +79,70 @@ class Command(BaseCommand):
 
         if queue_slugs is not None:
             queue_set = queue_slugs.split(',')
+            found = set(Queue.objects.filter(slug__in=queue_set).values_list('slug', flat=True))
             for queue in queue_set:
-                try:
-                    Queue.objects.get(slug__exact=queue)
-                except Queue.DoesNotExist:
+                if queue not in found:
                     raise CommandError("Queue %s does not exist." % queue)
                 queues.append(queue)
 
-        escalate_tickets(queues=queues, verbose=verbose)
+        count = escalate_tickets(queues=queues, verbose=verbose, dry_run=options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write('%s ticket(s) would be escalated' % count)
+        elif verbose:
+            self.stdout.write('%s ticket(s) escalated' % count)
+
+
+def working_days(first, last, excluded):
+    """
+    Number of days from first (included) to last (excluded) that are not
+    in the set of excluded dates.
+    """
+    days = 0
+    workdate = first
+    while workdate < last:
+        if workdate not in excluded:
+            days += 1
+        workdate = workdate + timedelta(days=1)
+    return days
 
 
-def escalate_tickets(queues, verbose):
+def notify_escalated(tickets):
+    """
+    Email the submitter, the queue CC and the owner of escalated tickets.
+    The messages are queued by send_templated_mail.
+    """
+    for t in tickets:
+        context = safe_template_context(t)
+
+        if t.submitter_email:
+            send_templated_mail(
+                'escalated_submitter',
+                context,
+                recipients=t.submitter_email,
+                sender=t.queue.from_address,
+                fail_silently=True,
+                )
+
+        if t.queue.updated_ticket_cc:
+            send_templated_mail(
+                'escalated_cc',
+                context,
+                recipients=t.queue.updated_ticket_cc,
+                sender=t.queue.from_address,
+                fail_silently=True,
+                )
+
+        if t.assigned_to and t.assigned_to.email:
+            send_templated_mail(
+                'escalated_owner',
+                context,
+                recipients=t.assigned_to.email,
+                sender=t.queue.from_address,
+                fail_silently=True,
+                )
+
+
+def escalate_tickets(queues, verbose, dry_run=False):
     """
     Escalate tickets for the given queues based on queue escalation settings.
 
@@ -89,6 +150,10 @@ def escalate_tickets(queues, verbose):
         queues (list of str): List of queue slugs to process. If empty, all queues
                               with escalation configured are processed.
         verbose (bool): If True, prints detailed processing information.
+        dry_run (bool): If True, only prints the tickets that would be escalated.
+
+    Returns:
+        int: Number of tickets escalated (or that would be).
 
     The function:
       - Computes the number of working days since the last escalation,
@@ -102,127 +167,68 @@ def escalate_tickets(queues, verbose):
     queryset = Queue.objects.filter(escalate_days__isnull=False).exclude(escalate_days=0)
     if queues:
         queryset = queryset.filter(slug__in=queues)
-
+    queryset = list(queryset)
+    if not queryset:
+        return 0
+
+    today = date.today()
+    first = today - timedelta(days=max(q.escalate_days for q in queryset))
+    excluded = set(EscalationExclusion.objects.filter(date__gte=first, date__lt=today)
+                   .values_list('date', flat=True))
+    if verbose:
+        for day in sorted(excluded):
+            print(("Excluded: %s" % day))
+
+    escalated = 0
     for q in queryset:
-        last = date.today() - timedelta(days=q.escalate_days)
-        today = date.today()
-        workdate = last
-
-        days = 0
-
-        while workdate < today:
-            if EscalationExclusion.objects.filter(date=workdate).count() == 0:
-                days += 1
-            workdate = workdate + timedelta(days=1)
+        days = working_days(today - timedelta(days=q.escalate_days), today, excluded)
+        req_last_escl_date = today - timedelta(days=days)
 
-        req_last_escl_date = date.today() - timedelta(days=days)
-
-        if verbose:
+        if verbose or dry_run:
             print(("Processing: %s" % q))
 
-        for t in q.ticket_set.filter(
-                      Q(status=Ticket.OPEN_STATUS)
-                      | Q(status=Ticket.REOPENED_STATUS)
-                ).exclude(
-                    priority=1
-                ).filter(
-                      Q(on_hold__isnull=True)
-                      | Q(on_hold=False)
-                ).filter(
-                      Q(last_escalation__lte=req_last_escl_date)
-                      | Q(last_escalation__isnull=True, created__lte=req_last_escl_date)
-                ):
-
-            t.last_escalation = timezone.now()
-            t.priority -= 1
-            t.save()
-
-            context = safe_template_context(t)
-
-            if t.submitter_email:
-                send_templated_mail(
-                    'escalated_submitter',
-                    context,
-                    recipients=t.submitter_email,
-                    sender=t.queue.from_address,
-                    fail_silently=True,
-                    )
-
-            if t.queue.updated_ticket_cc:
-                send_templated_mail(
-                    'escalated_cc',
-                    context,
-                    recipients=t.queue.updated_ticket_cc,
-                    sender=t.queue.from_address,
-                    fail_silently=True,
-                    )
-
-            if t.assigned_to:
-                send_templated_mail(
-                    'escalated_owner',
-                    context,
-                    recipients=t.assigned_to.email,
-                    sender=t.queue.from_address,
-                    fail_silently=True,
-                    )
-
-            if verbose:
-                print(("  - Esclating %s from %s>%s" % (
-                    t.ticket,
-                    t.priority+1,
-                    t.priority
-                    )
-                ))
-
-            f = FollowUp(
-                ticket=t,
-                title='Ticket Escalated',
-                date=timezone.now(),
-                public=True,
-                comment=_('Ticket escalated after %s days' % q.escalate_days),
-            )
-            f.save()
-
-            tc = TicketChange(
-                followup=f,
-                field=_('Priority'),
-                old_value=t.priority + 1,
-                new_value=t.priority,
-            )
-            tc.save()
-
-
-def usage():
-    print("Options:")
-    print(" --queues: Queues to include (default: all). Use queue slugs")
-    print(" --verboseescalation: Display a list of dates excluded")
-
-
-if __name__ == '__main__':
-    try:
-        opts, args = getopt.getopt(sys.argv[1:], ['queues=', 'verboseescalation'])
-    except getopt.GetoptError:
-        usage()
-        sys.exit(2)
-
-    verbose = False
-    queue_slugs = None
-    queues = []
-
-    for o, a in opts:
-        if o == '--verboseescalation':
-            verbose = True
-        if o == '--queues':
-            queue_slugs = a
-
-    if queue_slugs is not None:
-        queue_set = queue_slugs.split(',')
-        for queue in queue_set:
-            try:
-                q = Queue.objects.get(slug__exact=queue)
-            except Queue.DoesNotExist:
-                print(("Queue %s does not exist." % queue))
-                sys.exit(2)
-            queues.append(queue)
-
-    escalate_tickets(queues=queues, verbose=verbose)
+        with transaction.atomic():
+            tickets = list(q.ticket_set.filter(
+                          Q(status=Ticket.OPEN_STATUS)
+                          | Q(status=Ticket.REOPENED_STATUS)
+                    ).exclude(
+                        priority=1
+                    ).filter(
+                          Q(on_hold__isnull=True)
+                          | Q(on_hold=False)
+                    ).filter(
+                          Q(last_escalation__lte=req_last_escl_date)
+                          | Q(last_escalation__isnull=True, created__lte=req_last_escl_date)
+                    ).select_related('assigned_to').order_by('id'))
+
+            for t in tickets:
+                if verbose or dry_run:
+                    print(("  - %s %s from %s>%s" % (
+                        'Would escalate' if dry_run else 'Escalating',
+                        t.ticket,
+                        t.priority,
+                        t.priority - 1
+                        )
+                    ))
+            escalated += len(tickets)
+            if dry_run or not tickets:
+                continue
+
+            now = timezone.now()
+            Ticket.objects.filter(id__in=[t.pk for t in tickets]).update(
+                priority=F('priority') - 1, last_escalation=now, modified=now)
+
+            comment = _('Ticket escalated after %s days' % q.escalate_days)
+            create_followups(
+                [FollowUp(ticket=t, title='Ticket Escalated', date=now, public=True, comment=comment)
+                 for t in tickets],
+                [(_('Priority'), t.priority, t.priority - 1) for t in tickets])
+
+            for t in tickets:
+                t.priority -= 1
+                t.last_escalation = now
+                t.modified = now
+            transaction.on_commit(lambda tickets=tickets: notify_escalated(tickets))
+
+    return escalated
+
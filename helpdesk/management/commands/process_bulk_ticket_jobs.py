@@ -0,0 +1,57 @@
+"""
+process_bulk_ticket_jobs.py - Worker running the bulk ticket updates queued
+by the ticket list (see helpdesk.bulk).
+"""
+
+from __future__ import absolute_import
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from helpdesk.bulk import process_jobs
+
+
+class Command(BaseCommand):
+    """
+    Django management command running the pending bulk ticket updates.
+
+    Keep it running next to the web server, or let the BulkTicketJobsCronJob
+    cron job run the pending updates every minute. Several workers can run
+    together: each job is claimed once.
+    """
+
+    help = 'Run the pending bulk ticket updates.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=5,
+            help='Seconds to wait when there is no pending update.')
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            default=False,
+            help='Exit when there is no pending update.')
+
+    def handle(self, *args, **options):
+        """
+        Command entry point.
+
+        Args:
+            *args: Positional arguments (not used).
+            **options: sleep and once.
+        """
+        worker = '%s-%s' % (socket.gethostname(), os.getpid())
+        try:
+            while True:
+                count = process_jobs(worker)
+                if count:
+                    self.stdout.write('%s bulk update(s) run' % count)
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
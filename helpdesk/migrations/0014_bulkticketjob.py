@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import absolute_import
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    """
+    Adds the BulkTicketJob table, holding the large bulk updates of tickets
+    run in the background with their progress.
+    """
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('helpdesk', '0013_auto_20161230_1225'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkTicketJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(max_length=20, verbose_name='Action')),
+                ('ticket_ids', models.TextField(help_text='Comma separated IDs of the selected tickets the user can access.', verbose_name='Tickets')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10, verbose_name='Status')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Total')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Processed')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=100, verbose_name='Locked By')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Locked At')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Last Error')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Created')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='Finished')),
+                ('assign_to', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Assign To')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='helpdesk_bulk_jobs', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Bulk ticket update',
+                'verbose_name_plural': 'Bulk ticket updates',
+            },
+        ),
+    ]
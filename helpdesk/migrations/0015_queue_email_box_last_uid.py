@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+
+from __future__ import absolute_import
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Adds the IMAP UID of the last message read from the mailbox of a queue,
+    so get_email does not scan the messages it already read again.
+    """
+    dependencies = [
+        ('helpdesk', '0014_bulkticketjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queue',
+            name='email_box_last_uid',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='queue',
+            name='email_box_uid_validity',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
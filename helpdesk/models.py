@@ -199,6 +199,20 @@ class Queue(models.Model):
         # This is updated by management/commands/get_mail.py.
         )
 
+    email_box_last_uid = models.BigIntegerField(
+        blank=True,
+        null=True,
+        editable=False,
+        # UID of the last IMAP message read by management/commands/get_email.py,
+        # valid while the UIDVALIDITY of the folder is email_box_uid_validity.
+        )
+
+    email_box_uid_validity = models.BigIntegerField(
+        blank=True,
+        null=True,
+        editable=False,
+        )
+
     socks_proxy_type = models.CharField(
         _('Socks Proxy Type'),
         max_length=8,
@@ -1179,6 +1193,113 @@ class SavedSearch(models.Model):
         verbose_name_plural = _('Saved searches')
 
 
+class BulkTicketJob(models.Model):
+    """
+    A bulk update of tickets (assign, unassign, close or delete) selected in
+    the ticket list, run in the background when the selection is large. See
+    helpdesk.bulk.
+    """
+    STATUS_CHOICES = (
+        ('pending', _('Pending')),
+        ('running', _('Running')),
+        ('done', _('Done')),
+        ('failed', _('Failed')),
+    )
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name=_('User'),
+        related_name='helpdesk_bulk_jobs',
+        on_delete=models.CASCADE,
+        )
+
+    action = models.CharField(
+        _('Action'),
+        max_length=20,
+        )
+
+    assign_to = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name=_('Assign To'),
+        related_name='+',
+        blank=True,
+        null=True,
+        on_delete=models.SET_NULL,
+        )
+
+    ticket_ids = models.TextField(
+        _('Tickets'),
+        help_text=_('Comma separated IDs of the selected tickets the user can access.'),
+        )
+
+    status = models.CharField(
+        _('Status'),
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default='pending',
+        db_index=True,
+        )
+
+    total = models.PositiveIntegerField(
+        _('Total'),
+        default=0,
+        )
+
+    processed = models.PositiveIntegerField(
+        _('Processed'),
+        default=0,
+        )
+
+    locked_by = models.CharField(
+        _('Locked By'),
+        max_length=100,
+        blank=True,
+        default='',
+        )
+
+    locked_at = models.DateTimeField(
+        _('Locked At'),
+        blank=True,
+        null=True,
+        )
+
+    last_error = models.TextField(
+        _('Last Error'),
+        blank=True,
+        default='',
+        )
+
+    created = models.DateTimeField(
+        _('Created'),
+        auto_now_add=True,
+        )
+
+    finished = models.DateTimeField(
+        _('Finished'),
+        blank=True,
+        null=True,
+        )
+
+    def __str__(self):
+        """Returns the action, the progress and the status of the job."""
+        return '%s %s/%s (%s)' % (self.action, self.processed, self.total, self.status)
+
+    def get_ticket_ids(self):
+        """Returns the selected ticket IDs as a list of integers."""
+        return [int(pk) for pk in self.ticket_ids.split(',') if pk]
+
+    def _get_progress(self):
+        """Percentage of the selected tickets already processed."""
+        if not self.total:
+            return 100
+        return int(100 * self.processed / self.total)
+    progress = property(_get_progress)
+
+    class Meta:
+        verbose_name = _('Bulk ticket update')
+        verbose_name_plural = _('Bulk ticket updates')
+
+
 #@python_2_unicode_compatible
 class UserSettings(models.Model):
     """
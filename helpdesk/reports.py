@@ -0,0 +1,207 @@
+"""
+django-helpdesk - A Django powered ticket tracker for small enterprise.
+
+(c) Copyright 2008 Jutda. All Rights Reserved. See LICENSE for details.
+
+reports.py - Ticket reports shown by views.staff.run_report.
+
+Every report counts tickets grouped by a row metric (the assigned user or the
+queue) and a column metric (priority, status, queue or month of creation).
+The counts are computed by the database with one grouped values().annotate()
+query, so the tickets themselves are never loaded, and only the pivoted
+summary rows reach the template.
+
+Results are cached for HELPDESK_REPORT_CACHE_TIMEOUT seconds per report,
+saved query, set of visible queues and language. The cache key also holds
+the number of tickets and the latest modification date, so a new or updated
+ticket is reported at once.
+"""
+
+from __future__ import absolute_import
+import hashlib
+from datetime import timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Max, Min, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import translation
+from django.utils.dates import MONTHS_3
+from django.utils.translation import gettext_lazy as _, gettext
+
+from helpdesk import settings as helpdesk_settings
+from helpdesk.models import Ticket
+
+# report: (title, first column heading, row metric, column metric)
+REPORTS = {
+    'userpriority': (_('User by Priority'), _('User'), 'user', 'priority'),
+    'userqueue': (_('User by Category'), _('User'), 'user', 'queue'),
+    'userstatus': (_('User by Status'), _('User'), 'user', 'status'),
+    'usermonth': (_('User by Month'), _('User'), 'user', 'month'),
+    'queuepriority': (_('Category by Priority'), _('Category'), 'queue', 'priority'),
+    'queuestatus': (_('Category by Status'), _('Category'), 'queue', 'status'),
+    'queuemonth': (_('Category by Month'), _('Category'), 'queue', 'month'),
+    'daysuntilticketclosedbymonth': (_('Days until ticket closed by Month'), _('Category'), 'queue', 'month'),
+}
+
+# Grouped fields of each metric. Months are truncated in UTC, the time zone
+# of the stored creation dates.
+METRIC_FIELDS = {
+    'user': 'assigned_to',
+    'queue': 'queue__title',
+    'priority': 'priority',
+    'status': 'status',
+    'month': 'month',
+}
+
+
+def as_utc(value):
+    return value.astimezone(dt_timezone.utc) if value.tzinfo else value
+
+
+def month_name(date):
+    return "%s %s" % (MONTHS_3[date.month].title(), date.year)
+
+
+def report_periods(first, last):
+    """
+    Months from the creation of the first ticket to the one after the
+    creation of the last ticket, e.g. ['Jan 2017', 'Feb 2017', ...].
+    """
+    periods = []
+    year, month = first.year, first.month
+    working = True
+    periods.append("%s %s" % (MONTHS_3[month].title(), year))
+
+    while working:
+        month += 1
+        if month > 12:
+            year += 1
+            month = 1
+        if (year > last.year) or (month > last.month and year >= last.year):
+            working = False
+        periods.append("%s %s" % (MONTHS_3[month].title(), year))
+    return periods
+
+
+def user_names(ids):
+    """
+    Display names of assigned users, as Ticket.get_assigned_to prints them.
+    """
+    names = {None: gettext('Unassigned')}
+    for user in get_user_model().objects.filter(pk__in=[pk for pk in ids if pk is not None]):
+        names[user.pk] = user.get_full_name() or user.get_username()
+    return names
+
+
+def summarize(queryset, row, column, days=False):
+    """
+    Count the tickets of each (row, column) pair with one grouped query.
+
+    Args:
+        queryset: Tickets to report on.
+        row (str): Row metric, 'user' or 'queue'.
+        column (str): Column metric, 'priority', 'status', 'queue' or 'month'.
+        days (bool): Average the days from creation to last modification
+            instead of counting.
+
+    Returns:
+        dict: Values keyed by (row label, column label).
+    """
+    queryset = queryset.order_by()
+    if column == 'month':
+        queryset = queryset.annotate(month=TruncMonth('created', tzinfo=dt_timezone.utc))
+    fields = (METRIC_FIELDS[row], METRIC_FIELDS[column])
+    aggregates = {'total': Count('id')}
+    if days:
+        aggregates['duration'] = Sum(ExpressionWrapper(F('modified') - F('created'), output_field=DurationField()))
+    rows = list(queryset.values(*fields).annotate(**aggregates))
+
+    choices = {
+        'priority': dict((value, '%s' % label.title()) for value, label in Ticket.PRIORITY_CHOICES),
+        'status': dict((value, '%s' % label.title()) for value, label in Ticket.STATUS_CHOICES),
+    }
+    if row == 'user':
+        choices['user'] = user_names(set(values[fields[0]] for values in rows))
+
+    def label(metric, value):
+        if metric == 'month':
+            return month_name(value)
+        if metric in choices:
+            return choices[metric].get(value, '%s' % value)
+        return '%s' % value
+
+    totals, durations = {}, {}
+    for values in rows:
+        key = (label(row, values[fields[0]]), label(column, values[fields[1]]))
+        totals[key] = totals.get(key, 0) + values['total']
+        if days:
+            durations[key] = durations.get(key, 0) + (values['duration'].total_seconds() if values['duration'] else 0)
+    if days:
+        return dict((key, round(durations[key] / 86400.0 / totals[key], 2)) for key in totals)
+    return totals
+
+
+def pivot(summary, options):
+    """
+    Pivot the summary so that the row labels are always the first column of
+    a row, and the options are always the 2nd - nth columns.
+    """
+    table = []
+    for item in sorted(set(key for key, _option in summary)):
+        table.append([item] + [summary.get((item, option), 0) for option in options])
+    return table
+
+
+def build_report(report, queryset, queues, saved_query=None):
+    """
+    Compute a report, or read it from the cache.
+
+    Args:
+        report (str): One of REPORTS.
+        queryset: Tickets the user can see, filtered by the saved query.
+        queues (list): Queues the user can see.
+        saved_query (SavedSearch): Saved query applied to the queryset.
+
+    Returns:
+        dict: title, charttype, headings and data (the pivoted rows), or
+        None if there are no tickets.
+    """
+    title, col1heading, row, column = REPORTS[report]
+    stamp = Ticket.objects.aggregate(first=Min('created'), last=Max('created'),
+                                     count=Count('id'), modified=Max('modified'))
+    if not stamp['count']:
+        return None
+
+    key = 'helpdesk-report-%s' % hashlib.md5(repr((
+        report,
+        saved_query.pk if saved_query else None,
+        saved_query.query if saved_query else None,
+        sorted(queue.pk for queue in queues),
+        translation.get_language(),
+        stamp['count'], stamp['modified'],
+    )).encode('utf-8')).hexdigest()
+    timeout = helpdesk_settings.HELPDESK_REPORT_CACHE_TIMEOUT
+    result = cache.get(key) if timeout else None
+    if result is not None:
+        return result
+
+    if column == 'month':
+        possible_options = report_periods(as_utc(stamp['first']), as_utc(stamp['last']))
+    elif column == 'priority':
+        possible_options = [t[1].title() for t in Ticket.PRIORITY_CHOICES]
+    elif column == 'status':
+        possible_options = [s[1].title() for s in Ticket.STATUS_CHOICES]
+    else:
+        possible_options = [q.title for q in queues]
+
+    summary = summarize(queryset, row, column, days=(report == 'daysuntilticketclosedbymonth'))
+    result = {
+        'title': '%s' % title,
+        'charttype': 'date' if column == 'month' else 'bar',
+        'headings': ['%s' % col1heading] + possible_options,
+        'data': pivot(summary, possible_options),
+    }
+    if timeout:
+        cache.set(key, result, timeout)
+    return result
@@ -134,6 +134,17 @@ HELPDESK_EMAIL_SUBJECT_TEMPLATE = getattr(
 HELPDESK_EMAIL_FALLBACK_LOCALE = getattr(settings, 'HELPDESK_EMAIL_FALLBACK_LOCALE', 'en')
 
 
+######################################
+# options for staff.mass_update view #
+######################################
+
+# number of tickets updated per query (and per transaction) by a bulk update
+HELPDESK_BULK_UPDATE_CHUNK_SIZE = getattr(settings, 'HELPDESK_BULK_UPDATE_CHUNK_SIZE', 500)
+
+# bulk updates of more tickets are run in the background (see helpdesk.bulk)
+HELPDESK_BULK_UPDATE_BACKGROUND_THRESHOLD = getattr(settings, 'HELPDESK_BULK_UPDATE_BACKGROUND_THRESHOLD', 200)
+
+
 ########################################
 # options for staff.create_ticket view #
 ########################################
@@ -154,6 +165,26 @@ QUEUE_EMAIL_BOX_HOST = getattr(settings, 'QUEUE_EMAIL_BOX_HOST', None)
 QUEUE_EMAIL_BOX_USER = getattr(settings, 'QUEUE_EMAIL_BOX_USER', None)
 QUEUE_EMAIL_BOX_PASSWORD = getattr(settings, 'QUEUE_EMAIL_BOX_PASSWORD', None)
 
+# number of queue mailboxes get_email polls at the same time
+HELPDESK_EMAIL_WORKERS = getattr(settings, 'HELPDESK_EMAIL_WORKERS', 4)
+
+# number of messages downloaded and turned into tickets at once
+HELPDESK_EMAIL_BATCH_SIZE = getattr(settings, 'HELPDESK_EMAIL_BATCH_SIZE', 50)
+
+# seconds before a connection to a queue mailbox times out
+HELPDESK_EMAIL_TIMEOUT = getattr(settings, 'HELPDESK_EMAIL_TIMEOUT', 60)
+
 # only allow users to access queues that they are members of?
 HELPDESK_ENABLE_PER_QUEUE_STAFF_PERMISSION = getattr(
     settings, 'HELPDESK_ENABLE_PER_QUEUE_STAFF_PERMISSION', False)
+
+
+#####################################
+# options for staff.run_report view #
+#####################################
+
+# seconds a report is cached for, per saved query (0 disables the cache)
+HELPDESK_REPORT_CACHE_TIMEOUT = getattr(settings, 'HELPDESK_REPORT_CACHE_TIMEOUT', 120)
+
+# seconds the dashboard ticket statistics are cached for, per set of queues (0 disables the cache)
+HELPDESK_DASHBOARD_CACHE_TIMEOUT = getattr(settings, 'HELPDESK_DASHBOARD_CACHE_TIMEOUT', 60)
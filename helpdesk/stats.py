@@ -0,0 +1,139 @@
+"""
+django-helpdesk - A Django powered ticket tracker for small enterprise.
+
+(c) Copyright 2008 Jutda. All Rights Reserved. See LICENSE for details.
+
+stats.py - Ticket statistics of the staff dashboards (views.staff.dashboard
+           and the dashboard of helpdesk_api).
+
+The open tickets by age and the average time until closing are conditional
+Count and Avg aggregates of a single query, cached for
+HELPDESK_DASHBOARD_CACHE_TIMEOUT seconds per set of queues.
+"""
+
+from __future__ import absolute_import
+import hashlib
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, DurationField, ExpressionWrapper, F, Q
+
+from helpdesk import settings as helpdesk_settings
+from helpdesk.models import Ticket
+
+
+def time_open():
+    return ExpressionWrapper(F('modified') - F('created'), output_field=DurationField())
+
+
+def duration_days(duration):
+    """Number of days of an average duration, 0 without tickets."""
+    if not duration:
+        return 0
+    return round(duration.total_seconds() / 86400.0, 2)
+
+
+def calc_average_nbr_days_until_ticket_resolved(Tickets):
+    """Calculate the average number of days between ticket creation and last modification (resolved)."""
+    average = Tickets.aggregate(average=Avg(time_open()))['average']
+    return duration_days(average)
+
+
+def calc_basic_ticket_stats(Tickets):
+    """Compute basic statistics for tickets such as counts of open tickets by age,
+    and average resolution times, with one aggregate query."""
+    today = datetime.today()
+
+    date_30 = date_rel_to_today(today, 30)
+    date_60 = date_rel_to_today(today, 60)
+    date_30_str = date_30.strftime('%Y-%m-%d')
+    date_60_str = date_60.strftime('%Y-%m-%d')
+
+    # all not closed tickets (open, reopened, resolved,) - independent of user
+    not_closed = ~Q(status=Ticket.CLOSED_STATUS)
+    # all closed tickets - independent of user.
+    closed = Q(status=Ticket.CLOSED_STATUS)
+    stats = Tickets.order_by().aggregate(
+        # > 0 & <= 30
+        N_ota_le_30=Count('id', filter=not_closed & Q(created__gte=date_30_str)),
+        # >= 30 & <= 60
+        N_ota_le_60_ge_30=Count('id', filter=not_closed & Q(created__gte=date_60_str, created__lte=date_30_str)),
+        # >= 60
+        N_ota_ge_60=Count('id', filter=not_closed & Q(created__lte=date_60_str)),
+        closed=Avg(time_open(), filter=closed),
+        # closed tickets that were opened in the last 60 days.
+        closed_last_60_days=Avg(time_open(), filter=closed & Q(created__gte=date_60_str)),
+    )
+    N_ota_le_30 = stats['N_ota_le_30']
+    N_ota_le_60_ge_30 = stats['N_ota_le_60_ge_30']
+    N_ota_ge_60 = stats['N_ota_ge_60']
+
+    # (O)pen (T)icket (S)tats
+    ots = list()
+    # label, number entries, color, sort_string
+    ots.append(['< 30 days', N_ota_le_30, get_color_for_nbr_days(N_ota_le_30),
+                sort_string(date_30_str, ''), ])
+    ots.append(['30 - 60 days', N_ota_le_60_ge_30, get_color_for_nbr_days(N_ota_le_60_ge_30),
+                sort_string(date_60_str, date_30_str), ])
+    ots.append(['> 60 days', N_ota_ge_60, get_color_for_nbr_days(N_ota_ge_60),
+                sort_string('', date_60_str), ])
+
+    # put together basic stats
+    basic_ticket_stats = {
+        'average_nbr_days_until_ticket_closed': duration_days(stats['closed']),
+        'average_nbr_days_until_ticket_closed_last_60_days': duration_days(stats['closed_last_60_days']),
+        'open_ticket_stats': ots,
+    }
+
+    return basic_ticket_stats
+
+
+def dashboard_ticket_stats(queues):
+    """
+    Basic statistics of the tickets of the given queues (see
+    calc_basic_ticket_stats), cached per set of queues and day.
+
+    Args:
+        queues: Queues the user can see (a list or a QuerySet).
+
+    Returns:
+        dict: The statistics.
+    """
+    queue_ids = sorted(queue.pk for queue in queues)
+    key = 'helpdesk-dashboard-stats-%s' % hashlib.md5(
+        repr((queue_ids, datetime.today().strftime('%Y-%m-%d'))).encode('utf-8')).hexdigest()
+    timeout = helpdesk_settings.HELPDESK_DASHBOARD_CACHE_TIMEOUT
+    stats = cache.get(key) if timeout else None
+    if stats is None:
+        stats = calc_basic_ticket_stats(Ticket.objects.filter(queue__in=queue_ids))
+        if timeout:
+            cache.set(key, stats, timeout)
+    return stats
+
+
+def get_color_for_nbr_days(nbr_days):
+    """Return a color string("green", "orange or "red") based on the number of days."""
+    if nbr_days < 5:
+        color_string = 'green'
+    elif nbr_days < 10:
+        color_string = 'orange'
+    else:  # more than 10 days
+        color_string = 'red'
+
+    return color_string
+
+
+def days_since_created(today, ticket):
+    """Calculate the number of days since the ticket was created."""
+    return (today - ticket.created).days
+
+
+def date_rel_to_today(today, offset):
+    """Calculate the date relative to today by subtracting an offset in days."""
+    return today - timedelta(days = offset)
+
+
+def sort_string(begin, end):
+    """Construct a query string for sorting and filtering tickets by date and status."""
+    return 'sort=created&date_from=%s&date_to=%s&status=%s&status=%s&status=%s' % (
+        begin, end, Ticket.OPEN_STATUS, Ticket.REOPENED_STATUS, Ticket.RESOLVED_STATUS)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+test_bulk_update.py
+
+This module tests the bulk updates of the tickets selected in the ticket list
+(helpdesk.bulk): the set-based update of each chunk, its follow-ups and
+ticket changes, the closing emails and the background jobs.
+"""
+from __future__ import absolute_import
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.utils import timezone
+from helpdesk import bulk
+from helpdesk import settings as helpdesk_settings
+from helpdesk.models import BulkTicketJob, FollowUp, Queue, Ticket, TicketChange
+
+User = get_user_model()
+
+
+class BulkUpdateTestCase(TestCase):
+    """
+    Base TestCase with a queue of open tickets.
+    """
+    def setUp(self):
+        """
+        Set up a staff user, an owner and a queue with three open tickets.
+        """
+        self.user = User.objects.create_user(username='staff', email='staff@example.com', is_staff=True)
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', is_staff=True)
+        self.queue = Queue.objects.create(title='Q1', slug='q1', email_address='helpdesk@example.com')
+        self.tickets = [Ticket.objects.create(title='Ticket %s' % i, queue=self.queue,
+                                              submitter_email='submitter%s@example.com' % i)
+                        for i in range(3)]
+        self.ids = [ticket.pk for ticket in self.tickets]
+
+    def changes(self):
+        return sorted(TicketChange.objects.values_list('followup__ticket_id', 'field', 'old_value', 'new_value'))
+
+
+class TestUpdateChunk(BulkUpdateTestCase):
+    """
+    TestCase for the actions applied to a chunk of tickets.
+    """
+    def test_assign_and_unassign(self):
+        """
+        Test that assigning and unassigning change the owner of the tickets
+        with one public follow-up and one owner change per ticket, and skip
+        the tickets already in the target state.
+        """
+        Ticket.objects.filter(pk=self.ids[0]).update(assigned_to=self.owner)
+        self.assertEqual(bulk.update_chunk(self.ids, 'assign', self.user, self.owner), 2)
+        self.assertEqual(Ticket.objects.filter(assigned_to=self.owner).count(), 3)
+        self.assertEqual(self.changes(), [(pk, 'Owner', 'Unassigned', 'owner') for pk in self.ids[1:]])
+        followup = FollowUp.objects.get(ticket_id=self.ids[1])
+        self.assertEqual((followup.user, followup.public), (self.user, True))
+        self.assertEqual(followup.title, 'Assigned to owner in bulk update')
+
+        TicketChange.objects.all().delete()
+        Ticket.objects.filter(pk=self.ids[2]).update(assigned_to=None)
+        self.assertEqual(bulk.update_chunk(self.ids, 'unassign', self.user), 2)
+        self.assertFalse(Ticket.objects.filter(assigned_to__isnull=False).exists())
+        self.assertEqual(self.changes(), [(pk, 'Owner', 'owner', 'Unassigned') for pk in self.ids[:2]])
+
+    def test_close(self):
+        """
+        Test that closing sets the closed status with a private follow-up and
+        a status change, skips the closed tickets and sends no email.
+        """
+        Ticket.objects.filter(pk=self.ids[0]).update(status=Ticket.CLOSED_STATUS)
+        with mock.patch('helpdesk.bulk.send_templated_mail') as send_templated_mail:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                self.assertEqual(bulk.update_chunk(self.ids, 'close', self.user), 2)
+        self.assertEqual(callbacks, [])
+        send_templated_mail.assert_not_called()
+        self.assertFalse(Ticket.objects.exclude(status=Ticket.CLOSED_STATUS).exists())
+        self.assertEqual(self.changes(), [(pk, 'Status', 'Open', 'Closed') for pk in self.ids[1:]])
+        followups = FollowUp.objects.filter(ticket_id__in=self.ids[1:])
+        self.assertEqual(set(followups.values_list('public', 'new_status')), {(False, Ticket.CLOSED_STATUS)})
+        self.assertEqual(bulk.update_chunk(self.ids, 'close', self.user), 0)
+
+    def test_close_public(self):
+        """
+        Test that closing publicly emails the submitters only once the
+        transaction is committed.
+        """
+        with mock.patch('helpdesk.bulk.send_templated_mail') as send_templated_mail, \
+                mock.patch('django.urls.reverse', lambda viewname, *args, **kwargs: '/%s/' % viewname):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(bulk.update_tickets(self.ids, 'close_public', self.user), 3)
+                send_templated_mail.assert_not_called()
+        self.assertEqual(sorted(call.kwargs['recipients'] for call in send_templated_mail.call_args_list),
+                         ['submitter0@example.com', 'submitter1@example.com', 'submitter2@example.com'])
+        self.assertEqual({call.args[0] for call in send_templated_mail.call_args_list}, {'closed_submitter'})
+        self.assertFalse(FollowUp.objects.filter(public=False).exists())
+
+    def test_delete(self):
+        """
+        Test that deleting removes the tickets and their follow-ups.
+        """
+        bulk.update_chunk(self.ids[:1], 'close', self.user)
+        self.assertEqual(bulk.update_chunk(self.ids[:2], 'delete', self.user), 2)
+        self.assertEqual(list(Ticket.objects.values_list('id', flat=True)), self.ids[2:])
+        self.assertFalse(FollowUp.objects.exists())
+
+    def test_followups_without_returned_ids(self):
+        """
+        Test that the ticket changes are linked to their follow-ups on the
+        backends where bulk_create does not return the IDs.
+        """
+        create = FollowUp.objects.bulk_create
+
+        def bulk_create(followups):
+            followups = create(followups)
+            for followup in followups:
+                followup.pk = None
+            return followups
+
+        with mock.patch.object(FollowUp.objects, 'bulk_create', side_effect=bulk_create):
+            self.assertEqual(bulk.update_chunk(self.ids, 'close', self.user), 3)
+        self.assertEqual(sorted(TicketChange.objects.values_list('followup__ticket_id', flat=True)), self.ids)
+
+
+class TestBulkTicketJob(BulkUpdateTestCase):
+    """
+    TestCase for the large selections processed in the background.
+    """
+    def test_background_threshold(self):
+        """
+        Test that a selection above the threshold is stored as a job and left
+        untouched until a worker runs it.
+        """
+        with mock.patch.object(helpdesk_settings, 'HELPDESK_BULK_UPDATE_BACKGROUND_THRESHOLD', 3):
+            self.assertIsNone(bulk.mass_update_tickets(self.ids, 'close', self.user))
+        Ticket.objects.update(status=Ticket.OPEN_STATUS)
+        with mock.patch.object(helpdesk_settings, 'HELPDESK_BULK_UPDATE_BACKGROUND_THRESHOLD', 2):
+            job = bulk.mass_update_tickets(self.ids, 'close', self.user)
+        self.assertEqual((job.status, job.total, job.get_ticket_ids()), ('pending', 3, self.ids))
+        self.assertFalse(Ticket.objects.filter(status=Ticket.CLOSED_STATUS).exists())
+        with mock.patch.object(bulk, 'CHUNK_SIZE', 2):
+            self.assertEqual(bulk.process_jobs(worker='worker'), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), ('done', 3))
+        self.assertFalse(Ticket.objects.exclude(status=Ticket.CLOSED_STATUS).exists())
+
+    def test_resume(self):
+        """
+        Test that a job left running by a dead worker is claimed again once
+        its lock expired and resumes after the tickets already processed.
+        """
+        job = BulkTicketJob.objects.create(user=self.user, action='close', total=3, processed=1,
+                                           ticket_ids=','.join('%s' % pk for pk in self.ids), status='running',
+                                           locked_by='dead-worker', locked_at=timezone.now())
+        self.assertIsNone(bulk.claim_job('worker'))
+        locked_at = timezone.now() - timedelta(seconds=bulk.LOCK_TIMEOUT + 1)
+        BulkTicketJob.objects.filter(pk=job.pk).update(locked_at=locked_at)
+        job = bulk.claim_job('worker')
+        self.assertEqual((job.status, job.locked_by, job.processed), ('running', 'worker', 1))
+        self.assertTrue(bulk.run_job(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), ('done', 3))
+        self.assertEqual(Ticket.objects.get(pk=self.ids[0]).status, Ticket.OPEN_STATUS)
+        self.assertEqual(list(Ticket.objects.filter(status=Ticket.CLOSED_STATUS).values_list('id', flat=True)),
+                         self.ids[1:])
+        self.assertEqual(sorted(FollowUp.objects.values_list('ticket_id', flat=True)), self.ids[1:])
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+test_escalate_tickets.py
+
+This module tests the escalate_tickets management command, which lowers the
+priority number of the open tickets of a queue once they are older than the
+escalation days of the queue.
+"""
+from __future__ import absolute_import
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+from helpdesk.management.commands.escalate_tickets import escalate_tickets
+from helpdesk.models import FollowUp, Queue, Ticket, TicketChange
+
+
+class TestEscalateTickets(TestCase):
+    """
+    TestCase for the escalation of the tickets of a queue.
+    """
+    def setUp(self):
+        """
+        Set up a queue escalating after 2 days, with an old and a new ticket.
+        """
+        self.queue = Queue.objects.create(title='Q1', slug='q1', escalate_days=2)
+        self.old = Ticket.objects.create(title='Old', queue=self.queue, priority=3)
+        self.new = Ticket.objects.create(title='New', queue=self.queue, priority=3)
+        self.created = timezone.now() - timedelta(days=5)
+        Ticket.objects.filter(pk=self.old.pk).update(created=self.created, modified=self.created)
+
+    def test_escalate(self):
+        """
+        Test that an old ticket is escalated, with its modification time,
+        a public follow-up and the change of priority.
+        """
+        self.assertEqual(escalate_tickets(queues=['q1'], verbose=False), 1)
+        old = Ticket.objects.get(pk=self.old.pk)
+        self.assertEqual(old.priority, 2)
+        self.assertIsNotNone(old.last_escalation)
+        self.assertEqual(old.modified, old.last_escalation)
+        self.assertEqual(Ticket.objects.get(pk=self.new.pk).priority, 3)
+        followup = FollowUp.objects.get(ticket=old)
+        self.assertTrue(followup.public)
+        self.assertEqual(followup.date, old.last_escalation)
+        change = TicketChange.objects.get(followup=followup)
+        self.assertEqual((change.old_value, change.new_value), ('3', '2'))
+
+    def test_dry_run(self):
+        """
+        Test that a dry run counts the tickets without changing them.
+        """
+        self.assertEqual(escalate_tickets(queues=[], verbose=False, dry_run=True), 1)
+        old = Ticket.objects.get(pk=self.old.pk)
+        self.assertEqual(old.priority, 3)
+        self.assertEqual(old.modified, self.created)
+        self.assertFalse(FollowUp.objects.exists())
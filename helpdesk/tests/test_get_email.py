@@ -0,0 +1,467 @@
+"""
+This module tests the ingestion of the queue mailboxes (helpdesk.mailbox, run
+by the get_email management command) against local stand-in POP3, IMAP and
+SOCKS5 servers.
+Scenarios tested include:
+- New tickets, attachments and replies to existing tickets
+- Batches of IMAP UIDs and the last UID stored on the queue
+- Ignored senders kept in the mailbox
+- Mailboxes polled concurrently, through the proxy of their queue
+- Notifications sent once the mailbox is updated, files of failed batches removed
+"""
+
+from __future__ import absolute_import
+import os
+import select
+import shutil
+import socket
+import socketserver
+import struct
+import tempfile
+import threading
+from email.message import EmailMessage
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from helpdesk import mailbox
+from helpdesk.models import Queue, Ticket, FollowUp, Attachment, IgnoreEmail
+
+
+def make_message(subject, sender='submitter@example.com', body='Some text', attachment=None):
+    """
+    RFC822 bytes of a message, with an optional (filename, content) attachment.
+    """
+    message = EmailMessage()
+    message['Subject'] = subject
+    message['From'] = sender
+    message['To'] = 'helpdesk@example.com'
+    message.set_content(body)
+    if attachment:
+        message.add_attachment(attachment[1], maintype='application', subtype='octet-stream',
+                               filename=attachment[0], params={'name': attachment[0]})
+    return message.as_bytes()
+
+
+def recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return data
+
+
+class StandInServer(socketserver.ThreadingTCPServer):
+    """
+    Local server answering on a free port in a background thread. The
+    commands received are recorded in ``commands``.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handler):
+        socketserver.ThreadingTCPServer.__init__(self, ('127.0.0.1', 0), handler)
+        self.commands = []
+        self.thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class POP3Handler(socketserver.StreamRequestHandler):
+    """Minimal POP3 server: USER, PASS, LIST, RETR, DELE and QUIT."""
+
+    def send(self, line):
+        self.wfile.write(line + b'\r\n')
+
+    def handle(self):
+        server = self.server
+        deleted = set()
+        self.send(b'+OK stand-in POP3 server ready')
+        for line in self.rfile:
+            command, _, argument = line.strip().partition(b' ')
+            command = command.decode().upper()
+            server.commands.append(command)
+            if command == 'LIST':
+                self.send(b'+OK')
+                for number, message in enumerate(server.messages, 1):
+                    if number not in deleted:
+                        self.send(b'%d %d' % (number, len(message)))
+                self.send(b'.')
+            elif command == 'RETR':
+                self.send(b'+OK')
+                for message_line in server.messages[int(argument) - 1].splitlines():
+                    self.send(b'.' + message_line if message_line.startswith(b'.') else message_line)
+                self.send(b'.')
+            elif command == 'DELE':
+                deleted.add(int(argument))
+                self.send(b'+OK')
+            elif command == 'QUIT':
+                server.messages = [message for number, message in enumerate(server.messages, 1)
+                                   if number not in deleted]
+                self.send(b'+OK bye')
+                return
+            else:
+                self.send(b'+OK')
+
+
+class IMAPHandler(socketserver.StreamRequestHandler):
+    """
+    Minimal IMAP server for one folder: CAPABILITY, LOGIN, SELECT, UID
+    SEARCH/FETCH/STORE, EXPUNGE, CLOSE and LOGOUT. The messages are a dict
+    of UID to RFC822 bytes.
+    """
+
+    def send(self, line):
+        self.wfile.write(line + b'\r\n')
+
+    def uid_set(self, spec):
+        uids = sorted(self.server.messages)
+        found = set()
+        for part in spec.split(','):
+            first, _, last = part.partition(':')
+            if last == '*':
+                found.update(uid for uid in uids if uid >= int(first))
+                found.update(uids[-1:])
+            elif last:
+                low, high = sorted((int(first), int(last)))
+                found.update(uid for uid in uids if low <= uid <= high)
+            elif int(first) in self.server.messages:
+                found.add(int(first))
+        return sorted(found)
+
+    def expunge(self):
+        for uid in self.server.deleted:
+            self.server.messages.pop(uid, None)
+        self.server.deleted = set()
+
+    def handle(self):
+        server = self.server
+        if server.before_greeting:
+            server.before_greeting(server)
+        self.send(b'* OK stand-in IMAP server ready')
+        for line in self.rfile:
+            tag, command, *args = line.decode().split()
+            command = command.upper()
+            if command == 'UID':
+                command = 'UID ' + args.pop(0).upper()
+            server.commands.append((command, args))
+            if command == 'CAPABILITY':
+                self.send(b'* CAPABILITY IMAP4rev1')
+            elif command == 'SELECT':
+                self.send(b'* %d EXISTS' % len(server.messages))
+                self.send(b'* OK [UIDVALIDITY %d] UIDs valid' % server.uid_validity)
+            elif command == 'UID SEARCH':
+                uids = [uid for uid in self.uid_set(args[1]) if uid not in server.deleted]
+                self.send(b'* SEARCH ' + ' '.join('%s' % uid for uid in uids).encode())
+            elif command == 'UID FETCH':
+                sequence = sorted(server.messages)
+                for uid in self.uid_set(args[0]):
+                    message = server.messages[uid]
+                    self.send(b'* %d FETCH (UID %d RFC822 {%d}' % (sequence.index(uid) + 1, uid, len(message)))
+                    self.wfile.write(message)
+                    self.send(b')')
+            elif command == 'UID STORE':
+                server.deleted.update(self.uid_set(args[0]))
+            elif command in ('EXPUNGE', 'CLOSE'):
+                self.expunge()
+            elif command == 'LOGOUT':
+                self.send(b'* BYE')
+                self.send(tag.encode() + b' OK LOGOUT completed')
+                return
+            self.send(tag.encode() + b' OK %s completed' % command.encode())
+
+
+class SOCKS5Handler(socketserver.BaseRequestHandler):
+    """SOCKS5 proxy without authentication, relaying to the requested address."""
+
+    def handle(self):
+        sock = self.request
+        version, methods = recv_exact(sock, 2)
+        recv_exact(sock, methods)
+        sock.sendall(b'\x05\x00')
+        version, command, reserved, address_type = recv_exact(sock, 4)
+        if address_type == 1:
+            host = socket.inet_ntoa(recv_exact(sock, 4))
+        else:
+            host = recv_exact(sock, recv_exact(sock, 1)[0]).decode()
+        port = struct.unpack('>H', recv_exact(sock, 2))[0]
+        self.server.commands.append((host, port))
+        upstream = socket.create_connection((host, port))
+        sock.sendall(b'\x05\x00\x00\x01' + socket.inet_aton('0.0.0.0') + struct.pack('>H', 0))
+        try:
+            while True:
+                readable = select.select([sock, upstream], [], [], 5)[0]
+                if not readable:
+                    return
+                for source in readable:
+                    data = source.recv(65536)
+                    if not data:
+                        return
+                    (upstream if source is sock else sock).sendall(data)
+        finally:
+            upstream.close()
+
+
+def pop3_server(messages):
+    server = StandInServer(POP3Handler)
+    server.messages = list(messages)
+    return server
+
+
+def imap_server(messages, uid_validity=1, before_greeting=None):
+    server = StandInServer(IMAPHandler)
+    server.messages = dict(enumerate(messages, 1))
+    server.deleted = set()
+    server.uid_validity = uid_validity
+    server.before_greeting = before_greeting
+    return server
+
+
+def mailbox_queue(slug, server, email_box_type='imap', **kwargs):
+    return Queue.objects.create(
+        title='Queue %s' % slug,
+        slug=slug,
+        allow_email_submission=True,
+        email_box_type=email_box_type,
+        email_box_host='127.0.0.1',
+        email_box_port=server.port,
+        email_box_user='helpdesk',
+        email_box_pass='password',
+        email_box_interval=0,
+        **kwargs)
+
+
+class MailboxTestMixin(object):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage')
+        self.settings_override.enable()
+        # The helpdesk urls are not part of the urls of the project
+        self.reverse = mock.patch('django.urls.reverse', lambda viewname, *args, **kwargs: '/%s/' % viewname)
+        self.reverse.start()
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+        self.reverse.stop()
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def serve(self, server):
+        self.servers.append(server)
+        return server
+
+
+class GetEmailTestCase(MailboxTestMixin, TestCase):
+    """
+    TestCase for the messages of a mailbox turned into tickets, one queue
+    at a time.
+    """
+    fixtures = ['emailtemplate.json']
+
+    def test_pop3_creates_tickets_and_attachments(self):
+        """
+        USE CASE: a POP3 mailbox holds new messages, one with an attachment.
+        Each message becomes a ticket and is deleted from the mailbox.
+        """
+        server = self.serve(pop3_server([
+            make_message('Printer broken', attachment=('notes.txt', b'toner')),
+            make_message('Cannot log in', sender='Jane <jane@example.com>'),
+        ]))
+        queue = mailbox_queue('pop', server, email_box_type='pop3')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(mailbox.process_email(quiet=True, workers=1), 1)
+
+        tickets = Ticket.objects.filter(queue=queue).order_by('id')
+        self.assertEqual([(t.title, t.submitter_email) for t in tickets],
+                         [('Printer broken', 'submitter@example.com'), ('Cannot log in', 'jane@example.com')])
+        self.assertEqual(FollowUp.objects.filter(ticket__queue=queue).count(), 2)
+        attachment = Attachment.objects.get()
+        self.assertEqual((attachment.filename, attachment.size), ('notes.txt', 5))
+        self.assertEqual(attachment.followup.ticket, tickets[0])
+        self.assertEqual(server.messages, [])
+        self.assertIsNotNone(Queue.objects.get(pk=queue.pk).email_box_last_check)
+
+    def test_imap_batches_and_last_uid(self):
+        """
+        USE CASE: an IMAP folder is read by batches of UIDs, and a later run
+        only asks for the messages that arrived since.
+        """
+        server = self.serve(imap_server([make_message('Message %s' % number) for number in range(5)],
+                                        uid_validity=7))
+        queue = mailbox_queue('imap', server)
+
+        with mock.patch.object(mailbox, 'BATCH_SIZE', 2):
+            mailbox.process_email(quiet=True, workers=1)
+
+        self.assertEqual(Ticket.objects.filter(queue=queue).count(), 5)
+        fetches = [args[0] for command, args in server.commands if command == 'UID FETCH']
+        self.assertEqual(fetches, ['1:2', '3:4', '5'])
+        queue.refresh_from_db()
+        self.assertEqual((queue.email_box_last_uid, queue.email_box_uid_validity), (5, 7))
+        self.assertEqual(server.messages, {})
+
+        server.messages[6] = make_message('Message 6')
+        server.commands = []
+        mailbox.process_email(quiet=True, workers=1)
+
+        searches = [args for command, args in server.commands if command == 'UID SEARCH']
+        self.assertEqual(searches, [['UID', '6:*', 'NOT', 'DELETED']])
+        self.assertEqual(Ticket.objects.filter(queue=queue).count(), 6)
+
+    def test_imap_ignored_sender_kept_and_not_scanned_again(self):
+        """
+        USE CASE: a message of an ignored sender kept in the mailbox is left
+        there, and not read again by the next run.
+        """
+        server = self.serve(imap_server([make_message('Out of office', sender='robot@example.com'),
+                                         make_message('Help')]))
+        queue = mailbox_queue('imap', server)
+        IgnoreEmail.objects.create(name='Robot', email_address='robot@example.com', keep_in_mailbox=True)
+
+        mailbox.process_email(quiet=True, workers=1)
+        self.assertEqual(list(Ticket.objects.filter(queue=queue).values_list('title', flat=True)), ['Help'])
+        self.assertEqual(list(server.messages), [1])
+
+        server.commands = []
+        mailbox.process_email(quiet=True, workers=1)
+        self.assertNotIn('UID FETCH', [command for command, args in server.commands])
+        self.assertEqual(Ticket.objects.filter(queue=queue).count(), 1)
+
+    def test_reply_reopens_closed_ticket(self):
+        """
+        USE CASE: a reply to a closed ticket, recognised by [slug-id] in its
+        subject, is added to the ticket, which is re-opened.
+        """
+        server = self.serve(imap_server([]))
+        queue = mailbox_queue('imap', server, updated_ticket_cc='updates@example.com')
+        ticket = Ticket.objects.create(title='Old issue', queue=queue, status=Ticket.CLOSED_STATUS)
+        server.messages[1] = make_message('Re: [imap-%s] Old issue' % ticket.id, body='Still broken')
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            mailbox.process_email(quiet=True, workers=1)
+
+        self.assertEqual(len(callbacks), 1)
+        ticket.refresh_from_db()
+        self.assertEqual(ticket.status, Ticket.REOPENED_STATUS)
+        self.assertEqual(Ticket.objects.filter(queue=queue).count(), 1)
+        followup = ticket.followup_set.get()
+        self.assertEqual((followup.new_status, followup.comment), (Ticket.REOPENED_STATUS, 'Still broken'))
+        self.assertTrue(followup.title.startswith('Ticket Re-Opened by E-Mail'))
+
+    def test_failed_batch_removes_attachment_files(self):
+        """
+        USE CASE: a batch that cannot be saved leaves no ticket and no
+        attachment file, and its messages are left in the mailbox.
+        """
+        server = self.serve(imap_server([make_message('Printer broken', attachment=('notes.txt', b'toner'))]))
+        queue = mailbox_queue('imap', server)
+
+        with mock.patch.object(Attachment.objects, 'bulk_create', side_effect=RuntimeError('database error')):
+            self.assertEqual(mailbox.process_email(quiet=True, workers=1), 0)
+
+        self.assertFalse(Ticket.objects.filter(queue=queue).exists())
+        self.assertEqual([files for root, dirs, files in os.walk(self.media_root) if files], [])
+        self.assertEqual(list(server.messages), [1])
+        self.assertIsNone(Queue.objects.get(pk=queue.pk).email_box_last_uid)
+
+    def test_proxy_is_used_per_connection(self):
+        """
+        USE CASE: a queue with a SOCKS proxy connects through it, without
+        changing socket.socket for the queues polled after it.
+        """
+        socket_class = socket.socket
+        target = self.serve(imap_server([make_message('Through the proxy')]))
+        direct = self.serve(imap_server([make_message('Direct')]))
+        proxy = self.serve(StandInServer(SOCKS5Handler))
+        mailbox_queue('a-proxied', target, socks_proxy_type='socks5', socks_proxy_host='127.0.0.1',
+                      socks_proxy_port=proxy.port)
+        mailbox_queue('b-direct', direct)
+
+        self.assertEqual(mailbox.process_email(quiet=True, workers=1), 2)
+
+        self.assertEqual(proxy.commands, [('127.0.0.1', target.port)])
+        self.assertIs(socket.socket, socket_class)
+        self.assertEqual(sorted(Ticket.objects.values_list('title', flat=True)), ['Direct', 'Through the proxy'])
+
+
+class ConcurrentGetEmailTestCase(MailboxTestMixin, TransactionTestCase):
+    """
+    TestCase for mailboxes polled at the same time, each on its own
+    connection.
+    """
+
+    def test_slow_mailbox_does_not_delay_others(self):
+        """
+        USE CASE: the first mailbox answers only once the second one was
+        read and checked. The second is read while the first is still
+        waiting. Were they read one after the other, the first would time
+        out and be left unread.
+        """
+        fast_polled = threading.Event()
+        polled = []
+        poll_queue = mailbox.poll_queue
+
+        def poll(q, quiet=False):
+            try:
+                return poll_queue(q, quiet=quiet)
+            finally:
+                polled.append(q.slug)
+                if q.slug == 'b-fast':
+                    fast_polled.set()
+
+        slow = self.serve(imap_server([make_message('Slow')], before_greeting=lambda server: fast_polled.wait()))
+        fast = self.serve(imap_server([make_message('Fast')]))
+        mailbox_queue('a-slow', slow)
+        mailbox_queue('b-fast', fast)
+
+        with mock.patch.object(mailbox, 'poll_queue', poll):
+            self.assertEqual(mailbox.process_email(quiet=True, workers=2), 2)
+
+        self.assertEqual(polled, ['b-fast', 'a-slow'])
+        self.assertEqual(sorted(Ticket.objects.values_list('title', flat=True)), ['Fast', 'Slow'])
+
+
+class NotificationGetEmailTestCase(MailboxTestMixin, TransactionTestCase):
+    """
+    TestCase for the notifications of the messages received, sent once
+    the transaction is committed and the mailbox is updated.
+    """
+
+    def test_notification_error_after_checkpoint(self):
+        """
+        USE CASE: the notifications fail. The messages were already deleted
+        from the mailbox and the last UID stored, and the next mailboxes
+        are still read.
+        """
+        server = self.serve(imap_server([make_message('Help')], uid_validity=3))
+        other = self.serve(imap_server([make_message('Other')]))
+        queue = mailbox_queue('a-imap', server)
+        mailbox_queue('b-imap', other)
+        checkpoints = []
+
+        def notify_received(q, received):
+            checkpoints.append((q.slug, sorted(server.deleted), Queue.objects.get(pk=queue.pk).email_box_last_uid))
+            raise RuntimeError('mail server down')
+
+        with mock.patch.object(mailbox, 'notify_received', side_effect=notify_received):
+            self.assertEqual(mailbox.process_email(quiet=True, workers=1), 2)
+
+        self.assertEqual(checkpoints[0], ('a-imap', [1], 1))
+        self.assertEqual(len(checkpoints), 2)
+        self.assertEqual((server.messages, other.messages), ({}, {}))
+        self.assertEqual(sorted(Ticket.objects.values_list('title', flat=True)), ['Help', 'Other'])
@@ -11,6 +11,7 @@ from __future__ import absolute_import
 from helpdesk.models import Queue, CustomField, Ticket
 from django.test import TestCase
 from django.core import mail
+from common.mail_queue import send_queued_emails
 from django.test.client import Client
 from django.urls import reverse
 
@@ -63,6 +64,7 @@ class TicketBasicsTestCase(TestCase):
         ticket_data = dict(queue=self.queue_public, **self.ticket_data)
         ticket = Ticket.objects.create(**ticket_data)
         self.assertEqual(ticket.ticket_for_url, "q1-%s" % ticket.id)
+        send_queued_emails()
         self.assertEqual(email_count, len(mail.outbox))
 
     def test_create_ticket_public(self):
@@ -96,6 +98,7 @@ class TicketBasicsTestCase(TestCase):
         self.assertEqual(urlparts.path, reverse('helpdesk_public_view'))
 
         # Ensure submitter, new-queue + update-queue were all emailed.
+        send_queued_emails()
         self.assertEqual(email_count+3, len(mail.outbox))
 
     def test_create_ticket_private(self):
@@ -114,6 +117,7 @@ class TicketBasicsTestCase(TestCase):
 
         response = self.client.post(reverse('helpdesk_home'), post_data)
         self.assertEqual(response.status_code, 200)
+        send_queued_emails()
         self.assertEqual(email_count, len(mail.outbox))
         self.assertContains(response, 'Select a valid choice.')
 
@@ -159,4 +163,5 @@ class TicketBasicsTestCase(TestCase):
         self.assertEqual(urlparts.path, reverse('helpdesk_public_view'))
 
         # Ensure only two e-mails were sent - submitter & updated.
+        send_queued_emails()
         self.assertEqual(email_count+2, len(mail.outbox))
@@ -8,7 +8,7 @@ views/staff.py - The bulk of the application - provides most business logic and
 """
 
 from __future__ import absolute_import
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 from django import VERSION
 from django.conf import settings
@@ -21,7 +21,6 @@ from django.db import connection
 from django.db.models import Q
 from django.http import HttpResponseRedirect, Http404, HttpResponse
 from django.shortcuts import render, get_object_or_404
-from django.utils.dates import MONTHS_3
 from django.utils.translation import gettext as _
 from django.utils.html import escape
 from django import forms
@@ -40,8 +39,11 @@ from helpdesk.lib import (
 )
 from helpdesk.models import (
     Ticket, Queue, FollowUp, TicketChange, PreSetReply, Attachment, SavedSearch,
-    IgnoreEmail, TicketCC, TicketDependency,
+    IgnoreEmail, TicketCC, TicketDependency, BulkTicketJob,
 )
+from helpdesk.bulk import ACTIONS as BULK_ACTIONS, mass_update_tickets
+from helpdesk.reports import REPORTS, build_report
+from helpdesk.stats import dashboard_ticket_stats
 from helpdesk import settings as helpdesk_settings
 
 User = get_user_model()
@@ -134,10 +136,7 @@ def dashboard(request):
             submitter_email=email_current_user,
         ).order_by('status')
 
-    tickets_in_queues = Ticket.objects.filter(
-                queue__in=user_queues,
-            )
-    basic_ticket_stats = calc_basic_ticket_stats(tickets_in_queues)
+    basic_ticket_stats = dashboard_ticket_stats(user_queues)
 
     # The following query builds a grid of queues & ticket statuses,
     # to be displayed to the user. EG:
@@ -758,7 +757,8 @@ def mass_update(request):
 
     This view handles multiple actions like assign, unassign, close, and delete
     on selected tickets. It ensures proper permission checks and sends appropriate
-    email notifications.
+    email notifications. Tickets are updated in bulk by helpdesk.bulk, in the
+    background for large selections (see BulkTicketJob).
 
     Parameters:
     - request: The HTTP POST request containing ticket IDs and action.
@@ -772,6 +772,7 @@ def mass_update(request):
     if not (tickets and action):
         return HttpResponseRedirect(reverse('helpdesk_list'))
 
+    user = None
     if action.startswith('assign_'):
         parts = action.split('_')
         user = User.objects.get(id=parts[1])
@@ -779,104 +780,14 @@ def mass_update(request):
     elif action == 'take':
         user = request.user
         action = 'assign'
+    if action not in BULK_ACTIONS:
+        return HttpResponseRedirect(reverse('helpdesk_list'))
 
-    for t in Ticket.objects.filter(id__in=tickets):
-        if not _has_access_to_queue(request.user, t.queue):
-            continue
-
-        if action == 'assign' and t.assigned_to != user:
-            t.assigned_to = user
-            t.save()
-            f = FollowUp(ticket=t,
-                         date=timezone.now(),
-                         title=_('Assigned to %(username)s in bulk update' % {
-                             'username': user.get_username()
-                         }),
-                         public=True,
-                         user=request.user)
-            f.save()
-        elif action == 'unassign' and t.assigned_to is not None:
-            t.assigned_to = None
-            t.save()
-            f = FollowUp(ticket=t,
-                         date=timezone.now(),
-                         title=_('Unassigned in bulk update'),
-                         public=True,
-                         user=request.user)
-            f.save()
-        elif action == 'close' and t.status != Ticket.CLOSED_STATUS:
-            t.status = Ticket.CLOSED_STATUS
-            t.save()
-            f = FollowUp(ticket=t,
-                         date=timezone.now(),
-                         title=_('Closed in bulk update'),
-                         public=False,
-                         user=request.user,
-                         new_status=Ticket.CLOSED_STATUS)
-            f.save()
-        elif action == 'close_public' and t.status != Ticket.CLOSED_STATUS:
-            t.status = Ticket.CLOSED_STATUS
-            t.save()
-            f = FollowUp(ticket=t,
-                         date=timezone.now(),
-                         title=_('Closed in bulk update'),
-                         public=True,
-                         user=request.user,
-                         new_status=Ticket.CLOSED_STATUS)
-            f.save()
-            # Send email to Submitter, Owner, Queue CC
-            context = safe_template_context(t)
-            context.update(resolution=t.resolution,
-                           queue=t.queue)
-
-            messages_sent_to = []
-
-            if t.submitter_email:
-                send_templated_mail(
-                    'closed_submitter',
-                    context,
-                    recipients=t.submitter_email,
-                    sender=t.queue.from_address,
-                    fail_silently=True,
-                    )
-                messages_sent_to.append(t.submitter_email)
-
-            for cc in t.ticketcc_set.all():
-                if cc.email_address not in messages_sent_to:
-                    send_templated_mail(
-                        'closed_submitter',
-                        context,
-                        recipients=cc.email_address,
-                        sender=t.queue.from_address,
-                        fail_silently=True,
-                        )
-                    messages_sent_to.append(cc.email_address)
-
-            if t.assigned_to and \
-                    request.user != t.assigned_to and \
-                    t.assigned_to.email and \
-                    t.assigned_to.email not in messages_sent_to:
-                send_templated_mail(
-                    'closed_owner',
-                    context,
-                    recipients=t.assigned_to.email,
-                    sender=t.queue.from_address,
-                    fail_silently=True,
-                    )
-                messages_sent_to.append(t.assigned_to.email)
-
-            if t.queue.updated_ticket_cc and \
-                    t.queue.updated_ticket_cc not in messages_sent_to:
-                send_templated_mail(
-                    'closed_cc',
-                    context,
-                    recipients=t.queue.updated_ticket_cc,
-                    sender=t.queue.from_address,
-                    fail_silently=True,
-                    )
-
-        elif action == 'delete':
-            t.delete()
+    # queue access is checked once for the whole selection
+    ticket_ids = list(Ticket.objects.filter(
+        id__in=tickets, queue__in=_get_user_queues(request.user),
+    ).order_by('id').values_list('id', flat=True))
+    mass_update_tickets(ticket_ids, action, request.user, user)
 
     return HttpResponseRedirect(reverse('helpdesk_list'))
 mass_update = staff_member_required(mass_update)
@@ -1089,6 +1000,8 @@ def ticket_list(request):
         from_saved_query=from_saved_query,
         saved_query=saved_query,
         search_message=search_message,
+        bulk_jobs=BulkTicketJob.objects.filter(user=request.user).filter(
+            Q(finished__isnull=True) | Q(finished__gte=timezone.now() - timedelta(hours=1))).order_by('-created'),
     ))
 ticket_list = staff_member_required(ticket_list)
 
@@ -1326,14 +1239,11 @@ def run_report(request, report):
         - Applies saved query filtering if provided.
         - Generates summary tables for display in chart/table formats.
     """
-    if Ticket.objects.all().count() == 0 or report not in (
-            'queuemonth', 'usermonth', 'queuestatus', 'queuepriority', 'userstatus',
-            'userpriority', 'userqueue', 'daysuntilticketclosedbymonth'):
+    if report not in REPORTS:
         return HttpResponseRedirect(reverse("helpdesk_report_index"))
 
-    report_queryset = Ticket.objects.all().select_related().filter(
-        queue__in=_get_user_queues(request.user)
-    )
+    user_queues = list(_get_user_queues(request.user))
+    report_queryset = Ticket.objects.filter(queue__in=user_queues)
 
     from_saved_query = False
     saved_query = None
@@ -1356,151 +1266,15 @@ def run_report(request, report):
 
         report_queryset = apply_query(report_queryset, query_params)
 
-    from collections import defaultdict
-    summarytable = defaultdict(int)
-    # a second table for more complex queries
-    summarytable2 = defaultdict(int)
-
-    month_name = lambda m: MONTHS_3[m].title()
-
-    first_ticket = Ticket.objects.all().order_by('created')[0]
-    first_month = first_ticket.created.month
-    first_year = first_ticket.created.year
-
-    last_ticket = Ticket.objects.all().order_by('-created')[0]
-    last_month = last_ticket.created.month
-    last_year = last_ticket.created.year
-
-    periods = []
-    year, month = first_year, first_month
-    working = True
-    periods.append("%s %s" % (month_name(month), year))
-
-    while working:
-        month += 1
-        if month > 12:
-            year += 1
-            month = 1
-        if (year > last_year) or (month > last_month and year >= last_year):
-            working = False
-        periods.append("%s %s" % (month_name(month), year))
-
-    if report == 'userpriority':
-        title = _('User by Priority')
-        col1heading = _('User')
-        possible_options = [t[1].title() for t in Ticket.PRIORITY_CHOICES]
-        charttype = 'bar'
-
-    elif report == 'userqueue':
-        title = _('User by Category')
-        col1heading = _('User')
-        queue_options = _get_user_queues(request.user)
-        possible_options = [q.title for q in queue_options]
-        charttype = 'bar'
-
-    elif report == 'userstatus':
-        title = _('User by Status')
-        col1heading = _('User')
-        possible_options = [s[1].title() for s in Ticket.STATUS_CHOICES]
-        charttype = 'bar'
-
-    elif report == 'usermonth':
-        title = _('User by Month')
-        col1heading = _('User')
-        possible_options = periods
-        charttype = 'date'
-
-    elif report == 'queuepriority':
-        title = _('Category by Priority')
-        col1heading = _('Category')
-        possible_options = [t[1].title() for t in Ticket.PRIORITY_CHOICES]
-        charttype = 'bar'
-
-    elif report == 'queuestatus':
-        title = _('Category by Status')
-        col1heading = _('Category')
-        possible_options = [s[1].title() for s in Ticket.STATUS_CHOICES]
-        charttype = 'bar'
-
-    elif report == 'queuemonth':
-        title = _('Category by Month')
-        col1heading = _('Category')
-        possible_options = periods
-        charttype = 'date'
-
-    elif report == 'daysuntilticketclosedbymonth':
-        title = _('Days until ticket closed by Month')
-        col1heading = _('Category')
-        possible_options = periods
-        charttype = 'date'
-
-    metric3 = False
-    for ticket in report_queryset:
-        if report == 'userpriority':
-            metric1 = '%s' % ticket.get_assigned_to
-            metric2 = '%s' % ticket.get_priority_display()
-
-        elif report == 'userqueue':
-            metric1 = '%s' % ticket.get_assigned_to
-            metric2 = '%s' % ticket.queue.title
-
-        elif report == 'userstatus':
-            metric1 = '%s' % ticket.get_assigned_to
-            metric2 = '%s' % ticket.get_status_display()
-
-        elif report == 'usermonth':
-            metric1 = '%s' % ticket.get_assigned_to
-            metric2 = '%s %s' % (month_name(ticket.created.month), ticket.created.year)
-
-        elif report == 'queuepriority':
-            metric1 = '%s' % ticket.queue.title
-            metric2 = '%s' % ticket.get_priority_display()
-
-        elif report == 'queuestatus':
-            metric1 = '%s' % ticket.queue.title
-            metric2 = '%s' % ticket.get_status_display()
-
-        elif report == 'queuemonth':
-            metric1 = '%s' % ticket.queue.title
-            metric2 = '%s %s' % (month_name(ticket.created.month), ticket.created.year)
-
-        elif report == 'daysuntilticketclosedbymonth':
-            metric1 = '%s' % ticket.queue.title
-            metric2 = '%s %s' % (month_name(ticket.created.month), ticket.created.year)
-            metric3 = ticket.modified - ticket.created
-            metric3 = metric3.days
-
-        summarytable[metric1, metric2] += 1
-        if metric3:
-            if report == 'daysuntilticketclosedbymonth':
-                summarytable2[metric1, metric2] += metric3
-
-    table = []
-
-    if report == 'daysuntilticketclosedbymonth':
-        for key in list(summarytable2.keys()):
-            summarytable[key] = summarytable2[key] / summarytable[key]
-
-    header1 = sorted(set(list(i for i, _ in list(summarytable.keys()))))
-
-    column_headings = [col1heading] + possible_options
-
-    # Pivot the data so that 'header1' fields are always first column
-    # in the row, and 'possible_options' are always the 2nd - nth columns.
-    for item in header1:
-        data = []
-        for hdr in possible_options:
-            data.append(summarytable[item, hdr])
-        table.append([item] + data)
-
-    return render(request, 'helpdesk/report_output.html', {
-        'title': title,
-        'charttype': charttype,
-        'data': table,
-        'headings': column_headings,
+    result = build_report(report, report_queryset, user_queues, saved_query)
+    if result is None:
+        return HttpResponseRedirect(reverse("helpdesk_report_index"))
+
+    result.update({
         'from_saved_query': from_saved_query,
         'saved_query': saved_query,
     })
+    return render(request, 'helpdesk/report_output.html', result)
 run_report = staff_member_required(run_report)
 
 
@@ -1767,103 +1541,3 @@ def attachment_del(request, ticket_id, attachment_id):
 attachment_del = staff_member_required(attachment_del)
 
 
-def calc_average_nbr_days_until_ticket_resolved(Tickets):
-    """Calculate the average number of days between ticket creation and last modification (resolved)."""
-    nbr_closed_tickets = len(Tickets)
-    days_per_ticket = 0
-    days_each_ticket = list()
-
-    for ticket in Tickets:
-        time_ticket_open = ticket.modified - ticket.created
-        days_this_ticket = time_ticket_open.days
-        days_per_ticket += days_this_ticket
-        days_each_ticket.append(days_this_ticket)
-
-    if nbr_closed_tickets > 0:
-        mean_per_ticket = days_per_ticket / nbr_closed_tickets
-    else:
-        mean_per_ticket = 0
-
-    return mean_per_ticket
-
-
-def calc_basic_ticket_stats(Tickets):
-    """Compute basic statistics for tickets such as counts of open tickets by age,
-    and average resolution times."""
-    # all not closed tickets (open, reopened, resolved,) - independent of user
-    all_open_tickets = Tickets.exclude(status=Ticket.CLOSED_STATUS)
-    today = datetime.today()
-
-    date_30 = date_rel_to_today(today, 30)
-    date_60 = date_rel_to_today(today, 60)
-    date_30_str = date_30.strftime('%Y-%m-%d')
-    date_60_str = date_60.strftime('%Y-%m-%d')
-
-    # > 0 & <= 30
-    ota_le_30 = all_open_tickets.filter(created__gte=date_30_str)
-    N_ota_le_30 = len(ota_le_30)
-
-    # >= 30 & <= 60
-    ota_le_60_ge_30 = all_open_tickets.filter(created__gte=date_60_str, created__lte=date_30_str)
-    N_ota_le_60_ge_30 = len(ota_le_60_ge_30)
-
-    # >= 60
-    ota_ge_60 = all_open_tickets.filter(created__lte=date_60_str)
-    N_ota_ge_60 = len(ota_ge_60)
-
-    # (O)pen (T)icket (S)tats
-    ots = list()
-    # label, number entries, color, sort_string
-    ots.append(['< 30 days', N_ota_le_30, get_color_for_nbr_days(N_ota_le_30),
-                sort_string(date_30_str, ''), ])
-    ots.append(['30 - 60 days', N_ota_le_60_ge_30, get_color_for_nbr_days(N_ota_le_60_ge_30),
-                sort_string(date_60_str, date_30_str), ])
-    ots.append(['> 60 days', N_ota_ge_60, get_color_for_nbr_days(N_ota_ge_60),
-                sort_string('', date_60_str), ])
-
-    # all closed tickets - independent of user.
-    all_closed_tickets = Tickets.filter(status=Ticket.CLOSED_STATUS)
-    average_nbr_days_until_ticket_closed = \
-        calc_average_nbr_days_until_ticket_resolved(all_closed_tickets)
-    # all closed tickets that were opened in the last 60 days.
-    all_closed_last_60_days = all_closed_tickets.filter(created__gte=date_60_str)
-    average_nbr_days_until_ticket_closed_last_60_days = \
-        calc_average_nbr_days_until_ticket_resolved(all_closed_last_60_days)
-
-    # put together basic stats
-    basic_ticket_stats = {
-        'average_nbr_days_until_ticket_closed': average_nbr_days_until_ticket_closed,
-        'average_nbr_days_until_ticket_closed_last_60_days':
-            average_nbr_days_until_ticket_closed_last_60_days,
-        'open_ticket_stats': ots,
-    }
-
-    return basic_ticket_stats
-
-
-def get_color_for_nbr_days(nbr_days):
-    """Return a color string("green", "orange or "red") based on the number of days."""
-    if nbr_days < 5:
-        color_string = 'green'
-    elif nbr_days < 10:
-        color_string = 'orange'
-    else:  # more than 10 days
-        color_string = 'red'
-
-    return color_string
-
-
-def days_since_created(today, ticket):
-    """Calculate the number of days since the ticket was created."""
-    return (today - ticket.created).days
-
-
-def date_rel_to_today(today, offset):
-    """Calculate the date relative to today by subtracting an offset in days."""
-    return today - timedelta(days = offset)
-
-
-def sort_string(begin, end):
-    """Construct a query string for sorting and filtering tickets by date and status."""
-    return 'sort=created&date_from=%s&date_to=%s&status=%s&status=%s&status=%s' % (
-        begin, end, Ticket.OPEN_STATUS, Ticket.REOPENED_STATUS, Ticket.RESOLVED_STATUS)
@@ -5,7 +5,6 @@ from rest_framework.permissions import IsAdminUser, IsAuthenticated, BasePermiss
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.exceptions import NotFound
 from __future__ import absolute_import
-from datetime import datetime, timedelta
 from django import VERSION, forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -14,7 +13,7 @@ from django.urls import reverse
 from django.core.exceptions import ValidationError, PermissionDenied
 from django.core import paginator
 from django.db import connection
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.http import HttpResponseRedirect, Http404, HttpResponse
 from django.shortcuts import render, get_object_or_404, redirect
 from django.utils.dates import MONTHS_3
@@ -40,6 +39,7 @@ from helpdesk.models import (
     Ticket, Queue, FollowUp, TicketChange, PreSetReply, Attachment, SavedSearch,
     IgnoreEmail, TicketCC, TicketDependency,
 )
+from helpdesk.stats import dashboard_ticket_stats
 from helpdesk import settings as helpdesk_settings
 from helpdesk_api.serializers import *
 
@@ -146,99 +146,6 @@ def return_to_ticket(user, helpdesk_settings, ticket):
     else:
         return HttpResponseRedirect(ticket.ticket_url)
 
-def calc_average_nbr_days_until_ticket_resolved(Tickets):
-    nbr_closed_tickets = len(Tickets)
-    days_per_ticket = 0
-    days_each_ticket = list()
-
-    for ticket in Tickets:
-        time_ticket_open = ticket.modified - ticket.created
-        days_this_ticket = time_ticket_open.days
-        days_per_ticket += days_this_ticket
-        days_each_ticket.append(days_this_ticket)
-
-    if nbr_closed_tickets > 0:
-        mean_per_ticket = days_per_ticket / nbr_closed_tickets
-    else:
-        mean_per_ticket = 0
-
-    return mean_per_ticket
-
-def calc_basic_ticket_stats(Tickets):
-    # all not closed tickets (open, reopened, resolved,) - independent of user
-    all_open_tickets = Tickets.exclude(status=Ticket.CLOSED_STATUS)
-    today = datetime.today()
-
-    date_30 = date_rel_to_today(today, 30)
-    date_60 = date_rel_to_today(today, 60)
-    date_30_str = date_30.strftime('%Y-%m-%d')
-    date_60_str = date_60.strftime('%Y-%m-%d')
-
-    # > 0 & <= 30
-    ota_le_30 = all_open_tickets.filter(created__gte=date_30_str)
-    N_ota_le_30 = len(ota_le_30)
-
-    # >= 30 & <= 60
-    ota_le_60_ge_30 = all_open_tickets.filter(created__gte=date_60_str, created__lte=date_30_str)
-    N_ota_le_60_ge_30 = len(ota_le_60_ge_30)
-
-    # >= 60
-    ota_ge_60 = all_open_tickets.filter(created__lte=date_60_str)
-    N_ota_ge_60 = len(ota_ge_60)
-
-    # (O)pen (T)icket (S)tats
-    ots = list()
-    # label, number entries, color, sort_string
-    ots.append(['< 30 days', N_ota_le_30, get_color_for_nbr_days(N_ota_le_30),
-                sort_string(date_30_str, ''), ])
-    ots.append(['30 - 60 days', N_ota_le_60_ge_30, get_color_for_nbr_days(N_ota_le_60_ge_30),
-                sort_string(date_60_str, date_30_str), ])
-    ots.append(['> 60 days', N_ota_ge_60, get_color_for_nbr_days(N_ota_ge_60),
-                sort_string('', date_60_str), ])
-
-    # all closed tickets - independent of user.
-    all_closed_tickets = Tickets.filter(status=Ticket.CLOSED_STATUS)
-    average_nbr_days_until_ticket_closed = \
-        calc_average_nbr_days_until_ticket_resolved(all_closed_tickets)
-    # all closed tickets that were opened in the last 60 days.
-    all_closed_last_60_days = all_closed_tickets.filter(created__gte=date_60_str)
-    average_nbr_days_until_ticket_closed_last_60_days = \
-        calc_average_nbr_days_until_ticket_resolved(all_closed_last_60_days)
-
-    # put together basic stats
-    basic_ticket_stats = {
-        'average_nbr_days_until_ticket_closed': average_nbr_days_until_ticket_closed,
-        'average_nbr_days_until_ticket_closed_last_60_days':
-            average_nbr_days_until_ticket_closed_last_60_days,
-        'open_ticket_stats': ots,
-    }
-
-    return basic_ticket_stats
-
-
-def get_color_for_nbr_days(nbr_days):
-    if nbr_days < 5:
-        color_string = 'green'
-    elif nbr_days < 10:
-        color_string = 'orange'
-    else:  # more than 10 days
-        color_string = 'red'
-
-    return color_string
-
-
-def days_since_created(today, ticket):
-    return (today - ticket.created).days
-
-
-def date_rel_to_today(today, offset):
-    return today - timedelta(days = offset)
-
-
-def sort_string(begin, end):
-    return 'sort=created&date_from=%s&date_to=%s&status=%s&status=%s&status=%s' % (
-        begin, end, Ticket.OPEN_STATUS, Ticket.REOPENED_STATUS, Ticket.RESOLVED_STATUS)
-
 class TicketDashboardViewSet(viewsets.ModelViewSet):
     """
     A ModelViewSet that includes a dashboard view for ticket summaries.
@@ -280,7 +187,7 @@ class TicketDashboardViewSet(viewsets.ModelViewSet):
 
         # Tickets in queues the user has access to
         tickets_in_queues = Ticket.objects.filter(queue__in=user_queues)
-        basic_ticket_stats = calc_basic_ticket_stats(tickets_in_queues)
+        basic_ticket_stats = dashboard_ticket_stats(user_queues)
 
         # Status counts by queue
         dash_tickets = defaultdict(lambda: {
@@ -291,18 +198,18 @@ class TicketDashboardViewSet(viewsets.ModelViewSet):
             'closed': 0,
         })
 
-        for ticket in tickets_in_queues.select_related('queue'):
-            q_id = ticket.queue.id
-            data = dash_tickets[q_id]
-            data['queue'] = q_id
-            data['name'] = ticket.queue.title
-
-            if ticket.status in [Ticket.OPEN_STATUS, Ticket.REOPENED_STATUS]:
-                data['open'] += 1
-            elif ticket.status == Ticket.RESOLVED_STATUS:
-                data['resolved'] += 1
-            elif ticket.status == Ticket.CLOSED_STATUS:
-                data['closed'] += 1
+        counts = tickets_in_queues.order_by().values('queue', 'queue__title', 'status').annotate(count=Count('id'))
+        for row in counts:
+            data = dash_tickets[row['queue']]
+            data['queue'] = row['queue']
+            data['name'] = row['queue__title']
+
+            if row['status'] in [Ticket.OPEN_STATUS, Ticket.REOPENED_STATUS]:
+                data['open'] += row['count']
+            elif row['status'] == Ticket.RESOLVED_STATUS:
+                data['resolved'] += row['count']
+            elif row['status'] == Ticket.CLOSED_STATUS:
+                data['closed'] += row['count']
 
         return Response({
             'user_tickets': TicketSerializer(tickets, many=True).data,
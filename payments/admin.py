@@ -93,6 +93,20 @@ class SubscriptionAdmin(CustomModelAdminAllFields):
     search_fields = ('company__name', 'price_slab__currency__name', 'price_slab__currency__codename')
 admin.site.register(Subscription, SubscriptionAdmin)
 
+class SubscriptionEventAdmin(CustomModelAdminAllFields):
+    """
+    Admin interface for the SubscriptionEvent model.
+
+    Attributes:
+        list_filter (tuple): Filters by event type and timestamp.
+        list_display_links (tuple): Clickable fields in the list display.
+        search_fields (tuple): Fields used to search for events.
+    """
+    list_filter = ('event', 'timestamp')
+    list_display_links = ('id', 'subscription', 'event')
+    search_fields = ('subscription__company__name',)
+admin.site.register(SubscriptionEvent, SubscriptionEventAdmin)
+
 class TransactionsAdmin(CustomModelAdminAllFields):
     """
     Admin interface for the Transactions model.
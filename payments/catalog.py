@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Cached pricing catalog (packages, price slabs and service categories).
+
+Every page extends ``base.html``, whose pricing and billing modals list the
+packages, their price slabs per currency and the services of each category.
+The ``packages`` context processor used to hand lazy querysets to them, so
+every render ran one query per package, price slab, currency and service.
+
+The catalog is now loaded once with prefetches, precomputed (see
+``Package.package_slabs``) and stored in the Django cache under a versioned
+key, for ``PRICING_CACHE_TIMEOUT`` seconds. Saving or deleting a package, a
+price slab, a service or a service category bumps the version (see the end of
+``payments.models``) in the cache. With the default per-process cache (no
+``CACHES`` setting) only the process that saved the row sees the change at
+once, the other ones when their copy expires, hence the short timeout; with a
+shared cache backend every process reads the new catalog on its next render.
+Code changing those rows with ``QuerySet.update()`` must call
+``invalidate_pricing_catalog`` itself.
+"""
+
+from __future__ import absolute_import
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+PRICING_CACHE_TIMEOUT = getattr(settings, 'PRICING_CACHE_TIMEOUT', 5 * 60)
+VERSION_KEY = 'pricing_catalog:version'
+
+
+class CatalogList(list):
+    """ List of catalog rows, with the ``count()`` templates call on querysets. """
+    def count(self, *args):
+        if args:
+            return list.count(self, *args)
+        return len(self)
+
+
+def get_catalog_version():
+    """ Current version of the catalog, created on first use. """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # A timestamp never reuses the key of a catalog cached before a cache flush
+        version = int(time.time() * 1000)
+        if not cache.add(VERSION_KEY, version, None):
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def invalidate_pricing_catalog():
+    """ Make the processes sharing the cache rebuild the catalog on their next read. """
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time() * 1000), None)
+
+
+def build_pricing_catalog():
+    """
+    Load the catalog from the database.
+
+    Returns:
+        dict: ``packages`` and ``service_categories``, as ``CatalogList``.
+    """
+    from payments.models import Package, PriceSlab, ServiceCategory, Services
+    category_services = Prefetch('services_set', queryset=Services.objects.order_by('id'))
+    packages = CatalogList(Package.objects.prefetch_related(
+        Prefetch('priceslab_set', queryset=PriceSlab.objects.select_related('currency').order_by('id')),
+        Prefetch('services', queryset=Services.objects.prefetch_related(
+            Prefetch('category__services_set', queryset=Services.objects.order_by('id'))))))
+    for package in packages:
+        package.package_slabs()
+    service_categories = CatalogList(ServiceCategory.objects.prefetch_related(
+        category_services, 'services_set__package_set'))
+    return {'packages': packages, 'service_categories': service_categories}
+
+
+def get_pricing_catalog():
+    """
+    The catalog of the current version, from the cache when possible.
+
+    Returns:
+        dict: ``packages`` and ``service_categories``.
+    """
+    key = 'pricing_catalog:%s' % get_catalog_version()
+    catalog = cache.get(key)
+    if catalog is None:
+        catalog = build_pricing_catalog()
+        cache.set(key, catalog, PRICING_CACHE_TIMEOUT)
+    return catalog
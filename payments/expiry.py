@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Subscription expiry engine.
+
+``payments.cron.SubscriptionCronJob`` runs every minute. It used to load every
+subscription, test ``expired()`` on each one in Python and, for every hit, query
+the admins, the wallet and the price slab again and send the emails inline, so
+each run got slower with the number of tenants and could overlap the next one.
+
+``run_subscription_expiry`` selects the due subscriptions with range queries on
+the indexed ``expiry`` column and handles them in batches of
+``SUBSCRIPTION_EXPIRY_BATCH_SIZE``. Each batch runs in one transaction that
+locks its subscription and wallet rows. Renewals, downgrades and reminders each
+record a ``SubscriptionEvent`` keyed by the expiry date they were handled for.
+An event that already has its row is skipped, so a retried or overlapping batch
+never bills or reminds a company twice for the same period. Emails are queued
+while a batch runs and are only handed to ``send_TRM_email`` once the batch
+commits.
+"""
+
+from __future__ import absolute_import
+from collections import defaultdict
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+
+from activities.utils import post_org_notification
+from common.models import send_TRM_email
+from companies.models import Recruiter, Wallet
+from payments.models import PriceSlab, Subscription, SubscriptionEvent, Transactions
+
+BATCH_SIZE = getattr(settings, 'SUBSCRIPTION_EXPIRY_BATCH_SIZE', 100)
+
+SUBJECT_TEMPLATE = 'mails/billing_reminder_subject.html'
+EMAIL_TEMPLATE = 'mails/billing_reminder.html'
+
+REMINDERS = {
+    'week_reminder': {
+        'manual': 'Your current plan expires in a week. Kindly set "Auto Renew" and have sufficient credits to continue using the current plan.',
+        'credits': 'Your current plan expires in a week. You have insufficient credits to renew. Please top up now.',
+    },
+    'day_reminder': {
+        'manual': 'Your current plan expires today. Kindly set "Auto Renew" and have sufficient credits to continue using the current plan.',
+        'credits': 'Your current plan expires today. You have insufficient credits to renew. Please top up now.',
+    },
+}
+
+
+def send_billing_emails(mails):
+    """
+    Send the emails queued by a batch.
+
+    Args:
+        mails (list): ``(context_email, recipients)`` pairs.
+    """
+    for context_email, recipients in mails:
+        send_TRM_email(subject_template_name=SUBJECT_TEMPLATE, email_template_name=EMAIL_TEMPLATE,
+                       context_email=context_email, to_user=recipients)
+
+
+class ExpiryBatch(object):
+    """
+    A batch of locked subscriptions with the rows needed to handle them,
+    loaded in a fixed number of queries, and the changes to write back.
+    """
+    def __init__(self, subscriptions):
+        self.subscriptions = subscriptions
+        company_ids = [subscription.company_id for subscription in subscriptions if subscription.company_id]
+        self.wallets = {wallet.company_id: wallet for wallet in
+                        Wallet.objects.select_for_update().filter(company__in=company_ids)}
+        self.admins = defaultdict(list)
+        memberships = Recruiter.company.through.objects.filter(
+            company__in=company_ids, recruiter__membership=3, recruiter__user__is_active=True) \
+            .select_related('recruiter__user')
+        for membership in memberships:
+            self.admins[membership.company_id].append(membership.recruiter.user)
+        self.handled = set(SubscriptionEvent.objects.filter(subscription__in=subscriptions)
+                           .values_list('subscription_id', 'event', 'expiry'))
+        self.events = []
+        self.transactions = []
+        self.changed_wallets = []
+        self.mails = []
+
+    def is_handled(self, subscription, event):
+        return (subscription.pk, event, subscription.expiry) in self.handled
+
+    def record(self, subscription, event):
+        self.handled.add((subscription.pk, event, subscription.expiry))
+        self.events.append(SubscriptionEvent(subscription=subscription, event=event, expiry=subscription.expiry))
+
+    def available(self, subscription):
+        wallet = self.wallets.get(subscription.company_id)
+        return (wallet.available or 0) if wallet else 0
+
+    def notify(self, subscription, subject, message):
+        """ Queue the email and post the notification of the company admins. """
+        users = self.admins.get(subscription.company_id)
+        if not users:
+            return
+        company = subscription.company
+        href_url = company.geturl() + '/billing/' if company.subdomain_id else None
+        self.mails.append(({'subject': subject, 'message': message, 'href_url': href_url},
+                           [user.email for user in users]))
+        post_org_notification(user=users, action=message, url=reverse('companies_billing'))
+
+    def save(self):
+        """ Write the changes of the batch and queue its emails after commit. """
+        now = timezone.now()
+        for wallet in self.changed_wallets:
+            wallet.last_updated = now
+        Subscription.objects.bulk_update(self.subscriptions,
+                                         ['expiry', 'price_slab', 'added_users', 'last_week', 'last_day'])
+        Wallet.objects.bulk_update(self.changed_wallets, ['available', 'last_updated'])
+        Transactions.objects.bulk_create(self.transactions)
+        SubscriptionEvent.objects.bulk_create(self.events)
+        if self.mails:
+            transaction.on_commit(partial(send_billing_emails, self.mails))
+
+
+def handle_expired(batch, subscription, free_slab):
+    """
+    Renew an expired subscription from the company wallet, or downgrade it to
+    the free plan when it is not renewed automatically or credits are short.
+
+    Returns:
+        str: The recorded event, or None if it was handled before.
+    """
+    if batch.is_handled(subscription, 'renewed') or batch.is_handled(subscription, 'expired'):
+        return None
+    subscription.last_week = False
+    subscription.last_day = False
+    available = batch.available(subscription)
+    amount = subscription.bill_amount() if subscription.price_slab_id else None
+    if subscription.auto_renew and amount is not None and amount < available:
+        batch.record(subscription, 'renewed')
+        wallet = batch.wallets[subscription.company_id]
+        wallet.available = available - amount
+        batch.changed_wallets.append(wallet)
+        batch.transactions.append(Transactions(user=subscription.company.user, company=subscription.company,
+                                               type='R', reason='Plan Auto Renewal', amount=amount,
+                                               balance=wallet.available))
+        period = subscription.price_slab.expiry_period
+        subscription.expiry = subscription.expiry + timedelta(days=period) if period else None
+        batch.notify(subscription, 'Auto Renewal Successful',
+                     'Your plan has been successfuly renewed. Your available credit balance is %s' % wallet.available)
+        return 'renewed'
+    batch.record(subscription, 'expired')
+    if subscription.auto_renew:
+        message = 'Due to insufficient credits your auto renewal has failed. Kindly add credits to continue the current plan.'
+    else:
+        message = 'Your current plan has expired. Kindly add credits to continue the current plan.'
+    batch.notify(subscription, 'Action Required: Plan Expired', message)
+    subscription.expiry = None
+    subscription.price_slab = free_slab
+    subscription.added_users = 0
+    return 'expired'
+
+
+def handle_reminder(batch, subscription, event):
+    """
+    Remind the admins of a subscription about to expire that it will not be
+    renewed, unless it renews automatically with enough credits.
+
+    Returns:
+        str: The recorded event, or None if it was handled before.
+    """
+    if event == 'week_reminder':
+        subscription.last_week = True
+    else:
+        subscription.last_week = False
+        subscription.last_day = True
+    if batch.is_handled(subscription, event):
+        return None
+    batch.record(subscription, event)
+    if not subscription.auto_renew:
+        message = REMINDERS[event]['manual']
+    elif subscription.price_slab_id and batch.available(subscription) < subscription.bill_amount():
+        message = REMINDERS[event]['credits']
+    else:
+        return event
+    batch.notify(subscription, 'Action Required: Billing Reminder', message)
+    return event
+
+
+def process_in_batches(queryset, handler):
+    """
+    Apply a handler to the subscriptions of a queryset, batch by batch.
+
+    The ids are selected first. Each batch selects its rows again with the same
+    conditions, under row locks, so rows handled meanwhile by another run (or
+    locked by it) are skipped.
+
+    Args:
+        queryset (QuerySet): Due subscriptions.
+        handler (callable): Called with the batch and each subscription; returns
+            the recorded event or None.
+
+    Returns:
+        dict: Number of subscriptions per recorded event.
+    """
+    counts = defaultdict(int)
+    ids = list(queryset.order_by('expiry', 'id').values_list('id', flat=True))
+    for start in range(0, len(ids), BATCH_SIZE):
+        with transaction.atomic():
+            subscriptions = list(queryset.filter(pk__in=ids[start:start + BATCH_SIZE])
+                                 .select_for_update(skip_locked=True, of=('self',))
+                                 .select_related('company__subdomain', 'company__user', 'price_slab'))
+            if not subscriptions:
+                continue
+            batch = ExpiryBatch(subscriptions)
+            for subscription in subscriptions:
+                event = handler(batch, subscription)
+                if event:
+                    counts[event] += 1
+            batch.save()
+    return counts
+
+
+def run_subscription_expiry(now=None):
+    """
+    Renew or downgrade the expired subscriptions, send the expiry reminders and
+    clear the reminder flags of the renewed subscriptions.
+
+    Args:
+        now (datetime): Reference time (defaults to the current time).
+
+    Returns:
+        dict: Number of subscriptions renewed, expired and reminded, and of
+        cleared reminder flags.
+    """
+    now = now or timezone.now()
+    free_slab = PriceSlab.objects.first()
+    report = defaultdict(int)
+    phases = [
+        (Subscription.objects.filter(expiry__lte=now),
+         partial(handle_expired, free_slab=free_slab)),
+        (Subscription.objects.filter(expiry__gt=now + timedelta(days=1), expiry__lt=now + timedelta(days=7),
+                                     last_week=False),
+         partial(handle_reminder, event='week_reminder')),
+        (Subscription.objects.filter(expiry__gt=now, expiry__lt=now + timedelta(days=1), last_day=False),
+         partial(handle_reminder, event='day_reminder')),
+    ]
+    for queryset, handler in phases:
+        for event, count in process_in_batches(queryset, handler).items():
+            report[event] += count
+    report['flags_cleared'] = Subscription.objects.filter(Q(last_week=True) | Q(last_day=True)) \
+        .filter(Q(expiry__isnull=True) | Q(expiry__gt=now + timedelta(days=7))) \
+        .update(last_week=False, last_day=False)
+    return dict(report)
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0015_alter_discount_id_alter_discount_usage_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='subscription',
+            name='expiry',
+            field=models.DateTimeField(blank=True, db_index=True, default=None, null=True),
+        ),
+        migrations.CreateModel(
+            name='SubscriptionEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('renewed', 'Renewed'), ('expired', 'Expired'), ('week_reminder', 'Expires in a week'), ('day_reminder', 'Expires today')], max_length=15)),
+                ('expiry', models.DateTimeField()),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='payments.subscription')),
+            ],
+            options={
+                'verbose_name': 'Subscription Event',
+                'verbose_name_plural': 'Subscription Events',
+                'ordering': ('-timestamp',),
+                'unique_together': {('subscription', 'event', 'expiry')},
+            },
+        ),
+    ]
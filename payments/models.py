@@ -1,11 +1,10 @@
     # -*- coding: utf-8 -*-
 from __future__ import absolute_import
+import copy
 from datetime import datetime
 from common.models import Currency
 from companies.models import Company
 from django.db import models
-from django.db.models.expressions import Value
-from django.db.models.fields import BooleanField
 from django.utils.translation import gettext as _
 from TRM import settings
 
@@ -85,25 +84,36 @@ class Package(models.Model):
     def package_slabs(self):
         """
         Retrieves price slabs grouped by currency and annotated with service category information.
+
+        Works on ``priceslab_set`` and ``services`` as loaded by
+        ``payments.catalog.build_pricing_catalog`` without further queries, and
+        keeps its result on the instance, so the cached catalog carries it.
         """
-        currencies = self.priceslab_set.all().values_list('currency').distinct()
+        if getattr(self, '_package_slabs', None) is not None:
+            return self._package_slabs
+        price_slabs = {}
+        for price_slab in self.priceslab_set.all():
+            price_slabs.setdefault(price_slab.currency_id, []).append(price_slab)
+        services = list(self.services.all())
+        service_ids = set(service.id for service in services)
+        categories = {}
+        for service in services:
+            # ServiceCategory.objects (Active) used to leave disabled categories out, the prefetched
+            # service.category is loaded with the base manager
+            if service.category_id and service.category.enabled:
+                categories[service.category_id] = service.category
         slabset = []
-        for currency in currencies:
-            if currency[0]:
-                slabobject = {'currency':Currency.objects.get(id = currency[0])}
-            else:
-                slabobject = {'currency': None}
-            slabobject['price_slabs'] = self.priceslab_set.all().filter(currency = slabobject['currency'])
-            slabobject['ids'] = [sc['category'] for sc in self.services.all().values('category').distinct()]
-            slabobject['service_categories'] = ServiceCategory.objects.filter(id__in=slabobject['ids']).annotate(full_package=Value(False, output_field = BooleanField()))
-            # print slabobject['service_categories']
-            for category in slabobject['service_categories']:
+        for slabs in price_slabs.values():
+            slabobject = {'currency': slabs[0].currency, 'price_slabs': slabs}
+            slabobject['ids'] = list(set(service.category_id for service in services))
+            slabobject['service_categories'] = []
+            for category_id in sorted(categories):
+                category = copy.copy(categories[category_id])
                 ids = [c.id for c in category.services_set.all()]
-                if set(ids).issubset(set([service.id for service in self.services.all()])):
-                    category.full_package = True
-            slabobject['service_categories'].order_by('full_package')
-            # print slabobject['service_categories'].order_by('full_package')
+                category.full_package = set(ids).issubset(service_ids)
+                slabobject['service_categories'].append(category)
             slabset.append(slabobject)
+        self._package_slabs = slabset
         return slabset
 
     def currencies(self):
@@ -153,7 +163,7 @@ class PriceSlab(models.Model):
 class Subscription(models.Model):
     #company = models.OneToOneField(Company, null=True, blank=True, default=None)
     company = models.OneToOneField(Company, null=True, blank=True, default=None, on_delete=models.SET_NULL)
-    expiry = models.DateTimeField(null=True, blank=True, default=None)
+    expiry = models.DateTimeField(null=True, blank=True, default=None, db_index=True)
     added_users = models.PositiveIntegerField(null=True, blank=True, default=0)
     price_slab = models.ForeignKey(PriceSlab, null=True, blank=True, default=None,on_delete=models.SET_NULL)
     auto_renew = models.BooleanField(default = True, blank=True)
@@ -190,6 +200,34 @@ class Subscription(models.Model):
             amount = amount + (self.added_users*self.price_slab.price_per_user)
         return amount
     
+SUBSCRIPTION_EVENTS = (
+    ('renewed', _('Renewed')),
+    ('expired', _('Expired')),
+    ('week_reminder', _('Expires in a week')),
+    ('day_reminder', _('Expires today')),
+)
+
+class SubscriptionEvent(models.Model):
+    """
+    Run state of the subscription expiry engine (see payments.expiry): one row
+    per subscription, event and expiry date it was handled for. The engine
+    skips an event that already has its row, so a subscription is never billed
+    or reminded twice for the same period.
+    """
+    subscription = models.ForeignKey(Subscription, related_name='events', on_delete=models.CASCADE)
+    event = models.CharField(choices=SUBSCRIPTION_EVENTS, max_length=15)
+    expiry = models.DateTimeField()
+    timestamp = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Subscription Event"
+        verbose_name_plural = "Subscription Events"
+        unique_together = ('subscription', 'event', 'expiry')
+        ordering = ('-timestamp',)
+
+    def __unicode__(self):
+        return '%s %s' % (self.event, str(self.expiry))
+
 WALLET_MOVEMENTS_TYPE = (
     ('A', _('Added')),
     ('R', _('Paid'))
@@ -284,3 +322,16 @@ class Discount_Usage(models.Model):
 
 
 ### IF YOU ADD ADDITIONAL MODELS, DO NOT FORGET TO REGISTER THEM IN ADMIN ###
+
+
+def expire_pricing_catalog(sender, **kwargs):
+    """
+    Make the next render rebuild the cached pricing catalog (see ``payments.catalog``).
+    """
+    from payments.catalog import invalidate_pricing_catalog
+    invalidate_pricing_catalog()
+
+for catalog_model in (ServiceCategory, Services, Package, PriceSlab):
+    models.signals.post_save.connect(expire_pricing_catalog, sender=catalog_model)
+    models.signals.post_delete.connect(expire_pricing_catalog, sender=catalog_model)
+models.signals.m2m_changed.connect(expire_pricing_catalog, sender=Package.services.through)
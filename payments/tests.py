@@ -1,13 +1,216 @@
+"""
+ Testing the cached pricing catalog (payments.catalog) and the subscription
+ expiry engine (payments.expiry).
+ The test is divided into 4 parts:
+ 	1. Cache hits
+ 	2. Invalidation when catalog rows are saved
+ 	3. Renewal and downgrade of the expired subscriptions
+ 	4. Expiry reminders
+ """
+
+# Imports
 from __future__ import absolute_import
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from common.models import Currency, User
+from companies.models import Company, Recruiter, Wallet
+from payments.catalog import get_pricing_catalog
+from payments.expiry import run_subscription_expiry
+from payments.models import Package, PriceSlab, ServiceCategory, Services, Subscription, SubscriptionEvent, \
+	Transactions
 
-"""
-Creating unit tests for the app.
 
-This module is created for unit tests for the Django application.
-By default, it includes a subclass of `django.test.TestCase` which
-can be extended to write tests for models, views, forms, and other
-components of the app.
+class PricingCatalogTestCase(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.currency = Currency.objects.create(code='INR', symbol='Rs')
+		cls.category = ServiceCategory.objects.create(name='Support', codename='SUP')
+		cls.disabled_category = ServiceCategory.objects.create(name='Legacy', codename='LEG', enabled=False)
+		cls.service = Services.objects.create(name='Chat', codename='chat', category=cls.category)
+		cls.legacy_service = Services.objects.create(name='Fax', codename='fax', category=cls.disabled_category)
+		cls.package = Package.objects.create(name='Basic')
+		cls.package.services.add(cls.service, cls.legacy_service)
+		cls.price_slab = PriceSlab.objects.create(package=cls.package, currency=cls.currency, slab_period='M', amount=10)
 
-"""
-# Create your tests here.
+	def setUp(self):
+		cache.clear()
+
+	def slabs(self):
+		package = get_pricing_catalog()['packages'][0]
+		return package.package_slabs()
+
+## Testing the cache hits
+
+class PricingCatalogCacheTest(PricingCatalogTestCase):
+	"""
+	USE CASE
+	--------------------
+		1. The catalog is read from the cache after the first build, without queries
+		2. Price slabs are grouped by currency, disabled categories are left out
+	"""
+	def test_cache_hit(self):
+		"""Check that the second read runs no query"""
+		self.slabs()
+		with self.assertNumQueries(0):
+			catalog = get_pricing_catalog()
+			slabs = catalog['packages'][0].package_slabs()
+			self.assertEqual(catalog['service_categories'].count(), 1)
+			self.assertEqual([category.name for category in slabs[0]['service_categories']], ['Support'])
+
+	def test_package_slabs(self):
+		"""Check the price slabs and categories of a package"""
+		slabs = self.slabs()
+		self.assertEqual(len(slabs), 1)
+		self.assertEqual(slabs[0]['currency'], self.currency)
+		self.assertEqual(slabs[0]['price_slabs'], [self.price_slab])
+		self.assertTrue(slabs[0]['service_categories'][0].full_package)
+
+## Testing the invalidation
+
+class PricingCatalogInvalidationTest(PricingCatalogTestCase):
+	"""
+	USE CASE
+	--------------------
+		1. Saving a price slab rebuilds the catalog
+		2. Saving a package rebuilds the catalog
+	"""
+	def test_price_slab_save(self):
+		"""Check that a new amount is read after a price slab is saved"""
+		self.assertEqual(self.slabs()[0]['price_slabs'][0].amount, 10)
+		self.price_slab.amount = 25
+		self.price_slab.save()
+		self.assertEqual(self.slabs()[0]['price_slabs'][0].amount, 25)
+
+	def test_package_save(self):
+		"""Check that a new name is read after a package is saved"""
+		self.assertEqual(get_pricing_catalog()['packages'][0].name, 'Basic')
+		self.package.name = 'Premium'
+		self.package.save()
+		self.assertEqual(get_pricing_catalog()['packages'][0].name, 'Premium')
+
+
+class SubscriptionExpiryTestCase(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.free_slab = PriceSlab.objects.create(slab_period='M', amount=0)
+		cls.slab = PriceSlab.objects.create(slab_period='M', amount=100, price_per_user=10, expiry_period=30)
+		cls.user = User.objects.create(username='admin', email='admin@example.com')
+		cls.company = Company.objects.create(name='Acme', user=cls.user)
+		recruiter = Recruiter.objects.create(user=cls.user, membership=3)
+		recruiter.company.add(cls.company)
+
+	def setUp(self):
+		self.now = timezone.now()
+		patch = mock.patch('payments.expiry.send_TRM_email')
+		self.send_email = patch.start()
+		self.addCleanup(patch.stop)
+
+	def subscribe(self, expiry, available, auto_renew=True):
+		Wallet.objects.create(company=self.company, available=available)
+		return Subscription.objects.create(company=self.company, price_slab=self.slab, added_users=2,
+										   expiry=expiry, auto_renew=auto_renew)
+
+	def run_expiry(self, now=None):
+		with self.captureOnCommitCallbacks(execute=True):
+			return run_subscription_expiry(now or self.now)
+
+	def messages(self):
+		return [call[1]['context_email']['message'] for call in self.send_email.call_args_list]
+
+## Testing the renewal and downgrade
+
+class SubscriptionRenewalTest(SubscriptionExpiryTestCase):
+	"""
+	USE CASE
+	--------------------
+		1. Auto renewal debits the wallet once and extends the expiry by the expiry period
+		2. A second run is a no-op, the wallet is not debited twice
+		3. A low balance downgrades the subscription to the free plan
+		4. The emails are only sent once the batch is committed
+	"""
+	def test_auto_renewal(self):
+		"""Check the debit, the transaction and the new expiry of a renewal"""
+		expiry = self.now - timedelta(hours=1)
+		subscription = self.subscribe(expiry, 500)
+		self.assertEqual(self.run_expiry(), {'renewed': 1, 'flags_cleared': 0})
+		subscription.refresh_from_db()
+		self.assertEqual(subscription.expiry, expiry + timedelta(days=30))
+		self.assertEqual(subscription.price_slab, self.slab)
+		self.assertEqual(Wallet.objects.get(company=self.company).available, Decimal('380'))
+		transaction = Transactions.objects.get()
+		self.assertEqual((transaction.type, transaction.amount, transaction.balance), ('R', Decimal('120'), Decimal('380')))
+		self.assertEqual(list(subscription.events.values_list('event', 'expiry')), [('renewed', expiry)])
+		self.assertEqual(self.send_email.call_count, 1)
+
+	def test_second_run(self):
+		"""Check that a second run debits nothing"""
+		self.subscribe(self.now - timedelta(hours=1), 500)
+		self.run_expiry()
+		self.assertEqual(self.run_expiry(), {'flags_cleared': 0})
+		# A retried run still seeing the old expiry finds the event of the renewal
+		Subscription.objects.update(expiry=self.now - timedelta(hours=1))
+		self.assertEqual(self.run_expiry(), {'flags_cleared': 0})
+		self.assertEqual(Wallet.objects.get(company=self.company).available, Decimal('380'))
+		self.assertEqual(Transactions.objects.count(), 1)
+		self.assertEqual(SubscriptionEvent.objects.count(), 1)
+
+	def test_low_balance(self):
+		"""Check that a subscription without enough credits is downgraded"""
+		subscription = self.subscribe(self.now - timedelta(hours=1), 50)
+		self.assertEqual(self.run_expiry(), {'expired': 1, 'flags_cleared': 0})
+		subscription.refresh_from_db()
+		self.assertEqual((subscription.expiry, subscription.price_slab, subscription.added_users),
+						 (None, self.free_slab, 0))
+		self.assertEqual(Wallet.objects.get(company=self.company).available, Decimal('50'))
+		self.assertFalse(Transactions.objects.exists())
+		self.assertEqual(len(self.messages()), 1)
+		self.assertIn('insufficient credits', self.messages()[0])
+
+	def test_emails_after_commit(self):
+		"""Check that the emails are sent by the commit of the batch"""
+		self.subscribe(self.now - timedelta(hours=1), 500)
+		with self.captureOnCommitCallbacks(execute=True):
+			run_subscription_expiry(self.now)
+			self.assertFalse(self.send_email.called)
+		self.assertEqual(self.send_email.call_args[1]['to_user'], ['admin@example.com'])
+
+## Testing the reminders
+
+class SubscriptionReminderTest(SubscriptionExpiryTestCase):
+	"""
+	USE CASE
+	--------------------
+		1. The week and day reminders are sent once per expiry
+		2. A subscription renewed with enough credits gets no reminder email
+	"""
+	def test_reminders_once(self):
+		"""Check that each reminder is sent once, and again for the next expiry"""
+		expiry = self.now + timedelta(days=3)
+		subscription = self.subscribe(expiry, 0, auto_renew=False)
+		self.assertEqual(self.run_expiry(), {'week_reminder': 1, 'flags_cleared': 0})
+		self.assertEqual(self.run_expiry(), {'flags_cleared': 0})
+		day = expiry - timedelta(hours=12)
+		self.assertEqual(self.run_expiry(day), {'day_reminder': 1, 'flags_cleared': 0})
+		self.assertEqual(self.run_expiry(day), {'flags_cleared': 0})
+		# The flags are reset: only the events keep the reminders from being sent again
+		Subscription.objects.update(last_week=False, last_day=False)
+		self.assertEqual(self.run_expiry(day), {'flags_cleared': 0})
+		self.assertEqual(self.messages(), ['Your current plan expires in a week. Kindly set "Auto Renew" and have '
+										   'sufficient credits to continue using the current plan.',
+										   'Your current plan expires today. Kindly set "Auto Renew" and have '
+										   'sufficient credits to continue using the current plan.'])
+		Subscription.objects.filter(pk=subscription.pk).update(expiry=expiry + timedelta(days=30),
+															   last_week=False, last_day=False)
+		self.assertEqual(self.run_expiry(self.now + timedelta(days=30)), {'week_reminder': 1, 'flags_cleared': 0})
+		self.assertEqual(self.send_email.call_count, 3)
+
+	def test_auto_renew_with_credits(self):
+		"""Check that no email is sent when the plan will be renewed"""
+		subscription = self.subscribe(self.now + timedelta(days=3), 500)
+		self.assertEqual(self.run_expiry(), {'week_reminder': 1, 'flags_cleared': 0})
+		self.assertTrue(Subscription.objects.get(pk=subscription.pk).last_week)
+		self.assertFalse(self.send_email.called)
@@ -0,0 +1,124 @@
+'''
+batch parsing of resumes
+
+streams the files of a directory or of Curriculum rows
+through a pool of processes and appends one JSON record
+per file to an output file (JSON lines). The output is
+also the checkpoint: records already in it are skipped,
+so an interrupted batch resumes where it stopped.
+'''
+from __future__ import absolute_import
+import json
+import multiprocessing
+import os
+import time
+
+EXTENSIONS = ('.txt', '.docx', '.pdf', '.rtf', '.doc', '.html')
+
+def iter_directory(path, extensions=EXTENSIONS):
+    '''
+    yields (source, file path) for every resume
+    file of a directory and its sub-directories
+    '''
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in extensions:
+                file_path = os.path.join(root, name)
+                yield file_path, file_path
+
+def iter_curricula(curricula):
+    '''
+    yields (source, file path) for every
+    Curriculum of a queryset with a file
+    '''
+    for curriculum in curricula.exclude(file='').exclude(file__isnull=True).only('id', 'file').iterator(chunk_size=500):
+        yield 'curriculum:%s' % curriculum.id, curriculum.file.path
+
+def read_checkpoint(output, include_failed=True):
+    '''
+    returns the sources already written to the output file,
+    leaving out the failed ones if include_failed is False
+    '''
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output) as output_file:
+        for line in output_file:
+            try:
+                record = json.loads(line)
+                if include_failed or not record.get('error'):
+                    done.add(record['source'])
+            except (ValueError, KeyError):
+                # truncated last line of an interrupted batch
+                continue
+    return done
+
+def parse_file(task):
+    '''
+    parses one resume, runs in a pool process.
+    returns the JSON record of the file
+    '''
+    from resume_parser.resume_parser import read_file, parse_content
+    source, file_path = task
+    record = {'source': source, 'file': file_path}
+    start = time.perf_counter()
+    try:
+        file_content = read_file(file_path)
+        if not file_content or not file_content.strip():
+            raise ValueError('no text found')
+        result = parse_content(file_content, 'json')
+        record.update({
+            'name': result['name'][0] if result['name'] else '',
+            'email': result['emails'][0] if result['emails'] else '',
+            'phone': result['phones'][0] if result['phones'] else '',
+            'skills': sorted(result['skills']),
+            'education': result['education'],
+            'experience': result['experience'],
+            'error': None,
+        })
+    except Exception as e:
+        record['error'] = '%s: %s' % (e.__class__.__name__, e)
+    record['seconds'] = round(time.perf_counter() - start, 4)
+    return record
+
+def parse_batch(tasks, output, workers=None, chunksize=4, maxtasksperchild=200, retry_failed=False, callback=None):
+    '''
+    parses (source, file path) tasks in a pool of processes,
+    appending each record to the output file as soon as it is ready.
+    pool processes are recycled after maxtasksperchild files
+    to bound the memory held by the pdf parser.
+    failed files are parsed again if retry_failed is True
+    (the last record of a source wins).
+    callback, if given, is called with every record.
+    returns a summary dict
+    '''
+    done = read_checkpoint(output, include_failed=not retry_failed)
+    summary = {'parsed': 0, 'failed': 0, 'skipped': 0, 'seconds': 0.0, 'parse_seconds': 0.0}
+
+    def pending():
+        # counts the tasks of this batch found in the checkpoint,
+        # which may also hold sources that are not part of it
+        for task in tasks:
+            if task[0] in done:
+                summary['skipped'] += 1
+            else:
+                yield task
+
+    start = time.perf_counter()
+    pool = multiprocessing.Pool(processes=workers, maxtasksperchild=maxtasksperchild)
+    try:
+        with open(output, 'a') as output_file:
+            for record in pool.imap_unordered(parse_file, pending(), chunksize):
+                output_file.write(json.dumps(record) + '\n')
+                output_file.flush()
+                summary['failed' if record['error'] else 'parsed'] += 1
+                summary['parse_seconds'] += record['seconds']
+                if callback:
+                    callback(record)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    summary['seconds'] = time.perf_counter() - start
+    return summary
@@ -0,0 +1,180 @@
+"""
+Benchmark of the skill extraction of the resume parser.
+
+Compares the throughput and the output of get_skills (compiled phrase lookup)
+with the former implementation, which scanned the whole skill dictionary for
+every word of the skills section.
+
+The raw outputs differ by design: the former loop glued the last word of a
+line to the first word of the next one, never matched the dictionary entries
+with stray spaces ('spring ') and could not match multi-word skills. The
+outputs are therefore also compared normalized, the former loop reading the
+lines separately with a cleaned dictionary and the compiled lookup reporting
+single-word matches only; both must then agree on every resume.
+
+Usage:
+    python -m resume_parser.benchmark_skills [resume files or folders] [--repeat N]
+
+Without files, a reproducible corpus of generated resumes is used.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import os
+import random
+import time
+
+from resume_parser.batch import iter_directory
+from resume_parser.resume_parser import get_skill_data, get_skill_lookup, get_skill_words, get_skills, read_file
+
+
+def legacy_get_skills(file_content, json_data=None):
+    '''
+    former get_skills: O(words x dictionary).
+    kept for comparison only, with the str/bytes comparison
+    fixed so it behaves as it did on Python 2
+    '''
+    if json_data is None:
+        json_data = get_skill_data()
+    local_skill_flag = ''
+    local_skill_string = ''
+    skill_set = set()
+    for line in file_content.split('\n'):
+        if ('SKILL' in line) or ('Skill' in line) or ('EXPERTISE' in line) or ('Expertise' in line):
+            local_skill_flag = True
+        elif local_skill_flag == True:
+            if 'INTEREST' in line or 'PROJECT' in line or 'ACCOMPLISHMENT' in line or 'Interest' in line or 'Project' in line or 'Accomplishment' in line:
+                break
+        if local_skill_flag == True:
+            local_skill_string += line
+    local_skill_string = local_skill_string.replace(',',' ')
+    for word in local_skill_string.split():
+        found_in_key_flag = False
+        for key in json_data:
+            if word.lower().replace(' ','') == key:
+                skill_set.update([key])
+                found_in_key_flag = True
+        if not found_in_key_flag:
+            for key in json_data:
+                value_list = json_data[key]
+                for value in value_list:
+                    if (word.lower() == value):
+                        skill_set.update([value, key])
+    return skill_set
+
+
+def clean_skill_data():
+    '''
+    returns the skill dictionary without the stray spaces
+    of some entries ('spring '), which the former loop never matched
+    '''
+    return dict((key, [' '.join(value.split()) for value in value_list or ()])
+                for key, value_list in get_skill_data().items())
+
+
+def legacy_normalized(file_content, json_data):
+    '''
+    former get_skills, without gluing the lines of the skills
+    section together and with the cleaned skill dictionary
+    '''
+    return legacy_get_skills(file_content.replace('\n', ' \n'), json_data)
+
+
+def single_word_skills(file_content):
+    '''
+    get_skills, reporting the matches of single-word phrases only
+    '''
+    skill_lookup, skill_max_words = get_skill_lookup()
+    skill_set = set()
+    for word in get_skill_words(file_content):
+        skill_set.update(skill_lookup.get(word, ()))
+    return skill_set
+
+
+def generated_corpus(size=200, seed=42):
+    '''
+    returns reproducible resumes whose skills section mixes
+    dictionary skills, related libraries and unknown words
+    '''
+    json_data = get_skill_data()
+    rnd = random.Random(seed)
+    phrases = list(json_data)
+    for value_list in json_data.values():
+        phrases += list(value_list or ())
+    filler = ['team', 'player', 'excellent', 'communication', 'years', 'of', 'experience', 'with', 'and', 'good']
+    corpus = []
+    for index in range(size):
+        words = rnd.sample(phrases, 25) + rnd.sample(filler, 8)
+        rnd.shuffle(words)
+        lines = [', '.join(words[i:i + 6]) for i in range(0, len(words), 6)]
+        corpus.append('Candidate %s\nSUMMARY\nSoftware developer\nSKILLS\n%s\nPROJECTS\nInternal tools\n'
+                      % (index, '\n'.join(lines)))
+    return corpus
+
+
+def load_corpus(paths):
+    '''
+    reads the text of the resume files of the given files and folders
+    '''
+    corpus = []
+    for path in paths:
+        files = [file_path for source, file_path in iter_directory(path)] if os.path.isdir(path) else [path]
+        for file_path in files:
+            try:
+                text = read_file(file_path)
+            except Exception as e:
+                print('skipped %s: %s' % (file_path, e))
+                continue
+            if text.strip():
+                corpus.append(text)
+    return corpus
+
+
+def timed(function, corpus, repeat):
+    '''
+    returns the best time of repeat runs of function over the corpus, and its output
+    '''
+    best = None
+    for run in range(repeat):
+        start = time.perf_counter()
+        output = [function(text) for text in corpus]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark get_skills against the former implementation.')
+    parser.add_argument('paths', nargs='*', help='Resume files or folders (default: generated corpus).')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per implementation, the best one is kept.')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.paths) if args.paths else generated_corpus()
+    if not corpus:
+        parser.error('no resume text found')
+
+    legacy_time, legacy_output = timed(legacy_get_skills, corpus, args.repeat)
+    new_time, new_output = timed(get_skills, corpus, args.repeat)
+
+    clean_data = clean_skill_data()
+    legacy_lines = [legacy_normalized(text, clean_data) for text in corpus]
+    single_words = [single_word_skills(text) for text in corpus]
+
+    same = sum(1 for old, new in zip(legacy_output, new_output) if old == new)
+    agree = sum(1 for old, new in zip(legacy_lines, single_words) if old == new)
+    glued = sum(len(old ^ lines) for old, lines in zip(legacy_output, legacy_lines))
+    multi_word = sum(len(new - single) for new, single in zip(new_output, single_words))
+    print('resumes:            %s' % len(corpus))
+    print('legacy get_skills:  %.4fs (%.1f resumes/s)' % (legacy_time, len(corpus) / legacy_time))
+    print('compiled lookup:    %.4fs (%.1f resumes/s)' % (new_time, len(corpus) / new_time))
+    print('speed-up:           x%.1f' % (legacy_time / new_time))
+    print('identical output:   %s/%s resumes' % (same, len(corpus)))
+    print('identical output, normalized: %s/%s resumes' % (agree, len(corpus)))
+    print('skills changed by the legacy line gluing and unclean entries: %s' % glued)
+    print('skills only found through multi-word phrases: %s' % multi_word)
+    for index, (old, new) in enumerate(zip(legacy_lines, single_words)):
+        if old != new:
+            print('resume %s: only legacy %s, only compiled %s' % (index, sorted(old - new), sorted(new - old)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Startup benchmark of the resume parser and of the Django boot.
+
+Every target is imported in a fresh interpreter; the script reports the
+median import time, the peak memory of the process and which heavy parser
+dependencies (pdfminer, python-docx, BeautifulSoup, pyth, datefinder,
+mammoth, pypdf) ended up loaded.
+
+Usage:
+    python -m resume_parser.benchmark_startup [--repeat N] [--compare GIT_REF] [--settings MODULE]
+
+--compare runs the same measures on a temporary worktree of another
+revision (e.g. the commit before the lazy loading) to show the difference.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HEAVY_MODULES = ('pdfminer', 'docx', 'bs4', 'pyth', 'datefinder', 'mammoth', 'pypdf')
+
+TARGETS = (
+    ('resume_parser', 'import resume_parser.resume_parser'),
+    ('manage.py (django.setup)', 'import django; django.setup()'),
+    ('wsgi', 'import TRM.wsgi'),
+)
+
+PROBE = '''
+import json, resource, sys, time
+start = time.perf_counter()
+error = None
+try:
+    exec(%r)
+except Exception as e:
+    error = '%%s: %%s' %% (e.__class__.__name__, e)
+seconds = time.perf_counter() - start
+heavy = sorted(set(name.split('.')[0] for name in sys.modules) & set(%r))
+print(json.dumps({'seconds': seconds, 'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  'heavy': heavy, 'error': error}))
+'''
+
+
+def measure(root, code, repeat, settings):
+    '''
+    imports code repeat times in fresh interpreters run from root,
+    returns the median time, the median peak memory and the loaded heavy modules
+    '''
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings,
+               PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')])))
+    runs = []
+    for run in range(repeat):
+        output = subprocess.run([sys.executable, '-c', PROBE % (code, HEAVY_MODULES)], cwd=root, env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'seconds': statistics.median([result['seconds'] for result in runs]),
+        'maxrss_kb': statistics.median([result['maxrss_kb'] for result in runs]),
+        'heavy': runs[-1]['heavy'],
+        'error': runs[-1]['error'],
+    }
+
+
+def report(title, root, repeat, settings):
+    '''
+    measures every target on the tree at root and prints the results
+    '''
+    print(title)
+    results = {}
+    for name, code in TARGETS:
+        result = results[name] = measure(root, code, repeat, settings)
+        if result['error']:
+            print('  %-26s failed: %s' % (name, result['error']))
+            continue
+        print('  %-26s %7.1f ms  %8.1f MB  heavy modules: %s' % (
+            name, result['seconds'] * 1000, result['maxrss_kb'] / 1024.0, ', '.join(result['heavy']) or '-'))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the import cost of the resume parser and the Django boot.')
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters per target, the median is kept.')
+    parser.add_argument('--compare', help='Git revision to measure as well, e.g. HEAD~1.')
+    parser.add_argument('--settings', default=os.environ.get('DJANGO_SETTINGS_MODULE', 'TRM.settings'),
+                        help='Django settings module.')
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    current = report('current tree', root, args.repeat, args.settings)
+    if not args.compare:
+        return
+    worktree = tempfile.mkdtemp(prefix='trm-benchmark-')
+    try:
+        subprocess.check_call(['git', 'worktree', 'add', '--detach', worktree, args.compare], cwd=root,
+                              stdout=subprocess.DEVNULL)
+        baseline = report(args.compare, worktree, args.repeat, args.settings)
+    finally:
+        subprocess.call(['git', 'worktree', 'remove', '--force', worktree], cwd=root)
+        shutil.rmtree(worktree, ignore_errors=True)
+    print('difference')
+    for name, code in TARGETS:
+        if current[name]['error'] or baseline[name]['error']:
+            continue
+        print('  %-26s %+7.1f ms  %+8.1f MB' % (
+            name, (current[name]['seconds'] - baseline[name]['seconds']) * 1000,
+            (current[name]['maxrss_kb'] - baseline[name]['maxrss_kb']) / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
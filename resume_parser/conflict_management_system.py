@@ -1,6 +1,5 @@
 from __future__ import absolute_import
 from __future__ import print_function
-import datefinder
 import json
 import re
 import sys
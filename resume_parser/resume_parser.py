@@ -1,23 +1,16 @@
 from __future__ import absolute_import
 from __future__ import print_function
-import datefinder
-from docx import Document
 import json
-import pdb
-import pdfminer
 import os
 import re
 import subprocess
 import sys
-from bs4 import BeautifulSoup
+from functools import lru_cache
 from io import StringIO
-from pdfminer.converter import TextConverter
-from pdfminer.layout import LAParams
-from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-from pdfminer.pdfpage import PDFPage
-from pyth.plugins.plaintext.writer import PlaintextWriter
-from pyth.plugins.rtf15.reader import Rtf15Reader
-from xml.dom.minidom import parseString
+
+# The parser dependencies (pdfminer, python-docx, BeautifulSoup, pyth,
+# datefinder) and the corpora below are loaded on first use, so importing
+# this module costs nothing to processes that never parse a resume.
 
 from unidecode import unidecode
 def remove_non_ascii(text):
@@ -51,25 +44,99 @@ date_list = list()
 
 module_dir = os.path.dirname(__file__)  # get current directory
 
-file_path = os.path.join(module_dir, 'courses_corpus.txt')
-course_corpus_list = open(file_path).readlines()
+def read_corpus(name):
+    '''
+    returns the stripped lines of a corpus file of this module
+    '''
+    with open(os.path.join(module_dir, name)) as corpus:
+        return [line.strip() for line in corpus]
 
-file_path = os.path.join(module_dir, 'indian_female_list.txt')
-female_list = open(file_path).readlines()
+@lru_cache(maxsize=None)
+def get_course_corpus():
+    '''
+    returns the course names, read once per process
+    '''
+    return tuple(read_corpus('courses_corpus.txt'))
 
-file_path = os.path.join(module_dir, 'indian_male_list.txt')
-male_list = open(file_path).readlines()
+@lru_cache(maxsize=None)
+def get_name_words():
+    '''
+    returns the lower-cased words of the known
+    (up to three words) male and female names,
+    read once per process
+    '''
+    words = set()
+    for name in read_corpus('indian_male_list.txt') + read_corpus('indian_female_list.txt'):
+        name = name.split()
+        if 0 < len(name) <= 3:
+            words.update(name)
+    return frozenset(words)
+
+@lru_cache(maxsize=None)
+def get_skill_data():
+    '''
+    returns the skill dictionary, read once per process
+    '''
+    with open(os.path.join(module_dir, 'skill_data_json.json')) as data:
+        return json.load(data)
 
-file_path = os.path.join(module_dir, 'skill_data_json.json')
-with open(file_path) as data:
-    json_data = json.load(data)
+def compile_skills(skill_data):
+    '''
+    compiles the skill dictionary
+    (skill -> list of related libraries/frameworks)
+    into a hashed lookup of lower-cased phrase -> skills to report.
+    a skill reports itself, a related library reports
+    itself and every skill it belongs to.
+    returns the lookup and the number of words of the longest phrase
+    '''
+    lookup = dict()
+    for key, value_list in skill_data.items():
+        # an empty string when there are no related libraries
+        for value in value_list or ():
+            # some entries carry stray spaces ('spring ')
+            value = ' '.join(value.split())
+            phrase = value.lower()
+            if phrase:
+                lookup.setdefault(phrase, set()).update([value, key])
+    for key in skill_data:
+        phrase = ' '.join(key.lower().split())
+        if phrase:
+            lookup[phrase] = set([key])
+    max_words = max([len(phrase.split()) for phrase in lookup] or [1])
+    return dict((phrase, frozenset(skills)) for phrase, skills in lookup.items()), max_words
+
+@lru_cache(maxsize=None)
+def get_skill_lookup():
+    '''
+    returns the compiled skill lookup and
+    its longest phrase length, built once per process
+    '''
+    return compile_skills(get_skill_data())
+
+_resource_manager = None
+
+def get_resource_manager():
+    '''
+    returns the pdfminer resource manager of the process,
+    so that its font cache is shared by every pdf parsed
+    in a long-lived (batch) process
+    '''
+    global _resource_manager
+    if _resource_manager is None:
+        from pdfminer.pdfinterp import PDFResourceManager
+        _resource_manager = PDFResourceManager(caching=True)
+    return _resource_manager
 
 def pdf_to_text(filename):
     '''
     converts the pdf to text and returns the result
     to extract_file_content() method
     '''
-    rsrcmgr = PDFResourceManager()
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter
+    from pdfminer.pdfpage import PDFPage
+    rsrcmgr = get_resource_manager()
     retstr = StringIO()
     codec = 'utf-8'
     laparams = LAParams()
@@ -96,7 +163,11 @@ def pdf_to_text_for_direct_upload(fp):
     converts the pdf to text and returns the result
     to extract_file_content() method
     '''
-    rsrcmgr = PDFResourceManager()
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter
+    from pdfminer.pdfpage import PDFPage
+    rsrcmgr = get_resource_manager()
     retstr = StringIO()
     codec = 'utf-8'
     laparams = LAParams()
@@ -121,6 +192,7 @@ def get_dates(file_content):
     '''
     extracts dates from file-content
     '''
+    import datefinder
     local_date_list = list()
     output_dates = datefinder.find_dates(file_content)
     for date in output_dates:
@@ -203,8 +275,8 @@ def get_education(file_content):
                     college_school_list.append(school_college_name)
                     break
             
-            for course in course_corpus_list:
-                if course.strip() in item:
+            for course in get_course_corpus():
+                if course in item:
                     education_course_list.append(course)
                     break
         for item in college_school_list:
@@ -254,6 +326,7 @@ def get_name(file_content):
             local_name_block_string += line.strip() + '\n'
     # Remove all empty sections and return upper block
     local_list_name_block = [_f for _f in local_name_block_string.split('\n') if _f]
+    name_words = get_name_words()
     # while (iter_count <3) and (name_user == ''):
     for item in local_list_name_block:
         if ('NAME' in item) or ('Name' in item):
@@ -265,49 +338,11 @@ def get_name(file_content):
         if bool(re.search(r'\d',item)):
             local_list_name_block.remove(item)
             continue    
-        item_copy = item
-        for member in item_copy.split():
-            for male_name in male_list:
-                
-                male_name = male_name.split(' ')
-                
-                if len(male_name) == 1:
-                    if member.lower() == male_name[0]:
-                        # f.write(str(male_name))
-                        name_user_set.update([item])
-                        name_user = item
-                        break
-                if len(male_name) == 2:
-                    if member.lower() == male_name[0] or member.lower() == male_name[1]:
-                        # f.write(str(male_name))
-                        name_user_set.update([item])
-                        name_user = item
-                        break
-                if len(male_name) == 3:
-                    if member.lower() == male_name[0] or member.lower() == male_name[1] or member.lower() == male_name[2]:
-                        # f.write(str(male_name))
-                        name_user_set.update([item])
-                        name_user = item
-                        break
-            if name_user == '':
-                for female_name in female_list:
-
-                    female_name = female_name.split()
-                    if len(female_name) == 1:
-                        if member.lower() == female_name[0]:
-                            name_user_set.update([item])
-                            name_user = item
-                            break
-                    if len(female_name) == 2:
-                        if member.lower() == female_name[0] or member.lower() == female_name[1]:
-                            name_user_set.update([item])
-                            name_user = item
-                            break
-                    if len(male_name) == 3:
-                        if member.lower() == female_name[0] or member.lower() == female_name[1] or member.lower() == female_name[2]:
-                            name_user_set.update([item])
-                            name_user = item
-                            break
+        for member in item.split():
+            if member.lower() in name_words:
+                name_user_set.update([item])
+                name_user = item
+                break
         # iter_count += 1
     # f.write(str(name_user_set) + '\n')
 
@@ -325,13 +360,13 @@ def get_phone_number(file_content):
                 local_phone_list.append(i.strip())    
     return local_phone_list
 
-def get_skills(file_content):    
+def get_skill_words(file_content):
     '''
-    extracts skills from file-content
+    returns the lower-cased words
+    of the skills section of file-content
     '''
     local_skill_flag = ''
     local_skill_string = ''
-    skill_set = set()
     for line in file_content.split('\n'):
         if ('SKILL' in line) or ('Skill' in line) or ('EXPERTISE' in line) or ('Expertise' in line):
             local_skill_flag = True
@@ -339,20 +374,22 @@ def get_skills(file_content):
             if 'INTEREST' in line or 'PROJECT' in line or 'ACCOMPLISHMENT' in line or 'Interest' in line or 'Project' in line or 'Accomplishment' in line:
                 break
         if local_skill_flag == True:
-            local_skill_string += line
-    local_skill_string = local_skill_string.replace(',',' ')
-    for word in local_skill_string.split():
-        found_in_key_flag = False
-        for key in json_data:
-            if word.lower().replace(' ','') == key.encode('ascii','ignore'):
-                skill_set.update([key])
-                found_in_key_flag = True
-        if not found_in_key_flag:
-            for key in json_data:
-                value_list = json_data[key]
-                for value in value_list:
-                    if (word.lower() == value.encode('ascii','ignore')):
-                        skill_set.update([value, key])
+            local_skill_string += line + '\n'
+    return local_skill_string.replace(',',' ').lower().split()
+
+def get_skills(file_content):    
+    '''
+    extracts skills from file-content
+    '''
+    skill_set = set()
+    skill_lookup, skill_max_words = get_skill_lookup()
+    words = get_skill_words(file_content)
+    # every phrase of up to skill_max_words words is looked up once
+    for index in range(len(words)):
+        for length in range(1, min(skill_max_words, len(words) - index) + 1):
+            skills = skill_lookup.get(' '.join(words[index:index + length]))
+            if skills:
+                skill_set.update(skills)
     return skill_set
 
 def get_ratio(sentence):
@@ -496,58 +533,66 @@ def output_in_xml(date_list, email_list, phone_list, education_dict, work_experi
     result_xml_dict['skills'] = skill_list
     result_xml_dict['experience'] = work_experience_dict
     result_xml = dicttoxml.dicttoxml(result_xml_dict, root = False)
+    from xml.dom.minidom import parseString
     result_xml_indented = parseString(result_xml)
     # print result_xml_indented.toprettyxml()
 
-def extract_file_content(filename,  output_type):
+def read_file(filename):
     '''
-    extracts the file content and 
-    passes the file content to
-    get_email(), get_phone_number(), get_dates() methods
+    reads the text of a resume file
+    (.txt, .docx, .pdf, .rtf, .doc or .html),
+    raising an error if it cannot be read
     '''
     file_content = ''
     filename, file_extension = os.path.splitext(filename)
-    try:
-        if file_extension == '.txt':
-            file1 = open(filename,'r')
-            file_content = file2.read()
-
-        elif file_extension == '.docx':
-            document = Document(filename + '.docx')
-            for paragraph in document.paragraphs:
-                file_content += paragraph.text.encode('utf-8')
-        
-        elif file_extension == '.pdf':
-            file_content = pdf_to_text(filename + '.pdf')
-
-        elif file_extension == '.rtf':
-            doc = Rtf15Reader.read(open(filename + '.rtf'))
-            file_content = PlaintextWriter.write(doc).getvalue()
-
-        elif file_extension == '.doc':
-            content,errors = subprocess.Popen(
-                                [
-                                    "antiword", 
-                                    filename + '.doc',
-                                    "-f",
-                                    "-i", 
-                                    "1"
-                                ],
-                                stdout = subprocess.PIPE,
-                                stderr = subprocess.PIPE,
-                                stdin = subprocess.PIPE
-                            ).communicate()
-            file_content = content
-
-        elif file_extension == '.html':
-            soup = BeautifulSoup(html)
-            file_content = soup.get_text()
-    except:
-        file_content = ""
-    # print file_content
-    # f = open("filecontent.txt","w+")
-    # f.write(file_content)
-    # f.close()
+    file_extension = file_extension.lower()
+    if file_extension == '.txt':
+        with open(filename + file_extension, 'r', errors='ignore') as file1:
+            file_content = file1.read()
+
+    elif file_extension == '.docx':
+        from docx import Document
+        document = Document(filename + file_extension)
+        file_content = '\n'.join(paragraph.text for paragraph in document.paragraphs)
+
+    elif file_extension == '.pdf':
+        file_content = pdf_to_text(filename + file_extension)
+
+    elif file_extension == '.rtf':
+        from pyth.plugins.plaintext.writer import PlaintextWriter
+        from pyth.plugins.rtf15.reader import Rtf15Reader
+        with open(filename + file_extension) as rtf:
+            doc = Rtf15Reader.read(rtf)
+        file_content = PlaintextWriter.write(doc).getvalue()
+
+    elif file_extension == '.doc':
+        content,errors = subprocess.Popen(
+                            [
+                                "antiword", 
+                                filename + file_extension,
+                                "-f",
+                                "-i", 
+                                "1"
+                            ],
+                            stdout = subprocess.PIPE,
+                            stderr = subprocess.PIPE,
+                            stdin = subprocess.PIPE
+                        ).communicate()
+        file_content = content.decode('utf-8', 'ignore')
+
+    elif file_extension == '.html':
+        from bs4 import BeautifulSoup
+        with open(filename + file_extension, 'r', errors='ignore') as html:
+            soup = BeautifulSoup(html.read(), 'html.parser')
+        file_content = soup.get_text()
+    return file_content
+
+def parse_content(file_content, output_type = 'json'):
+    '''
+    passes the file content to
+    get_name(), get_email(), get_phone_number(),
+    get_skills(), get_work_experience() and get_education() methods
+    '''
     name_list = list()
     email_list = list()
     phone_list = list()
@@ -581,6 +626,18 @@ def extract_file_content(filename,  output_type):
     else:
         return output_in_xml(date_list, email_list, name_list, phone_list, skill_list, education_dict, work_experience_dict)
 
+def extract_file_content(filename,  output_type):
+    '''
+    extracts the file content and 
+    passes the file content to
+    get_email(), get_phone_number(), get_dates() methods
+    '''
+    try:
+        file_content = read_file(filename)
+    except:
+        file_content = ""
+    return parse_content(file_content, output_type)
+
 def read_file_content_directly(file_object, output_type = 'json'):
     
     file_content = ''
@@ -600,6 +657,7 @@ def read_file_content_directly(file_object, output_type = 'json'):
         file_content = pdf_to_text_for_direct_upload(file_object)
 
     elif file_extension == '.rtf':
+        from pyth.plugins.plaintext.writer import PlaintextWriter
         file_content = PlaintextWriter.write(file_object).getvalue()
 
     elif file_extension == '.doc':
@@ -618,6 +676,7 @@ def read_file_content_directly(file_object, output_type = 'json'):
         file_content = content
 
     elif file_extension == '.html':
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(html)
         file_content = soup.get_text()
 
@@ -1,13 +1,17 @@
 from __future__ import absolute_import
 from __future__ import print_function
-import mammoth
-from docx import Document
-from pypdf import PdfReader
 import json
 from datetime import datetime
 from django.db.models import Count
+from django.utils.html import strip_tags
+from unidecode import unidecode
 from payments.models import Discount, Discount_Usage
 from time import mktime
+import hashlib
+import re
+
+# Document libraries (mammoth, python-docx, pypdf, pdfminer) are imported by the
+# functions using them: this module is imported by the models of every app.
 
 def get_epoch():
     dt = datetime.now()
@@ -17,10 +21,38 @@ def get_epoch():
     return str(sec_since_epoch)
 
 
+SEARCH_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(text, min_length=2, max_length=50):
+    """
+    Split a text into normalized search terms: HTML tags are removed, accents
+    are transliterated and words are lowercased. Used by the search indexes of
+    vacancies and candidates.
+
+    Returns:
+        list: Terms in order of appearance.
+    """
+    if not text:
+        return []
+    text = unidecode(strip_tags('%s' % text)).lower()
+    return [word[:max_length] for word in SEARCH_WORD_RE.findall(text) if len(word) >= min_length]
+
+def get_file_hash(path, chunk_size=65536):
+    """
+    Returns the SHA-256 hex digest of a file, read in chunks.
+    Identifies a file version for the extracted text cache of curricula.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 def get_file_content(path):
     content = ""
     # try:
     if path.split('.')[-1] == 'docx':
+        import mammoth
         with open(path,'rb') as doc_file:
             result = mammoth.convert_to_html(doc_file)
             content = result.value
@@ -38,6 +70,7 @@ def get_file_text(path):
     content = ""
     # try:
     if path.split('.')[-1] == 'docx':
+        from docx import Document
         doc_file = Document(path)
         full_text = []
         for para in doc_file.paragraphs:
@@ -69,6 +102,7 @@ def get_file_text(path):
     return content
 
 def get_pdf_content(pdf_path, page_nums=[]):
+    from pypdf import PdfReader
     content = ''
     try:
         p = open(pdf_path, "rb")
@@ -85,13 +119,12 @@ def get_pdf_content(pdf_path, page_nums=[]):
         pass
     return content
 
-from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-from pdfminer.converter import TextConverter
-from pdfminer.layout import LAParams
-from pdfminer.pdfpage import PDFPage
-from io import StringIO
-
 def convert_pdf_to_txt(path):
+    from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfpage import PDFPage
+    from io import StringIO
     rsrcmgr = PDFResourceManager()
     retstr = StringIO()
     codec = 'utf-8'
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Filters of the applicants of a vacancy stage.
+
+The keyword box of the stage details page posts a comma separated filter
+spec to ``common.ajax.filter_candidates``. Each item is ``<type>-<value>``:
+
+- ``0-<text>``: text of the candidate profile, CV or application notes,
+- ``1-<min>-<max>``: average score of the application stage (the rating box
+  sends ``1-rating-<min>-<max>``),
+- ``2-<recruiter id>``: commented by the recruiter,
+- ``3-<recruiter id>``: added by the recruiter,
+- ``5-<tag id>``: tagged with a tag of the vacancy.
+
+An applicant is shown when it matches any item. The view used to build the
+matching ids in Python, with one query per applicant for the comment filter
+and per tag for the tag filter. ``CandidateFilter`` compiles the spec into a
+single condition made of subqueries, so the matching candidates are read in
+one query whatever the number of applicants and filters.
+
+The stage details page itself filters the applications it pages through with
+``filter_applications``, so the filter covers every page of the section and
+not only the rendered cards.
+"""
+
+from __future__ import absolute_import
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+from candidates.search import text_condition
+from vacancies.models import Comment, Postulate, VacancyTags
+
+
+class CandidateFilter(object):
+    """
+    A parsed filter spec.
+
+    Attributes:
+        texts (list): Search texts (type 0).
+        scores (list): ``(min, max)`` score ranges (type 1).
+        commenters (list): Ids of recruiters who commented (type 2).
+        recruiters (list): Ids of recruiters who added the application (type 3).
+        tags (list): Ids of vacancy tags (type 5).
+    """
+    def __init__(self, texts=None, scores=None, commenters=None, recruiters=None, tags=None):
+        self.texts = texts or []
+        self.scores = scores or []
+        self.commenters = commenters or []
+        self.recruiters = recruiters or []
+        self.tags = tags or []
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        Parse a filter spec, e.g. ``'5-12,3-4,0-new delhi,1-2-5'``.
+
+        Args:
+            spec (str): Comma separated filter items.
+
+        Returns:
+            CandidateFilter: The filter, or None if the spec is empty.
+
+        Raises:
+            ValueError: If an item is malformed.
+        """
+        items = [item.strip() for item in (spec or '').split(',') if item.strip()]
+        if not items:
+            return None
+        candidate_filter = cls()
+        for item in items:
+            type, _, value = item.partition('-')
+            if not value:
+                raise ValueError('Invalid filter %r' % item)
+            if type == '0':
+                candidate_filter.texts.append(value)
+            elif type == '1':
+                if value.startswith('rating-'):
+                    value = value[len('rating-'):]
+                low, _, high = value.partition('-')
+                candidate_filter.scores.append((int(low), int(high)))
+            elif type == '2':
+                candidate_filter.commenters.append(int(value))
+            elif type == '3':
+                candidate_filter.recruiters.append(int(value))
+            elif type == '5':
+                candidate_filter.tags.append(int(value))
+        return candidate_filter
+
+    def text_condition(self, prefix='postulate__'):
+        """
+        Condition on the candidate search index and the application notes.
+
+        Args:
+            prefix (str): Lookup path from the filtered model to the application.
+
+        Returns:
+            Q or None: The condition, or None without texts.
+        """
+        texts = [text.strip() for text in self.texts if text and text.strip()]
+        if not texts:
+            return None
+        condition = text_condition(texts, prefix=prefix + 'candidate__')
+        for text in texts:
+            # Notes of the application itself are not part of the candidate document
+            description = Q(**{prefix + 'description__icontains': text})
+            condition = condition | description if condition is not None else description
+        return condition
+
+    def condition(self, vacancy, prefix='postulate__'):
+        """
+        Compile the filter into a condition on application stages, or on
+        applications with an empty ``prefix``.
+
+        The score ranges read the ``score_avg`` annotation of ``with_scores()``,
+        see ``apply``: the average of the stage for application stages, the
+        average of all the stages for applications.
+
+        Args:
+            vacancy (Vacancy): Vacancy of the stage, which owns the tags.
+            prefix (str): Lookup path from the filtered model to the application.
+
+        Returns:
+            Q or None: Condition matching any item, or None if no item can match.
+        """
+        application = prefix + 'in' if prefix else 'pk__in'
+        conditions = []
+        if self.tags:
+            tags = VacancyTags.objects.filter(id__in=self.tags, vacancy=vacancy)
+            conditions.append(Q(**{application: Postulate.tags.through.objects.filter(vacancytags__in=tags)
+                                   .values('postulate')}))
+        if self.recruiters:
+            conditions.append(Q(**{prefix + 'recruiter__in': self.recruiters}))
+        if self.commenters:
+            conditions.append(Q(**{application: Comment.objects.filter(recruiter__in=self.commenters)
+                                   .values('postulate')}))
+        text = self.text_condition(prefix)
+        if text is not None:
+            conditions.append(text)
+        for low, high in self.scores:
+            if low >= 0 and high >= 0:
+                conditions.append(Q(score_avg__gte=low, score_avg__lte=high))
+        if not conditions:
+            return None
+        return reduce(or_, conditions)
+
+    def apply(self, stages, vacancy, prefix='postulate__'):
+        """
+        Filter application stages, or applications with an empty ``prefix``.
+
+        Args:
+            stages (QuerySet): Postulate_Stage (or Postulate) rows to filter.
+            vacancy (Vacancy): Vacancy of the stage.
+            prefix (str): Lookup path from the filtered model to the application.
+
+        Returns:
+            QuerySet: The matching rows.
+        """
+        condition = self.condition(vacancy, prefix)
+        if condition is None:
+            return stages.none()
+        if self.scores:
+            stages = stages.with_scores()
+        return stages.filter(condition)
+
+
+def filter_stage_candidates(stages, spec, vacancy):
+    """
+    Ids of the applications of the stages matching a filter spec, read in a
+    single query.
+
+    Args:
+        stages (QuerySet): Postulate_Stage rows shown in the stage section.
+        spec (str): Filter spec posted by the keyword box.
+        vacancy (Vacancy): Vacancy of the stage.
+
+    Returns:
+        list: Ids of the matching Postulate rows (every row without filters).
+
+    Raises:
+        ValueError: If the spec is malformed.
+    """
+    candidate_filter = CandidateFilter.parse(spec)
+    if candidate_filter is not None:
+        stages = candidate_filter.apply(stages, vacancy)
+    return list(stages.filter(postulate__isnull=False).order_by('postulate')
+                .values_list('postulate', flat=True).distinct())
+
+
+def filter_applications(candidates, spec, vacancy):
+    """
+    Applications matching a filter spec, e.g. the applications of a section of
+    the stage details page (``vacancies.pipeline.section_candidates``) before
+    they are paged.
+
+    Args:
+        candidates (QuerySet): Postulate rows to filter.
+        spec (str): Filter spec of the keyword box.
+        vacancy (Vacancy): Vacancy of the stage.
+
+    Returns:
+        QuerySet: The matching applications (every row without filters).
+
+    Raises:
+        ValueError: If the spec is malformed.
+    """
+    candidate_filter = CandidateFilter.parse(spec)
+    if candidate_filter is None:
+        return candidates
+    return candidate_filter.apply(candidates, vacancy, prefix='')
@@ -1,49 +1,50 @@
 from __future__ import absolute_import
 from __future__ import print_function
-from datetime import datetime, timedelta, date
+from datetime import datetime
 
-from vacancies.models import Vacancy
+from django.conf import settings
 
+from common.locks import cron_lock
+from vacancies.scheduler import publish_due_vacancies, unpublish_due_vacancies
 
-# from .models import *
+# Seconds after which the lock of a run killed before releasing it expires
+LOCK_TIMEOUT = getattr(settings, 'VACANCY_SCHEDULE_LOCK_TIMEOUT', 600)
 
 
 def PublishCronJob():
     """
-    Publishes all Vacancy entries scheduled for publication today.
+    Publishes all Vacancy entries whose scheduled publication date has come,
+    including the ones a missed run left behind (see vacancies.scheduler).
 
-    This function filters Vacancy objects with a status codename of 'open' and a 
-    publication date equal to the current date. It then calls the `publish()` method 
-    on each of these vacancies and logs the operation with timestamps.
-
-    Exceptions during execution are caught and printed to the console.
+    The job holds a cross-process lock, so overlapping invocations skip their
+    run. Exceptions during execution are caught and printed to the console.
     """
     print((str(datetime.now()) + ' --> Publish Cron start\n\n'))
     try:
-        jobs = Vacancy.objects.filter(status__codename = 'open', pub_date = date.today())
-        for job in jobs:
-            job.publish()
-            print((str(job) + ' --> Published'))
+        with cron_lock('vacancies.cron.PublishCronJob', LOCK_TIMEOUT) as acquired:
+            if acquired:
+                print('%s vacancies published' % len(publish_due_vacancies()))
+            else:
+                print('Previous run still in progress, skipped')
     except Exception as e:
         print(e)
     print((str(datetime.now()) + ' --> Publish Cron completed\n\n'))
 
 def UnPublishCronJob():
     """
-    Unpublishes all Vacancy entries scheduled to be unpublished as of yesterday.
-
-    This function filters Vacancy objects with a status codename of 'open' and an 
-    unpublication date equal to one day before the current date. It then calls the 
-    `unublish()` method on each of these vacancies and logs the operation with timestamps.
+    Unpublishes all Vacancy entries whose unpublication date has passed,
+    including the ones a missed run left behind (see vacancies.scheduler).
 
-    Exceptions during execution are caught and printed to the console.
+    The job holds a cross-process lock, so overlapping invocations skip their
+    run. Exceptions during execution are caught and printed to the console.
     """
     print((str(datetime.now()) + ' --> UnPublish Cron start\n\n'))
     try:
-        jobs = Vacancy.objects.filter(status__codename='open', unpub_date= date.today() - timedelta(days=1))
-        for job in jobs:
-            job.unublish()
-            print((str(job) + ' --> UnPublished'))
+        with cron_lock('vacancies.cron.UnPublishCronJob', LOCK_TIMEOUT) as acquired:
+            if acquired:
+                print('%s vacancies unpublished' % len(unpublish_due_vacancies()))
+            else:
+                print('Previous run still in progress, skipped')
     except Exception as e:
         print(e)
-    print((str(datetime.now()) + ' --> UnPublish Cron completed\n\n'))
\ No newline at end of file
+    print((str(datetime.now()) + ' --> UnPublish Cron completed\n\n'))
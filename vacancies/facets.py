@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Faceted search helpers for the public job board.
+
+The sidebar of the vacancy search shows how many published vacancies fall in
+every publication date range, industry, state and type of employment for the
+filters currently stored in session. Instead of issuing one ``count()`` per
+facet row, all of them are computed from a single grouped query with
+conditional counts and the facet labels are resolved in bulk.
+"""
+
+from __future__ import absolute_import
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from django.db.models import Count, Q
+from django.utils.dateparse import parse_date, parse_datetime
+
+from common.models import Employment_Type
+from companies.models import Company_Industry as Industry
+from TRM.settings import days_default_search
+from vacancies.models import PubDate_Search
+from vacancies.search import filter_vacancies_by_text, search_vacancies
+
+
+def _as_id(value):
+    """
+    Normalize a session filter (model instance, serialized id or None) to a primary key.
+
+    Args:
+        value: Model instance, primary key or empty value.
+
+    Returns:
+        int or None: The primary key of the filter.
+    """
+    if not value:
+        return None
+    value = getattr(value, 'pk', value)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_state(value):
+    """
+    Normalize the state filter. ``Vacancy.state`` is a plain text field, but the
+    search form stores a State instance in session.
+
+    Args:
+        value: State instance, state name or empty value.
+
+    Returns:
+        str or None: The state name.
+    """
+    if not value:
+        return None
+    return '%s' % getattr(value, 'name', value)
+
+
+def _as_date(value):
+    """
+    Normalize a publication date threshold (date, datetime or ISO string) to a date.
+
+    Args:
+        value: Date-like value stored in session.
+
+    Returns:
+        date or None: The threshold date.
+    """
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    parsed = parse_datetime(value)
+    if parsed:
+        return parsed.date()
+    return parse_date(value)
+
+
+def filter_vacancies(vacancies, industry=None, area=None, state=None, employment_type=None, search_text=None):
+    """
+    Apply the session search filters to a vacancy queryset.
+
+    Args:
+        vacancies (QuerySet): Base queryset, usually ``Vacancy.publishedjobs``.
+        industry: Selected industry (instance or id).
+        area: Selected area (instance or id).
+        state: Selected state (instance or name).
+        employment_type: Selected type of employment (instance or id).
+        search_text (str): Words typed in the search form. Results are then
+            ranked by relevance (see ``vacancies.search``).
+
+    Returns:
+        QuerySet: The filtered queryset.
+    """
+    if _as_id(industry):
+        vacancies = vacancies.filter(industry_id=_as_id(industry))
+    if _as_id(area):
+        vacancies = vacancies.filter(area_id=_as_id(area))
+    if _as_state(state):
+        vacancies = vacancies.filter(state=_as_state(state))
+    if _as_id(employment_type):
+        vacancies = vacancies.filter(employmentType_id=_as_id(employment_type))
+    if search_text:
+        vacancies = search_vacancies(vacancies, search_text)
+    return vacancies
+
+
+def get_vacancy_facets(vacancies, industry=None, state=None, employment_type=None, search_text=None, pub_date=None):
+    """
+    Compute the sidebar facet counts for the current search filters.
+
+    Every facet ignores its own selection so that the user can switch to a
+    sibling value (e.g. the industry counts are filtered by state and type of
+    employment, but not by industry). Publication date buckets are not
+    restricted by the selected publication date.
+
+    All the counts come from one query grouped by (industry, state, type of
+    employment) with a conditional count per publication date bucket; the
+    groups are then pivoted in Python. Industry and employment type labels
+    are fetched with one ``in_bulk`` query each.
+
+    Args:
+        vacancies (QuerySet): Base queryset, usually ``Vacancy.publishedjobs``.
+        industry: Selected industry (instance or id).
+        state: Selected state (instance or name).
+        employment_type: Selected type of employment (instance or id).
+        search_text (str): Words typed in the search form.
+        pub_date: Lower publication date for the current results. Defaults to
+            ``days_default_search`` days ago.
+
+    Returns:
+        dict: ``pub_dates``, ``industries``, ``states`` and ``employment_types``,
+        each a list of ``[label, count]`` pairs with a non zero count.
+    """
+    industry_id = _as_id(industry)
+    state_name = _as_state(state)
+    employment_type_id = _as_id(employment_type)
+    today = date.today()
+    pub_date = _as_date(pub_date) or today - timedelta(days=days_default_search)
+
+    pub_date_searches = list(PubDate_Search.objects.all())
+    thresholds = dict((pub_date_search.pk, today - timedelta(days=pub_date_search.days or 0))
+                      for pub_date_search in pub_date_searches)
+
+    if search_text:
+        vacancies = filter_vacancies_by_text(vacancies, search_text)
+    lowest_date = min(list(thresholds.values()) + [pub_date])
+
+    annotations = {'current': Count('pk', filter=Q(pub_date__gte=pub_date))}
+    for pk, threshold in thresholds.items():
+        annotations['pub_date_%s' % pk] = Count('pk', filter=Q(pub_date__gte=threshold))
+    rows = vacancies.filter(pub_date__gte=lowest_date).order_by() \
+        .values('industry', 'state', 'employmentType').annotate(**annotations)
+
+    pub_date_counts = Counter()
+    industry_counts = Counter()
+    state_counts = Counter()
+    employment_type_counts = Counter()
+    for row in rows:
+        in_industry = not industry_id or row['industry'] == industry_id
+        in_state = not state_name or row['state'] == state_name
+        in_employment_type = not employment_type_id or row['employmentType'] == employment_type_id
+        if in_state and in_employment_type:
+            for pk in thresholds:
+                pub_date_counts[pk] += row['pub_date_%s' % pk]
+            if row['industry']:
+                industry_counts[row['industry']] += row['current']
+        if in_industry and in_employment_type and row['state']:
+            state_counts[row['state']] += row['current']
+        if in_industry and in_state and row['employmentType']:
+            employment_type_counts[row['employmentType']] += row['current']
+
+    industry_labels = Industry.objects.in_bulk([pk for pk, count in industry_counts.items() if count])
+    employment_type_labels = Employment_Type.objects.in_bulk(
+        [pk for pk, count in employment_type_counts.items() if count])
+
+    return {
+        'pub_dates': [[pub_date_search, pub_date_counts[pub_date_search.pk]]
+                      for pub_date_search in pub_date_searches if pub_date_counts[pub_date_search.pk]],
+        'industries': [[industry_labels[pk], industry_counts[pk]]
+                       for pk in sorted(industry_labels)],
+        'states': [[name, count] for name, count in sorted(state_counts.items()) if count],
+        'employment_types': [[employment_type_labels[pk], employment_type_counts[pk]]
+                             for pk in sorted(employment_type_labels)],
+    }
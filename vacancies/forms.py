@@ -18,6 +18,7 @@ from django.utils.translation import gettext as _
 from TRM.settings import days_default_search
 from upload_logos.widgets import AjaxClearableFileInput
 from vacancies.models import *
+from vacancies.search import normalize_query
 
 
 def diff_month(d1, d2):
@@ -987,6 +988,7 @@ class BasicSearchVacancyForm(forms.Form):
         - __init__: Handles dynamic behavior like selected industry.
         - clean_state: Validates that selected state exists in the initial country.
         - clean_industry: Validates selected industry.
+        - clean_search: Normalizes the keywords for the full-text index.
         - clean_vacancyPubDateSearch: Validates publication date.
         - clean_gender: Validates gender.
         - clean_degree: Validates degree.
@@ -1020,7 +1022,7 @@ class BasicSearchVacancyForm(forms.Form):
     search = forms.CharField(
         widget=forms.TextInput(attrs={'placeholder': _('Keywords: System Management, Assistant'),
                                       'class': 'form-control'}),
-        max_length=10,
+        max_length=100,
         min_length=3,
         required=False,
         label=_("Search words"),
@@ -1141,6 +1143,16 @@ class BasicSearchVacancyForm(forms.Form):
     #         raise forms.ValidationError(error)
     #     return area
 
+    def clean_search(self):
+        """
+        Normalize the keywords to the terms understood by the full-text index
+        (see vacancies.search).
+
+        Returns:
+            str or None: Space separated search terms, or None if there is nothing to search.
+        """
+        return normalize_query(self.cleaned_data.get('search'))
+
     def clean_vacancyPubDateSearch(self):
         """
         Validate the 'vacancyPubDateSearch' field to ensure the selected publication date is valid.
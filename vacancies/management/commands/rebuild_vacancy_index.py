@@ -0,0 +1,47 @@
+"""
+rebuild_vacancy_index.py - Rebuild the full-text index used by the vacancy
+keyword search (see vacancies.search).
+"""
+
+from __future__ import absolute_import
+from django.core.management.base import BaseCommand
+
+from vacancies.search import BACKENDS, get_search_backend
+
+
+class Command(BaseCommand):
+    """
+    Django management command to (re)index every vacancy.
+
+    Run it once after migrating, or after changing VACANCY_SEARCH_BACKEND.
+    Day to day the index is kept current by the Vacancy save/delete signals.
+    """
+
+    help = 'Rebuild the full-text index used by the vacancy keyword search.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend',
+            choices=sorted(BACKENDS),
+            default=None,
+            help='Backend to rebuild (defaults to the configured one).')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of vacancies read from the database at a time.')
+
+    def handle(self, *args, **options):
+        """
+        Command entry point.
+
+        Args:
+            *args: Positional arguments (not used).
+            **options: backend and chunk_size.
+        """
+        if options['backend']:
+            backend = BACKENDS[options['backend']]()
+        else:
+            backend = get_search_backend()
+        total = backend.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write('Indexed %s vacancies with the %s backend.' % (total, backend.__class__.__name__))
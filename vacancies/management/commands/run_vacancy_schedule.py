@@ -0,0 +1,56 @@
+"""
+run_vacancy_schedule.py - Publish and unpublish the vacancies whose scheduled
+dates are due (see vacancies.scheduler), or report them with --dry-run.
+"""
+
+from __future__ import absolute_import
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from vacancies.models import Vacancy
+from vacancies.scheduler import run_vacancy_schedule
+
+TRANSITIONS = (('published', 'publication'), ('unpublished', 'unpublication'))
+
+
+class Command(BaseCommand):
+    """
+    Django management command applying the overdue publications and
+    unpublications at once, e.g. to catch up after the cron jobs were down.
+    """
+
+    help = 'Publish and unpublish the vacancies whose scheduled dates are due.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List the due vacancies without changing them.')
+        parser.add_argument(
+            '--date',
+            default=None,
+            help='Reference date as YYYY-MM-DD (defaults to today).')
+
+    def handle(self, *args, **options):
+        """
+        Command entry point.
+
+        Args:
+            *args: Positional arguments (not used).
+            **options: dry_run and date.
+        """
+        today = None
+        if options['date']:
+            try:
+                today = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Invalid date %r, expected YYYY-MM-DD.' % options['date'])
+        report = run_vacancy_schedule(today, dry_run=options['dry_run'])
+        verb = 'Due for' if options['dry_run'] else 'Applied'
+        for transition, label in TRANSITIONS:
+            ids = report[transition]
+            self.stdout.write('%s %s: %s vacancies' % (verb, label, len(ids)))
+            if options['verbosity'] > 1 or options['dry_run']:
+                for vacancy in Vacancy.objects.filter(pk__in=ids).order_by('id').values('id', 'employment', 'pub_date', 'unpub_date'):
+                    self.stdout.write('  #%(id)s %(employment)s (%(pub_date)s - %(unpub_date)s)' % vacancy)
@@ -0,0 +1,55 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+POSTGRES_DOCUMENT = ("setweight(to_tsvector('simple', coalesce(employment, '')), 'A') || "
+                     "setweight(to_tsvector('simple', coalesce(skills, '') || ' ' || "
+                     "coalesce(function, '')), 'B') || "
+                     "setweight(to_tsvector('simple', coalesce(description, '')), 'C')")
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Create the database native full-text structures used by vacancies.search.
+    Other databases use the VacancySearchTerm table.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE INDEX vacancies_vacancy_search_idx ON vacancies_vacancy USING GIN ((%s))'
+                              % POSTGRES_DOCUMENT)
+    elif vendor == 'sqlite':
+        schema_editor.execute('CREATE VIRTUAL TABLE vacancies_vacancy_fts USING fts5('
+                              'employment, skills, function, description, tokenize="unicode61 remove_diacritics 2")')
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS vacancies_vacancy_search_idx')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS vacancies_vacancy_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vacancies', '0056_alter_candidate_fav_id_alter_comment_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VacancySearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(db_index=True, max_length=50, verbose_name='Term')),
+                ('weight', models.PositiveIntegerField(default=1, verbose_name='Weight')),
+                ('vacancy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='vacancies.vacancy', verbose_name='Job')),
+            ],
+            options={
+                'verbose_name': 'Job Search Term',
+                'verbose_name_plural': 'Job Search Terms',
+                'unique_together': {('term', 'vacancy')},
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
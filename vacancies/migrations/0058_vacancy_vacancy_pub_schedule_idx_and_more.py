@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0011_cronlock'),
+        ('companies', '0025_alter_ban_id_alter_company_id_and_more'),
+        ('customField', '0005_alter_field_id_alter_fieldclassification_id_and_more'),
+        ('vacancies', '0057_vacancysearchterm'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vacancy',
+            index=models.Index(fields=['pub_after', 'pub_date'], name='vacancy_pub_schedule_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vacancy',
+            index=models.Index(fields=['expired', 'unpub_date'], name='vacancy_unpub_schedule_idx'),
+        ),
+    ]
@@ -10,10 +10,11 @@ from customField.models import Template, FieldValue
 from datetime import date, timedelta
 from django.urls import reverse
 from django.db import models
-from django.db.models import Q, Sum
+from django.db.models import Avg, FloatField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.utils.translation import gettext as _
 from TRM import settings
-from utils import get_file_content, get_file_text, tagcloud
+from utils import tagcloud
 
 Name = _('Name')
 
@@ -730,6 +731,11 @@ class Vacancy(models.Model):
         verbose_name = _('Job')
         verbose_name_plural = _('Jobs')
         ordering = ('-pub_date', '-id')
+        indexes = [
+            # Due publications and unpublications (see vacancies.scheduler)
+            models.Index(fields=['pub_after', 'pub_date'], name='vacancy_pub_schedule_idx'),
+            models.Index(fields=['expired', 'unpub_date'], name='vacancy_unpub_schedule_idx'),
+        ]
 
 ACTION_CHOICES = (
     ('1', 'Published'),
@@ -763,6 +769,29 @@ class Publish_History(models.Model):
         return str(self.vacancy)
     
 
+class VacancySearchTerm(models.Model):
+    """ Inverted index used by the vacancy keyword search """
+    """
+    One row per (vacancy, term). Maintained by ``vacancies.search.InvertedIndexBackend``.
+
+    Attributes:
+        vacancy (ForeignKey): The indexed Vacancy.
+        term (CharField): Normalized word found in the job role, skills, function or description.
+        weight (PositiveIntegerField): Term frequency weighted by the field it was found in.
+    """
+    vacancy = models.ForeignKey(Vacancy, verbose_name=_('Job'), related_name='search_terms', on_delete=models.CASCADE)
+    term = models.CharField(verbose_name=_('Term'), max_length=50, db_index=True)
+    weight = models.PositiveIntegerField(verbose_name=_('Weight'), default=1)
+
+    class Meta:
+        verbose_name = "Job Search Term"
+        verbose_name_plural = "Job Search Terms"
+        unique_together = ('term', 'vacancy')
+
+    def __str__(self):
+        return self.term
+
+
 class Question(models.Model):
     """ Questions/Comments on the published jobs """
     """
@@ -1128,6 +1157,120 @@ class Medium(models.Model):
         """Unicode representation of Medium."""
         return self.name
 
+def stage_score_avg(stage_ref='pk'):
+    """
+    Subquery computing the average score of an application stage.
+
+    Args:
+        stage_ref (str): Field of the outer query holding the Postulate_Stage id.
+
+    Returns:
+        Subquery: The average, NULL for a stage without scores.
+    """
+    scores = Postulate_Score.objects.filter(postulate_stage=OuterRef(stage_ref)).order_by() \
+        .values('postulate_stage').annotate(avg=Avg('score')).values('avg')
+    return Subquery(scores, output_field=FloatField())
+
+
+class PostulateQuerySet(models.QuerySet):
+    """
+    QuerySet of applications.
+
+    Methods:
+        with_scores():
+            Annotates ``score_avg``, read by ``Postulate.avg_score``.
+    """
+    def with_scores(self):
+        """
+        Annotate the average score of every application: the mean of the
+        averages of its stages, leaving out the stages without scores.
+
+        Returns:
+            QuerySet: Applications with a ``score_avg`` float (0.0 without scores).
+        """
+        stages = Postulate_Stage.objects.filter(postulate=OuterRef('pk')).order_by() \
+            .annotate(stage_avg=stage_score_avg()).values('postulate').annotate(avg=Avg('stage_avg')).values('avg')
+        return self.annotate(score_avg=Coalesce(Subquery(stages, output_field=FloatField()), Value(0.0),
+                                                output_field=FloatField()))
+
+
+class Postulate_StageQuerySet(models.QuerySet):
+    """
+    QuerySet of application stages.
+
+    Methods:
+        with_scores():
+            Annotates ``score_avg``, read by ``Postulate_Stage.avg_score``.
+    """
+    def with_scores(self):
+        """
+        Annotate the average score of every application stage.
+
+        Returns:
+            QuerySet: Stages with a ``score_avg`` float (0.0 without scores).
+        """
+        return self.annotate(score_avg=Coalesce(stage_score_avg(), Value(0.0), output_field=FloatField()))
+
+
+class PrefetchedList(list):
+    """
+    List of rows loaded beforehand, used where templates expect a QuerySet:
+    ``count()`` without argument returns the length without a query.
+    """
+    def count(self, *args):
+        if args:
+            return list.count(self, *args)
+        return len(self)
+
+
+def load_criteria_scores(stages):
+    """
+    Compute the average score per criterion of many application stages with
+    a single grouped query. The result is stored in ``criteria_scores`` and
+    used by ``Postulate_Stage.criteria_avg_scores``.
+
+    Args:
+        stages (iterable): Postulate_Stage instances.
+
+    Returns:
+        list: The stages.
+    """
+    stages = list(stages)
+    for stage in stages:
+        stage.criteria_scores = []
+    by_id = dict((stage.pk, stage) for stage in stages)
+    rows = Postulate_Score.objects.filter(postulate_stage__in=list(by_id)).order_by('postulate_stage', 'name') \
+        .values('postulate_stage', 'name').annotate(avg=Avg('score'))
+    for row in rows:
+        by_id[row['postulate_stage']].criteria_scores.append((row['name'], float(row['avg'])))
+    return stages
+
+
+def score_stars(avg, css_class):
+    """
+    HTML star rating (out of 5, with half stars) of an average score.
+
+    Args:
+        avg (float): Average score.
+        css_class (str): Color class of the icons, e.g. 'text-light'.
+
+    Returns:
+        str: HTML string with star icons.
+    """
+    full = int(avg)
+    half = int(avg * 2) % 2 == 1
+    html = ''
+    for position in range(5):
+        if position < full:
+            icon = 'fa-star'
+        elif half and position == full:
+            icon = 'fa-star-half-o'
+        else:
+            icon = 'fa-star-o'
+        html = html + '<i class="fa %s %s pl5"></i>' % (icon, css_class)
+    return html
+
+
 class Postulate(models.Model):
     """ Indicates whether a candidate is running a Job and if the Company has already seen or not the CV of the candidate nominated """
     """
@@ -1227,6 +1370,8 @@ class Postulate(models.Model):
     external_referer = models.ForeignKey(ExternalReferal, null = True, blank=True,default=None, on_delete=models.SET_DEFAULT)
     medium = models.ForeignKey(Medium, null=True, blank=True, default=None, on_delete=models.SET_DEFAULT)
 
+    objects = PostulateQuerySet.as_manager()
+
     def __unicode__(self):
         return 'Id: %s - Job: %s - Candidate: %s - Seen: %s - Discard: %s' % (str(self.pk), str(self.vacancy.pk), str(self.candidate.pk), self.seen, self.discard)
 
@@ -1268,23 +1413,16 @@ class Postulate(models.Model):
         """
         Calculates the average score across all stages linked to this application.
 
+        Uses the ``score_avg`` annotation of ``Postulate.objects.with_scores()``
+        when present, otherwise computes it with one query and keeps it.
+
         Returns:
             float: The average score or 0 if no scores exist.
         """
-        stages = self.postulate_stage_set.all()
-        g_total=0.0
-        count=0
-        for stage in stages:
-            scores = stage.scores.all()
-            total = 0.0
-            if scores:
-                total = scores.aggregate(Sum('score'))['score__sum'] * 1.0
-                total = total / scores.count()
-                g_total = g_total + total
-                count = count+1
-        if count:
-            g_total = g_total/count
-        return g_total
+        if not hasattr(self, 'score_avg'):
+            self.score_avg = Postulate.objects.filter(pk=self.pk).with_scores() \
+                .values_list('score_avg', flat=True).first() or 0.0
+        return self.score_avg
 
     def avg_stars(self):
         """
@@ -1338,20 +1476,33 @@ class Postulate(models.Model):
         return 'http://%s/' % url.strip('/')
 
     def file_content(self):
-        return get_file_content(self.candidate.curriculum.file.path)
+        curriculum = self.candidate.curriculum_set.all().first()
+        return curriculum.file_content() if curriculum else ""
 
     def file_text(self):
-        return get_file_text(self.candidate.curiculum.file.path)
+        curriculum = self.candidate.curriculum_set.all().first()
+        return curriculum.file_text() if curriculum else ""
     def filename(self):
-        return os.path.basename(self.candidate.curriculum.file.name)
+        curriculum = self.candidate.curriculum_set.all().first()
+        return os.path.basename(curriculum.file.name) if curriculum and curriculum.file else ""
 
     def fileext(self):
-        return os.path.splitext(self.candidate.curriculum.file.name)[1]
+        curriculum = self.candidate.curriculum_set.all().first()
+        return os.path.splitext(curriculum.file.name)[1] if curriculum and curriculum.file else ""
     def timeline(self):
+        # loaded_comments is set by vacancies.pipeline.load_stage_candidates
+        if hasattr(self, 'loaded_comments'):
+            return PrefetchedList(comment for comment in self.loaded_comments
+                                  if comment.comment_type is not None and comment.comment_type >= 2)
         return self.comment_set.all().filter(comment_type__gte=2)
     def comments(self):
+        if hasattr(self, 'loaded_comments'):
+            return PrefetchedList(comment for comment in self.loaded_comments
+                                  if comment.comment_type is not None and comment.comment_type < 2)
         return self.comment_set.all().filter(comment_type__lt=2)
     def processes(self):
+        if hasattr(self, 'loaded_processes'):
+            return self.loaded_processes
         return self.postulate_stage_set.all()
     def full_name(self):
         return str(self.candidate)
@@ -1446,8 +1597,11 @@ class Comment(models.Model):
         Retrieves all Postulate_Score instances associated with this comment's postulate stage and recruiter.
 
         Returns:
-            QuerySet: A queryset of related Postulate_Score objects.
+            QuerySet: A queryset of related Postulate_Score objects (the list
+            stored in ``stage_scores`` by ``vacancies.pipeline`` when loaded).
         """
+        if hasattr(self, 'stage_scores'):
+            return self.stage_scores
         if self.postulate:
             process = self.postulate.postulate_stage_set.all().filter(vacancy_stage=self.stage)[0]
         # else:
@@ -1468,13 +1622,11 @@ class Comment(models.Model):
         Returns:
             float: The average score, or 0 if no scores exist.
         """
-        scores = self.get_scores()
+        scores = [score.score for score in self.get_scores() or []]
         total=0.0
         if scores:
-            total = scores.aggregate(Sum('score'))['score__sum'] * 1.0
-            total = total / scores.count()
+            total = sum(scores) * 1.0 / len(scores)
         return total
-        # return total
 
     def avg_stars(self):
         """
@@ -1590,7 +1742,9 @@ class Postulate_Stage(models.Model):
     vacancy_stage = models.ForeignKey(VacancyStage,verbose_name='Job Stage', null=True, blank=True, default=None,on_delete=models.SET_NULL)
     postulate = models.ForeignKey(Postulate, verbose_name='Postulate Stage', default=None, null=True, blank=True,on_delete=models.SET_NULL)
     scores = models.ManyToManyField(Postulate_Score, default=None)
-    
+
+    objects = Postulate_StageQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Applicant Stage"
         verbose_name_plural = "Applicant Stages"
@@ -1606,15 +1760,15 @@ class Postulate_Stage(models.Model):
         """
         Computes the average score from all associated Postulate_Score objects.
 
+        Uses the ``score_avg`` annotation of ``Postulate_Stage.objects.with_scores()``
+        when present, otherwise computes it with one query and keeps it.
+
         Returns:
             float: Average score or 0 if no scores exist.
         """
-        scores = self.scores.all()
-        total=0.0
-        if scores:
-            total = scores.aggregate(Sum('score'))['score__sum'] * 1.0
-            total = total / scores.count()
-        return total
+        if not hasattr(self, 'score_avg'):
+            self.score_avg = self.scores.aggregate(avg=Avg('score'))['avg'] or 0.0
+        return self.score_avg
 
     def avg_stars(self):
         """
@@ -1656,44 +1810,14 @@ class Postulate_Stage(models.Model):
         """
         Calculates average scores for each criterion related to this postulate stage.
 
+        Uses the averages stored by ``load_criteria_scores`` when present.
+
         Returns:
             list of tuples: Each tuple contains (criterion name, average score, HTML stars).
         """
-        criteria = self.scores.all().values_list('name').distinct()
-        g_total = []
-        for criterion in criteria:
-            scores = self.scores.all().filter(name=criterion[0])
-            total = scores.aggregate(Sum('score'))['score__sum'] * 1.0
-            total = total / scores.count()
-            avg = total
-            avg = avg*2
-            count = 5
-            html =""
-            if int(avg)%2==0:
-                stars = int(avg/2)
-                while count>0:
-                    if stars>0:
-                        html = html + '<i class="fa fa-star text-light pl5"></i>'
-                        stars = stars - 1
-                    else:
-                        html= html + '<i class="fa fa-star-o text-light pl5"></i>'
-                    count = count-1
-            else:
-                stars = int(avg/2)
-                halfstar=True
-                while count>0:
-                    if stars>0:
-                        html = html + '<i class="fa fa-star text-light pl5"></i>'
-                        stars = stars -1
-                    else:
-                        if halfstar:
-                            html = html + '<i class="fa fa-star-half-o text-light pl5"></i>'
-                            halfstar = False
-                        else:
-                            html= html + '<i class="fa fa-star-o text-light pl5"></i>'
-                    count = count-1 
-            g_total = g_total + [(criterion[0],total,html),]
-        return g_total
+        if not hasattr(self, 'criteria_scores'):
+            load_criteria_scores([self])
+        return [(name, avg, score_stars(avg, 'text-light')) for name, avg in self.criteria_scores]
 
     def get_comments(self):
         """
@@ -1705,7 +1829,73 @@ class Postulate_Stage(models.Model):
         Returns:
             list: Comments enriched with their filtered scores.
         """
+        # stage_comments is set by vacancies.pipeline.load_stage_candidates
+        if hasattr(self, 'stage_comments'):
+            return self.stage_comments
         comments = self.postulate.comment_set.all().filter(stage=self.vacancy_stage, comment_type=2)
         for comment in comments:
             comment.scores = self.scores.all().filter(recruiter=comment.recruiter)
         return comments
+
+
+def vacancy_search_values(instance):
+    """
+    Values of the indexed fields loaded on a vacancy (deferred fields are left out).
+    """
+    from vacancies.search import FIELD_WEIGHTS
+    return dict((field, instance.__dict__[field]) for field, weight in FIELD_WEIGHTS if field in instance.__dict__)
+
+
+def remember_vacancy_search_values(sender, instance, **kwargs):
+    """
+    Keep the indexed values a vacancy was loaded with, to re-index it only when they change.
+    """
+    instance._search_values = vacancy_search_values(instance)
+
+
+def update_vacancy_search_index(sender, instance, created=False, update_fields=None, **kwargs):
+    """
+    Keep the keyword search index in sync when a vacancy is saved. Saves that
+    do not change the job role, skills, function or description (publish(),
+    unpublish(), counters...) leave the index alone.
+    """
+    from vacancies.search import FIELD_WEIGHTS, get_search_backend
+    if update_fields is not None and not set(update_fields) & set(field for field, weight in FIELD_WEIGHTS):
+        return
+    values = vacancy_search_values(instance)
+    if not created and values == getattr(instance, '_search_values', None):
+        return
+    get_search_backend().index(instance)
+    instance._search_values = values
+
+
+def remove_vacancy_search_index(sender, instance, **kwargs):
+    """
+    Drop a deleted vacancy from the keyword search index.
+    """
+    from vacancies.search import get_search_backend
+    get_search_backend().remove(instance.pk)
+
+models.signals.post_init.connect(remember_vacancy_search_values, sender=Vacancy)
+models.signals.post_save.connect(update_vacancy_search_index, sender=Vacancy)
+models.signals.post_delete.connect(remove_vacancy_search_index, sender=Vacancy)
+
+
+def invalidate_vacancy_pdf(sender, instance, **kwargs):
+    """
+    Drop the cached PDFs of a saved or deleted vacancy.
+    """
+    from common.pdf_cache import invalidate_pdf_cache
+    invalidate_pdf_cache('vacancy', [instance.pk])
+
+
+def invalidate_company_vacancies_pdf(sender, instance, **kwargs):
+    """
+    Drop the cached PDFs of the vacancies of a company (name, logo...).
+    """
+    from common.pdf_cache import invalidate_pdf_cache
+    invalidate_pdf_cache('vacancy', Vacancy.objects.filter(company=instance).values_list('id', flat=True))
+
+models.signals.post_save.connect(invalidate_vacancy_pdf, sender=Vacancy)
+models.signals.post_delete.connect(invalidate_vacancy_pdf, sender=Vacancy)
+models.signals.post_save.connect(invalidate_company_vacancies_pdf, sender=Company)
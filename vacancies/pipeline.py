@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Data loading of the stage details page (the hiring pipeline of a vacancy).
+
+``vacancies.views.vacancy_stage_details`` and its API counterpart used to count
+the applications of every stage and section with separate queries, and to read
+the ratings, comments, schedules, tags and CV details of each candidate from
+the template, which issued several queries per candidate.
+
+The page data is now loaded explicitly, in a fixed number of queries:
+
+- ``section_counts`` reads the counts of every stage and section from one
+  grouped query,
+- ``load_stage_candidates`` reads one page of candidates (keyset pagination on
+  the id, ``STAGE_CANDIDATES_PER_PAGE`` per page) with their related rows
+  prefetched and attaches what the template reads to each of them,
+- ``load_compared_candidates`` does the same for the columns of the
+  candidate comparison.
+"""
+
+from __future__ import absolute_import
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count, Prefetch, Q
+from django.db.models.query import prefetch_related_objects
+
+from candidates.models import CurriculumText
+from scheduler.models import Schedule
+from vacancies.models import Comment, Postulate, Postulate_Score, Postulate_Stage, PrefetchedList, \
+    load_criteria_scores
+
+CANDIDATES_PER_PAGE = getattr(settings, 'STAGE_CANDIDATES_PER_PAGE', 50)
+# Columns rendered per chunk of the streamed comparison, and the most columns compared at once
+COMPARE_CHUNK_SIZE = getattr(settings, 'COMPARE_CANDIDATES_CHUNK_SIZE', 20)
+COMPARE_MAX_CANDIDATES = getattr(settings, 'COMPARE_MAX_CANDIDATES', 300)
+
+
+def section_candidates(vacancy, vacancystage, stage_section):
+    """
+    Applications shown in a section of a stage.
+
+    Args:
+        vacancy (Vacancy): The vacancy.
+        vacancystage (VacancyStage): The stage, None for the finalized candidates.
+        stage_section (str): '0' in process, '1' moved to a next stage or
+            finalized, '2' archived.
+
+    Returns:
+        QuerySet: The applications.
+    """
+    if vacancystage is None:
+        return Postulate.objects.filter(vacancy=vacancy, finalize=True, discard=False)
+    if stage_section == '1':
+        return Postulate.objects.filter(Q(vacancy=vacancy), Q(finalize=True) | Q(vacancy_stage__order__gt=vacancystage.order))
+    if stage_section == '2':
+        return Postulate.objects.filter(vacancy=vacancy, vacancy_stage=vacancystage, discard=True)
+    return Postulate.objects.filter(vacancy=vacancy, vacancy_stage=vacancystage).exclude(discard=True)
+
+
+def section_counts(vacancy, stages):
+    """
+    Count the applications of every stage and section with one grouped query.
+
+    Sets ``total_count`` on every stage (the applications in process,
+    archived and moved past it).
+
+    Args:
+        vacancy (Vacancy): The vacancy.
+        stages (list): VacancyStage rows of the vacancy.
+
+    Returns:
+        dict: ``{stage id: (in process, moved to a next stage, archived)}``
+        and the number of finalized applications under ``'finalized'``.
+    """
+    rows = Postulate.objects.filter(vacancy=vacancy).order_by() \
+        .values('vacancy_stage', 'vacancy_stage__order', 'discard', 'finalize').annotate(total=Count('id'))
+    in_stage = defaultdict(lambda: [0, 0])
+    by_order = defaultdict(int)
+    finalized = 0
+    for row in rows:
+        in_stage[row['vacancy_stage']][1 if row['discard'] else 0] += row['total']
+        if row['vacancy_stage__order'] is not None:
+            by_order[row['vacancy_stage__order']] += row['total']
+        if row['finalize']:
+            finalized += row['total']
+    counts = {'finalized': finalized}
+    for stage in stages:
+        moved = sum(total for order, total in by_order.items() if stage.order is not None and order > stage.order)
+        in_process, archived = in_stage[stage.pk]
+        counts[stage.pk] = (in_process, moved, archived)
+        stage.total_count = in_process + moved + archived
+    return counts
+
+
+def candidate_page(candidates, after=None, per_page=CANDIDATES_PER_PAGE):
+    """
+    One page of applications, newest first, after the id of the last
+    application of the previous page.
+
+    Args:
+        candidates (QuerySet): Applications of the section.
+        after (int): Id of the last application of the previous page.
+        per_page (int): Size of the page.
+
+    Returns:
+        tuple: The QuerySet of the page and the ``after`` value of the next
+        page (None on the last page).
+    """
+    candidates = candidates.order_by('-id')
+    if after:
+        candidates = candidates.filter(id__lt=after)
+    ids = list(candidates.values_list('id', flat=True)[:per_page + 1])
+    next_after = ids[per_page - 1] if len(ids) > per_page else None
+    return Postulate.objects.filter(id__in=ids[:per_page]).order_by('-id'), next_after
+
+
+def load_stage_candidates(candidates, vacancy, process, recruiter, user):
+    """
+    Load applications with everything the stage details page reads from them.
+
+    Each application gets:
+
+    - ``process``: its Postulate_Stage for the current stage, created if missing,
+    - all its stages with their scores, per-criterion averages and rating
+      comments (``Postulate_Stage.get_comments``), served by ``Postulate.processes``,
+    - ``hasRated`` and ``comment``: whether the recruiter rated it in the
+      current stage and the comment of the rating,
+    - ``schedule``: the open schedule of the user, or None,
+    - its comments, served by ``Postulate.comments`` and ``Postulate.timeline``.
+
+    Args:
+        candidates (QuerySet): Applications, e.g. a page of ``candidate_page``.
+        vacancy (Vacancy): The vacancy, whose tags are loaded as well.
+        process (VacancyStage): Current stage, None for the finalized candidates.
+        recruiter (Recruiter): Recruiter viewing the page.
+        user (User): User viewing the page.
+
+    Returns:
+        PrefetchedList: The applications.
+    """
+    prefetch_related_objects([vacancy], 'vacancytags_set')
+    candidates = PrefetchedList(candidates.with_scores().select_related('candidate__user', 'recruiter', 'medium')
+                                .prefetch_related(
+        'tags',
+        'candidate__expertise_set',
+        'candidate__academic_set',
+        'candidate__curriculum_set',
+        Prefetch('postulate_stage_set', to_attr='loaded_processes',
+                 queryset=Postulate_Stage.objects.with_scores().select_related('vacancy_stage').prefetch_related('scores')),
+        Prefetch('comment_set', to_attr='loaded_comments',
+                 queryset=Comment.objects.select_related('recruiter__user', 'stage')),
+        Prefetch('schedule_set', to_attr='open_schedules',
+                 queryset=Schedule.objects.filter(user=user, status=0)),
+    ))
+    process_id = process.pk if process else None
+    missing = []
+    for candidate in candidates:
+        candidate.vacancy = vacancy
+        candidate.process = next((stage for stage in candidate.loaded_processes
+                                  if stage.vacancy_stage_id == process_id), None)
+        if candidate.process is None:
+            candidate.process = Postulate_Stage(postulate=candidate, vacancy_stage=process)
+            candidate.process.score_avg = 0.0
+            missing.append(candidate.process)
+            candidate.loaded_processes.append(candidate.process)
+    if missing:
+        Postulate_Stage.objects.bulk_create(missing)
+        for stage in missing:
+            stage._prefetched_objects_cache = {'scores': Postulate_Score.objects.none()}
+    load_criteria_scores(stage for candidate in candidates for stage in candidate.loaded_processes)
+    load_curriculum_texts(candidates)
+    for candidate in candidates:
+        link_loaded_rows(candidate)
+        rated = [score for score in candidate.process.scores.all() if score.recruiter_id == recruiter.pk]
+        candidate.hasRated = bool(rated)
+        candidate.comment = next((comment for comment in candidate.loaded_comments
+                                  if comment.comment_type == 2 and comment.recruiter_id == recruiter.pk), None) \
+            if rated else None
+        candidate.schedule = candidate.open_schedules[0] if candidate.open_schedules else None
+    return candidates
+
+
+def link_loaded_rows(candidate):
+    """
+    Link the stages, scores and comments prefetched on an application (the
+    ``loaded_processes`` and ``loaded_comments`` attributes) to each other, so
+    ``Postulate_Stage.get_comments`` and ``Comment.get_scores`` read no rows.
+    """
+    scores_by_stage = {}
+    for stage in candidate.loaded_processes:
+        stage.postulate = candidate
+        scores_by_stage.setdefault(stage.vacancy_stage_id, list(stage.scores.all()))
+    for comment in candidate.loaded_comments:
+        comment.postulate = candidate
+        comment.stage_scores = PrefetchedList(score for score in scores_by_stage.get(comment.stage_id, [])
+                                              if score.recruiter_id == comment.recruiter_id)
+        comment.scores = comment.stage_scores
+    for stage in candidate.loaded_processes:
+        stage.stage_comments = PrefetchedList(comment for comment in candidate.loaded_comments
+                                              if comment.stage_id == stage.vacancy_stage_id and comment.comment_type == 2)
+
+
+def load_compared_candidates(ids, vacancy_stage):
+    """
+    Load the applications compared side by side (``common.ajax.compare_candidates``)
+    in a fixed number of queries: the applications, their stages, the scores,
+    the comments and the per-criterion averages.
+
+    Args:
+        ids (list): Ids of the applications, in the order of the columns.
+        vacancy_stage (VacancyStage): Stage the applications are compared in.
+
+    Returns:
+        list: The applications found, in the order of ``ids``. Each one has
+        ``process`` (its stages matching ``vacancy_stage``) and ``checkbox_id``.
+    """
+    candidates = Postulate.objects.filter(id__in=ids).with_scores().select_related('candidate').prefetch_related(
+        Prefetch('postulate_stage_set', to_attr='loaded_processes',
+                 queryset=Postulate_Stage.objects.with_scores().select_related('vacancy_stage').prefetch_related('scores')),
+        Prefetch('comment_set', to_attr='loaded_comments',
+                 queryset=Comment.objects.select_related('recruiter__user', 'stage')),
+    )
+    candidates = dict((candidate.pk, candidate) for candidate in candidates)
+    candidates = [candidates[pk] for pk in ids if pk in candidates]
+    load_criteria_scores(stage for candidate in candidates for stage in candidate.loaded_processes)
+    for candidate in candidates:
+        link_loaded_rows(candidate)
+        candidate.process = [stage for stage in candidate.loaded_processes if stage.vacancy_stage_id == vacancy_stage.pk]
+        candidate.checkbox_id = '-0-%s' % candidate.pk
+    return candidates
+
+
+def load_curriculum_texts(candidates):
+    """
+    Load the extracted CV texts of the applications with one query (see
+    ``Curriculum.extracted_text``).
+    """
+    curricula = [curriculum for candidate in candidates if candidate.candidate
+                 for curriculum in candidate.candidate.curriculum_set.all()[:1] if curriculum.file and curriculum.file_hash]
+    texts = dict((text.file_hash, text) for text in
+                 CurriculumText.objects.filter(file_hash__in=set(curriculum.file_hash for curriculum in curricula)))
+    for curriculum in curricula:
+        if curriculum.file_hash in texts:
+            curriculum._extracted_text = texts[curriculum.file_hash]
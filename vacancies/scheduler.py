@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Scheduled publication and unpublication of vacancies.
+
+``PublishCronJob`` and ``UnPublishCronJob`` ran once a day and matched exact
+dates (``pub_date = today``, ``unpub_date = yesterday``), calling
+``publish()``/``unpublish()`` and saving row by row. A day without cron left
+vacancies scheduled or published for good.
+
+``run_vacancy_schedule`` selects every overdue transition with range queries
+on indexed columns:
+
+- scheduled vacancies (``pub_after``) whose ``pub_date`` has come are published,
+- published vacancies whose ``unpub_date`` has passed are unpublished,
+
+and applies them with one ``UPDATE`` and one bulk insert of ``Publish_History``
+rows per batch of ``VACANCY_SCHEDULE_BATCH_SIZE``. The scheduled dates are kept,
+so a late run records the period the vacancy was actually meant to be online.
+Nothing is due most of the time, so the job is cheap enough to run every few
+minutes. ``dry_run`` reports the due vacancies without changing them.
+"""
+
+from __future__ import absolute_import
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from vacancies.models import Publish_History, Vacancy
+
+BATCH_SIZE = getattr(settings, 'VACANCY_SCHEDULE_BATCH_SIZE', 500)
+
+
+def due_for_publication(today):
+    """ Open vacancies scheduled to be published on or before ``today``. """
+    return Vacancy.objects.filter(status__codename='open', pub_after=True, pub_date__lte=today)
+
+
+def due_for_unpublication(today):
+    """
+    Open, published vacancies whose unpublication date is before ``today``.
+    Scheduled vacancies with an unpublication date before their publication
+    date get a new one when published, so they are not due.
+    """
+    return Vacancy.objects.filter(status__codename='open', expired=False, pub_date__lte=today, unpub_date__lt=today) \
+        .exclude(pub_after=True, unpub_date__lt=F('pub_date'))
+
+
+def _apply(queryset, values, action, dry_run):
+    """
+    Update the vacancies of a queryset batch by batch and log the action.
+
+    Each batch locks its rows (skipping the ones locked by a concurrent run)
+    and only updates those still matching the queryset.
+
+    Returns:
+        list: Ids of the updated (or, on a dry run, due) vacancies.
+    """
+    ids = list(queryset.order_by('id').values_list('id', flat=True))
+    if dry_run:
+        return ids
+    done = []
+    for start in range(0, len(ids), BATCH_SIZE):
+        with transaction.atomic():
+            batch = list(queryset.filter(pk__in=ids[start:start + BATCH_SIZE])
+                         .select_for_update(skip_locked=True, of=('self',)).order_by('id').values_list('id', flat=True))
+            if not batch:
+                continue
+            Vacancy.objects.filter(pk__in=batch).update(**values)
+            Publish_History.objects.bulk_create([Publish_History(vacancy_id=pk, action=action) for pk in batch])
+            transaction.on_commit(lambda batch=batch: _changed(batch))
+        done.extend(batch)
+    return done
+
+
+def _changed(ids):
+    """
+    Work the post_save signals of ``Vacancy`` do on ``save()``, skipped by
+    ``QuerySet.update()``. The search index only covers the texts of a
+    vacancy, which do not change here.
+    """
+    from common.pdf_cache import invalidate_pdf_cache
+    invalidate_pdf_cache('vacancy', ids)
+
+
+def publish_due_vacancies(today=None, dry_run=False):
+    """
+    Publish the scheduled vacancies whose publication date has come.
+
+    Args:
+        today (date): Reference date (defaults to today).
+        dry_run (bool): Only report the due vacancies.
+
+    Returns:
+        list: Ids of the published vacancies.
+    """
+    today = today or date.today()
+    return _apply(due_for_publication(today), {
+        'expired': False,
+        'pub_after': False,
+        # Same rule as Vacancy.publish()
+        'unpub_date': Case(When(unpub_date__lt=F('pub_date'), then=Value(today + timedelta(days=29))),
+                           default=F('unpub_date')),
+    }, '1', dry_run)
+
+
+def unpublish_due_vacancies(today=None, dry_run=False):
+    """
+    Unpublish the vacancies whose unpublication date has passed.
+
+    Args:
+        today (date): Reference date (defaults to today).
+        dry_run (bool): Only report the due vacancies.
+
+    Returns:
+        list: Ids of the unpublished vacancies.
+    """
+    today = today or date.today()
+    return _apply(due_for_unpublication(today), {'expired': True}, '2', dry_run)
+
+
+def run_vacancy_schedule(today=None, dry_run=False):
+    """
+    Apply every overdue publication, then every overdue unpublication.
+
+    Args:
+        today (date): Reference date (defaults to today).
+        dry_run (bool): Only report the due vacancies.
+
+    Returns:
+        dict: Ids of the ``published`` and ``unpublished`` vacancies.
+    """
+    today = today or date.today()
+    return {
+        'published': publish_due_vacancies(today, dry_run),
+        'unpublished': unpublish_due_vacancies(today, dry_run),
+    }
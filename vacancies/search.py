@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+Full-text search for vacancies.
+
+Keyword search used to be ``employment__icontains | description__icontains``,
+which forces a sequential scan over every description. The search is now
+answered by an index through one of the following backends:
+
+    - ``postgres``: ``tsvector`` documents matched against a GIN expression
+      index and ranked with ``ts_rank``.
+    - ``sqlite``: an FTS5 virtual table ranked with ``bm25``, queried through
+      subqueries so the SQL does not grow with the number of matches.
+    - ``inverted``: a pure-Python tokenizer feeding the ``VacancySearchTerm``
+      table (term -> vacancy, weight). Works on any database, MySQL included.
+
+The backend is chosen by ``settings.VACANCY_SEARCH_BACKEND``; by default it
+follows the database vendor and falls back to the inverted index.
+The index is refreshed from the ``Vacancy`` post_save/post_delete signals when
+an indexed field changes (the publication status is filtered on the queryset,
+not indexed); ``rebuild_vacancy_index`` fills it for existing rows.
+
+Matching is by word: every term must be a word of the vacancy, the last one
+may be the start of a word. The former icontains search also matched inside
+words ('net' found 'internet'), the index does not.
+"""
+
+from __future__ import absolute_import
+from collections import Counter
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField, Count, FloatField, OuterRef, Q, Subquery, Sum
+from django.db.models.expressions import RawSQL
+from django.utils.html import strip_tags
+from unidecode import unidecode
+
+from utils import tokenize
+from vacancies.models import Vacancy, VacancySearchTerm
+
+# Relative weight of every indexed field (job role > skills > description)
+FIELD_WEIGHTS = (
+    ('employment', 4),
+    ('skills', 2),
+    ('function', 2),
+    ('description', 1),
+)
+
+
+def normalize_query(text):
+    """
+    Normalize a keyword query to the indexed terms, or None if nothing is searchable.
+
+    Args:
+        text (str): Words typed in the search form.
+
+    Returns:
+        str or None: Space separated terms.
+    """
+    terms = tokenize(text)
+    if not terms:
+        return None
+    return ' '.join(terms)
+
+
+class BaseSearchBackend(object):
+    """
+    Interface of the vacancy search backends.
+    """
+    vendor = None
+
+    def index(self, vacancy):
+        """ Add or refresh a vacancy in the index. """
+        raise NotImplementedError
+
+    def remove(self, vacancy_id):
+        """ Drop a vacancy from the index. """
+        raise NotImplementedError
+
+    def clear(self):
+        """ Empty the index. """
+        raise NotImplementedError
+
+    def search(self, vacancies, text):
+        """
+        Restrict ``vacancies`` to the rows matching every term of ``text``.
+
+        The queryset is annotated with ``search_rank`` and ordered by it
+        (best match first).
+        """
+        raise NotImplementedError
+
+    def filter(self, vacancies, text):
+        """
+        Restrict ``vacancies`` to the rows matching ``text`` without ranking.
+        Used by the facet counts, where ordering is irrelevant.
+        """
+        return vacancies.filter(pk__in=self.search(Vacancy.objects.all(), text).values('pk'))
+
+    def rebuild(self, vacancies=None, chunk_size=500):
+        """
+        Index all the given vacancies (every vacancy by default).
+
+        Returns:
+            int: Number of indexed vacancies.
+        """
+        if vacancies is None:
+            self.clear()
+            vacancies = Vacancy.objects.all()
+        total = 0
+        for vacancy in vacancies.only(*[field for field, weight in FIELD_WEIGHTS]).iterator(chunk_size=chunk_size):
+            self.index(vacancy)
+            total += 1
+        return total
+
+
+class InvertedIndexBackend(BaseSearchBackend):
+    """
+    Database agnostic backend. Terms are computed in Python and stored in
+    ``VacancySearchTerm``; a query is a lookup on the indexed ``term`` column.
+    The last query term is matched as a prefix so partial words still match.
+    """
+
+    def document(self, vacancy):
+        """
+        Weighted term frequencies of a vacancy.
+
+        Returns:
+            Counter: term -> weight.
+        """
+        terms = Counter()
+        for field, weight in FIELD_WEIGHTS:
+            for term in tokenize(getattr(vacancy, field, None)):
+                terms[term] += weight
+        return terms
+
+    def index(self, vacancy):
+        terms = self.document(vacancy)
+        with transaction.atomic():
+            VacancySearchTerm.objects.filter(vacancy_id=vacancy.pk).delete()
+            VacancySearchTerm.objects.bulk_create([
+                VacancySearchTerm(vacancy_id=vacancy.pk, term=term, weight=weight)
+                for term, weight in terms.items()
+            ])
+
+    def remove(self, vacancy_id):
+        VacancySearchTerm.objects.filter(vacancy_id=vacancy_id).delete()
+
+    def clear(self):
+        VacancySearchTerm.objects.all().delete()
+
+    def _matches(self, text):
+        terms = tokenize(text)
+        if not terms:
+            return None
+        conditions = [Q(term=term) for term in terms[:-1]] + [Q(term__startswith=terms[-1])]
+        annotations = dict(('term_%s' % i, Count('pk', filter=condition)) for i, condition in enumerate(conditions))
+        matches = VacancySearchTerm.objects.filter(reduce(or_, conditions)).order_by() \
+            .values('vacancy').annotate(rank=Sum('weight'), **annotations)
+        return matches.filter(**dict(('term_%s__gt' % i, 0) for i in range(len(conditions))))
+
+    def search(self, vacancies, text):
+        matches = self._matches(text)
+        if matches is None:
+            return vacancies.none()
+        rank = Subquery(matches.filter(vacancy=OuterRef('pk')).values('rank')[:1])
+        return vacancies.annotate(search_rank=rank).filter(search_rank__isnull=False) \
+            .order_by('-search_rank', '-pub_date', '-id')
+
+    def filter(self, vacancies, text):
+        matches = self._matches(text)
+        if matches is None:
+            return vacancies.none()
+        return vacancies.filter(pk__in=matches.values('vacancy'))
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    PostgreSQL backend. The database maintains the GIN expression index created
+    by the ``vacancies`` migrations, so there is nothing to do on save.
+    """
+    vendor = 'postgresql'
+
+    # Must stay identical to the indexed expression (see migration 0057)
+    DOCUMENT = ("setweight(to_tsvector('simple', coalesce({prefix}employment, '')), 'A') || "
+                "setweight(to_tsvector('simple', coalesce({prefix}skills, '') || ' ' || "
+                "coalesce({prefix}function, '')), 'B') || "
+                "setweight(to_tsvector('simple', coalesce({prefix}description, '')), 'C')")
+
+    @classmethod
+    def document(cls, qualified=True):
+        """
+        SQL expression of the weighted document of a vacancy.
+
+        Args:
+            qualified (bool): Prefix the columns with the table name. Index
+                definitions need the unqualified form.
+        """
+        prefix = ''
+        if qualified:
+            prefix = connection.ops.quote_name(Vacancy._meta.db_table) + '.'
+        return cls.DOCUMENT.format(prefix=prefix)
+
+    def index(self, vacancy):
+        pass
+
+    def remove(self, vacancy_id):
+        pass
+
+    def clear(self):
+        pass
+
+    def rebuild(self, vacancies=None, chunk_size=500):
+        with connection.cursor() as cursor:
+            cursor.execute('REINDEX INDEX vacancies_vacancy_search_idx')
+        return Vacancy.objects.count()
+
+    def _query(self, text):
+        terms = tokenize(text)
+        if not terms:
+            return None
+        return ' & '.join(terms[:-1] + [terms[-1] + ':*'])
+
+    def _match(self, query):
+        # Raw SQL rather than SearchVector, so the expression stays identical to the indexed one
+        return RawSQL("%s @@ to_tsquery('simple', %%s)" % self.document(), (query,), output_field=BooleanField())
+
+    def search(self, vacancies, text):
+        query = self._query(text)
+        if query is None:
+            return vacancies.none()
+        return vacancies.filter(self._match(query)).annotate(
+            search_rank=RawSQL("ts_rank(%s, to_tsquery('simple', %%s))" % self.document(), (query,),
+                               output_field=FloatField())
+        ).order_by('-search_rank', '-pub_date', '-id')
+
+    def filter(self, vacancies, text):
+        query = self._query(text)
+        if query is None:
+            return vacancies.none()
+        return vacancies.filter(self._match(query))
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """
+    SQLite backend based on the FTS5 virtual table created by the ``vacancies``
+    migrations. The rowid of the virtual table is the vacancy id.
+    """
+    vendor = 'sqlite'
+    table = 'vacancies_vacancy_fts'
+
+    def index(self, vacancy):
+        values = [unidecode(strip_tags('%s' % (getattr(vacancy, field, None) or ''))) for field, weight in FIELD_WEIGHTS]
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE rowid = %%s' % self.table, [vacancy.pk])
+            cursor.execute('INSERT INTO %s (rowid, employment, skills, function, description) '
+                           'VALUES (%%s, %%s, %%s, %%s, %%s)' % self.table, [vacancy.pk] + values)
+
+    def remove(self, vacancy_id):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE rowid = %%s' % self.table, [vacancy_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % self.table)
+
+    def _match(self, text):
+        terms = tokenize(text)
+        if not terms:
+            return None
+        return ' '.join(['"%s"' % term for term in terms[:-1]] + ['"%s"*' % terms[-1]])
+
+    def search(self, vacancies, text):
+        match = self._match(text)
+        if match is None:
+            return vacancies.none()
+        weights = ', '.join(['%s' % float(weight) for field, weight in FIELD_WEIGHTS])
+        vacancy_id = '%s.%s' % (connection.ops.quote_name(Vacancy._meta.db_table), connection.ops.quote_name('id'))
+        # bm25() is negative, the lower the better
+        rank = RawSQL('SELECT -bm25(%s, %s) FROM %s WHERE %s MATCH %%s AND rowid = %s'
+                      % (self.table, weights, self.table, self.table, vacancy_id), (match,), output_field=FloatField())
+        return self.filter(vacancies, text).annotate(search_rank=rank).order_by('-search_rank', '-pub_date', '-id')
+
+    def filter(self, vacancies, text):
+        match = self._match(text)
+        if match is None:
+            return vacancies.none()
+        return vacancies.filter(pk__in=RawSQL('SELECT rowid FROM %s WHERE %s MATCH %%s' % (self.table, self.table),
+                                              (match,)))
+
+
+BACKENDS = {
+    'inverted': InvertedIndexBackend,
+    'postgres': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+VENDOR_BACKENDS = {
+    'postgresql': 'postgres',
+    'sqlite': 'sqlite',
+}
+
+_backend = None
+
+
+def get_search_backend():
+    """
+    Return the configured search backend (``settings.VACANCY_SEARCH_BACKEND``),
+    or the best one available for the current database.
+
+    Returns:
+        BaseSearchBackend: Shared backend instance.
+    """
+    global _backend
+    if _backend is None:
+        name = getattr(settings, 'VACANCY_SEARCH_BACKEND', None) or VENDOR_BACKENDS.get(connection.vendor, 'inverted')
+        _backend = BACKENDS[name]()
+    return _backend
+
+
+def search_vacancies(vacancies, text):
+    """
+    Ranked keyword search over a vacancy queryset.
+
+    Args:
+        vacancies (QuerySet): Vacancies to search in.
+        text (str): Words typed in the search form.
+
+    Returns:
+        QuerySet: Matching vacancies annotated with ``search_rank``, best first.
+    """
+    return get_search_backend().search(vacancies, text)
+
+
+def filter_vacancies_by_text(vacancies, text):
+    """
+    Unranked keyword filter over a vacancy queryset.
+
+    Args:
+        vacancies (QuerySet): Vacancies to filter.
+        text (str): Words typed in the search form.
+
+    Returns:
+        QuerySet: Matching vacancies.
+    """
+    return get_search_backend().filter(vacancies, text)
+
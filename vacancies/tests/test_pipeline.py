@@ -0,0 +1,184 @@
+"""
+ Testing the data loading of the stage details page (vacancies.pipeline).
+ The test is divided into 2 parts:
+ 	1. Section counts and keyset pagination
+ 	2. Candidates loaded in a fixed number of queries, whatever their number
+ """
+
+# Imports
+from __future__ import absolute_import
+from django.test import TestCase
+from candidates.models import Academic, Candidate, Expertise
+from common.models import User
+from companies.models import Company, Recruiter, Stage
+from scheduler.models import Schedule
+from vacancies.candidate_filter import filter_applications
+from vacancies.models import Comment, Postulate, Postulate_Score, Postulate_Stage, Vacancy, VacancyStage, VacancyTags
+from vacancies.pipeline import candidate_page, load_compared_candidates, load_stage_candidates, section_candidates, \
+	section_counts
+
+# Queries of section_counts, candidate_page and load_stage_candidates
+QUERY_BUDGET = 15
+# Queries of load_compared_candidates
+COMPARE_QUERY_BUDGET = 5
+
+
+def read_candidate(candidate):
+	"""Read what vacancies_stage_details.html reads from a candidate."""
+	values = [candidate.candidate.user, candidate.candidate.role(), candidate.candidate.education(),
+			  candidate.recruiter, candidate.medium, candidate.avg_stars(), candidate.schedule, candidate.hasRated,
+			  candidate.comment, candidate.comments().count(), list(candidate.tags.all()),
+			  list(candidate.vacancy.available_tags()), candidate.timeline().count()]
+	for comment in candidate.comments():
+		values += [comment.recruiter.user.photo, comment.stage_string(), comment.get_scores().count()]
+	for tline in candidate.timeline():
+		values += [tline.avg_stars(), tline.stage]
+	for process in candidate.processes():
+		values += [process.avg_stars(), process.criteria_avg_scores(), process.get_comments().count()]
+		values += [comment.get_scores().count() for comment in process.get_comments()]
+	return values
+
+
+class PipelineTest(TestCase):
+	"""
+	USE CASE
+	--------------------
+		1. Section counts match the sections of every stage
+		2. Keyset pages cover every candidate once
+		3. Keyword filters are applied to the section before it is paged
+		4. The stage of the current process is created when missing
+		5. Ratings, comments and schedules of the recruiter are attached
+		6. Loading and reading a page takes the same queries for '5' or '30' candidates
+		7. Compared candidates keep their order and are loaded in a fixed number of queries
+	"""
+	@classmethod
+	def setUpTestData(cls):
+		cls.user = User.objects.create(username='recruiter', email='recruiter@example.com')
+		cls.company = Company.objects.create(name='Acme', user=cls.user)
+		cls.recruiter = Recruiter.objects.create(user=cls.user, membership=3)
+		cls.recruiter.company.add(cls.company)
+		cls.vacancy = Vacancy.objects.create(employment='Developer', company=cls.company, user=cls.user)
+		cls.stages = [VacancyStage.objects.create(vacancy=cls.vacancy, order=order,
+												  stage=Stage.objects.create(name='Stage %s' % order, company=cls.company))
+					  for order in range(3)]
+		cls.tag = VacancyTags.objects.create(name='senior', vacancy=cls.vacancy)
+
+	def add_candidates(self, number, stage=None, **kwargs):
+		"""Add rated, commented, tagged and scheduled candidates to a stage."""
+		stage = stage or self.stages[0]
+		postulates = []
+		for i in range(number):
+			candidate = Candidate.objects.create(first_name='Candidate', last_name='%s' % i)
+			Expertise.objects.create(candidate=candidate, employment='Developer', present=True)
+			Academic.objects.create(candidate=candidate, course_name='Engineering')
+			postulate = Postulate.objects.create(vacancy=self.vacancy, candidate=candidate, vacancy_stage=stage, **kwargs)
+			postulate.tags.add(self.tag)
+			process = Postulate_Stage.objects.create(postulate=postulate, vacancy_stage=stage)
+			process.scores.add(Postulate_Score.objects.create(name='skill', score=4, recruiter=self.recruiter))
+			Comment.objects.create(text='Rated', comment_type=2, recruiter=self.recruiter, postulate=postulate, stage=stage)
+			Comment.objects.create(text='Note', comment_type=1, recruiter=self.recruiter, postulate=postulate, stage=stage)
+			Schedule.objects.create(user=self.user, application=postulate, status='0')
+			postulates.append(postulate)
+		return postulates
+
+	def load_page(self, after=None, per_page=50, spec=''):
+		vacancy = Vacancy.objects.get(pk=self.vacancy.pk)
+		stages = list(VacancyStage.objects.filter(vacancy=vacancy))
+		counts = section_counts(vacancy, stages)
+		candidates = filter_applications(section_candidates(vacancy, stages[0], '0'), spec, vacancy)
+		page, next_after = candidate_page(candidates, after, per_page)
+		candidates = load_stage_candidates(page, vacancy, stages[0], self.recruiter, self.user)
+		return counts, candidates, next_after
+
+	def test_section_counts(self):
+		"""Check the counts of every stage and section"""
+		self.add_candidates(2)
+		self.add_candidates(1, discard=True)
+		self.add_candidates(1, stage=self.stages[1], finalize=True)
+		counts = section_counts(self.vacancy, self.stages)
+		self.assertEqual(counts[self.stages[0].pk], (2, 1, 1))
+		self.assertEqual(counts[self.stages[1].pk], (1, 0, 0))
+		self.assertEqual(counts['finalized'], 1)
+		self.assertEqual([stage.total_count for stage in self.stages], [4, 1, 0])
+
+	def test_keyset_pagination(self):
+		"""Check that pages cover every candidate once, newest first"""
+		ids = [postulate.pk for postulate in self.add_candidates(5)]
+		counts, first, after = self.load_page(per_page=2)
+		self.assertEqual([candidate.pk for candidate in first], [ids[4], ids[3]])
+		counts, second, after = self.load_page(after, per_page=2)
+		counts, third, after = self.load_page(after, per_page=2)
+		self.assertIsNone(after)
+		self.assertEqual([candidate.pk for candidate in first + second + third], ids[::-1])
+
+	def test_filtered_pagination(self):
+		"""Check that the pages of a filtered section cover every matching candidate once"""
+		ids = [postulate.pk for postulate in self.add_candidates(3, recruiter=self.recruiter)]
+		self.add_candidates(3)
+		candidate = Candidate.objects.create(first_name='New')
+		# Without a stage row yet, created when its page is loaded
+		ids.append(Postulate.objects.create(vacancy=self.vacancy, candidate=candidate, vacancy_stage=self.stages[0],
+											recruiter=self.recruiter).pk)
+		spec = '3-%s' % self.recruiter.pk
+		counts, first, after = self.load_page(per_page=2, spec=spec)
+		counts, second, after = self.load_page(after, per_page=2, spec=spec)
+		self.assertIsNone(after)
+		self.assertEqual([candidate.pk for candidate in first + second], ids[::-1])
+		for spec in ('5-%s' % self.tag.pk, '2-%s' % self.recruiter.pk, '1-3-5,0-nothing'):
+			counts, candidates, after = self.load_page(spec=spec)
+			self.assertEqual(len(candidates), 6)
+
+	def test_missing_process_is_created(self):
+		"""Check that the stage of the current process is created when missing"""
+		candidate = Candidate.objects.create(first_name='New')
+		postulate = Postulate.objects.create(vacancy=self.vacancy, candidate=candidate, vacancy_stage=self.stages[0])
+		counts, candidates, after = self.load_page()
+		self.assertIsNotNone(candidates[0].process.pk)
+		self.assertTrue(Postulate_Stage.objects.filter(postulate=postulate, vacancy_stage=self.stages[0]).exists())
+		self.assertFalse(candidates[0].hasRated)
+		self.assertEqual(read_candidate(candidates[0])[9], 0)
+
+	def test_loaded_values(self):
+		"""Check the rating, comments and schedule of a candidate"""
+		self.add_candidates(1)
+		counts, candidates, after = self.load_page()
+		candidate = candidates[0]
+		self.assertTrue(candidate.hasRated)
+		self.assertEqual(candidate.comment.text, 'Rated')
+		self.assertEqual([comment.text for comment in candidate.comments()], ['Note'])
+		self.assertEqual([comment.text for comment in candidate.timeline()], ['Rated'])
+		self.assertEqual(candidate.timeline()[0].avg_score(), 4.0)
+		self.assertEqual(candidate.process.get_comments()[0].get_scores().count(), 1)
+		self.assertEqual(candidate.schedule.application_id, candidate.pk)
+		self.assertEqual(candidate.candidate.role(), 'Developer')
+
+	def test_query_budget(self):
+		"""Check that a page takes the same queries for '5' or '30' candidates"""
+		self.add_candidates(5)
+		self.load_page()
+		with self.assertNumQueries(QUERY_BUDGET):
+			counts, candidates, after = self.load_page()
+			for candidate in candidates:
+				read_candidate(candidate)
+		self.add_candidates(25)
+		self.load_page()
+		with self.assertNumQueries(QUERY_BUDGET):
+			counts, candidates, after = self.load_page()
+			for candidate in candidates:
+				read_candidate(candidate)
+		self.assertEqual(len(candidates), 30)
+
+	def test_compared_candidates(self):
+		"""Check the columns of the comparison and their number of queries"""
+		ids = [postulate.pk for postulate in self.add_candidates(20)]
+		ids = ids[::2] + ids[1::2]
+		with self.assertNumQueries(COMPARE_QUERY_BUDGET):
+			candidates = load_compared_candidates(ids, self.stages[0])
+			for candidate in candidates:
+				values = [candidate.full_name(), candidate.avg_stars()]
+				for process in candidate.processes():
+					values += [process.vacancy_stage.id, process.avg_stars(), process.criteria_avg_scores()]
+					values += [comment.get_scores().count() for comment in process.get_comments()]
+		self.assertEqual([candidate.pk for candidate in candidates], ids)
+		self.assertEqual(candidates[0].checkbox_id, '-0-%s' % ids[0])
+		self.assertEqual([process.vacancy_stage_id for process in candidates[0].process], [self.stages[0].pk])
@@ -0,0 +1,146 @@
+"""
+ Testing the scheduled publication and unpublication of vacancies (vacancies.scheduler).
+ The test is divided into 3 parts:
+ 	1. Publication of the scheduled vacancies
+ 	2. Unpublication of the expired vacancies
+ 	3. Dry runs and the run_vacancy_schedule command
+ """
+
+# Imports
+from __future__ import absolute_import
+from datetime import date, timedelta
+from io import StringIO
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from vacancies.models import Publish_History, Vacancy, Vacancy_Status
+from vacancies.scheduler import publish_due_vacancies, run_vacancy_schedule, unpublish_due_vacancies
+
+TODAY = date(2024, 3, 10)
+
+
+def days(number):
+	return TODAY + timedelta(days=number)
+
+
+class VacancyScheduleTestCase(TestCase):
+	@classmethod
+	def setUpTestData(cls):
+		cls.open = Vacancy_Status.objects.create(name='Open', codename='open')
+		cls.closed = Vacancy_Status.objects.create(name='Closed', codename='closed')
+
+	def vacancy(self, pub_date, unpub_date, pub_after=False, expired=False, status=None):
+		return Vacancy.objects.create(employment='Developer', status=status or self.open, pub_after=pub_after,
+									  pub_date=pub_date, unpub_date=unpub_date, expired=expired)
+
+	def history(self):
+		return sorted(Publish_History.objects.values_list('vacancy', 'action'))
+
+## Testing the publication
+
+class PublishTest(VacancyScheduleTestCase):
+	"""
+	USE CASE
+	--------------------
+		1. Scheduled vacancies are published on their date, or later when days were missed
+		2. The scheduled dates are kept, an unpublication date before the publication date is reset
+		3. Vacancies not due yet or not open are left scheduled
+		4. Each publication is logged
+	"""
+	def test_missed_days(self):
+		"""Check that a vacancy due since '3' days is published with its dates kept"""
+		vacancy = self.vacancy(days(-3), days(20), pub_after=True)
+		self.assertEqual(publish_due_vacancies(TODAY), [vacancy.pk])
+		vacancy.refresh_from_db()
+		self.assertEqual((vacancy.pub_after, vacancy.expired, vacancy.pub_date, vacancy.unpub_date),
+						 (False, False, days(-3), days(20)))
+		self.assertEqual(self.history(), [(vacancy.pk, '1')])
+
+	def test_unpublication_date_reset(self):
+		"""Check that an unpublication date before the publication date becomes today + 29"""
+		vacancy = self.vacancy(days(-2), days(-5), pub_after=True)
+		publish_due_vacancies(TODAY)
+		vacancy.refresh_from_db()
+		self.assertEqual(vacancy.unpub_date, days(29))
+
+	def test_not_due(self):
+		"""Check that future and closed vacancies are not published"""
+		future = self.vacancy(days(1), days(30), pub_after=True)
+		closed = self.vacancy(days(-1), days(30), pub_after=True, status=self.closed)
+		self.assertEqual(publish_due_vacancies(TODAY), [])
+		self.assertTrue(Vacancy.objects.get(pk=future.pk).pub_after)
+		self.assertTrue(Vacancy.objects.get(pk=closed.pk).pub_after)
+		self.assertEqual(self.history(), [])
+
+## Testing the unpublication
+
+class UnpublishTest(VacancyScheduleTestCase):
+	"""
+	USE CASE
+	--------------------
+		1. Published vacancies are unpublished after their date, or later when days were missed
+		2. Scheduled vacancies with an unpublication date before their publication date are not due
+		3. Each unpublication is logged
+	"""
+	def test_missed_days(self):
+		"""Check that a vacancy due since '5' days is unpublished"""
+		vacancy = self.vacancy(days(-40), days(-5))
+		current = self.vacancy(days(-10), TODAY)
+		self.assertEqual(unpublish_due_vacancies(TODAY), [vacancy.pk])
+		self.assertTrue(Vacancy.objects.get(pk=vacancy.pk).expired)
+		self.assertFalse(Vacancy.objects.get(pk=current.pk).expired)
+		self.assertEqual(self.history(), [(vacancy.pk, '2')])
+
+	def test_scheduled_with_earlier_unpublication_date(self):
+		"""Check that a scheduled vacancy is left to the publication, which resets its date"""
+		vacancy = self.vacancy(days(-1), days(-10), pub_after=True)
+		self.assertEqual(unpublish_due_vacancies(TODAY), [])
+		self.assertEqual(run_vacancy_schedule(TODAY), {'published': [vacancy.pk], 'unpublished': []})
+		vacancy.refresh_from_db()
+		self.assertEqual((vacancy.expired, vacancy.unpub_date), (False, days(29)))
+
+	def test_published_then_unpublished(self):
+		"""Check that a vacancy whose whole period was missed is published and unpublished"""
+		vacancy = self.vacancy(days(-20), days(-5), pub_after=True)
+		self.assertEqual(run_vacancy_schedule(TODAY), {'published': [vacancy.pk], 'unpublished': [vacancy.pk]})
+		self.assertTrue(Vacancy.objects.get(pk=vacancy.pk).expired)
+		self.assertEqual(self.history(), [(vacancy.pk, '1'), (vacancy.pk, '2')])
+
+## Testing the dry runs and the command
+
+class ScheduleCommandTest(VacancyScheduleTestCase):
+	"""
+	USE CASE
+	--------------------
+		1. A dry run reports the due vacancies without changing them
+		2. The command applies the schedule of the given date
+		3. An invalid date is rejected
+	"""
+	def setUp(self):
+		self.scheduled = self.vacancy(days(-1), days(30), pub_after=True)
+		self.published = self.vacancy(days(-40), days(-1))
+
+	def test_dry_run(self):
+		"""Check that a dry run changes nothing"""
+		report = run_vacancy_schedule(TODAY, dry_run=True)
+		self.assertEqual(report, {'published': [self.scheduled.pk], 'unpublished': [self.published.pk]})
+		self.assertTrue(Vacancy.objects.get(pk=self.scheduled.pk).pub_after)
+		self.assertFalse(Vacancy.objects.get(pk=self.published.pk).expired)
+		self.assertEqual(self.history(), [])
+
+	def test_command(self):
+		"""Check the output of the command, with and without --dry-run"""
+		out = StringIO()
+		call_command('run_vacancy_schedule', '--date', TODAY.isoformat(), '--dry-run', stdout=out)
+		self.assertIn('Due for publication: 1 vacancies', out.getvalue())
+		self.assertIn('  #%s Developer' % self.published.pk, out.getvalue())
+		self.assertEqual(self.history(), [])
+		out = StringIO()
+		call_command('run_vacancy_schedule', '--date', TODAY.isoformat(), stdout=out)
+		self.assertEqual(out.getvalue().splitlines(), ['Applied publication: 1 vacancies',
+													   'Applied unpublication: 1 vacancies'])
+		self.assertEqual(self.history(), [(self.scheduled.pk, '1'), (self.published.pk, '2')])
+
+	def test_invalid_date(self):
+		"""Check that an invalid date raises CommandError"""
+		with self.assertRaises(CommandError):
+			call_command('run_vacancy_schedule', '--date', '10/03/2024')
@@ -0,0 +1,81 @@
+"""
+ Testing the keyword search of vacancies (vacancies.search) on the SQLite index.
+ The test is divided into 2 parts:
+ 	1. Word and prefix matching, ranked by field
+ 	2. Index refreshed only when an indexed field changes
+ """
+
+# Imports
+from __future__ import absolute_import
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from common.models import User
+from companies.models import Company
+from vacancies.models import Vacancy
+from vacancies.search import SQLiteSearchBackend, filter_vacancies_by_text, search_vacancies
+
+
+def titles(vacancies):
+	return [vacancy.employment for vacancy in vacancies]
+
+
+class VacancySearchTest(TestCase):
+	"""
+	USE CASE
+	--------------------
+		1. Every term must be a word of the vacancy, the last one may be a word prefix
+		2. Text inside a word does not match (the former icontains search matched it)
+		3. Matches in the job role rank above matches in the description
+		4. The SQL does not grow with the number of matches
+		5. Saving a vacancy without changing an indexed field does not touch the index
+	"""
+	@classmethod
+	def setUpTestData(cls):
+		cls.user = User.objects.create(username='recruiter', email='recruiter@example.com')
+		cls.company = Company.objects.create(name='Acme', user=cls.user)
+
+	def create(self, employment, description=''):
+		return Vacancy.objects.create(employment=employment, description=description, company=self.company,
+									  user=self.user)
+
+	def test_words_and_prefix(self):
+		self.create('Python Developer')
+		self.create('Internet Sales', description='Sell our network products')
+		self.assertEqual(titles(search_vacancies(Vacancy.objects.all(), 'python')), ['Python Developer'])
+		self.assertEqual(titles(search_vacancies(Vacancy.objects.all(), 'developer pyth')), ['Python Developer'])
+		self.assertEqual(titles(filter_vacancies_by_text(Vacancy.objects.all(), 'netw')), ['Internet Sales'])
+		# Substrings inside a word no longer match
+		self.assertEqual(titles(search_vacancies(Vacancy.objects.all(), 'thon')), [])
+		self.assertEqual(titles(filter_vacancies_by_text(Vacancy.objects.all(), 'ernet')), [])
+		# Every term is required
+		self.assertEqual(titles(search_vacancies(Vacancy.objects.all(), 'python sales')), [])
+
+	def test_rank(self):
+		self.create('Accountant', description='Works with the sales team')
+		self.create('Sales Manager')
+		self.assertEqual(titles(search_vacancies(Vacancy.objects.all(), 'sales')), ['Sales Manager', 'Accountant'])
+
+	def test_query_size(self):
+		for number in range(3):
+			self.create('Cook %s' % number)
+		with CaptureQueriesContext(connection) as few:
+			self.assertEqual(len(search_vacancies(Vacancy.objects.all(), 'cook')), 3)
+		for number in range(3, 40):
+			self.create('Cook %s' % number)
+		with CaptureQueriesContext(connection) as many:
+			self.assertEqual(len(search_vacancies(Vacancy.objects.all(), 'cook')), 40)
+		self.assertEqual(len(few.captured_queries), 1)
+		self.assertEqual(few.captured_queries[0]['sql'], many.captured_queries[0]['sql'])
+
+	def test_reindex_only_on_change(self):
+		vacancy = self.create('Driver')
+		vacancy = Vacancy.objects.get(pk=vacancy.pk)
+		with CaptureQueriesContext(connection) as queries:
+			vacancy.save()
+			vacancy.save(update_fields=['status'])
+		self.assertFalse([query for query in queries.captured_queries if SQLiteSearchBackend.table in query['sql']])
+
+		vacancy.description = 'Forklift licence required'
+		vacancy.save()
+		self.assertEqual(titles(search_vacancies(Vacancy.objects.all(), 'forklift')), ['Driver'])
@@ -16,8 +16,8 @@ from django.conf import settings
 from django.contrib import messages
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.urls import reverse, NoReverseMatch, resolve
-from django.db.models import Count, Q
-from django.http import QueryDict, HttpResponseNotFound, JsonResponse, Http404, HttpResponse
+from django.db.models import Q
+from django.http import QueryDict, HttpResponseNotFound, JsonResponse, Http404
 from django.shortcuts import render,redirect, get_object_or_404
 from django.template import RequestContext,Context, Node, Library, TemplateSyntaxError, VariableDoesNotExist
 from django.template.loader import render_to_string
@@ -28,15 +28,20 @@ import datetime
 utc = datetime.timezone.utc
 from django.utils.translation import gettext as _
 from django.views.decorators.csrf import csrf_exempt
-from weasyprint import HTML
+from common.pdf_cache import cached_pdf_response
 from hashids import Hashids
 from payments.models import *
 from TRM.context_processors import subdomain
+from TRM.tenancy import get_tenant_company, get_tenant_company_or_404
 from TRM.settings import days_default_search, SITE_URL, LOGO_COMPANY_DEFAULT, num_pages, number_objects_page, MEDIA_ROOT
+from vacancies.facets import filter_vacancies, get_vacancy_facets
+from vacancies.candidate_filter import filter_applications
+from vacancies.pipeline import candidate_page, load_stage_candidates, section_candidates, section_counts
+from vacancies.search import normalize_query
 from vacancies.forms import BasicSearchVacancyForm, QuestionVacancyForm, Public_FilesForm, Public_Files_OnlyForm, get_notice_period
 from vacancies.models import Vacancy, PubDate_Search, Vacancy_Status, Postulate, Salary_Type, \
     Employment_Experience, Degree,Question, Vacancy_Files, Candidate_Fav, VacancyStage, \
-    Postulate_Stage, Postulate_Score, Comment, Medium
+    Postulate_Score, Comment, Medium
 from six.moves import range
 referer_hash = Hashids(salt='Job Referal', min_length = 5)
 external_referer_hash = Hashids(salt='Job External Referal', min_length=5)
@@ -56,10 +61,13 @@ def get_vacancy_active_status():
 
 def first_search(request):
     """ 
-    Retrieve the Vacancy_Status instance with codename 'open' representing active vacancies.
+    Reset the search filters stored in session and redirect to the vacancy search.
+
+    The optional ``search`` GET parameter seeds the keyword search, which is
+    answered by the full-text index (see vacancies.search).
 
     Returns:
-        Vacancy_Status or None: The Vacancy_Status object with codename 'open' or None if not found.
+        HttpResponseRedirect: Redirects to the vacancies search results page.
     """
     if request.user.is_authenticated and not request.user.email:
         # If user is logged in and has no email...
@@ -71,7 +79,8 @@ def first_search(request):
     request.session['vacancies_search_state'] = []
     request.session['vacancies_search_employment_type'] = []
     request.session['vacancies_search_pub_date'] = []
-    request.session['vacancies_search_text'] = []
+    # A search can be started directly from a link, e.g. /search/?search=python
+    request.session['vacancies_search_text'] = normalize_query(request.GET.get('search')) or []
     request.session['pub_dates'] = []
     request.session['industries'] = []
     request.session['states'] = []
@@ -123,7 +132,7 @@ def get_vacancies_and_filters(request):
 
     This includes filtering vacancies by industry, area, state, employment type, publication date,
     and search text. It also computes aggregated counts for publication dates, industries, states,
-    and employment types to populate filter options.
+    and employment types to populate filter options (see ``vacancies.facets.get_vacancy_facets``).
 
     Args:
         request (HttpRequest): The current HTTP request.
@@ -133,7 +142,6 @@ def get_vacancies_and_filters(request):
     """
     #### Section Vacancies ####
     all_vacancies = Vacancy.publishedjobs.all()
-    vacancies = all_vacancies
 
     # The filters are added to vacancies based on search parameters
     vacancies_search_industry = request.session.get('vacancies_search_industry')
@@ -143,61 +151,15 @@ def get_vacancies_and_filters(request):
     vacancies_search_pub_date = request.session.get('vacancies_search_pub_date')
     vacancies_search_text = request.session.get('vacancies_search_text')
 
-    del_filters = False
-
-    if vacancies_search_industry:
-        vacancies = vacancies.filter(industry_id=vacancies_search_industry)
-        del_filters = True
-    if vacancies_search_area:
-        vacancies = vacancies.filter(area_id=vacancies_search_area)
-        del_filters = True
-    if vacancies_search_state:
-        vacancies = vacancies.filter(state_id=vacancies_search_state)
-        del_filters = True
-    if vacancies_search_employment_type:
-        vacancies = vacancies.filter(employmentType_id=vacancies_search_employment_type)
-        del_filters = True
-    if vacancies_search_text:
-        vacancies = vacancies.filter(Q(employment__icontains=vacancies_search_text) |
-                                     Q(description__icontains=vacancies_search_text))
-        del_filters = True
-
-    request.session['del_filters'] = del_filters
-
-    ####  Home section filters the side panel ####
-
-    # Starts section date Published #
-    pubDates = PubDate_Search.objects.all()
-    pub_dates = []
-    for pubDate in pubDates:
-        vacancy_pub_dates = all_vacancies
-        # Right way to get the current date and avoid warning
-        # (DateTimeField received a naive datetime while time zone support is active)
-        now = datetime.utcnow().replace(tzinfo=utc)
-        search_date = now - timedelta(days=pubDate.days)
-
-
-        # State, Type of Employment
-        if vacancies_search_state and vacancies_search_employment_type:
-            vacancy_pub_dates = vacancy_pub_dates.filter(state_id=vacancies_search_state,
-                                                         employmentType_id=vacancies_search_employment_type)
-        # State
-        elif vacancies_search_state:
-            vacancy_pub_dates = vacancy_pub_dates.filter(state_id=vacancies_search_state)
-        # Type of Employment
-        elif vacancies_search_employment_type:
-            vacancy_pub_dates = vacancy_pub_dates.filter(employmentType_id=vacancies_search_employment_type)
-        else:
-            pass
-        # Words from search form
-        if vacancies_search_text:
-            vacancy_pub_dates = vacancy_pub_dates.filter(Q(employment__icontains=vacancies_search_text) |
-                                                         Q(description__icontains=vacancies_search_text))
-
-        vacancy_pub_dates = vacancy_pub_dates.filter(pub_date__gte=search_date)
-
-        if vacancy_pub_dates:
-            pub_dates.append([pubDate, vacancy_pub_dates.count()])
+    vacancies = filter_vacancies(all_vacancies,
+                                 industry=vacancies_search_industry,
+                                 area=vacancies_search_area,
+                                 state=vacancies_search_state,
+                                 employment_type=vacancies_search_employment_type,
+                                 search_text=vacancies_search_text)
+    request.session['del_filters'] = bool(vacancies_search_industry or vacancies_search_area or
+                                          vacancies_search_state or vacancies_search_employment_type or
+                                          vacancies_search_text)
 
     if not vacancies_search_pub_date:
         now = datetime.utcnow().replace(tzinfo=utc)
@@ -206,115 +168,20 @@ def get_vacancies_and_filters(request):
                                                                               days=days_default_search)
 
     vacancies = vacancies.filter(pub_date__gte=vacancies_search_pub_date)
-    # End section Date Published #
-
-    # Start Section Industries #
-    vacancy_industries = all_vacancies
-
-    # State, Type of Employment
-    if vacancies_search_state and vacancies_search_employment_type:
-        vacancy_industries = vacancy_industries.filter(state_id=vacancies_search_state,
-                                                       employmentType_id=vacancies_search_employment_type). \
-            order_by('industry').values('industry').annotate(count=Count('industry'))
-    # State
-    elif vacancies_search_state:
-        vacancy_industries = vacancy_industries.filter(state_id=vacancies_search_state). \
-            order_by('industry').values('industry').annotate(count=Count('industry'))
-    # Type of Employment
-    elif vacancies_search_employment_type:
-        vacancy_industries = vacancy_industries.filter(employmentType_id=vacancies_search_employment_type). \
-            order_by('industry').values('industry').annotate(count=Count('industry'))
-    else:
-        vacancy_industries = vacancy_industries.filter(status=get_vacancy_active_status()). \
-            order_by('industry').values('industry').annotate(count=Count('industry'))
-    # Words from Search Form
-    if vacancies_search_text:
-        vacancy_industries = vacancy_industries.filter(Q(employment__icontains=vacancies_search_text) |
-                                                       Q(description__icontains=vacancies_search_text))
-
-    vacancy_industries = vacancy_industries.filter(pub_date__gte=vacancies_search_pub_date)
-
-    industries = []
-    for industry in vacancy_industries:
-        if industry['industry']:
-            count = industry['count']
-            industry = get_object_or_404(Industry, pk=industry['industry'])
-            industries.append([industry, count])
-    # End of section Industries #
-
-    # Start of section States #
-    vacancy_states = all_vacancies
-
-    # Industries, Type of Employment
-    if vacancies_search_industry and vacancies_search_employment_type:
-        vacancy_states = vacancy_states.filter(industry_id=vacancies_search_industry,
-                                               employmentType_id=vacancies_search_employment_type). \
-            order_by('state').values('state').annotate(count=Count('state'))
-    # Industries
-    elif vacancies_search_industry:
-        vacancy_states = vacancy_states.filter(industry_id=vacancies_search_industry). \
-            order_by('state').values('state').annotate(count=Count('state'))
-    # Type of Employment
-    elif vacancies_search_employment_type:
-        vacancy_states = vacancy_states.filter(employmentType_id=vacancies_search_employment_type). \
-            order_by('state').values('state').annotate(count=Count('state'))
-    else:
-        vacancy_states = vacancy_states.filter(status=get_vacancy_active_status()). \
-            order_by('state').values('state').annotate(count=Count('state'))
-    # Words from Search Form
-    if vacancies_search_text:
-        vacancy_states = vacancy_states.filter(Q(employment__icontains=vacancies_search_text) |
-                                               Q(description__icontains=vacancies_search_text))
-
-    vacancy_states = vacancy_states.filter(pub_date__gte=vacancies_search_pub_date)
-
-    states = []
-    for state in vacancy_states:
-        if state['state']:
-            count = state['count']
-            # state = get_object_or_404(State, pk=state['state'])
-            states.append([state, count])
-    # End of section States #
-
-    # Start of section Types of Employment #
-    vacancy_employment_types = all_vacancies
-
-    # Industries, State
-    if vacancies_search_industry and vacancies_search_state:
-        vacancy_employment_types = vacancy_employment_types.filter(industry_id=vacancies_search_industry,
-                                                                   state_id=vacancies_search_state). \
-            order_by('employmentType').values('employmentType').annotate(count=Count('employmentType'))
-    # Industries
-    elif vacancies_search_industry:
-        vacancy_employment_types = vacancy_employment_types.filter(industry_id=vacancies_search_industry). \
-            order_by('employmentType').values('employmentType').annotate(count=Count('employmentType'))
-    # State
-    elif vacancies_search_state:
-        vacancy_employment_types = vacancy_employment_types.filter(state_id=vacancies_search_state). \
-            order_by('employmentType').values('employmentType').annotate(count=Count('employmentType'))
-    else:
-        vacancy_employment_types = vacancy_employment_types.filter(status=get_vacancy_active_status()). \
-            order_by('employmentType').values('employmentType').annotate(count=Count('employmentType'))
-    # Words from Search Form
-    if vacancies_search_text:
-        vacancy_employment_types = vacancy_employment_types.filter(Q(employment__icontains=vacancies_search_text) |
-                                                                   Q(description__icontains=vacancies_search_text))
-
-    vacancy_employment_types = vacancy_employment_types.filter(pub_date__gte=vacancies_search_pub_date)
-
-    employment_types = []
-    for employment_type in vacancy_employment_types:
-        if employment_type['employmentType']:
-            count = employment_type['count']
-            employmenType = get_object_or_404(Employment_Type, pk=employment_type['employmentType'])
-            employment_types.append([employmenType, count])
-    # End of section Types of Employment #
+
+    ####  Home section filters the side panel ####
+    facets = get_vacancy_facets(all_vacancies,
+                                industry=vacancies_search_industry,
+                                state=vacancies_search_state,
+                                employment_type=vacancies_search_employment_type,
+                                search_text=vacancies_search_text,
+                                pub_date=vacancies_search_pub_date)
 
     # The results are assigned to the session variable
-    request.session['pub_dates'] = pub_dates
-    request.session['industries'] = industries
-    request.session['states'] = states
-    request.session['employment_types'] = employment_types
+    request.session['pub_dates'] = facets['pub_dates']
+    request.session['industries'] = facets['industries']
+    request.session['states'] = facets['states']
+    request.session['employment_types'] = facets['employment_types']
 
     return vacancies
 
@@ -460,10 +327,7 @@ def search_vacancies(request, template_name):
             now = datetime.utcnow().replace(tzinfo=utc)
             request.session['vacancies_search_pub_date'] = now - timedelta(days=pubDateSearch.days)
             request.session['vacancies_search_pub_date_days'] = pubDateSearch
-            if len(form.data['search']) > 4:
-                request.session['vacancies_search_text'] = form.data['search']
-            else:
-                request.session['vacancies_search_text'] = None
+            request.session['vacancies_search_text'] = form.cleaned_data.get('search')
             vacancies = get_vacancies_and_filters(request)
             if gender.codename != 'indistinct':
                 vacancies = vacancies.filter(gender_id=gender)
@@ -1127,6 +991,8 @@ def vacancy_stage_details(request, vacancy_id=None, vacancy_stage=None, stage_se
         - Section 2: Discarded candidates.
     - Includes recruiter rating, comments, and interview schedule data per candidate.
     - Gathers additional data like form questions, counts per section, available stages, etc.
+    - Candidates are paginated by id (``?after=<id>``) and loaded in a fixed
+      number of queries, see vacancies.pipeline.
     Args:
         request (HttpRequest): The HTTP request object.
         vacancy_id (int, optional): The primary key of the vacancy.
@@ -1150,7 +1016,7 @@ def vacancy_stage_details(request, vacancy_id=None, vacancy_stage=None, stage_se
     if request.user.is_authenticated:
         # raise ValueError()
         try:
-            recruiter = Recruiter.objects.get(user=request.user, user__is_active=True, company__subdomain__slug=subdomain_data['active_subdomain'])
+            recruiter = Recruiter.objects.get(user=request.user, user__is_active=True, company=get_tenant_company(request))
         except:
             raise Http404
     else:
@@ -1170,7 +1036,7 @@ def vacancy_stage_details(request, vacancy_id=None, vacancy_stage=None, stage_se
 
             user_profile = None
 
-            if user.is_authenticated():
+            if user.is_authenticated:
                 user_profile = user.profile.codename
                        
         except Http404:
@@ -1200,56 +1066,26 @@ def vacancy_stage_details(request, vacancy_id=None, vacancy_stage=None, stage_se
     else:
         public_form = Public_Files_OnlyForm()
     finalize=False
-    if not stage_section==0 or not stage_section ==1 or not stage_section ==2:
-        stage_section == 0
+    # The subdomain urls pass the stage order and the section as integers
+    vacancy_stage = str(vacancy_stage) if vacancy_stage is not None else None
+    stage_section = str(stage_section)
+    if stage_section not in ('0', '1', '2'):
+        stage_section = '0'
+    stages = list(VacancyStage.objects.filter(vacancy=vacancy).select_related('stage'))
+    counts = section_counts(vacancy, stages)
+    process = next((stage for stage in stages if vacancy_stage and str(stage.order) == vacancy_stage), None)
     if vacancy_stage and vacancy_stage!='100':
-        # print('vacancy_stage')
-        # print(vacancy_stage)
-        # print(vacancy)
-        vacancystage = get_object_or_404(VacancyStage, vacancy = vacancy,order = int(vacancy_stage))
-        # print(vacancystage.id)
-        if stage_section == '1':
-            candidates = Postulate.objects.filter(Q(vacancy=vacancy), Q(finalize=True)|Q(vacancy_stage__order__gt=vacancy_stage))
-            # public_candidates = Public_Postulate.objects.filter(Q(vacancy=vacancy), Q(finalize=True)|Q(vacancy_stage__order__gt=vacancy_stage))
-        elif stage_section =='2':
-            candidates = vacancystage.postulate_set.all().filter(vacancy=vacancy,discard=True)
-            # public_candidates = vacancystage.public_postulate_set.all().filter(vacancy=vacancy, discard = True)
-        else:
-            candidates = vacancystage.postulate_set.all().filter(vacancy =vacancy).exclude(discard=True)
-            # public_candidates = vacancystage.public_postulate_set.all().filter(vacancy = vacancy).exclude(discard=True)
-        section0_count = int(vacancystage.postulate_set.all().filter(vacancy =vacancy).exclude(discard=True).count()) 
-        section1_count = int(Postulate.objects.filter(vacancy=vacancy, vacancy_stage__order__gt=vacancy_stage).count()) 
-        section2_count = int(vacancystage.postulate_set.all().filter(vacancy=vacancy,discard=True).count()) 
-        # section0_count = int(vacancystage.postulate_set.all().filter(vacancy =vacancy).exclude(discard=True).count()) + int(vacancystage.public_postulate_set.all().filter(vacancy = vacancy).exclude(discard=True).count())
-        # section1_count = int(Postulate.objects.filter(vacancy=vacancy, vacancy_stage__order__gt=vacancy_stage).count()) + int(Public_Postulate.objects.filter(vacancy=vacancy, vacancy_stage__order__gt=vacancy_stage).count())
-        # section2_count = int(vacancystage.postulate_set.all().filter(vacancy=vacancy,discard=True).count()) + int(vacancystage.public_postulate_set.all().filter(vacancy=vacancy, discard = True).count())
-                # raise Http404
-            # except:
-                # raise Http404
-            # except:
-    # elif vacancy_stage == '100':  
-        #     if stage_section == '1':
-        #         candidates = Postulate.objects.filter(Q(vacancy = vacancy), Q(finalize=True)|~Q(vacancy_stage=None))
-        #         public_candidates = Public_Postulate.objects.filter(Q(vacancy = vacancy), Q(finalize=True)|~Q(vacancy_stage=None))
-        #     elif stage_section == '2':
-        #         candidates = Postulate.objects.filter(vacancy = vacancy, discard=True, vacancy_stage=None)
-        #         public_candidates = Public_Postulate.objects.filter(vacancy = vacancy, discard=True, vacancy_stage=None)
-        #         # raise ValueError()
-        #     else:
-        #         candidates = Postulate.objects.filter(Q(vacancy = vacancy), vacancy_stage=None, finalize=False).exclude(discard = True)
-        #         public_candidates = Public_Postulate.objects.filter(Q(vacancy = vacancy), vacancy_stage=None, finalize=False).exclude(discard=True)
-        #     section0_count = int(Postulate.objects.filter(Q(vacancy = vacancy), vacancy_stage=None, finalize=False).exclude(discard = True).count()) + int(Public_Postulate.objects.filter(Q(vacancy = vacancy), vacancy_stage=None, finalize=False).exclude(discard=True).count())
-        #     section1_count = int(Postulate.objects.filter(Q(vacancy = vacancy), Q(finalize=True)|~Q(vacancy_stage=None)).count()) + int(Public_Postulate.objects.filter(Q(vacancy = vacancy), Q(finalize=True)|~Q(vacancy_stage=None)).count())
-        #     section2_count = int(Postulate.objects.filter(Q(vacancy = vacancy), discard=True, finalize=False, vacancy_stage=None).count()) + int(Public_Postulate.objects.filter(Q(vacancy = vacancy), discard=True, finalize=False, vacancy_stage=None).count())
+        if process is None:
+            raise Http404
+        vacancystage = process
+        section0_count, section1_count, section2_count = counts[vacancystage.pk]
     else:
+        vacancystage = None
         section0_count = None
         section1_count = None
         section2_count = None
-        candidates=None
-        public_candidates = None
         finalize=True
-        candidates = Postulate.objects.filter(vacancy = vacancy, finalize=True, discard = False)
-        # public_candidates = Public_Postulate.objects.filter(vacancy = vacancy, finalize=True, discard = False)
+    candidates = section_candidates(vacancy, vacancystage, stage_section)
 
     # To indicate whether a question was raised in the vacancy
     question_published = None
@@ -1259,63 +1095,29 @@ def vacancy_stage_details(request, vacancy_id=None, vacancy_stage=None, stage_se
         company = Company.objects.get(user=request.user)
     except:
         company = None
-    stages = VacancyStage.objects.filter(vacancy=vacancy)
-    for stage in stages:
-        # count0 = int(stage.postulate_set.all().filter(vacancy =vacancy).exclude(discard=True).count()) + int(stage.public_postulate_set.all().filter(vacancy = vacancy).exclude(discard=True).count())
-        # count1 = int(Postulate.objects.filter(vacancy=vacancy, vacancy_stage__order__gt=stage.order).count()) + int(Public_Postulate.objects.filter(vacancy=vacancy, vacancy_stage__order__gt=stage.order).count())
-        # count2 = int(stage.postulate_set.all().filter(vacancy=vacancy,discard=True).count()) + int(stage.public_postulate_set.all().filter(vacancy=vacancy, discard = True).count())
-        # count3 = int(Postulate.objects.filter(vacancy=vacancy,finalize=True).count()) + int(Public_Postulate.objects.filter(vacancy=vacancy,finalize=True).count())
-        count0 = int(stage.postulate_set.all().filter(vacancy =vacancy).exclude(discard=True).count())
-        count1 = int(Postulate.objects.filter(vacancy=vacancy, vacancy_stage__order__gt=stage.order).count())
-        count2 = int(stage.postulate_set.all().filter(vacancy=vacancy,discard=True).count())
-        count3 = int(Postulate.objects.filter(vacancy=vacancy,finalize=True).count())
-        stage.total_count = count0 + count1 + count2
-    finalized_count = Postulate.objects.filter(vacancy=vacancy, finalize = True).count()
-    stageids=[]
-    for stage in stages:
-        stageids.append(stage.stage.id)
-    allstages = Stage.objects.filter(company=vacancy.company).exclude(id__in=stageids)
-    try: 
-        process = VacancyStage.objects.get(vacancy = vacancy, order = vacancy_stage)
-        
-    except:
-        process = None
-    for candidate in candidates:
-        candidate.process,created = Postulate_Stage.objects.get_or_create(postulate=candidate, vacancy_stage=process)
-        candidate.processes = candidate.postulate_stage_set.all()
-        candidate.comments = candidate.comment_set.all().filter(comment_type__lt=2)
-        candidate.timeline = candidate.comment_set.all().filter(comment_type__gte=2)
-        rated = candidate.process.scores.all().filter(recruiter=recruiter)
-        if rated:
-            candidate.hasRated = True
-        else:
-            candidate.hasRated = False
-        if candidate.hasRated:
-            candidate.comment = rated[0].get_comment
-        else:
-            candidate.comment=None
-    for candidate in candidates:
-         candidate.schedule = candidate.schedule_set.filter(user=request.user,status=0)
-         if candidate.schedule:
-            candidate.schedule = candidate.schedule[0]
-    # for candidate in public_candidates:
-        #     candidate.process,created = Public_Postulate_Stage.objects.get_or_create(postulate=candidate, vacancy_stage=process)
-        #     candidate.processes = candidate.public_postulate_stage_set.all()
-        #     candidate.comments = candidate.comment_set.all().filter(comment_type__lt=2)
-        #     candidate.timeline = candidate.comment_set.all().filter(comment_type__gte=2)
-        #     rated = candidate.process.scores.all().filter(recruiter=recruiter)
-        #     if rated:
-        #         candidate.hasRated = True
-        #     else:
-        #         candidate.hasRated = False
-        #     if candidate.hasRated:
-        #         candidate.comment = rated[0].get_comment
-        #     else:
-        #         candidate.comment=None
+    finalized_count = counts['finalized']
+    allstages = Stage.objects.filter(company=vacancy.company).exclude(id__in=[stage.stage_id for stage in stages])
     if process and request.user.recruiter in process.recruiters.all():
         isProcessMember = True
     else:
         isProcessMember = False
+    # Keywords of the filter box, applied to the whole section before it is paged.
+    # The box keeps them in the url and in a cookie, read when the url has none.
+    candidate_filter = ''
+    if (recruiter.is_manager() or isProcessMember) and stage_section == '0' \
+            and vacancy.company.check_service('AS_FILTER_CANDIDATES'):
+        candidate_filter = request.GET.get('filter', request.COOKIES.get('candidate-filter', ''))
+        try:
+            candidates = filter_applications(candidates, candidate_filter, vacancy)
+        except ValueError:
+            candidate_filter = ''
+    # One page of candidates with their ratings, comments, schedules and tags, see vacancies.pipeline
+    try:
+        after = int(request.GET.get('after') or 0)
+    except ValueError:
+        after = None
+    candidates, next_after = candidate_page(candidates, after)
+    candidates = load_stage_candidates(candidates, vacancy, process, recruiter, request.user)
 
 
     # vacancies = Vacancy.objects.filter(company = company)
@@ -1332,6 +1134,8 @@ def vacancy_stage_details(request, vacancy_id=None, vacancy_stage=None, stage_se
                                'allstages': allstages,
                                'current_process': process,
                                'candidates': candidates,
+                               'next_after': next_after,
+                               'candidate_filter': candidate_filter,
                                'finalize_count': finalized_count,
                                # 'public_candidates': public_candidates,
                                'today': today,
@@ -1354,14 +1158,15 @@ def vacancy_to_pdf(request, vacancy_id):
     Generates a PDF version of the vacancy details.
 
     - Validates user ownership to determine if it's their vacancy.
-    - Renders a template with company logo and media info into a PDF.
+    - Renders a template with company logo and media info into a PDF, cached
+      until the vacancy changes.
 
     Args:
         request (HttpRequest): The HTTP request object.
         vacancy_id (int): The ID of the vacancy to generate the PDF for.
 
     Returns:
-        HttpResponse: A PDF file download response.
+        HttpResponse: A streamed PDF file download response, or 304 Not Modified.
     """
     from TRM.settings import MEDIA_URL
     vacancy = get_object_or_404(Vacancy, pk=vacancy_id)
@@ -1369,24 +1174,24 @@ def vacancy_to_pdf(request, vacancy_id):
     user = request.user
     # user_profile = None
     my_vacancy = False
-    if user.is_authenticated():
+    if user.is_authenticated:
         if request.user == vacancy.user:
             my_vacancy = True
 
     pdf_name = '%s_%s.pdf' % (vacancy.employment[:30].replace(' ', '_'), vacancy.pk)
-    html_string = render_to_string('vacancy_details_pdf.html',
-                                    context={'vacancy': vacancy,
-                                             'MEDIA_URL': MEDIA_URL,
-                                             'logo_pdf': logo_pdf,
-                                             'my_vacancy': my_vacancy,
-                                             'LOGO_COMPANY_DEFAULT': LOGO_COMPANY_DEFAULT,
-                                             })
-
-    # Create PDF response using WeasyPrint
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="%s"' % pdf_name
-    HTML(string=html_string, base_url=request.build_absolute_uri('/')).write_pdf(response)
-    return response
+
+    def render_html():
+        return render_to_string('vacancy_details_pdf.html',
+                                context={'vacancy': vacancy,
+                                         'MEDIA_URL': MEDIA_URL,
+                                         'logo_pdf': logo_pdf,
+                                         'my_vacancy': my_vacancy,
+                                         'LOGO_COMPANY_DEFAULT': LOGO_COMPANY_DEFAULT,
+                                         })
+
+    # PDF rendered with WeasyPrint once per vacancy version (see common.pdf_cache)
+    return cached_pdf_response(request, 'vacancy', vacancy.pk, 'owner' if my_vacancy else 'public', pdf_name,
+                               render_html, request.build_absolute_uri('/'))
 
 
 def vacancies_by_company(request, company_id):
@@ -1568,7 +1373,7 @@ def public_apply(request, vacancy_id = None, referer = None, external_referer=No
     if not subdomain_data['active_host']:
         raise Http404
     try:
-        company = Company.objects.get(subdomain__slug = subdomain_data['active_subdomain'])
+        company = get_tenant_company(request)
     except:
         raise Http404
 
@@ -2294,7 +2099,7 @@ def vacancy_talent_sourcing(request, vacancy_id):
     recruiter = get_object_or_404(Recruiter,user=request.user, user__is_active=True)
     if not recruiter.is_manager():
         raise Http404
-    company = get_object_or_404(Company, subdomain__slug=subdomain_data['active_subdomain'])
+    company = get_tenant_company_or_404(request)
     if not company.check_service('JP_POST'):
         raise Http404
     vacancy = get_object_or_404(Vacancy, pk=vacancy_id,company__in=recruiter.company.all())
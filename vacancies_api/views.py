@@ -3,13 +3,13 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import redirect
 from django.urls import reverse, resolve
-from django.db.models import Q, Count
+from django.db.models import Q
 #from django.utils.timezone import utc, now
 from datetime import timezone
 from django.utils.timezone import now
 from django.utils.translation import gettext as _
 from django.shortcuts import get_object_or_404
-from django.http import JsonResponse, Http404, HttpResponse
+from django.http import JsonResponse, Http404
 from django.template.loader import render_to_string
 from django.contrib import messages
 from rest_framework import permissions
@@ -17,8 +17,7 @@ from django.contrib.auth.models import AnonymousUser
 from django.middleware import csrf
 from rest_framework.pagination import PageNumberPagination
 from datetime import datetime, timedelta, date
-from weasyprint import HTML
-import tempfile
+from common.pdf_cache import cached_pdf_response
 import random
 import traceback
 from hashids import Hashids
@@ -34,11 +33,16 @@ from customField.forms import TemplatedForm
 from payments.models import *
 from TRM.settings import MEDIA_URL, LOGO_COMPANY_DEFAULT
 from TRM.context_processors import subdomain
+from TRM.tenancy import get_tenant, get_tenant_company_or_404
 from TRM.settings import days_default_search, SITE_URL, LOGO_COMPANY_DEFAULT, num_pages, number_objects_page, MEDIA_ROOT
+from vacancies.facets import filter_vacancies, get_vacancy_facets
+from vacancies.candidate_filter import filter_applications
+from vacancies.pipeline import candidate_page, load_stage_candidates, section_candidates, section_counts
+from vacancies.search import normalize_query, search_vacancies
 from vacancies.forms import BasicSearchVacancyForm, QuestionVacancyForm, Public_FilesForm, Public_Files_OnlyForm, get_notice_period
 from vacancies.models import Vacancy, PubDate_Search, Vacancy_Status, Postulate, Salary_Type, \
     Employment_Experience, Degree, Question, Vacancy_Files, Candidate_Fav, VacancyStage, \
-    Postulate_Stage, Postulate_Score, Comment, Medium, Industry
+    Postulate_Score, Comment, Medium, Industry
 from .serializers import (VacancyStatusSerializer, PubDateSearchSerializer, EmploymentExperienceSerializer, SalaryTypeSerializer,
     VacancySerializer, PublishHistorySerializer, QuestionSerializer, CandidateFavSerializer, 
     VacancyFilesSerializer, VacancyStageSerializer, StageCriterionSerializer, VacancyTagsSerializer, MediumSerializer, 
@@ -93,7 +97,7 @@ class FirstSearchAPIView(APIView):
             'vacancies_search_state': [],
             'vacancies_search_employment_type': [],
             'vacancies_search_pub_date': [],
-            'vacancies_search_text': [],
+            'vacancies_search_text': normalize_query(request.query_params.get('search')) or [],
             'pub_dates': [],
             'industries': [],
             'states': [],
@@ -149,7 +153,6 @@ class VacancyAndFilterAPIView(APIView):
     def get(self, request):
         session = request.session
         all_vacancies = Vacancy.publishedjobs.all()
-        vacancies = all_vacancies
 
         vacancies_search_industry = session.get('vacancies_search_industry')
         vacancies_search_area = session.get('vacancies_search_area')
@@ -158,28 +161,18 @@ class VacancyAndFilterAPIView(APIView):
         vacancies_search_pub_date = session.get('vacancies_search_pub_date')
         vacancies_search_text = session.get('vacancies_search_text')
 
-        del_filters = False
-
-        if vacancies_search_industry:
-            vacancies = vacancies.filter(industry_id=vacancies_search_industry)
-            del_filters = True
-        if vacancies_search_area:
-            vacancies = vacancies.filter(area_id=vacancies_search_area)
-            del_filters = True
-        if vacancies_search_state:
-            vacancies = vacancies.filter(state_id=vacancies_search_state)
-            del_filters = True
-        if vacancies_search_employment_type:
-            vacancies = vacancies.filter(employmentType_id=vacancies_search_employment_type)
-            del_filters = True
-        if vacancies_search_text:
-            vacancies = vacancies.filter(
-                Q(employment__icontains=vacancies_search_text) |
-                Q(description__icontains=vacancies_search_text)
-            )
-            del_filters = True
-
-        session['del_filters'] = del_filters
+        vacancies = filter_vacancies(
+            all_vacancies,
+            industry=vacancies_search_industry,
+            area=vacancies_search_area,
+            state=vacancies_search_state,
+            employment_type=vacancies_search_employment_type,
+            search_text=vacancies_search_text
+        )
+        session['del_filters'] = bool(
+            vacancies_search_industry or vacancies_search_area or vacancies_search_state or
+            vacancies_search_employment_type or vacancies_search_text
+        )
 
         now = datetime.utcnow().replace(tzinfo=timezone.utc)
 
@@ -189,97 +182,36 @@ class VacancyAndFilterAPIView(APIView):
 
         vacancies = vacancies.filter(pub_date__gte=vacancies_search_pub_date)
 
-        pub_dates = []
-        for pubDate in PubDate_Search.objects.all():
-            search_date = now - timedelta(days=pubDate.days)
-            filtered = all_vacancies.filter(pub_date__gte=search_date)
-
-            if vacancies_search_state:
-                filtered = filtered.filter(state_id=vacancies_search_state)
-            if vacancies_search_employment_type:
-                filtered = filtered.filter(employmentType_id=vacancies_search_employment_type)
-            if vacancies_search_text:
-                filtered = filtered.filter(
-                    Q(employment__icontains=vacancies_search_text) |
-                    Q(description__icontains=vacancies_search_text)
-                )
-
-            count = filtered.count()
-            if count:
-                pub_dates.append({
-                    'id': pubDate.id,
-                    'name': pubDate.name,
-                    'days': pubDate.days,
-                    'codename': pubDate.codename,
-                    'count': count
-                })
-
-        # Start: Industries
-        industries = []
-        industry_qs = all_vacancies.filter(pub_date__gte=vacancies_search_pub_date)
-        if vacancies_search_text:
-            industry_qs = industry_qs.filter(
-                Q(employment__icontains=vacancies_search_text) |
-                Q(description__icontains=vacancies_search_text)
-            )
-        if vacancies_search_state:
-            industry_qs = industry_qs.filter(state_id=vacancies_search_state)
-        if vacancies_search_employment_type:
-            industry_qs = industry_qs.filter(employmentType_id=vacancies_search_employment_type)
-
-        industry_annotated = industry_qs.values('industry').annotate(count=Count('industry')).order_by('industry')
-        for entry in industry_annotated:
-            if entry['industry']:
-                industry = get_object_or_404(Industry, pk=entry['industry'])
-                industries.append({
-                    'id': industry.id,
-                    'name': industry.name,
-                    'count': entry['count']
-                })
-
-        # Start: States
-        states = []
-        state_qs = all_vacancies.filter(pub_date__gte=vacancies_search_pub_date)
-        if vacancies_search_text:
-            state_qs = state_qs.filter(
-                Q(employment__icontains=vacancies_search_text) |
-                Q(description__icontains=vacancies_search_text)
-            )
-        if vacancies_search_industry:
-            state_qs = state_qs.filter(industry_id=vacancies_search_industry)
-        if vacancies_search_employment_type:
-            state_qs = state_qs.filter(employmentType_id=vacancies_search_employment_type)
-
-        state_annotated = state_qs.values('state').annotate(count=Count('state')).order_by('state')
-        for entry in state_annotated:
-            if entry['state']:
-                state = get_object_or_404(State, pk=entry['state'])
-                states.append({
-                    'id': state.id,
-                    'name': state.name,
-                    'count': entry['count']
-                })
-        employment_types = []
-        etype_qs = all_vacancies.filter(pub_date__gte=vacancies_search_pub_date)
-        if vacancies_search_text:
-            etype_qs = etype_qs.filter(
-                Q(employment__icontains=vacancies_search_text) |
-                Q(description__icontains=vacancies_search_text)
-            )
-        if vacancies_search_industry:
-            etype_qs = etype_qs.filter(industry_id=vacancies_search_industry)
-        if vacancies_search_state:
-            etype_qs = etype_qs.filter(state_id=vacancies_search_state)
-
-        etype_annotated = etype_qs.values('employmentType').annotate(count=Count('employmentType')).order_by('employmentType')
-        for entry in etype_annotated:
-            if entry['employmentType']:
-                etype = get_object_or_404(Employment_Type, pk=entry['employmentType'])
-                employment_types.append({
-                    'id': etype.id,
-                    'name': etype.name,
-                    'count': entry['count']
-                })
+        facets = get_vacancy_facets(
+            all_vacancies,
+            industry=vacancies_search_industry,
+            state=vacancies_search_state,
+            employment_type=vacancies_search_employment_type,
+            search_text=vacancies_search_text,
+            pub_date=vacancies_search_pub_date
+        )
+        pub_dates = [{
+            'id': pubDate.id,
+            'name': pubDate.name,
+            'days': pubDate.days,
+            'codename': pubDate.codename,
+            'count': count
+        } for pubDate, count in facets['pub_dates']]
+        industries = [{
+            'id': industry.id,
+            'name': industry.name,
+            'count': count
+        } for industry, count in facets['industries']]
+        states = [{
+            'id': state,
+            'name': state,
+            'count': count
+        } for state, count in facets['states']]
+        employment_types = [{
+            'id': etype.id,
+            'name': etype.name,
+            'count': count
+        } for etype, count in facets['employment_types']]
 
         vacancy_data = VacancySerializer(vacancies, many=True).data
         return Response({
@@ -437,8 +369,8 @@ class VacancySearchAPIView(APIView):
             vacancies = vacancies.filter(state_id=filters['state_id'])
         if filters.get('industry_id'):
             vacancies = vacancies.filter(industry_id=filters['industry_id'])
-        if search_text and len(search_text) > 4:
-            vacancies = vacancies.filter(title__icontains=search_text)
+        if search_text:
+            vacancies = search_vacancies(vacancies, search_text)
         paginator = self.VacancyPagination()
         result_page = paginator.paginate_queryset(vacancies, request)
 
@@ -551,9 +483,12 @@ class VacancyDetailsAPIView(APIView):
 
 class VacancyStageDetailsAPIView(APIView):
 
-    def get_recruiter(self, user, active_subdomain):
+    def get_recruiter(self, request):
+        company = get_tenant(request).company
+        if company is None:
+            return None
         try:
-            return Recruiter.objects.get(user=user, user__is_active=True, company__subdomain__slug=active_subdomain)
+            return Recruiter.objects.get(user=request.user, user__is_active=True, company=company)
         except Recruiter.DoesNotExist:
             return None
 
@@ -565,7 +500,7 @@ class VacancyStageDetailsAPIView(APIView):
         if not subdomain_data['active_subdomain']:
             return Response({"detail": "Invalid subdomain"}, status=status.HTTP_404_NOT_FOUND)
 
-        recruiter = self.get_recruiter(request.user, subdomain_data['active_subdomain'])
+        recruiter = self.get_recruiter(request)
         if not recruiter:
             return Response({"detail": "Recruiter not found or unauthorized"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -582,52 +517,44 @@ class VacancyStageDetailsAPIView(APIView):
         if not my_vacancy and not vacancy in Vacancy.publishedjobs.all():
             return Response({"detail": error_message}, status=status.HTTP_404_NOT_FOUND)
 
+        vacancy_stage = str(vacancy_stage) if vacancy_stage is not None else None
+        stage_section = str(stage_section)
         # Validate stage_section, default to '0' if invalid
         if stage_section not in ['0', '1', '2']:
             stage_section = '0'
 
-        candidates = None
         section0_count = section1_count = section2_count = None
         finalize = False
 
+        # Counts and one page of candidates loaded in a fixed number of queries, see vacancies.pipeline
+        stages = list(VacancyStage.objects.filter(vacancy=vacancy))
+        counts = section_counts(vacancy, stages)
+        process = next((stage for stage in stages if vacancy_stage and str(stage.order) == vacancy_stage), None)
         if vacancy_stage and vacancy_stage != '100':
-            vacancystage = get_object_or_404(VacancyStage, vacancy=vacancy, order=int(vacancy_stage))
-            if stage_section == '1':
-                candidates = Postulate.objects.filter(Q(vacancy=vacancy), Q(finalize=True) | Q(vacancy_stage__order__gt=vacancy_stage))
-            elif stage_section == '2':
-                candidates = vacancystage.postulate_set.filter(vacancy=vacancy, discard=True)
-            else:
-                candidates = vacancystage.postulate_set.filter(vacancy=vacancy).exclude(discard=True)
-
-            section0_count = vacancystage.postulate_set.filter(vacancy=vacancy).exclude(discard=True).count()
-            section1_count = Postulate.objects.filter(vacancy=vacancy, vacancy_stage__order__gt=vacancy_stage).count()
-            section2_count = vacancystage.postulate_set.filter(vacancy=vacancy, discard=True).count()
-
+            if process is None:
+                raise Http404
+            section0_count, section1_count, section2_count = counts[process.pk]
+            candidates = section_candidates(vacancy, process, stage_section)
         else:
             finalize = True
-            candidates = Postulate.objects.filter(vacancy=vacancy, finalize=True, discard=False)
+            candidates = section_candidates(vacancy, None, stage_section)
 
-        stages = VacancyStage.objects.filter(vacancy=vacancy)
-        for stage in stages:
-            count0 = stage.postulate_set.filter(vacancy=vacancy).exclude(discard=True).count()
-            count1 = Postulate.objects.filter(vacancy=vacancy, vacancy_stage__order__gt=stage.order).count()
-            count2 = stage.postulate_set.filter(vacancy=vacancy, discard=True).count()
-            count3 = Postulate.objects.filter(vacancy=vacancy, finalize=True).count()
-            stage.total_count = count0 + count1 + count2
-
-        finalized_count = Postulate.objects.filter(vacancy=vacancy, finalize=True).count()
-
-        process = VacancyStage.objects.filter(vacancy=vacancy, order=vacancy_stage).first()
-
-        for candidate in candidates:
-            candidate.process, created = Postulate_Stage.objects.get_or_create(postulate=candidate, vacancy_stage=process)
-            candidate.processes = candidate.postulate_stage_set.all()
-            candidate.comments = candidate.comment_set.filter(comment_type__lt=2)
-            candidate.timeline = candidate.comment_set.filter(comment_type__gte=2)
-            rated = candidate.process.scores.filter(recruiter=recruiter)
-            candidate.hasRated = rated.exists()
-            candidate.comment = rated.first().get_comment if candidate.hasRated else None
-            candidate.schedule = candidate.schedule_set.filter(user=request.user, status=0).first()
+        finalized_count = counts['finalized']
+
+        # Keywords of the filter box (vacancies.candidate_filter), applied before paging
+        candidate_filter = request.GET.get('filter', '') if stage_section == '0' else ''
+        try:
+            candidates = filter_applications(candidates, candidate_filter, vacancy)
+        except ValueError:
+            return Response({"detail": "Invalid 'filter' parameter."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            after = int(request.GET.get('after') or 0)
+        except ValueError:
+            after = None
+        candidates, next_after = candidate_page(candidates, after)
+        candidates = load_stage_candidates(candidates.prefetch_related('custom_form_application'), vacancy, process,
+                                           recruiter, request.user)
 
         isProcessMember = process and request.user.recruiter in process.recruiters.all()
 
@@ -644,6 +571,7 @@ class VacancyStageDetailsAPIView(APIView):
             'allstages': [],
             'current_process': VacancyStageSerializer(process).data if process else None,
             'candidates': candidates_data,
+            'next_after': next_after,
             'finalize_count': finalized_count,
             'today': today,
             'finalize': finalize,
@@ -663,7 +591,7 @@ class VacancyStageDetailsAPIView(APIView):
         if not subdomain_data['active_subdomain']:
             return Response({"detail": "Invalid subdomain"}, status=status.HTTP_404_NOT_FOUND)
 
-        recruiter = self.get_recruiter(request.user, subdomain_data['active_subdomain'])
+        recruiter = self.get_recruiter(request)
         if not recruiter:
             return Response({"detail": "Recruiter not found or unauthorized"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -679,6 +607,7 @@ class VacancyStageDetailsAPIView(APIView):
 class VacancyToPDFAPIView(APIView):
     """
     API endpoint to generate a PDF version of a vacancy using WeasyPrint.
+    The PDF is cached until the vacancy changes (see common.pdf_cache).
     """
     def get(self, request, vacancy_id):
         vacancy = get_object_or_404(Vacancy, pk=vacancy_id)
@@ -688,20 +617,17 @@ class VacancyToPDFAPIView(APIView):
         logo_pdf = 'logos_TRM/logo_pdf.png'
         pdf_name = f"{vacancy.employment[:30].replace(' ', '_')}_{vacancy.pk}.pdf"
 
-        html_string = render_to_string('vacancy_details_pdf.html', {
-            'vacancy': vacancy,
-            'MEDIA_URL': MEDIA_URL,
-            'logo_pdf': logo_pdf,
-            'my_vacancy': my_vacancy,
-            'LOGO_COMPANY_DEFAULT': LOGO_COMPANY_DEFAULT,
-        })
+        def render_html():
+            return render_to_string('vacancy_details_pdf.html', {
+                'vacancy': vacancy,
+                'MEDIA_URL': MEDIA_URL,
+                'logo_pdf': logo_pdf,
+                'my_vacancy': my_vacancy,
+                'LOGO_COMPANY_DEFAULT': LOGO_COMPANY_DEFAULT,
+            })
 
-        with tempfile.NamedTemporaryFile(delete=True, suffix=".pdf") as output:
-            HTML(string=html_string, base_url=request.build_absolute_uri()).write_pdf(output.name)
-            output.seek(0)
-            response = HttpResponse(output.read(), content_type='application/pdf')
-            response['Content-Disposition'] = f'attachment; filename="{pdf_name}"'
-            return response
+        return cached_pdf_response(request, 'vacancy', vacancy.pk, 'owner' if my_vacancy else 'public', pdf_name,
+                                   render_html, request.build_absolute_uri('/'))
 
 class VacanciesByCompanyAPIView(APIView):
     """
@@ -975,7 +901,7 @@ class PublicApplyAPIView(APIView):
         if not subdomain_data['active_host']:
             raise Http404
 
-        company = get_object_or_404(Company, subdomain__slug=subdomain_data['active_subdomain'])
+        company = get_tenant_company_or_404(request)
 
         if not company.check_service('CSM_ONSITE_APPLY'):
             raise Http404
@@ -1464,7 +1390,7 @@ class VacancyTalentSourcingAPIView(APIView):
         if not recruiter.is_manager():
             raise Http404("User is not a manager recruiter")
 
-        company = get_object_or_404(Company, subdomain__slug=subdomain_data['active_subdomain'])
+        company = get_tenant_company_or_404(request)
         if not company.check_service('JP_POST'):
             raise Http404("JP_POST service not active for company")
 